@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # 导入模块以注册用户缓存失效的信号（User 保存/删除时清理认证缓存）
+        from api import authentication  # noqa: F401
+        # 注册课程变更后增量更新全文搜索索引的信号
+        from api import search  # noqa: F401
+        # 注册模型变更后让响应缓存按标签失效的信号
+        from api import response_cache  # noqa: F401
@@ -0,0 +1,139 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import update_last_login
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.settings import api_settings
+
+from api import serializer as api_serializer
+from api.hashing import HashingPoolSaturated, acheck_password, ahash_password, get_hashing_pool
+from api.ratelimit import acheck, arecord_login_failure, arecord_login_success
+from userauths.models import User
+
+"""
+ASGI 原生的登录 / 注册视图
+
+与 MyTokenObtainPairView、RegisterView 返回相同的数据，区别在于：
+- 视图是 async def，在 ASGI（backend/asgi.py）下运行时不会占住 worker
+- PBKDF2 哈希交给 api.hashing 的有界线程池计算，线程池满时返回 503 并带上 Retry-After
+- 限流和登录失败锁定（api.ratelimit）在查询用户和计算哈希之前检查，超限时返回 429
+- 数据库访问使用 Django 的异步 ORM 或 sync_to_async
+"""
+
+
+def _saturated_response():
+    response = JsonResponse({"detail": "服务繁忙，请稍后重试"}, status=503)
+    response["Retry-After"] = "1"
+    return response
+
+
+def _throttled_response(wait):
+    # 与 DRF 的 Throttled 异常返回相同的内容
+    response = JsonResponse(
+        {"detail": f"Request was throttled. Expected available in {wait} seconds."},
+        status=429,
+    )
+    response["Retry-After"] = str(wait)
+    return response
+
+
+def _parse_json(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@csrf_exempt
+@require_POST
+async def token_obtain_view(request):
+    """
+    异步登录接口
+    请求：{"email": "...", "password": "..."}
+    响应：{"refresh": "...", "access": "..."}，与 MyTokenObtainPairView 相同
+    """
+    data = _parse_json(request)
+    if data is None:
+        return JsonResponse({"detail": "请求体必须是 JSON 对象"}, status=400)
+
+    email = data.get(User.USERNAME_FIELD)
+    password = data.get("password")
+    errors = {name: ["This field is required."] for name in (User.USERNAME_FIELD, "password") if not data.get(name)}
+    if errors:
+        return JsonResponse(errors, status=400)
+
+    wait = await acheck("login", request, email)
+    if wait:
+        return _throttled_response(wait)
+
+    # 与 ModelBackend 相同，按邮箱不区分大小写查找（UserManager.get_by_natural_key）
+    user = await User.objects.by_email(email).afirst()
+    try:
+        if user is None:
+            # 用户不存在时同样计算一次哈希，避免通过响应时间判断邮箱是否已注册（与 ModelBackend 一致）
+            await ahash_password(password)
+            valid = False
+        else:
+            valid = await acheck_password(user, password)
+    except HashingPoolSaturated:
+        return _saturated_response()
+
+    if not valid or not api_settings.USER_AUTHENTICATION_RULE(user):
+        await arecord_login_failure(request, email)
+        return JsonResponse(
+            {"detail": "No active account found with the given credentials"},
+            status=401,
+        )
+
+    await arecord_login_success(request, email)
+    # 签发 token 时可能写入 OutstandingToken，放到同步线程中执行
+    refresh = await sync_to_async(api_serializer.MyTokenObtainPairSerializer.get_token)(user)
+    if api_settings.UPDATE_LAST_LOGIN:
+        await sync_to_async(update_last_login)(None, user)
+
+    return JsonResponse({"refresh": str(refresh), "access": str(refresh.access_token)})
+
+
+@csrf_exempt
+@require_POST
+async def register_view(request):
+    """
+    异步注册接口
+    请求与响应格式与 RegisterView 相同：校验和写库在同步线程中执行，密码哈希在线程池中执行
+    """
+    data = _parse_json(request)
+    if data is None:
+        return JsonResponse({"detail": "请求体必须是 JSON 对象"}, status=400)
+
+    wait = await acheck("register", request)
+    if wait:
+        return _throttled_response(wait)
+
+    serializer = api_serializer.RegisterSerializer(data=data)
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse(serializer.errors, status=400)
+
+    try:
+        password_hash = await ahash_password(serializer.validated_data["password"])
+    except HashingPoolSaturated:
+        return _saturated_response()
+
+    try:
+        await sync_to_async(serializer.save)(password_hash=password_hash)
+    except ValidationError as e:
+        # 校验之后有并发注册了同一个邮箱（RegisterSerializer.create）
+        return JsonResponse(e.detail, status=400)
+    return JsonResponse(serializer.data, status=201)
+
+
+async def hashing_pool_stats_view(request):
+    """哈希线程池的排队深度等指标（仅 DEBUG 模式或管理员可见）"""
+    user = await request.auser()
+    if not (settings.DEBUG or user.is_staff):
+        return JsonResponse({"detail": "Forbidden"}, status=403)
+    return JsonResponse(get_hashing_pool().stats())
@@ -0,0 +1,256 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from userauths.models import User
+
+"""
+JWT 认证时的用户解析
+
+SimpleJWT 自带的 JWTAuthentication 每个请求都会按 token 里的 user_id 查询一次数据库。
+这里提供两种替代方案（在 settings.REST_FRAMEWORK 的 DEFAULT_AUTHENTICATION_CLASSES 中选择）：
+
+CachedJWTAuthentication     先查进程内的有界 TTL 缓存，再查可选的共享缓存（Django CACHES），最后才查数据库
+StatelessJWTAuthentication  完全不查数据库，直接用 token 里的 username / email / full_name 构造一个轻量用户对象
+
+User.save()（包括把 is_active 改成 False）和删除用户时会自动让缓存失效。
+注意：QuerySet.update() 不会触发信号，批量停用用户后需要手动调用 invalidate_user()。
+
+缓存里只保存认证和权限判断需要的字段（AUTH_FIELDS），不保存密码哈希；其余字段在视图中用到时按需查询。
+没有配置共享缓存时，失效只发生在当前进程，其他 worker 中的旧数据最多保留 LOCAL_TTL 秒，
+因此这时的有效期取 TTL 和 LOCAL_TTL 中较小的一个。
+"""
+
+# 默认配置，可以在 settings.py 中用 API_USER_CACHE 覆盖其中任意一项
+DEFAULTS = {
+    # 进程内缓存最多保存多少个用户，超出后按 LRU 淘汰
+    'MAX_SIZE': 10000,
+    # 缓存有效期（秒），过期后重新查询数据库
+    'TTL': 60,
+    # 没有共享缓存时的有效期上限（秒）：停用用户后其他进程最多还能用旧数据认证这么久
+    'LOCAL_TTL': 5,
+    # 共享缓存的别名（对应 settings.CACHES 中的 key），None 表示不使用共享缓存
+    'SHARED_CACHE': None,
+    # 共享缓存中 key 的前缀
+    'KEY_PREFIX': 'api:user',
+}
+
+
+# 缓存中保存的用户字段，只包含认证和权限判断需要的部分
+AUTH_FIELDS = ('id', 'email', 'username', 'full_name', 'is_active', 'is_staff', 'is_superuser')
+
+# Model.from_db() 要求值按模型字段的定义顺序排列
+_CACHED_FIELDS = tuple(field.attname for field in User._meta.concrete_fields if field.attname in AUTH_FIELDS)
+
+
+def get_cache_settings():
+    """合并默认配置和 settings.API_USER_CACHE"""
+    return {**DEFAULTS, **getattr(settings, 'API_USER_CACHE', {})}
+
+
+class UserCache:
+    """
+    两级用户缓存
+    第一级：进程内 OrderedDict，容量有上限，按最近使用淘汰，每个条目带过期时间
+    第二级：可选的 Django 共享缓存（如 Redis / Memcached），多个 worker 共用
+    两级缓存保存的都是 AUTH_FIELDS 的值组成的元组，取出时再构造成 User 实例
+    """
+
+    def __init__(self, max_size, ttl, shared_cache=None, key_prefix='api:user'):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared_cache = shared_cache
+        self.key_prefix = key_prefix
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+
+    @staticmethod
+    def _dump(user):
+        return tuple(getattr(user, name) for name in _CACHED_FIELDS)
+
+    @staticmethod
+    def _load(values):
+        # 和从数据库只查询了这些字段一样，其余字段是延迟字段，访问时才查询
+        return User.from_db(None, _CACHED_FIELDS, values)
+
+    def _deny_key(self, user_id):
+        return f'{self.key_prefix}:inactive:{user_id}'
+
+    def get(self, user_id):
+        """
+        按 user_id 取出缓存的用户，取不到返回 None
+        每次都构造新的实例，视图里修改 request.user 不会污染缓存
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                expires_at, values = entry
+                if expires_at > now:
+                    self._entries.move_to_end(user_id)
+                    return self._load(values)
+                del self._entries[user_id]
+
+        if self.shared_cache is not None:
+            values = self.shared_cache.get(self._key(user_id))
+            if values is not None:
+                self._store_local(user_id, values, now)
+                return self._load(values)
+        return None
+
+    def set(self, user):
+        """把用户的认证字段写入两级缓存"""
+        values = self._dump(user)
+        self._store_local(user.pk, values, time.monotonic())
+        if self.shared_cache is not None:
+            self.shared_cache.set(self._key(user.pk), values, self.ttl)
+
+    def _store_local(self, user_id, values, now):
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id, deactivated=False):
+        """
+        让某个用户的缓存失效
+        deactivated=True 时同时在共享缓存里记录“已停用”，供无状态模式检查
+        """
+        with self._lock:
+            self._entries.pop(user_id, None)
+        if self.shared_cache is not None:
+            self.shared_cache.delete(self._key(user_id))
+            if deactivated:
+                # 停用标记至少要保留到已签发的 access token 全部过期
+                lifetime = int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+                self.shared_cache.set(self._deny_key(user_id), True, lifetime)
+            else:
+                self.shared_cache.delete(self._deny_key(user_id))
+
+    def is_deactivated(self, user_id):
+        """无状态模式下判断用户是否已被停用（只查共享缓存，不查数据库）"""
+        if self.shared_cache is None:
+            return False
+        return bool(self.shared_cache.get(self._deny_key(user_id)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    """返回进程内唯一的 UserCache 实例（第一次调用时按配置创建）"""
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                conf = get_cache_settings()
+                shared = caches[conf['SHARED_CACHE']] if conf['SHARED_CACHE'] else None
+                # 只有进程内缓存时，其他进程的失效无法传递过来，有效期要短得多
+                ttl = conf['TTL'] if shared is not None else min(conf['TTL'], conf['LOCAL_TTL'])
+                _user_cache = UserCache(
+                    max_size=conf['MAX_SIZE'],
+                    ttl=ttl,
+                    shared_cache=shared,
+                    key_prefix=conf['KEY_PREFIX'],
+                )
+    return _user_cache
+
+
+def reset_user_cache():
+    """丢弃当前缓存实例，下次使用时按最新配置重建（修改配置后调用）"""
+    global _user_cache
+    with _user_cache_lock:
+        _user_cache = None
+
+
+def invalidate_user(user_id, deactivated=False):
+    """对外暴露的失效入口，例如批量 update(is_active=False) 之后调用"""
+    get_user_cache().invalidate(user_id, deactivated=deactivated)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    带缓存的 JWT 认证
+    行为与 JWTAuthentication 一致，只是用户对象优先从缓存读取
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        cache = get_user_cache()
+        user = cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(user)
+        elif not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+class ClaimsUser(TokenUser):
+    """
+    由 token 声明构造的轻量用户对象
+    在 TokenUser 的基础上补充 MyTokenObtainPairSerializer.get_token 写入的 email 和 full_name
+    """
+
+    @property
+    def email(self):
+        return self.token.get('email', '')
+
+    @property
+    def full_name(self):
+        return self.token.get('full_name', '')
+
+    def __str__(self):
+        return self.email or super().__str__()
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    无状态 JWT 认证，整个认证过程不访问数据库
+    如果配置了共享缓存，会额外检查用户是否已被停用
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = ClaimsUser(validated_token)
+        if get_user_cache().is_deactivated(user.id):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+def invalidate_user_on_save(sender, instance, **kwargs):
+    """用户保存后让缓存失效；如果用户被停用，同时写入停用标记"""
+    invalidate_user(instance.pk, deactivated=not instance.is_active)
+
+
+def invalidate_user_on_delete(sender, instance, **kwargs):
+    """用户删除后让缓存失效，并按停用处理"""
+    invalidate_user(instance.pk, deactivated=True)
+
+
+post_save.connect(invalidate_user_on_save, sender=User)
+post_delete.connect(invalidate_user_on_delete, sender=User)
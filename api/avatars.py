@@ -0,0 +1,228 @@
+import hashlib
+import io
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.db import connections
+
+from userauths.models import Profile
+
+"""
+头像上传与缩略图
+
+上传：AvatarUploadHandler 把请求体按块写入临时文件，同时
+  - 边写边计算 SHA-256（内容寻址，用于去重）
+  - 根据第一个数据块的文件头判断真实的图片类型，不信任客户端声明的 Content-Type
+  - 超过 AVATAR_MAX_UPLOAD_SIZE 立即停止接收
+保存：文件名由内容哈希决定（user_folder/ab/abcdef....png），相同的头像只保存一份；
+     通过 default_storage 写入，本地文件系统和 S3（django-storages）都适用
+缩略图：资料保存后提交到后台线程池，按 AVATAR_THUMBNAIL_SIZES 居中裁剪成正方形，生成 WebP（不支持时退回 JPEG）；
+       全部生成后把资料的 thumbnails_ready 置为 True，在此之前序列化器返回原图地址
+"""
+
+logger = logging.getLogger(__name__)
+
+# 文件头魔数 -> (MIME 类型, 扩展名)
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', ('image/jpeg', 'jpg')),
+    (b'\x89PNG\r\n\x1a\n', ('image/png', 'png')),
+    (b'GIF87a', ('image/gif', 'gif')),
+    (b'GIF89a', ('image/gif', 'gif')),
+)
+
+# 内容寻址的头像文件名：user_folder/<前两位>/<sha256>.<扩展名>
+HASHED_NAME_RE = re.compile(r'^user_folder/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})\.[a-z]+$')
+
+
+def get_max_upload_size():
+    return getattr(settings, 'AVATAR_MAX_UPLOAD_SIZE', 5 * 1024 * 1024)
+
+
+def get_thumbnail_sizes():
+    return tuple(getattr(settings, 'AVATAR_THUMBNAIL_SIZES', (64, 128, 256)))
+
+
+def sniff_image_type(head):
+    """根据文件头判断图片类型，返回 (MIME 类型, 扩展名)，无法识别时返回 None"""
+    for signature, result in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return result
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp', 'webp'
+    return None
+
+
+class AvatarUploadHandler(TemporaryFileUploadHandler):
+    """
+    头像上传处理器
+    出错时不抛出异常给客户端，而是记录在 self.error 中，由视图返回 400 / 413
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.error = None
+        self.status_code = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.detected = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > get_max_upload_size():
+            self.error = f"文件不能超过 {get_max_upload_size() // 1024} KB"
+            self.status_code = 413
+            raise StopUpload(connection_reset=False)
+        if start == 0:
+            self.detected = sniff_image_type(raw_data[:16])
+            if self.detected is None:
+                self.error = "只支持 JPEG、PNG、GIF、WebP 格式的图片"
+                self.status_code = 400
+                raise StopUpload(connection_reset=False)
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.detected is None:
+            # 空文件不会调用 receive_data_chunk()，没有判断过类型
+            self.error = "上传的文件是空的"
+            self.status_code = 400
+            raise StopUpload(connection_reset=False)
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.sha256.hexdigest()
+        uploaded.content_type, uploaded.extension = self.detected
+        return uploaded
+
+
+def hashed_name(digest, extension):
+    return f'user_folder/{digest[:2]}/{digest}.{extension}'
+
+
+def thumbnail_name(digest, size):
+    return f'user_folder/thumbs/{digest[:2]}/{digest}_{size}.{thumbnail_format()[1]}'
+
+
+def thumbnail_format():
+    """缩略图格式：优先 WebP，Pillow 未编译 WebP 支持时使用 JPEG"""
+    from PIL import features
+
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+
+def store_avatar(uploaded, storage=None):
+    """
+    按内容寻址保存上传的头像，返回保存后的文件名
+    同样内容的文件已经存在时直接复用，不重复写入；缩略图由调用方在资料保存后用 schedule_thumbnails() 生成
+    """
+    storage = storage or default_storage
+    name = hashed_name(uploaded.sha256, uploaded.extension)
+    if not storage.exists(name):
+        # storage.save 按块读取临时文件写入目标存储，不会把整个文件读入内存
+        saved = storage.save(name, uploaded)
+        if saved != name:
+            # 并发上传同一文件时，另一个请求已经先写入，删除重复的一份
+            storage.delete(saved)
+    return name
+
+
+def digest_from_name(name):
+    match = HASHED_NAME_RE.match(name or '')
+    return match.group('digest') if match else None
+
+
+def thumbnail_urls(name, ready, storage=None):
+    """
+    返回 {尺寸: URL}
+    缩略图还没有生成（ready 为 False）或非内容寻址的旧头像（例如默认头像）没有缩略图，各尺寸都返回原图 URL
+    """
+    storage = storage or default_storage
+    if not name:
+        return {}
+    digest = digest_from_name(name)
+    if digest is None or not ready:
+        url = storage.url(name)
+        return {size: url for size in get_thumbnail_sizes()}
+    return {size: storage.url(thumbnail_name(digest, size)) for size in get_thumbnail_sizes()}
+
+
+def generate_thumbnails(name, storage=None):
+    """为内容寻址的头像生成所有尺寸的正方形缩略图（已存在的尺寸跳过），返回新保存的文件名"""
+    from PIL import Image, ImageOps
+
+    storage = storage or default_storage
+    digest = digest_from_name(name)
+    if digest is None:
+        return []
+    pending = [size for size in get_thumbnail_sizes() if not storage.exists(thumbnail_name(digest, size))]
+    if not pending:
+        return []
+
+    image_format, _ = thumbnail_format()
+    with storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    image = image.convert('RGBA' if image_format == 'WEBP' else 'RGB')
+
+    created = []
+    for size in sorted(pending, reverse=True):
+        # 居中裁剪成正方形再缩放；从大到小依次处理，后面的尺寸复用前一次的结果，减少计算量
+        image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format, quality=85)
+        created.append(storage.save(thumbnail_name(digest, size), ContentFile(buffer.getvalue())))
+    return created
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_thumbnail_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'AVATAR_THUMBNAIL_WORKERS', 2),
+                    thread_name_prefix='avatar-thumbnail',
+                )
+    return _executor
+
+
+def mark_thumbnails_ready(user_id, name):
+    """
+    缩略图生成后标记资料（头像已经换成别的文件时不标记）
+    通过 Profile.save 写入：版本号加一，/user/me/ 的 ETag 随之变化
+    """
+    for profile in Profile.objects.filter(user_id=user_id, image=name, thumbnails_ready=False):
+        profile.thumbnails_ready = True
+        profile.save(update_fields=['thumbnails_ready'])
+
+
+def _generate_thumbnails_logged(name, storage, user_id):
+    try:
+        created = generate_thumbnails(name, storage)
+        if user_id is not None:
+            mark_thumbnails_ready(user_id, name)
+        return created
+    except Exception:
+        logger.exception("Failed to generate thumbnails for %s", name)
+        raise
+    finally:
+        # 后台线程不经过请求周期，用完及时归还连接
+        connections.close_all()
+
+
+def schedule_thumbnails(name, storage=None, user_id=None):
+    """
+    把缩略图生成任务提交到后台线程池，返回 Future
+    传入 user_id 时，生成后标记该用户的资料 thumbnails_ready；调用方应在资料的事务提交后再调用
+    """
+    return get_thumbnail_executor().submit(_generate_thumbnails_logged, name, storage or default_storage, user_id)
@@ -0,0 +1,483 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, close_old_connections, connections
+from django.utils import timezone
+
+from api.models import RevokedToken
+
+"""
+可扩展的 refresh token 黑名单
+
+SimpleJWT 自带的 token_blacklist 每次刷新都要写 OutstandingToken + BlacklistedToken 两张表，
+而且两张表只增不减。这里改为：
+
+- 登录签发 refresh token 时不再记录 OutstandingToken（只有被拉黑的 jti 才需要保存）
+- 检查时先查进程内的布隆过滤器：不在过滤器中的 jti 一定没有被拉黑，不用访问存储；
+  只有命中过滤器（真正被拉黑或极少数误判）时才去存储中确认
+- 存储可插拔：默认是带索引的数据库表 api.RevokedToken，也可以换成 Redis（或本地的 Redis 替身 LocalRedis）
+- 过期的记录由 purge_revoked_tokens 命令分批删除
+
+多进程部署时，其他进程拉黑的 jti 通过 changes_since() 增量同步到本进程的过滤器，
+同步间隔由 SYNC_INTERVAL 控制（0 表示每次检查前都同步一次）。数据库存储的读取固定走主库，
+并重新检查增量同步时跳过的主键，晚提交的插入不会要等到下一次完整重建才同步过来。
+
+完整加载黑名单只在以下时机进行，且都按块流式读取，不会一次性把所有 jti 读入内存：
+- 进程启动时（backend/wsgi.py、backend/asgi.py 调用 warm_up_token_blacklist()），而不是在第一个请求里
+- 过滤器中的 jti 超出容量，或距离上次完整构建超过 REBUILD_INTERVAL 时，在后台线程中按存储的实际行数
+  重新构建，构建期间旧的过滤器继续使用（它只会多出误判，不会漏判）。purge_revoked_tokens 删除的 jti
+  也是通过这种定期重建从每个进程的过滤器中去掉的。
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # 存储后端：'database' 或 'redis'
+    'STORE': 'database',
+    # Redis 地址；STORE 为 'redis' 且未设置地址时使用进程内的 LocalRedis 替身
+    'REDIS_URL': None,
+    # Redis 中 key 的前缀
+    'KEY_PREFIX': 'jwt:revoked',
+    # 布隆过滤器预计容纳的 jti 数量和期望误判率
+    'CAPACITY': 1_000_000,
+    'ERROR_RATE': 0.001,
+    # 从存储增量同步新拉黑 jti 的最小间隔（秒）
+    'SYNC_INTERVAL': 1.0,
+    # 数据库存储：增量同步时跳过的主键（可能是还没提交的插入）继续等待的时间（秒）
+    'SYNC_GAP_TIMEOUT': 60,
+    # 每个进程定期在后台重建过滤器的间隔（秒），去掉已过期并被清理的 jti；0 表示只在超出容量时重建
+    'REBUILD_INTERVAL': 3600,
+}
+
+
+def get_blacklist_settings():
+    """合并默认配置和 settings.TOKEN_BLACKLIST"""
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_BLACKLIST', {})}
+
+
+class BloomFilter:
+    """
+    布隆过滤器
+    只会误判“存在”，不会误判“不存在”；容量和误判率决定位数组大小和哈希函数个数
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # 双重哈希：用一次 blake2b 得到两个 64 位哈希值，组合出 k 个位置
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        """加入 key；只有设置了新的位（key 原来不在过滤器中）时才计入 count，返回是否新增"""
+        bits = self.bits
+        added = False
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class DatabaseBlacklistStore:
+    """
+    数据库存储：api.RevokedToken 表，jti 唯一索引，expires_at 普通索引
+    读取固定走主库（using），不经过 PrimaryReplicaRouter：副本的复制延迟会让刚拉黑的 jti 在其他进程中暂时查不到
+    """
+
+    def __init__(self, chunk_size=10000, gap_timeout=60, max_gaps=1000, using=DEFAULT_DB_ALIAS):
+        self.chunk_size = chunk_size
+        self.gap_timeout = gap_timeout
+        self.max_gaps = max_gaps
+        self.using = using
+
+    def _revoked(self):
+        return RevokedToken.objects.using(self.using)
+
+    def add(self, jti, expires_at):
+        # INSERT ... ON CONFLICT DO NOTHING，重复拉黑同一个 jti 也只有一条语句
+        RevokedToken.objects.bulk_create(
+            [RevokedToken(jti=jti, expires_at=expires_at)],
+            ignore_conflicts=True,
+        )
+
+    def contains(self, jti):
+        return self._revoked().filter(jti=jti).exists()
+
+    def count(self):
+        return self._revoked().count()
+
+    def changes_since(self, cursor):
+        """
+        分块读取游标之后新增的 jti，每块产出 (jti 列表, 新游标)
+        游标是 (已同步的最大主键, {还没有出现的较小主键: 放弃等待的时间})，也可以只传最大主键（例如 0）
+
+        PostgreSQL 上并发插入的提交顺序不一定是主键顺序，主键较小的行可能在较大的行之后才提交，
+        只按 pk > 游标 读取会永远漏掉它。因此读取时把跳过的主键记为空洞，之后每次同步都按主键再查一次，
+        直到出现或超过 gap_timeout 秒（回滚的事务、ON CONFLICT DO NOTHING 也会留下永远不会出现的空洞）；
+        最多记录最大的 max_gaps 个空洞，迟到的提交总是在最新的主键附近
+        """
+        last, gaps = cursor if isinstance(cursor, tuple) else (cursor, {})
+        now = time.monotonic()
+        gaps = {pk: deadline for pk, deadline in gaps.items() if deadline > now}
+        if gaps:
+            rows = list(self._revoked().filter(pk__in=list(gaps)).values_list('pk', 'jti'))
+            for pk, _ in rows:
+                del gaps[pk]
+            if rows:
+                yield [jti for _, jti in rows], (last, dict(gaps))
+
+        while True:
+            rows = list(
+                self._revoked().filter(pk__gt=last)
+                .order_by('pk')
+                .values_list('pk', 'jti')[:self.chunk_size]
+            )
+            if not rows:
+                return
+            expected = last + 1
+            for pk, _ in rows:
+                for missing in range(max(expected, pk - self.max_gaps), pk):
+                    gaps[missing] = now + self.gap_timeout
+                expected = pk + 1
+            if len(gaps) > self.max_gaps:
+                gaps = dict(sorted(gaps.items())[-self.max_gaps:])
+            last = rows[-1][0]
+            yield [jti for _, jti in rows], (last, dict(gaps))
+            if len(rows) < self.chunk_size:
+                return
+
+    def purge_expired(self, now=None, chunk_size=None):
+        """分批删除已过期的记录，每删除一批产出一次删除数量"""
+        now = now or timezone.now()
+        chunk_size = chunk_size or self.chunk_size
+        while True:
+            ids = list(
+                self._revoked().filter(expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('pk', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            deleted, _ = self._revoked().filter(pk__in=ids).delete()
+            yield deleted
+
+
+class LocalRedis:
+    """
+    进程内的 Redis 替身，只实现 RedisBlacklistStore 用到的命令
+    用于本地开发和测试，返回值类型与 redis-py 保持一致（字符串以 bytes 返回）
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expiry = {}
+        self._zsets = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, name):
+        expires_at = self._expiry.get(name)
+        if expires_at is not None and expires_at <= time.time():
+            self._data.pop(name, None)
+            self._expiry.pop(name, None)
+        return name in self._data
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._data[name] = str(value).encode()
+            if ex is not None:
+                self._expiry[name] = time.time() + ex
+            else:
+                self._expiry.pop(name, None)
+        return True
+
+    def get(self, name):
+        with self._lock:
+            return self._data[name] if self._alive(name) else None
+
+    def exists(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._alive(name))
+
+    def delete(self, *names):
+        with self._lock:
+            removed = 0
+            for name in names:
+                removed += int(name in self._data or name in self._zsets)
+                self._data.pop(name, None)
+                self._zsets.pop(name, None)
+                self._expiry.pop(name, None)
+            return removed
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            value = int(self._data[name]) + amount if self._alive(name) else amount
+            self._data[name] = str(value).encode()
+            return value
+
+    def zadd(self, name, mapping):
+        with self._lock:
+            zset = self._zsets.setdefault(name, {})
+            mapping = {str(member).encode(): float(score) for member, score in mapping.items()}
+            added = sum(1 for member in mapping if member not in zset)
+            zset.update(mapping)
+            return added
+
+    def zcard(self, name):
+        with self._lock:
+            return len(self._zsets.get(name, {}))
+
+    def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False):
+        low, low_open = self._parse_score(min)
+        high, high_open = self._parse_score(max)
+        with self._lock:
+            items = sorted(self._zsets.get(name, {}).items(), key=lambda item: item[1])
+        items = [
+            (member, score) for member, score in items
+            if (score > low if low_open else score >= low) and (score < high if high_open else score <= high)
+        ]
+        if start is not None and num is not None:
+            items = items[start:start + num]
+        return items if withscores else [member for member, _ in items]
+
+    def zrem(self, name, *values):
+        with self._lock:
+            zset = self._zsets.get(name, {})
+            return sum(1 for value in values if zset.pop(value if isinstance(value, bytes) else str(value).encode(), None) is not None)
+
+    @staticmethod
+    def _parse_score(value):
+        value = str(value)
+        if value in ('-inf', '+inf', 'inf'):
+            return float(value), False
+        if value.startswith('('):
+            return float(value[1:]), True
+        return float(value), False
+
+
+class RedisBlacklistStore:
+    """
+    Redis 存储
+    每个被拉黑的 jti 对应一个带 TTL 的 key（过期自动删除），
+    另有一个有序集合按写入序号记录 jti，供其他进程增量同步
+    """
+
+    def __init__(self, client, key_prefix='jwt:revoked', chunk_size=10000):
+        self.client = client
+        self.key_prefix = key_prefix
+        self.chunk_size = chunk_size
+
+    def _key(self, jti):
+        return f'{self.key_prefix}:{jti}'
+
+    @property
+    def _log_key(self):
+        return f'{self.key_prefix}:log'
+
+    @property
+    def _seq_key(self):
+        return f'{self.key_prefix}:seq'
+
+    def add(self, jti, expires_at):
+        ttl = max(1, int((expires_at - timezone.now()).total_seconds()))
+        self.client.set(self._key(jti), 1, ex=ttl)
+        self.client.zadd(self._log_key, {jti: self.client.incr(self._seq_key)})
+
+    def contains(self, jti):
+        return bool(self.client.exists(self._key(jti)))
+
+    def count(self):
+        return self.client.zcard(self._log_key)
+
+    def changes_since(self, cursor):
+        while True:
+            rows = self.client.zrangebyscore(
+                self._log_key, f'({cursor}', '+inf', start=0, num=self.chunk_size, withscores=True
+            )
+            if not rows:
+                return
+            cursor = int(rows[-1][1])
+            yield [member.decode() if isinstance(member, bytes) else member for member, _ in rows], cursor
+            if len(rows) < self.chunk_size:
+                return
+
+    def purge_expired(self, now=None, chunk_size=None):
+        """jti 的 key 由 Redis 自动过期，这里只清理同步日志中对应 key 已不存在的条目"""
+        chunk_size = chunk_size or self.chunk_size
+        cursor = 0
+        while True:
+            rows = self.client.zrangebyscore(
+                self._log_key, f'({cursor}', '+inf', start=0, num=chunk_size, withscores=True
+            )
+            if not rows:
+                break
+            cursor = int(rows[-1][1])
+            expired = [
+                member for member, _ in rows
+                if not self.client.exists(self._key(member.decode() if isinstance(member, bytes) else member))
+            ]
+            if expired:
+                self.client.zrem(self._log_key, *expired)
+                yield len(expired)
+
+
+class TokenBlacklist:
+    """布隆过滤器 + 存储 组成的黑名单"""
+
+    def __init__(self, store, capacity, error_rate, sync_interval, rebuild_interval=0):
+        self.store = store
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        # 同一时间只进行一次完整构建
+        self._rebuild_lock = threading.Lock()
+        self.filter = BloomFilter(capacity, error_rate)
+        self._cursor = 0
+        self._last_sync = None
+        self._built_at = None
+        self._rebuilding = False
+
+    def _load(self, bloom, cursor):
+        """把游标之后的 jti 逐块加入 bloom，返回新游标"""
+        for jtis, cursor in self.store.changes_since(cursor):
+            for jti in jtis:
+                bloom.add(jti)
+        return cursor
+
+    def _build(self):
+        # 按存储中的实际行数确定容量，留出一倍的余量
+        bloom = BloomFilter(max(self.capacity, 2 * self.store.count()), self.error_rate)
+        cursor = self._load(bloom, 0)
+        with self._lock:
+            # 补上构建期间新拉黑的 jti，然后替换过滤器
+            self._cursor = self._load(bloom, cursor)
+            self.filter = bloom
+            self._last_sync = self._built_at = time.monotonic()
+
+    def rebuild(self):
+        """从存储完整加载一个新的过滤器并替换当前的过滤器，构建期间当前的过滤器继续使用"""
+        with self._rebuild_lock:
+            self._build()
+
+    def warm_up(self):
+        """还没有完整加载过时立即加载；进程启动时调用，避免第一个请求承担加载的开销"""
+        if self._built_at is None:
+            with self._rebuild_lock:
+                if self._built_at is None:
+                    self._build()
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception("Failed to rebuild the token blacklist filter")
+        finally:
+            self._rebuilding = False
+            # 后台线程不受请求生命周期管理，用完主动归还数据库连接
+            close_old_connections()
+
+    def sync(self, force=False):
+        """把存储中新增的 jti 同步到过滤器；过滤器超出容量或需要定期重建时在后台线程中重建"""
+        # 没有预热过（例如管理命令、测试中）时先完整加载，保证过滤器不会漏判
+        self.warm_up()
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._last_sync is not None and now - self._last_sync < self.sync_interval:
+                return
+            self._cursor = self._load(self.filter, self._cursor)
+            self._last_sync = now
+            # 超出容量后误判率会快速上升
+            stale = self.filter.count > self.filter.capacity or (
+                self.rebuild_interval and now - self._built_at >= self.rebuild_interval
+            )
+            if not stale or self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, name='token-blacklist-rebuild', daemon=True).start()
+
+    def add(self, jti, expires_at):
+        self.store.add(jti, expires_at)
+        with self._lock:
+            self.filter.add(jti)
+
+    def is_blacklisted(self, jti):
+        self.sync()
+        if jti not in self.filter:
+            return False
+        return self.store.contains(jti)
+
+
+def build_store(conf):
+    """根据配置创建存储后端"""
+    if conf['STORE'] == 'database':
+        return DatabaseBlacklistStore(gap_timeout=conf['SYNC_GAP_TIMEOUT'])
+    if conf['STORE'] == 'redis':
+        if conf['REDIS_URL']:
+            import redis  # 可选依赖，只有使用真实 Redis 时才需要安装
+
+            client = redis.Redis.from_url(conf['REDIS_URL'])
+        else:
+            client = LocalRedis()
+        return RedisBlacklistStore(client, key_prefix=conf['KEY_PREFIX'])
+    raise ValueError(f"Unknown TOKEN_BLACKLIST store: {conf['STORE']}")
+
+
+_blacklist = None
+_blacklist_lock = threading.Lock()
+
+
+def get_token_blacklist():
+    """返回进程内唯一的 TokenBlacklist 实例"""
+    global _blacklist
+    if _blacklist is None:
+        with _blacklist_lock:
+            if _blacklist is None:
+                conf = get_blacklist_settings()
+                _blacklist = TokenBlacklist(
+                    store=build_store(conf),
+                    capacity=conf['CAPACITY'],
+                    error_rate=conf['ERROR_RATE'],
+                    sync_interval=conf['SYNC_INTERVAL'],
+                    rebuild_interval=conf['REBUILD_INTERVAL'],
+                )
+    return _blacklist
+
+
+def warm_up_token_blacklist():
+    """
+    进程启动时加载黑名单（backend/wsgi.py、backend/asgi.py 在创建 application 之后调用）
+    加载完成后关闭数据库连接，预先加载应用再 fork 的服务器（如 gunicorn --preload）中子进程不会共用父进程的连接
+    """
+    try:
+        get_token_blacklist().warm_up()
+    except DatabaseError:
+        # 例如还没有执行迁移；第一次检查时会再次尝试加载
+        logger.exception("Failed to warm up the token blacklist")
+    connections.close_all()
+
+
+def reset_token_blacklist():
+    """丢弃当前实例，下次使用时按最新配置重建"""
+    global _blacklist
+    with _blacklist_lock:
+        _blacklist = None
@@ -0,0 +1,339 @@
+import itertools
+import json
+import logging
+import operator
+import time
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import serializers
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+from core.metrics import record_serializer_time
+
+"""
+只读序列化的快速路径（编译序列化器）
+
+DRF 序列化每个对象都要走一遍 get_attribute / to_representation / ReturnDict 等通用流程，序列化之前还要先构造模型实例，
+列表接口的 CPU 时间大部分花在这里。compile_serializer() 为序列化器类预先算好一份扁平的取值计划：
+    - 需要查询哪些列（QuerySet.values_list() 的参数，跨关联的字段展开为 category__title 这样的查询路径）
+    - 每个输出字段取第几列、怎样转换（就是对应 DRF 字段的 to_representation，简单字段直接用 str / int / float）
+之后把 values_list() 返回的元组直接转换成字典，不构造模型实例，渲染出的 JSON 与原序列化器逐字节相同
+（python manage.py bench_fast_serializer 校验输出并比较耗时）。
+
+能编译的字段：模型字段、PrimaryKeyRelatedField、文件字段（按存储生成地址）、通过 source 跨关联取值的字段、
+单个对象的嵌套序列化器，以及在序列化器的 value_sources 中声明了取值列（一列或多列）的 SerializerMethodField
+（改为调用 get_<字段>_from_value(各列的值)）。其他情况（many=True、source='*'、没有声明的方法字段等）
+抛出 NotCompilable，get_plan() 返回 None，调用方使用原来的序列化器。
+
+大列表用 stream_json() 按块编码成 JSON 数组，配合 StreamingHttpResponse 边查询边返回。
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # 视图是否使用编译后的序列化器，关闭时完全使用 DRF 原来的实现
+    'ENABLED': True,
+    # JSON 编码器：json（标准库，与 DRF JSONRenderer 逐字节相同）或 orjson（需要安装，更快；
+    # 浮点数的指数写法与标准库不同，例如 1e16 和 1e+16）
+    'ENCODER': 'json',
+    # stream_json() 每块转换和编码的行数
+    'CHUNK_SIZE': 1000,
+}
+
+
+def get_fast_serializer_settings():
+    """合并默认配置和 settings.FAST_SERIALIZER"""
+    return {**DEFAULTS, **getattr(settings, 'FAST_SERIALIZER', {})}
+
+
+class NotCompilable(Exception):
+    """序列化器中有无法从 values_list() 的行直接取值的字段"""
+
+
+class Columns:
+    """查询路径 -> 在行中的位置（同一个路径只查询一次）"""
+
+    def __init__(self):
+        self.lookups = []
+        self.index = {}
+
+    def add(self, lookup):
+        if lookup not in self.index:
+            self.index[lookup] = len(self.lookups)
+            self.lookups.append(lookup)
+        return self.index[lookup]
+
+
+def resolve(model, attrs, prefix):
+    """沿 source 路径解析模型字段，返回 (最后一个模型字段, values_list() 的查询路径)"""
+    field = None
+    for attr in attrs:
+        if field is not None:
+            if not field.is_relation or field.many_to_many or field.one_to_many:
+                raise NotCompilable(f'{field.name} 不是指向单个对象的关联')
+            model = field.related_model
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            raise NotCompilable(f'{model.__name__}.{attr} 不是模型字段')
+    return field, prefix + '__'.join(attrs)
+
+
+def value_converter(field):
+    """DRF 字段的 to_representation；CharField / IntegerField / FloatField 的实现就是内置类型转换，直接使用"""
+    method = type(field).to_representation
+    if method is serializers.CharField.to_representation:
+        return str
+    if method is serializers.IntegerField.to_representation:
+        return int
+    if method is serializers.FloatField.to_representation:
+        return float
+    return field.to_representation
+
+
+def compile_fields(serializer, model, prefix, columns):
+    """[(输出字段名, 取值规则)]，顺序与 serializer.data 的键相同"""
+    specs = []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        try:
+            specs.append((field.field_name, compile_field(serializer, field, model, prefix, columns)))
+        except NotCompilable as e:
+            raise NotCompilable(f'{type(serializer).__name__}.{field.field_name}: {e}')
+    return specs
+
+
+def compile_field(serializer, field, model, prefix, columns):
+    if isinstance(field, serializers.SerializerMethodField):
+        source = getattr(type(serializer), 'value_sources', {}).get(field.field_name)
+        if source is None:
+            raise NotCompilable('方法字段没有在 value_sources 中声明取值列')
+        sources = (source,) if isinstance(source, str) else source
+        indexes = tuple(columns.add(resolve(model, name.split('.'), prefix)[1]) for name in sources)
+        return ('method', indexes, type(serializer), f'{field.method_name}_from_value')
+
+    if field.source == '*' or isinstance(field, serializers.ListSerializer):
+        raise NotCompilable('不支持 source="*" 和 many=True')
+
+    model_field, lookup = resolve(model, field.source_attrs, prefix)
+
+    if isinstance(field, serializers.BaseSerializer):
+        if not model_field.is_relation or model_field.many_to_many or model_field.one_to_many:
+            raise NotCompilable('嵌套序列化器必须对应指向单个对象的关联')
+        # 关联本身的取值（外键 id）为 None 时整个嵌套对象输出 None
+        nested = compile_fields(field, model_field.related_model, lookup + '__', columns)
+        return ('nested', columns.add(lookup), nested)
+
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        # 外键的查询路径取到的就是主键值
+        return ('value', columns.add(lookup), None)
+
+    if isinstance(field, serializers.FileField):
+        if not isinstance(model_field, models.FileField):
+            raise NotCompilable('文件字段必须对应模型的 FileField')
+        use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+        return ('file', columns.add(lookup), model_field.storage, use_url)
+
+    # 外键的 attname（例如 source='user_id'）取到的也是普通的值
+    if model_field.is_relation and field.source_attrs[-1] != model_field.attname:
+        raise NotCompilable('关联字段只支持 PrimaryKeyRelatedField 或嵌套序列化器')
+    return ('value', columns.add(lookup), value_converter(field))
+
+
+def bind_fields(specs, context, instances):
+    """把取值规则变成 行 -> 字典 的函数；方法字段绑定到带 context 的序列化器实例上"""
+    request = context.get('request')
+    getters = []
+    for name, spec in specs:
+        kind, index = spec[0], spec[1]
+        if kind == 'value':
+            getters.append((name, value_getter(index, spec[2])))
+        elif kind == 'file':
+            getters.append((name, file_getter(index, spec[2], spec[3], request)))
+        elif kind == 'method':
+            serializer_class, method_name = spec[2], spec[3]
+            if serializer_class not in instances:
+                instances[serializer_class] = serializer_class(context=context)
+            getters.append((name, method_getter(index, getattr(instances[serializer_class], method_name))))
+        else:
+            getters.append((name, nested_getter(index, bind_fields(spec[2], context, instances))))
+
+    def convert(row):
+        return {name: get(row) for name, get in getters}
+
+    return convert
+
+
+def value_getter(index, convert):
+    if convert is None:
+        return operator.itemgetter(index)
+
+    def get(row):
+        value = row[index]
+        # 与 Serializer.to_representation 相同：取到 None 时不调用字段的 to_representation
+        return None if value is None else convert(value)
+
+    return get
+
+
+def file_getter(index, storage, use_url, request):
+    # 与 serializers.FileField.to_representation 相同
+    def get(row):
+        name = row[index]
+        if not name:
+            return None
+        if not use_url:
+            return name
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+
+    return get
+
+
+def method_getter(indexes, method):
+    def get(row):
+        return method(*(row[index] for index in indexes))
+
+    return get
+
+
+def nested_getter(index, convert):
+    def get(row):
+        return None if row[index] is None else convert(row)
+
+    return get
+
+
+class SerializerPlan:
+    """
+    一个序列化器类的取值计划
+    lookups：需要查询的列；rows(queryset)：按 lookups 查询出的行；bind(context)：行 -> 字典 的转换函数
+    """
+
+    def __init__(self, serializer_class, model=None):
+        if model is None:
+            model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+        if model is None:
+            raise NotCompilable(f'{serializer_class.__name__} 没有对应的模型')
+        self.serializer_class = serializer_class
+        self.columns = Columns()
+        self.specs = compile_fields(serializer_class(), model, '', self.columns)
+        self.lookups = tuple(self.columns.lookups)
+
+    def rows(self, queryset, *extra):
+        """
+        values_list() 查询集，行是具名元组：前面是 lookups，后面是 extra 中尚未包含的列（例如分页的排序字段）
+        """
+        extra = tuple(dict.fromkeys(lookup for lookup in extra if lookup not in self.columns.index))
+        return queryset.values_list(*self.lookups, *extra, named=True)
+
+    def bind(self, context=None):
+        return bind_fields(self.specs, context or {}, {})
+
+    def serialize(self, rows, context=None):
+        convert = self.bind(context)
+        return [convert(row) for row in rows]
+
+
+def compile_serializer(serializer_class, model=None):
+    """编译序列化器（不缓存，视图中请使用 get_plan()）"""
+    return SerializerPlan(serializer_class, model)
+
+
+_plans = {}
+
+
+def get_plan(serializer_class):
+    """已启用并且可以编译时返回 serializer_class 的计划（按类缓存），否则返回 None"""
+    if not get_fast_serializer_settings()['ENABLED']:
+        return None
+    try:
+        return _plans[serializer_class]
+    except KeyError:
+        pass
+    try:
+        plan = compile_serializer(serializer_class)
+    except NotCompilable as e:
+        logger.info('%s uses the regular serializer: %s', serializer_class.__name__, e)
+        plan = None
+    _plans[serializer_class] = plan
+    return plan
+
+
+# ---- JSON 编码 ----
+
+def _orjson_default(obj):
+    # 标准库能编码的类型之外的对象（Decimal、懒翻译字符串等）交给 DRF 的编码器处理
+    return encoders.JSONEncoder().default(obj)
+
+
+def dumps(data):
+    """与 DRF JSONRenderer.render(data) 相同的字节"""
+    if get_fast_serializer_settings()['ENCODER'] == 'orjson' and api_settings.UNICODE_JSON and api_settings.COMPACT_JSON:
+        import orjson
+
+        ret = orjson.dumps(data, default=_orjson_default)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+    ret = json.dumps(
+        data, cls=encoders.JSONEncoder,
+        ensure_ascii=not api_settings.UNICODE_JSON,
+        allow_nan=not api_settings.STRICT_JSON,
+        separators=SHORT_SEPARATORS if api_settings.COMPACT_JSON else LONG_SEPARATORS,
+    )
+    # JSONRenderer 总是转义这两个字符，输出才是合法的 JavaScript
+    return ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def stream_json(rows, convert, chunk_size=None):
+    """
+    把 rows 逐块转换、编码成一个 JSON 数组，返回字节块的迭代器（用于 StreamingHttpResponse）
+    拼接后的内容与 dumps(整个列表) 相同；查询集请传入 .iterator()，避免一次性载入所有行
+    """
+    chunk_size = chunk_size or get_fast_serializer_settings()['CHUNK_SIZE']
+    separator = (SHORT_SEPARATORS if api_settings.COMPACT_JSON else LONG_SEPARATORS)[0].encode()
+    rows = iter(rows)
+    yield b'['
+    first = True
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        # 去掉每块数组自己的方括号，块与块之间补上元素分隔符
+        body = dumps([convert(row) for row in chunk])[1:-1]
+        yield body if first else separator + body
+        first = False
+    yield b']'
+
+
+class CompiledListMixin:
+    """
+    ListAPIView 的快速路径：用编译后的 serializer_class 直接转换 values_list() 的行，不构造模型实例
+    行是具名元组，并附带 get_keyset_ordering() 的排序字段，KeysetPagination 可以照常读取游标；
+    序列化器无法编译或 FAST_SERIALIZER['ENABLED'] 为 False 时使用 ListAPIView 原来的实现
+    """
+
+    def list(self, request, *args, **kwargs):
+        plan = get_plan(self.get_serializer_class())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        ordering = self.get_keyset_ordering(request) if hasattr(self, 'get_keyset_ordering') else ()
+        rows = plan.rows(self.filter_queryset(self.get_queryset()), *(field.lstrip('-') for field in ordering))
+        convert = plan.bind(self.get_serializer_context())
+
+        page = self.paginate_queryset(rows)
+        items = list(rows) if page is None else page
+        # 行已经取出，查询耗时不计入序列化耗时
+        start = time.perf_counter()
+        data = [convert(row) for row in items]
+        record_serializer_time(time.perf_counter() - start)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+"""
+密码哈希线程池
+
+PBKDF2 是纯 CPU 计算，hashlib 在计算时会释放 GIL，所以放到线程池里就能真正并行，
+同时不会占住 ASGI 事件循环。线程池大小和排队长度都有上限：
+排队的任务超过上限时直接抛出 HashingPoolSaturated，由视图返回 503（背压），而不是无限堆积请求。
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # 同时计算哈希的线程数
+    'WORKERS': 4,
+    # 除正在计算的任务外，最多允许排队的任务数
+    'MAX_QUEUE': 64,
+    # 登录时发现密码使用旧参数（如迭代次数变化）后的处理方式：
+    # 'sync'       与 Django 默认行为一致，在登录请求中重新哈希并保存
+    # 'background' 登录请求立即返回，重新哈希放到线程池后台执行
+    # 'off'        不升级
+    'UPGRADE_ON_LOGIN': 'background',
+}
+
+
+def get_pool_settings():
+    """合并默认配置和 settings.PASSWORD_HASHING_POOL"""
+    return {**DEFAULTS, **getattr(settings, 'PASSWORD_HASHING_POOL', {})}
+
+
+class HashingPoolSaturated(Exception):
+    """线程池排队已满"""
+
+
+class HashingPool:
+    """带背压和排队深度统计的哈希线程池"""
+
+    def __init__(self, workers, max_queue):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hasher')
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+        self._completed = 0
+
+    def submit(self, func, *args):
+        """提交任务并返回 concurrent.futures.Future；排队已满时抛出 HashingPoolSaturated"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HashingPoolSaturated()
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+        self._slots.release()
+
+    async def run(self, func, *args):
+        """在事件循环中等待线程池执行 func(*args) 的结果"""
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def stats(self):
+        """
+        返回当前指标：
+        in_flight   正在计算或排队中的任务数
+        queue_depth 排队等待线程的任务数
+        """
+        with self._lock:
+            pending = self._pending
+            return {
+                'workers': self.workers,
+                'in_flight': pending,
+                'queue_depth': max(0, pending - self.workers),
+                'completed': self._completed,
+                'rejected': self._rejected,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    """返回进程内唯一的 HashingPool 实例"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                conf = get_pool_settings()
+                _pool = HashingPool(workers=conf['WORKERS'], max_queue=conf['MAX_QUEUE'])
+    return _pool
+
+
+async def ahash_password(raw_password):
+    """在线程池中计算密码哈希"""
+    return await get_hashing_pool().run(make_password, raw_password)
+
+
+async def acheck_password(user, raw_password):
+    """
+    在线程池中校验用户密码，并按 UPGRADE_ON_LOGIN 策略处理需要升级的旧哈希
+    返回 True / False
+    """
+    policy = get_pool_settings()['UPGRADE_ON_LOGIN']
+    pool = get_hashing_pool()
+    upgrade_requested = []
+
+    def setter(raw):
+        # check_password 判断需要升级时才会调用 setter，这里先记下来，由下面按策略处理
+        upgrade_requested.append(raw)
+
+    valid = await pool.run(check_password, raw_password, user.password, setter if policy != 'off' else None)
+
+    if valid and upgrade_requested:
+        if policy == 'sync':
+            await pool.run(_upgrade_password, user.pk, raw_password)
+        elif policy == 'background':
+            try:
+                pool.submit(_upgrade_password, user.pk, raw_password)
+            except HashingPoolSaturated:
+                # 升级只是优化，线程池繁忙时跳过，下次登录再升级
+                logger.info("Skipped password hash upgrade for user %s: hashing pool saturated", user.pk)
+    return valid
+
+
+def _upgrade_password(user_id, raw_password):
+    """用当前默认哈希参数重新计算并保存密码（在线程池中执行）"""
+    from django.db import close_old_connections
+    from api.authentication import invalidate_user
+    from userauths.models import User
+
+    try:
+        User.objects.filter(pk=user_id).update(password=make_password(raw_password))
+        # update() 不会触发 post_save，需要手动让认证缓存失效
+        invalidate_user(user_id)
+    finally:
+        # 线程池中的线程不受请求生命周期管理，用完主动归还数据库连接
+        close_old_connections()
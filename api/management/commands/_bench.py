@@ -0,0 +1,66 @@
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+"""
+基准测试命令共用的小工具（文件名以下划线开头，Django 不会把它当成命令）
+
+所有 bench_* 命令都在一次性的测试数据库里运行，不会改动 db.sqlite3。
+"""
+
+
+@contextmanager
+def throwaway_database(verbosity=0):
+    """创建临时测试数据库（和 manage.py test 一样），退出时销毁"""
+    setup_test_environment()
+    old_config = setup_databases(verbosity, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity)
+        teardown_test_environment()
+
+
+class QueryCounter:
+    """
+    统计执行过的 SQL 语句
+    使用 connection.execute_wrapper 实现，不受测试客户端在每个请求开始时清空 connection.queries 的影响
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries():
+    """with count_queries() as queries: ... 之后 len(queries) 即为执行的语句数"""
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+def measure(func, rounds):
+    """
+    重复执行 func rounds 次
+    返回 (每次平均耗时毫秒, 每次平均 SQL 查询数)
+    """
+    with count_queries() as queries:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func()
+        elapsed = time.perf_counter() - start
+    return elapsed * 1000 / rounds, len(queries) / rounds
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.management.commands._bench import throwaway_database
+from api.serializer import MyTokenObtainPairSerializer
+from api.tokens import CachedAccessToken, get_claims_cache
+from userauths.models import User
+
+
+class Command(BaseCommand):
+    """
+    access token 解码 + 验签的微基准：AccessToken vs CachedAccessToken
+    模拟前端一个页面用同一个 token 连续发出的多次请求
+    用法：python manage.py bench_access_token --rounds 20000
+    """
+    help = "Micro-benchmark AccessToken validation with and without the claims cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=20000, help="每种 token 类的校验次数")
+
+    def handle(self, *args, **options):
+        rounds = options['rounds']
+        with throwaway_database():
+            user = User.objects.create(email='bench@example.com', full_name='bench')
+            raw = str(MyTokenObtainPairSerializer.get_token(user).access_token).encode()
+
+            get_claims_cache().clear()
+            for label, token_class in (('AccessToken', AccessToken), ('CachedAccessToken', CachedAccessToken)):
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    token = token_class(raw)
+                elapsed = time.perf_counter() - start
+                assert token['user_id'] == user.pk
+                self.stdout.write(f"{label:<20} {elapsed * 1e6 / rounds:8.2f} µs/validation")
+
+            # 吊销后必须立即拒绝
+            CachedAccessToken(raw).blacklist()
+            try:
+                CachedAccessToken(raw)
+            except TokenError as e:
+                self.stdout.write(f"revoked token rejected: {e}")
+            else:
+                raise AssertionError("revoked token was accepted")
+            self.stdout.write(f"cache: {get_claims_cache().stats()}")
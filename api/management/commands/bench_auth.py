@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from api.authentication import CachedJWTAuthentication, StatelessJWTAuthentication, get_user_cache
+from api.serializer import MyTokenObtainPairSerializer
+from api.management.commands._bench import measure, throwaway_database
+from userauths.models import User
+
+
+class Command(BaseCommand):
+    """
+    对比不同 JWT 认证方式下，每个已认证请求的 SQL 查询数和耗时
+    用法：python manage.py bench_auth --rounds 1000
+    """
+    help = "Benchmark queries per authenticated request for each JWT authentication backend"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=1000, help="每种认证方式发送的请求数")
+
+    def handle(self, *args, **options):
+        rounds = options['rounds']
+        with throwaway_database():
+            user = User.objects.create(email='bench@example.com', full_name='bench')
+            access = str(MyTokenObtainPairSerializer.get_token(user).access_token)
+            factory = APIRequestFactory()
+
+            backends = [
+                ('JWTAuthentication（原方案）', JWTAuthentication),
+                ('CachedJWTAuthentication', CachedJWTAuthentication),
+                ('StatelessJWTAuthentication', StatelessJWTAuthentication),
+            ]
+            get_user_cache().clear()
+            for label, backend in backends:
+                view = self.build_view(backend)
+
+                def call():
+                    request = factory.get('/bench/', HTTP_AUTHORIZATION=f'Bearer {access}')
+                    response = view(request)
+                    assert response.status_code == 200, response.data
+
+                ms, queries = measure(call, rounds)
+                self.stdout.write(f"{label:<32} {queries:6.3f} queries/request  {ms:8.3f} ms/request")
+
+    @staticmethod
+    def build_view(backend):
+        class WhoAmIView(APIView):
+            authentication_classes = (backend,)
+            permission_classes = (IsAuthenticated,)
+
+            def get(self, request):
+                return Response({'email': request.user.email})
+
+        return WhoAmIView.as_view()
@@ -0,0 +1,120 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from api import views as api_views
+from api.management.commands._bench import measure, throwaway_database
+from api.models import Category, Course
+from api.pagination import KeysetPagination
+from userauths.models import User
+
+
+class Command(BaseCommand):
+    """
+    课程目录分页基准测试
+    在临时数据库中插入 --courses 门课程，分别请求第一页和很深位置的页（用 keyset 游标直接定位），
+    检查每页的 SQL 查询数完全相同，且深页的耗时不超过第一页的 --tolerance 倍，否则命令失败
+    用法：python manage.py bench_catalog --courses 1000000 --rounds 50
+    """
+    help = "Seed a large course catalog and assert constant per-page latency and query count"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=1_000_000, help="插入的课程数")
+        parser.add_argument('--categories', type=int, default=20, help="分类数")
+        parser.add_argument('--rounds', type=int, default=50, help="每个位置请求的次数")
+        parser.add_argument('--tolerance', type=float, default=3.0, help="深页耗时 / 第一页耗时的上限")
+
+    def handle(self, *args, **options):
+        # 测的是查询本身，关闭响应缓存（见 bench_response_cache）
+        with throwaway_database(), override_settings(RESPONSE_CACHE={'ENABLED': False}):
+            start = time.perf_counter()
+            categories = self.seed(options['courses'], options['categories'])
+            self.stdout.write(f"Seeded {options['courses']} courses in {time.perf_counter() - start:.1f}s")
+
+            factory = APIRequestFactory()
+            view = api_views.CourseListView.as_view()
+            failures = []
+            scenarios = [
+                ('all, rating', {'ordering': 'rating'}),
+                ('all, price', {'ordering': 'price'}),
+                ('all, newest', {'ordering': 'newest'}),
+                ('category, rating', {'ordering': 'rating', 'category': categories[0].slug}),
+                ('category, price range', {'ordering': 'price', 'category': categories[0].slug, 'min_price': 20, 'max_price': 80}),
+            ]
+            for label, params in scenarios:
+                results = []
+                for depth, cursor in self.cursors(factory, params):
+                    query = {**params, **({'cursor': cursor} if cursor else {})}
+
+                    def call():
+                        response = view(factory.get('/api/v1/course/', query))
+                        assert response.status_code == 200, response.data
+                        response.render()
+
+                    ms, queries = measure(call, options['rounds'])
+                    results.append((depth, ms, queries))
+                    self.stdout.write(f"{label:<24} row {depth:>9}  {queries:5.1f} queries/page  {ms:8.3f} ms/page")
+
+                first_ms, first_queries = results[0][1], results[0][2]
+                for depth, ms, queries in results[1:]:
+                    if queries != first_queries:
+                        failures.append(f"{label}: row {depth} ran {queries} queries, first page ran {first_queries}")
+                    # 1 ms 的余量，避免第一页本身很快时被计时抖动误判
+                    if ms > first_ms * options['tolerance'] + 1:
+                        failures.append(f"{label}: row {depth} took {ms:.3f} ms, first page took {first_ms:.3f} ms")
+
+        if failures:
+            raise CommandError("Per-page cost is not constant:\n  " + "\n  ".join(failures))
+        self.stdout.write("OK: per-page query count and latency are independent of depth")
+
+    def seed(self, count, category_count, batch_size=10000):
+        teacher = User.objects.create(email='teacher@example.com', full_name='Bench Teacher')
+        categories = Category.objects.bulk_create(
+            Category(title=f'Category {i}', slug=f'category-{i}') for i in range(category_count)
+        )
+        rng = random.Random(42)
+        now = timezone.now()
+        for offset in range(0, count, batch_size):
+            Course.objects.bulk_create(
+                Course(
+                    category=categories[i % category_count],
+                    teacher=teacher,
+                    title=f'Course {i}',
+                    slug=f'course-{i}',
+                    price=Decimal(rng.choice((0, 9, 19, 29, 49, 79, 99, 149))) + Decimal('0.99'),
+                    # 保留一位小数，制造大量相同评分，检查相同值内部翻页也不退化
+                    rating=round(rng.uniform(1, 5), 1),
+                    status=Course.PUBLISHED,
+                    date=now - timedelta(minutes=i),
+                )
+                for i in range(offset, min(offset + batch_size, count))
+            )
+        return categories
+
+    def cursors(self, factory, params):
+        """返回 [(位置, 游标)]：第一页，以及结果集中 1%、50%、99% 处的游标"""
+        view = api_views.CourseListView()
+        request = view.initialize_request(factory.get('/api/v1/course/', params))
+        view.request = request
+        view.format_kwarg = None
+        pagination = KeysetPagination()
+        pagination.ordering = view.get_keyset_ordering(request)
+
+        queryset = view.get_queryset().order_by(*pagination.ordering)
+        total = queryset.count()
+        positions = [0] + sorted({int(total * fraction) for fraction in (0.01, 0.5, 0.99) if int(total * fraction) > 0})
+        result = []
+        for position in positions:
+            if position == 0:
+                result.append((0, None))
+            else:
+                # 只在准备阶段用一次 OFFSET 找到该位置的行
+                row = queryset[position - 1]
+                result.append((position, pagination.encode_cursor(row)))
+        return result
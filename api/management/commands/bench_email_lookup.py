@@ -0,0 +1,68 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.management.commands._bench import measure, throwaway_database
+from userauths.models import User
+
+
+class Command(BaseCommand):
+    """
+    登录 / 注册邮箱查询的基准测试
+    在临时数据库中插入 --users 个用户并 ANALYZE，用随机改变大小写的已有邮箱分别执行：
+        iexact       User.objects.get(email__iexact=...)，原来不区分大小写的写法，无法使用索引
+        login        User.objects.get_by_natural_key(...)，即 LOWER(email) = LOWER(%s)，使用函数唯一索引
+        register     User.objects.by_email(...).exists()，注册时的邮箱唯一性检查
+    login 相对 iexact 的加速比低于 --min-speedup 时命令失败
+    用法：python manage.py bench_email_lookup --users 1000000 --rounds 200
+    """
+    help = "Compare case-insensitive email lookups through the LOWER(email) index with email__iexact"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000, help="插入的用户数")
+        parser.add_argument('--rounds', type=int, default=200, help="每种查询执行的次数")
+        parser.add_argument('--min-speedup', type=float, default=10.0, help="login 相对 iexact 的最低加速比")
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            start = time.perf_counter()
+            self.seed(options['users'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.stdout.write(f"Seeded {options['users']} users in {time.perf_counter() - start:.1f}s")
+
+            rng = random.Random(42)
+            emails = [
+                ''.join(c.upper() if rng.random() < 0.5 else c for c in f'user{rng.randrange(options["users"])}@example.com')
+                for _ in range(options['rounds'])
+            ]
+
+            def cycle(func):
+                values = iter(emails)
+                return lambda: func(next(values))
+
+            # iexact 每次都要扫描全表，只执行 1/10 的次数
+            iexact_rounds = max(1, options['rounds'] // 10)
+            results = {
+                'iexact': measure(cycle(lambda email: User.objects.get(email__iexact=email)), iexact_rounds),
+                'login': measure(cycle(User.objects.get_by_natural_key), options['rounds']),
+                'register': measure(cycle(lambda email: User.objects.by_email(email).exists()), options['rounds']),
+            }
+
+        for name, (ms, queries) in results.items():
+            self.stdout.write(f"{name:<9} {ms:9.3f} ms/lookup  {queries:.1f} queries")
+        speedup = results['iexact'][0] / results['login'][0]
+        self.stdout.write(f"login speedup over iexact: {speedup:.1f}x")
+        if speedup < options['min_speedup']:
+            raise CommandError(f"login lookup is only {speedup:.1f}x faster than email__iexact")
+
+    @staticmethod
+    def seed(count, batch_size=10_000):
+        with transaction.atomic():
+            for offset in range(0, count, batch_size):
+                User.objects.bulk_create(
+                    User(email=f'user{i}@example.com', username=f'user{i}', full_name=f'User {i % 1000}')
+                    for i in range(offset, min(offset + batch_size, count))
+                )
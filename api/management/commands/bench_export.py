@@ -0,0 +1,96 @@
+import os
+import resource
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.management.commands._bench import throwaway_database
+from userauths.export import export_stream
+from userauths.models import Profile, User
+
+
+def current_rss():
+    """当前进程的常驻内存（字节）；没有 /proc 时退化为 ru_maxrss（峰值，只能看出是否继续增长）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Command(BaseCommand):
+    """
+    流式导出的内存基准
+    在临时数据库中插入 --rows 个用户和资料，然后完整消费 export_stream() 的输出（不写文件），
+    每个字节块之后采样一次 RSS。前 --warmup 个块之后的 RSS 作为基线，
+    之后的增长超过 --max-growth MB 时命令失败，即内存随导出的行数增长
+    用法：python manage.py bench_export --rows 5000000
+    """
+    help = "Export millions of users and profiles through the streaming exporter and check that RSS stays flat"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5_000_000, help="插入的用户数（每个用户一条资料）")
+        parser.add_argument('--batch-size', type=int, default=10_000, help="插入数据时每批的行数")
+        parser.add_argument('--warmup', type=int, default=20, help="计算基线前跳过的字节块数")
+        parser.add_argument('--max-growth', type=float, default=32.0, help="基线之后允许的 RSS 增长（MB）")
+
+    def handle(self, *args, **options):
+        failures = []
+
+        with throwaway_database():
+            start = time.perf_counter()
+            self.seed(options['rows'], options['batch_size'])
+            self.stdout.write(f"seeded {options['rows']} users + profiles in {time.perf_counter() - start:.1f} s")
+
+            cases = [
+                ('users.csv', 'users', 'csv', False),
+                ('users.ndjson', 'users', 'ndjson', False),
+                ('profiles.csv.gz', 'profiles', 'csv', True),
+                ('profiles.ndjson.gz', 'profiles', 'ndjson', True),
+            ]
+            for label, dataset, fmt, compress in cases:
+                size, chunks, baseline, peak = 0, 0, None, 0
+                start = time.perf_counter()
+                for chunk in export_stream(dataset, fmt, compress=compress):
+                    size += len(chunk)
+                    chunks += 1
+                    rss = current_rss()
+                    if chunks == options['warmup']:
+                        baseline = rss
+                    peak = max(peak, rss)
+                elapsed = time.perf_counter() - start
+
+                if baseline is None:
+                    failures.append(f"{label}: fewer than {options['warmup']} chunks, use more --rows")
+                    continue
+                growth = (peak - baseline) / 2 ** 20
+                self.stdout.write(
+                    f"{label:<19} {options['rows'] / elapsed:>10,.0f} rows/s  {size / 2 ** 20:9.1f} MB  "
+                    f"rss {baseline / 2 ** 20:7.1f} -> {peak / 2 ** 20:7.1f} MB  (+{growth:.1f} MB)"
+                )
+                if growth > options['max_growth']:
+                    failures.append(f"{label}: RSS grew by {growth:.1f} MB while exporting")
+
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write("OK: memory stayed flat")
+
+    @staticmethod
+    def seed(count, batch_size):
+        # 每批单独 bulk_create：bulk_create 会把传入的对象全部放进一个列表，直接传生成器会占用与表大小相当的内存
+        with transaction.atomic():
+            for offset in range(0, count, batch_size):
+                User.objects.bulk_create(
+                    User(email=f'user{i}@example.com', username=f'user{i}', full_name=f'User {i}')
+                    for i in range(offset, min(offset + batch_size, count))
+                )
+            # bulk_create 不触发 post_save，资料需要单独插入
+            user_ids = User.objects.order_by('id').values_list('id', 'full_name').iterator(chunk_size=batch_size)
+            batch = []
+            for user_id, full_name in user_ids:
+                batch.append(Profile(user_id=user_id, full_name=full_name, country='China', about='Exported profile'))
+                if len(batch) == batch_size:
+                    Profile.objects.bulk_create(batch)
+                    batch = []
+            Profile.objects.bulk_create(batch)
@@ -0,0 +1,106 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api import serializer as api_serializer
+from api.fastserializer import compile_serializer, dumps, stream_json
+from api.management.commands._bench import throwaway_database
+from api.models import Category, Course
+from userauths.models import Profile, User
+
+
+class Command(BaseCommand):
+    """
+    编译序列化器与 DRF 序列化器的对比
+    在临时数据库中插入 --rows 个用户、资料和课程，分别用三种方式把整张表序列化成 JSON：
+        drf       查询模型实例 + Serializer(many=True).data + JSONRenderer
+        compiled  values_list() + 编译后的计划 + dumps()
+        stream    values_list().iterator() + stream_json() 分块编码
+    三种方式的输出必须逐字节相同，compiled 的加速比低于 --min-speedup 时命令失败
+    用法：python manage.py bench_fast_serializer --rows 10000 --rounds 5
+    """
+    help = "Compare compiled read-only serializers with DRF serializers on large lists"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000, help="每张表插入的行数")
+        parser.add_argument('--rounds', type=int, default=5, help="每种方式执行的次数（取最快的一次）")
+        parser.add_argument('--min-speedup', type=float, default=2.0, help="compiled 相对 drf 的最低加速比")
+
+    def handle(self, *args, **options):
+        context = {'request': Request(APIRequestFactory().get('/api/v1/'))}
+        failures = []
+
+        with throwaway_database():
+            self.seed(options['rows'])
+            cases = [
+                ('users', api_serializer.UserSerializer, User.objects.order_by('id')),
+                ('profiles', api_serializer.ProfileSerializer, Profile.objects.order_by('id')),
+                ('courses', api_serializer.CourseListSerializer,
+                 Course.objects.select_related('category', 'teacher').order_by('id')),
+            ]
+            for label, serializer_class, queryset in cases:
+                plan = compile_serializer(serializer_class)
+
+                def drf():
+                    data = serializer_class(list(queryset), many=True, context=context).data
+                    return JSONRenderer().render(data)
+
+                def compiled():
+                    return dumps(plan.serialize(plan.rows(queryset), context))
+
+                def stream():
+                    return b''.join(stream_json(plan.rows(queryset).iterator(), plan.bind(context)))
+
+                outputs, timings = {}, {}
+                for name, func in (('drf', drf), ('compiled', compiled), ('stream', stream)):
+                    best = None
+                    for _ in range(options['rounds']):
+                        start = time.perf_counter()
+                        outputs[name] = func()
+                        elapsed = time.perf_counter() - start
+                        best = elapsed if best is None else min(best, elapsed)
+                    timings[name] = best
+
+                speedup = timings['drf'] / timings['compiled']
+                self.stdout.write(
+                    f"{label:<9} drf {timings['drf'] * 1000:8.1f} ms  "
+                    f"compiled {timings['compiled'] * 1000:8.1f} ms  "
+                    f"stream {timings['stream'] * 1000:8.1f} ms  "
+                    f"speedup {speedup:5.1f}x  ({len(outputs['drf'])} bytes)"
+                )
+                for name in ('compiled', 'stream'):
+                    if outputs[name] != outputs['drf']:
+                        failures.append(f"{label}: {name} output differs from the DRF serializer")
+                if speedup < options['min_speedup']:
+                    failures.append(f"{label}: compiled is only {speedup:.1f}x faster")
+
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write("OK: identical output")
+
+    @staticmethod
+    def seed(count, batch_size=2000):
+        users = User.objects.bulk_create(
+            (User(email=f'user{i}@example.com', username=f'user{i}', full_name=f'User {i}') for i in range(count)),
+            batch_size=batch_size,
+        )
+        # bulk_create 不触发 post_save，资料需要单独插入
+        Profile.objects.bulk_create(
+            (Profile(user=user, full_name=user.full_name, country='China', about='Bench profile ' * 8) for user in users),
+            batch_size=batch_size,
+        )
+        category = Category.objects.create(title='Bench', slug='bench')
+        Course.objects.bulk_create(
+            (
+                Course(
+                    category=category if i % 10 else None, teacher=users[i % 50], title=f'Course {i}',
+                    slug=f'course-{i}', price=i % 100, rating=i % 50 / 10, status=Course.PUBLISHED,
+                    image=f'course_images/{i}.jpg' if i % 2 else None,
+                )
+                for i in range(count)
+            ),
+            batch_size=batch_size,
+        )
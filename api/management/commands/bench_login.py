@@ -0,0 +1,64 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from api.hashing import get_hashing_pool
+from api.management.commands._bench import throwaway_database
+from userauths.models import User
+
+
+class Command(BaseCommand):
+    """
+    登录吞吐量对比：同步 MyTokenObtainPairView vs 异步 token_obtain_view
+    同步接口用线程模拟并发（相当于多个 sync worker），异步接口在单个事件循环中并发
+    用法：python manage.py bench_login --requests 32 --concurrency 8
+    """
+    help = "Compare login throughput of the sync token view and the ASGI token view"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=16, help="每种接口发送的登录请求数")
+        parser.add_argument('--concurrency', type=int, default=4, help="并发数")
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        concurrency = options['concurrency']
+        password = 'Str0ng-Passw0rd!'
+        payload = {'email': 'bench@example.com', 'password': password}
+
+        # 所有请求来自同一个 IP，关闭限流（见 bench_ratelimit）
+        with throwaway_database(), override_settings(AUTH_RATE_LIMIT={'ENABLED': False}):
+            user = User(email='bench@example.com', full_name='bench')
+            user.set_password(password)
+            user.save()
+
+            def sync_login(_):
+                response = Client().post('/api/v1/user/token/', payload, content_type='application/json')
+                assert response.status_code == 200, response.content
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(sync_login, range(total)))
+            self.report('sync  MyTokenObtainPairView', total, time.perf_counter() - start)
+
+            async def async_logins():
+                client = AsyncClient()
+                semaphore = asyncio.Semaphore(concurrency)
+
+                async def login():
+                    async with semaphore:
+                        response = await client.post('/api/v1/user/token/async/', payload, content_type='application/json')
+                        assert response.status_code == 200, response.content
+
+                await asyncio.gather(*(login() for _ in range(total)))
+
+            start = time.perf_counter()
+            asyncio.run(async_logins())
+            self.report('async token_obtain_view', total, time.perf_counter() - start)
+            self.stdout.write(f"hashing pool: {get_hashing_pool().stats()}")
+
+    def report(self, label, total, elapsed):
+        self.stdout.write(f"{label:<28} {total / elapsed:8.2f} logins/s  ({elapsed:.2f}s for {total} requests)")
@@ -0,0 +1,90 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from api.management.commands._bench import throwaway_database
+from api.models import Category, Course
+from core.metrics import get_metrics, make_profile_header, reset_metrics
+
+MIDDLEWARE_PATH = 'core.metrics.MetricsMiddleware'
+
+
+class Command(BaseCommand):
+    """
+    测量 core.metrics.MetricsMiddleware 的开销
+    用两个测试客户端分别经过带 / 不带该中间件的完整中间件链请求课程目录（关闭响应缓存，每次都查询和序列化），
+    两组交替执行 --batches 批，比较每批耗时的中位数；开销超过 --budget 时命令失败
+    最后用签名的 X-Profile 头请求一次，检查采样分析器能正常输出
+    用法：python manage.py bench_metrics --batches 30 --requests 200
+    """
+    help = "Assert that request metrics add less than 2% latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batches', type=int, default=30, help="交替测量的批数")
+        parser.add_argument('--requests', type=int, default=200, help="每批的请求数")
+        parser.add_argument('--budget', type=float, default=0.02, help="允许的开销比例")
+
+    def handle(self, *args, **options):
+        without = [path for path in settings.MIDDLEWARE if path != MIDDLEWARE_PATH]
+        url = '/api/v1/course/?ordering=rating&page_size=20'
+        quiet = {
+            'RESPONSE_CACHE': {'ENABLED': False},
+            'AUTH_RATE_LIMIT': {'ENABLED': False},
+            'METRICS': {**getattr(settings, 'METRICS', {}), 'MULTIPROCESS_DIR': None},
+        }
+
+        with throwaway_database(), override_settings(**quiet):
+            reset_metrics()
+            self.seed()
+            # 测试客户端在第一次请求时按当时的 MIDDLEWARE 构建中间件链，之后一直沿用
+            instrumented = Client()
+            instrumented.get(url)
+            with override_settings(MIDDLEWARE=without):
+                plain = Client()
+                plain.get(url)
+
+            def batch(client):
+                start = time.perf_counter()
+                for _ in range(options['requests']):
+                    response = client.get(url)
+                    assert response.status_code == 200, response.content
+                return time.perf_counter() - start
+
+            timings = {'with': [], 'without': []}
+            for _ in range(options['batches']):
+                timings['with'].append(batch(instrumented))
+                timings['without'].append(batch(plain))
+
+            profiled = instrumented.get(url, HTTP_X_PROFILE=make_profile_header())
+            exported = get_metrics().export()
+            reset_metrics()
+
+        with_ms = statistics.median(timings['with']) * 1000 / options['requests']
+        without_ms = statistics.median(timings['without']) * 1000 / options['requests']
+        overhead = with_ms / without_ms - 1
+        self.stdout.write(f"without metrics: {without_ms:8.3f} ms/request")
+        self.stdout.write(f"with metrics:    {with_ms:8.3f} ms/request  overhead {overhead * 100:+.2f}%")
+        self.stdout.write(
+            f"profiled request: {profiled.get('X-Profile-Samples')} samples -> {profiled.get('X-Profile-File')}"
+        )
+        self.stdout.write(f"exported {len(exported.splitlines())} metric lines")
+
+        if not profiled.has_header('X-Profile-File'):
+            raise CommandError("Signed X-Profile header did not produce a profile")
+        if 'db_queries_total' not in exported or 'serializer_duration_seconds_total' not in exported:
+            raise CommandError("Expected database and serializer metrics in the export")
+        if overhead > options['budget']:
+            raise CommandError(f"Metrics overhead {overhead * 100:.2f}% exceeds {options['budget'] * 100:.0f}% budget")
+        self.stdout.write(f"OK: overhead under {options['budget'] * 100:.0f}%")
+
+    @staticmethod
+    def seed():
+        category = Category.objects.create(title='Bench', slug='bench')
+        Course.objects.bulk_create(
+            Course(category=category, title=f'Course {i}', slug=f'course-{i}', rating=i % 50 / 10, status=Course.PUBLISHED)
+            for i in range(200)
+        )
@@ -0,0 +1,118 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.commands._bench import throwaway_database
+from api.models import Course, Enrollment, Lecture, LectureProgress, Section
+from api.progress import ProgressBuffer, get_progress_settings, record_heartbeat
+from userauths.models import User
+
+
+class Command(BaseCommand):
+    """
+    观看进度压力测试：模拟 --viewers 个用户同时看视频，每人发送 --heartbeats 次心跳
+    用两个 ProgressBuffer 模拟两个 worker 进程，每条心跳随机发往其中一个，
+    并按 --duplicate-rate 把部分心跳再发一次到另一个进程（模拟客户端重试），
+    最后检查数据库中的进度与预期完全一致（没有丢失、没有重复计算），并输出写库次数
+    用法：python manage.py bench_progress --viewers 10000 --heartbeats 20 --threads 32
+    """
+    help = "Load test lecture progress heartbeats with write-behind batching across two simulated processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--viewers', type=int, default=10000, help="同时观看的用户数")
+        parser.add_argument('--heartbeats', type=int, default=20, help="每个用户发送的心跳数")
+        parser.add_argument('--lectures', type=int, default=10, help="课时数")
+        parser.add_argument('--threads', type=int, default=32, help="发送心跳的线程数")
+        parser.add_argument('--duplicate-rate', type=float, default=0.1, help="重复发送心跳的比例")
+        parser.add_argument('--step', type=float, default=5.0, help="两次心跳之间的播放进度（秒）")
+
+    def handle(self, *args, **options):
+        viewers, heartbeats, step = options['viewers'], options['heartbeats'], options['step']
+        with throwaway_database():
+            lectures = self.seed_lectures(options['lectures'], duration=heartbeats * step)
+            user_ids = self.seed_users(viewers, Course.objects.values_list('pk', flat=True).get(slug='bench-course'))
+            conf = get_progress_settings()
+            processes = [
+                ProgressBuffer(conf['FLUSH_INTERVAL'], conf['FLUSH_THRESHOLD'], conf['MAX_PENDING'], conf['BATCH_SIZE'])
+                for _ in range(2)
+            ]
+            rng = random.Random(42)
+            base_ts = int(time.time() * 1000)
+
+            def send(round_index, chunk):
+                latencies = []
+                for user_id in chunk:
+                    lecture_id = lectures[user_id % len(lectures)]
+                    position = (round_index + 1) * step
+                    client_ts = base_ts + round_index * 1000
+                    targets = [rng.choice(processes)]
+                    if rng.random() < options['duplicate_rate']:
+                        targets.append(processes[1] if targets[0] is processes[0] else processes[0])
+                    for buffer in targets:
+                        start = time.perf_counter()
+                        record_heartbeat(user_id, lecture_id, position, client_ts, buffer=buffer)
+                        latencies.append(time.perf_counter() - start)
+                return latencies
+
+            chunk_size = max(1, viewers // options['threads'])
+            chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+            latencies = []
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                for round_index in range(heartbeats):
+                    for result in pool.map(lambda chunk: send(round_index, chunk), chunks):
+                        latencies.extend(result)
+            elapsed = time.perf_counter() - start
+            for buffer in processes:
+                buffer.flush()
+
+            sent = sum(buffer.stats['heartbeats'] for buffer in processes)
+            statements = sum(buffer.stats['statements'] for buffer in processes)
+            rows = sum(buffer.stats['rows_written'] for buffer in processes)
+            latencies.sort()
+            self.stdout.write(f"viewers={viewers} heartbeats={sent} elapsed={elapsed:.2f}s ({sent / elapsed:,.0f} heartbeats/s)")
+            self.stdout.write(
+                f"heartbeat latency p50={latencies[len(latencies) // 2] * 1e6:.0f}us "
+                f"p99={latencies[int(len(latencies) * 0.99)] * 1e6:.0f}us"
+            )
+            self.stdout.write(
+                f"database: {statements} INSERT statements, {rows} rows upserted "
+                f"(naive per-heartbeat writes: {sent})"
+            )
+            self.verify(viewers, heartbeats * step)
+
+    @staticmethod
+    def seed_lectures(count, duration):
+        course = Course.objects.create(title='Bench course', slug='bench-course', status=Course.PUBLISHED)
+        section = Section.objects.create(course=course, title='Section 1', position=0)
+        return [
+            Lecture.objects.create(section=section, title=f'Lecture {i}', position=i, duration=duration).pk
+            for i in range(count)
+        ]
+
+    @staticmethod
+    def seed_users(count, course_id, batch_size=5000):
+        User.objects.bulk_create(
+            (
+                User(email=f'viewer{i}@example.com', username=f'viewer{i}', full_name=f'viewer{i}')
+                for i in range(count)
+            ),
+            batch_size=batch_size,
+        )
+        user_ids = list(User.objects.filter(email__startswith='viewer').values_list('pk', flat=True))
+        # 只有报名了课程的用户的进度会写入
+        Enrollment.objects.bulk_create(
+            (Enrollment(user_id=user_id, course_id=course_id) for user_id in user_ids), batch_size=batch_size,
+        )
+        return user_ids
+
+    def verify(self, viewers, expected_position):
+        rows = LectureProgress.objects.count()
+        wrong = LectureProgress.objects.exclude(
+            position=expected_position, furthest_position=expected_position, completed=True,
+        ).count()
+        if rows != viewers or wrong:
+            raise CommandError(f"Progress mismatch: {rows} rows for {viewers} viewers, {wrong} rows with wrong values")
+        self.stdout.write(f"OK: {rows} progress rows match the last heartbeat of every viewer")
@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, RequestFactory
+from django.test.utils import override_settings
+
+from api.management.commands._bench import throwaway_database
+from api.ratelimit import get_rate_limiter, identities_for, reset_rate_limiter
+from userauths.models import User
+
+
+class Command(BaseCommand):
+    """
+    撞库场景下登录限流的开销
+    用错误密码连续登录同一个账号：锁定之前每次都要计算 PBKDF2，锁定之后请求在哈希之前被拒绝（429），
+    分别统计两种请求的平均耗时，并单独测量一次 RateLimiter.check() 的耗时
+    用法：python manage.py bench_ratelimit --rejected 1000
+    """
+    help = "Compare the cost of a rejected login with a full password check"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rejected', type=int, default=1000, help="锁定后继续发送的登录请求数")
+        parser.add_argument('--checks', type=int, default=100_000, help="直接调用 check() 的次数")
+
+    def handle(self, *args, **options):
+        password = 'Str0ng-Passw0rd!'
+        payload = {'email': 'victim@example.com', 'password': 'wrong-password'}
+        limits = {'STORE': 'local', 'LOCKOUT_THRESHOLDS': {'account': 5, 'ip': 1_000_000}}
+
+        with throwaway_database(), override_settings(AUTH_RATE_LIMIT=limits):
+            reset_rate_limiter()
+            user = User(email='victim@example.com', full_name='victim')
+            user.set_password(password)
+            user.save()
+            client = Client(REMOTE_ADDR='203.0.113.7')
+
+            def login():
+                start = time.perf_counter()
+                response = client.post('/api/v1/user/token/', payload, content_type='application/json')
+                return response.status_code, time.perf_counter() - start
+
+            hashed = []
+            while True:
+                status, elapsed = login()
+                if status == 429:
+                    break
+                if status != 401 or len(hashed) > 100:
+                    raise CommandError(f"Expected the account to be locked after failed logins, got {status}")
+                hashed.append(elapsed)
+
+            rejected = []
+            for _ in range(options['rejected']):
+                status, elapsed = login()
+                if status != 429:
+                    raise CommandError(f"Locked account accepted a login attempt ({status})")
+                rejected.append(elapsed)
+
+            limiter = get_rate_limiter()
+            request = RequestFactory(REMOTE_ADDR='203.0.113.7').post('/api/v1/user/token/')
+            identities = identities_for(request, payload['email'])
+            start = time.perf_counter()
+            for _ in range(options['checks']):
+                limiter.check('login', identities)
+            check_us = (time.perf_counter() - start) * 1e6 / options['checks']
+            reset_rate_limiter()
+
+        hashed_ms = sum(hashed) * 1000 / len(hashed)
+        rejected_ms = sum(rejected) * 1000 / len(rejected)
+        self.stdout.write(f"failed logins before lockout: {len(hashed)}, {hashed_ms:8.3f} ms/request (PBKDF2)")
+        self.stdout.write(f"rejected while locked:        {len(rejected)}, {rejected_ms:8.3f} ms/request (429)")
+        self.stdout.write(f"RateLimiter.check():          {check_us:8.2f} us/call")
+        self.stdout.write(f"a rejected request costs {hashed_ms / rejected_ms:.0f}x less than a password check")
+        if rejected_ms * 10 > hashed_ms:
+            raise CommandError("Rejected requests are not significantly cheaper than password checks")
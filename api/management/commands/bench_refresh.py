@@ -0,0 +1,68 @@
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.utils import timezone
+
+from api.blacklist import get_token_blacklist, reset_token_blacklist
+from api.management.commands._bench import count_queries, throwaway_database
+from api.models import RevokedToken
+from api.serializer import MyTokenObtainPairSerializer
+from userauths.models import User
+
+
+class Command(BaseCommand):
+    """
+    在黑名单中预先写入大量 jti，测量 /api/v1/user/token/refresh/ 的延迟
+    用法：python manage.py bench_refresh --tokens 1000000 10000000 --requests 200
+    """
+    help = "Benchmark refresh latency with millions of revoked tokens"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', type=int, nargs='+', default=[1_000_000], help="黑名单中的 jti 数量，可以给多个")
+        parser.add_argument('--requests', type=int, default=200, help="每组测量的刷新请求数")
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            user = User.objects.create(email='bench@example.com', full_name='bench')
+            client = Client()
+            populated = 0
+            for target in sorted(options['tokens']):
+                self.populate(populated, target)
+                populated = target
+                reset_token_blacklist()
+
+                start = time.perf_counter()
+                get_token_blacklist().warm_up()
+                warmup = time.perf_counter() - start
+
+                first = refresh = str(MyTokenObtainPairSerializer.get_token(user))
+                latencies = []
+                with count_queries() as queries:
+                    for _ in range(options['requests']):
+                        start = time.perf_counter()
+                        response = client.post('/api/v1/user/token/refresh/', {'refresh': refresh}, content_type='application/json')
+                        latencies.append((time.perf_counter() - start) * 1000)
+                        assert response.status_code == 200, response.content
+                        refresh = response.json()['refresh']
+
+                # 轮换后的旧 token 必须被拒绝
+                reused = client.post('/api/v1/user/token/refresh/', {'refresh': first}, content_type='application/json')
+                assert reused.status_code == 401, reused.content
+
+                latencies.sort()
+                self.stdout.write(
+                    f"{target:>11,} revoked  warm-up {warmup:6.2f}s  "
+                    f"p50 {statistics.median(latencies):6.3f} ms  p99 {latencies[int(len(latencies) * 0.99) - 1]:6.3f} ms  "
+                    f"{len(queries) / options['requests']:.2f} queries/refresh"
+                )
+
+    def populate(self, start, end, chunk=50000):
+        expires_at = timezone.now() + timedelta(days=50)
+        for offset in range(start, end, chunk):
+            RevokedToken.objects.bulk_create(
+                [RevokedToken(jti=uuid.uuid4().hex, expires_at=expires_at) for _ in range(min(chunk, end - offset))]
+            )
@@ -0,0 +1,113 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from api import views as api_views
+from api.management.commands._bench import measure, throwaway_database
+from api.models import Category, Course
+from api.response_cache import get_response_cache, reset_response_cache
+
+
+class Command(BaseCommand):
+    """
+    响应缓存基准测试
+    1. 冷缓存时 --threads 个线程同时请求同一页课程目录，检查只有一个请求查询了数据库（请求合并）
+    2. 比较命中缓存和关闭缓存时每次请求的耗时与查询数
+    3. 修改一门课程后，下一次请求必须重新生成（标签失效）
+    4. 条目过期后的 stale 窗口内，并发请求只有一个重新生成，其余返回旧内容
+    用法：python manage.py bench_response_cache --courses 2000 --threads 32 --rounds 500
+    """
+    help = "Measure response cache hit latency and check coalescing, tag invalidation and stale-while-revalidate"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=2000, help="插入的课程数")
+        parser.add_argument('--threads', type=int, default=32, help="并发请求的线程数")
+        parser.add_argument('--rounds', type=int, default=500, help="测量耗时的请求次数")
+
+    def handle(self, *args, **options):
+        failures = []
+        with throwaway_database(), override_settings(RESPONSE_CACHE={'TTL': 60, 'STALE_TTL': 30}):
+            reset_response_cache()
+            self.seed(options['courses'])
+            factory = APIRequestFactory()
+            view = api_views.CourseListView.as_view()
+
+            def call(params=None):
+                response = view(factory.get('/api/v1/course/', params or {'ordering': 'rating'}))
+                assert response.status_code == 200, response.data
+                response.render()
+                return response
+
+            cache = get_response_cache()
+            states = self.concurrent(call, options['threads'])
+            self.stdout.write(f"cold start, {options['threads']} concurrent requests: {self.summary(states)}")
+            if states.count('MISS') != 1:
+                failures.append(f"cold start: {states.count('MISS')} requests hit the database, expected 1")
+
+            hit_ms, hit_queries = measure(call, options['rounds'])
+            with override_settings(RESPONSE_CACHE={'ENABLED': False}):
+                miss_ms, miss_queries = measure(call, options['rounds'])
+            self.stdout.write(f"cached:   {hit_ms:8.3f} ms/request  {hit_queries:4.1f} SQL/request")
+            self.stdout.write(f"uncached: {miss_ms:8.3f} ms/request  {miss_queries:4.1f} SQL/request")
+            if hit_queries:
+                failures.append(f"cache hits ran {hit_queries} SQL statements per request")
+
+            course = Course.objects.order_by('-rating', '-id').first()
+            course.title = 'Renamed course'
+            course.save()
+            response = call()
+            renamed = response.data['results'][0]['title'] == 'Renamed course'
+            self.stdout.write(f"after Course.save(): X-Cache={response['X-Cache']} title updated={renamed}")
+            if response['X-Cache'] != 'MISS' or not renamed:
+                failures.append("saving a course did not invalidate the cached catalog page")
+
+            with override_settings(RESPONSE_CACHE={'TTL': 0.2, 'STALE_TTL': 30}):
+                call({'ordering': 'price'})
+                time.sleep(0.3)
+                states = self.concurrent(lambda: call({'ordering': 'price'}), options['threads'])
+            self.stdout.write(f"expired entry, {options['threads']} concurrent requests: {self.summary(states)}")
+            if states.count('MISS') != 1:
+                failures.append(f"stale window: {states.count('MISS')} requests regenerated the page, expected 1")
+
+            self.stdout.write(f"stats: {cache.snapshot()}")
+            reset_response_cache()
+
+        if failures:
+            raise CommandError("Response cache check failed:\n  " + "\n  ".join(failures))
+        self.stdout.write("OK: coalescing, invalidation and stale-while-revalidate behave as expected")
+
+    @staticmethod
+    def seed(count, batch_size=10000):
+        category = Category.objects.create(title='Bench', slug='bench')
+        for offset in range(0, count, batch_size):
+            Course.objects.bulk_create(
+                Course(
+                    category=category, title=f'Course {i}', slug=f'course-{i}',
+                    rating=i % 50 / 10, status=Course.PUBLISHED,
+                )
+                for i in range(offset, min(offset + batch_size, count))
+            )
+
+    @staticmethod
+    def concurrent(call, threads):
+        """threads 个线程同时发出请求，返回各自的 X-Cache"""
+        barrier = threading.Barrier(threads)
+        states = []
+
+        def worker():
+            barrier.wait()
+            states.append(call()['X-Cache'])
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return states
+
+    @staticmethod
+    def summary(states):
+        return ', '.join(f"{state}={states.count(state)}" for state in sorted(set(states)))
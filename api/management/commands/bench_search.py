@@ -0,0 +1,82 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.commands._bench import measure, throwaway_database
+from api.models import Category, Course
+from api.search import autocomplete_courses, rebuild_index, search_courses
+
+# 常见的课程主题词，其余的词随机生成，模拟长尾词汇
+TOPICS = (
+    'python', 'django', 'react', 'javascript', 'typescript', 'data', 'science', 'machine', 'learning',
+    'design', 'marketing', 'finance', 'photography', 'music', 'guitar', 'excel', 'sql', 'docker', 'kubernetes',
+    'security', 'network', 'cloud', 'aws', 'linux', 'rust', 'golang', 'java', 'spring', 'android', 'ios',
+)
+WORDS = ('beginner', 'complete', 'advanced', 'masterclass', 'bootcamp', 'guide', 'project', 'practical', 'fundamentals')
+
+
+class Command(BaseCommand):
+    """
+    课程全文搜索基准测试
+    在临时数据库中插入 --courses 门课程并重建索引，测量搜索和输入联想的平均耗时，
+    任意一种查询超过 --budget-ms 时命令失败
+    用法：python manage.py bench_search --courses 1000000 --rounds 200
+    """
+    help = "Seed a large course catalog, build the search index and assert query latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=1_000_000, help="插入的课程数")
+        parser.add_argument('--rounds', type=int, default=200, help="每种查询执行的次数")
+        parser.add_argument('--budget-ms', type=float, default=20.0, help="每次查询的耗时上限（毫秒）")
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            start = time.perf_counter()
+            self.seed(options['courses'])
+            self.stdout.write(f"Seeded {options['courses']} courses in {time.perf_counter() - start:.1f}s")
+
+            start = time.perf_counter()
+            rebuild_index(chunk_size=10000)
+            self.stdout.write(f"Built search index in {time.perf_counter() - start:.1f}s")
+
+            queries = [
+                ('search: common term', lambda: search_courses('python')),
+                ('search: two terms', lambda: search_courses('django rest')),
+                ('search: rare term', lambda: search_courses('zyqu')),
+                ('search: prefix', lambda: search_courses('machine lear')),
+                ('autocomplete: 2 chars', lambda: autocomplete_courses('py')),
+                ('autocomplete: 5 chars', lambda: autocomplete_courses('kuber')),
+            ]
+            failures = []
+            for label, func in queries:
+                ms, count = measure(func, options['rounds'])
+                self.stdout.write(f"{label:<24} {ms:8.3f} ms/query  {count:4.1f} SQL/query  {len(func())} results")
+                if ms > options['budget_ms']:
+                    failures.append(f"{label}: {ms:.3f} ms")
+
+        if failures:
+            raise CommandError(f"Queries over {options['budget_ms']} ms budget:\n  " + "\n  ".join(failures))
+        self.stdout.write(f"OK: all queries under {options['budget_ms']} ms")
+
+    @staticmethod
+    def seed(count, batch_size=10000):
+        rng = random.Random(42)
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        vocabulary = [''.join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(20000)]
+        categories = Category.objects.bulk_create(
+            Category(title=topic.title(), slug=topic) for topic in TOPICS
+        )
+        for offset in range(0, count, batch_size):
+            courses = []
+            for i in range(offset, min(offset + batch_size, count)):
+                topic = rng.choice(TOPICS)
+                title = ' '.join([topic, rng.choice(WORDS), *rng.sample(vocabulary, 2)])
+                courses.append(Course(
+                    category=categories[TOPICS.index(topic)],
+                    title=title,
+                    slug=f'course-{i}',
+                    description=' '.join(rng.sample(vocabulary, 20)),
+                    status=Course.PUBLISHED,
+                ))
+            Course.objects.bulk_create(courses)
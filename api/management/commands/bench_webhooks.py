@@ -0,0 +1,112 @@
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from api.management.commands._bench import count_queries, throwaway_database
+from api.models import Course, Enrollment, Order, StripeEvent
+from api.payments import get_stripe_settings, process_pending
+from api.stripe_fake import FakeStripe, sign_webhook
+from userauths.models import User
+
+WEBHOOK_URL = '/api/v1/payments/stripe/webhook/'
+SECRET = 'whsec_bench'
+
+
+class Command(BaseCommand):
+    """
+    Stripe webhook 吞吐量基准测试
+    为 --orders 个待支付订单生成 checkout.session.completed 事件（按 --duplicate-rate 重复推送），
+    用 --threads 个线程并发 POST 到 webhook 接口，测量接收速率；再批量处理收件箱，测量处理速率，
+    最后检查每个订单都恰好创建了一条报名记录。接收速率低于 --target 时命令失败
+    用法：python manage.py bench_webhooks --orders 10000 --threads 16 --target 1000
+    """
+    help = "Benchmark webhook ingest and batched processing throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000, help="订单数（每个订单一个支付成功事件）")
+        parser.add_argument('--courses', type=int, default=50, help="课程数")
+        parser.add_argument('--threads', type=int, default=16, help="并发推送 webhook 的线程数")
+        parser.add_argument('--duplicate-rate', type=float, default=0.1, help="重复推送事件的比例")
+        parser.add_argument('--target', type=float, default=1000, help="webhook 接收速率下限（个/秒）")
+
+    def handle(self, *args, **options):
+        stripe_settings = {**get_stripe_settings(), 'WEBHOOK_SECRET': SECRET}
+        with override_settings(STRIPE=stripe_settings), throwaway_database():
+            payloads = self.seed(options['orders'], options['courses'], options['duplicate_rate'])
+            self.stdout.write(f"Prepared {len(payloads)} webhook deliveries for {options['orders']} orders")
+
+            def deliver(chunk):
+                client = Client()
+                for body in chunk:
+                    response = client.post(
+                        WEBHOOK_URL, body, content_type='application/json',
+                        HTTP_STRIPE_SIGNATURE=sign_webhook(body, SECRET),
+                    )
+                    assert response.status_code == 200, response.content
+
+            threads = options['threads']
+            chunks = [payloads[i::threads] for i in range(threads)]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(deliver, chunks))
+            ingest_elapsed = time.perf_counter() - start
+            ingest_rate = len(payloads) / ingest_elapsed
+            self.stdout.write(
+                f"ingest: {len(payloads)} webhooks in {ingest_elapsed:.2f}s ({ingest_rate:,.0f}/s), "
+                f"{StripeEvent.objects.count()} unique events in inbox"
+            )
+
+            start = time.perf_counter()
+            with count_queries() as queries:
+                processed = process_pending()
+            process_elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"process: {processed} events in {process_elapsed:.2f}s ({processed / process_elapsed:,.0f}/s), "
+                f"{len(queries)} SQL statements"
+            )
+
+            enrollments = Enrollment.objects.count()
+            paid = Order.objects.filter(status=Order.PAID).count()
+            if enrollments != options['orders'] or paid != options['orders']:
+                raise CommandError(f"Expected {options['orders']} paid orders and enrollments, got {paid} and {enrollments}")
+        if ingest_rate < options['target']:
+            raise CommandError(f"Webhook ingest rate {ingest_rate:,.0f}/s is below target {options['target']:,.0f}/s")
+        self.stdout.write("OK: every order paid and enrolled exactly once")
+
+    @staticmethod
+    def seed(order_count, course_count, duplicate_rate):
+        courses = Course.objects.bulk_create(
+            Course(title=f'Course {i}', slug=f'course-{i}', price=Decimal('19.99'), status=Course.PUBLISHED)
+            for i in range(course_count)
+        )
+        User.objects.bulk_create(
+            (User(email=f'buyer{i}@example.com', username=f'buyer{i}', full_name=f'buyer{i}') for i in range(order_count)),
+            batch_size=5000,
+        )
+        user_ids = list(User.objects.filter(email__startswith='buyer').values_list('pk', flat=True))
+        Order.objects.bulk_create(
+            (
+                Order(user_id=user_id, course=courses[i % course_count], amount=Decimal('19.99'), stripe_session_id=f'cs_bench_{i}')
+                for i, user_id in enumerate(user_ids)
+            ),
+            batch_size=5000,
+        )
+
+        fake = FakeStripe()
+        rng = random.Random(42)
+        payloads = []
+        for i in range(order_count):
+            event = fake.complete_session(f'cs_bench_{i}')
+            body = json.dumps(event)
+            payloads.append(body)
+            if rng.random() < duplicate_rate:
+                # Stripe 重复推送同一个事件
+                payloads.append(body)
+        rng.shuffle(payloads)
+        return payloads
@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIClient
+
+from api.management.commands._bench import count_queries, throwaway_database
+from userauths.models import Profile, User
+
+# 各场景允许的 SQL 语句数（包括显式执行的 BEGIN），超出即视为性能回退
+BUDGETS = {
+    # 邮箱唯一性校验 1 条 + 插入用户和资料 2 条（BEGIN 由数据库后端直接执行，不计入）
+    'register': 3,
+    # 按邮箱查询用户（签发 token 不再写 OutstandingToken）
+    'login': 1,
+    # 只更新被修改的资料列
+    'profile_update': 1,
+    # 资料没有任何改动时不访问数据库
+    'profile_noop_save': 0,
+    # 更新用户 + 同步资料中的 full_name + 提交后读回资料版本号写入缓存（userauths/profile_version.py）
+    'user_rename': 3,
+    # 与资料无关的用户字段改动不再查询或写入 Profile
+    'user_unrelated_update': 2,
+}
+
+
+class Command(BaseCommand):
+    """
+    在临时数据库中执行注册、登录、资料更新等场景，统计 SQL 查询数并与 BUDGETS 比较
+    任何场景超出预算时命令以非零状态退出，可以直接放进 CI
+    用法：python manage.py check_query_budgets
+    """
+    help = "Assert the number of SQL queries used by register, login and profile updates"
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            results = self.run_scenarios()
+
+        failed = []
+        for name, count in results.items():
+            budget = BUDGETS[name]
+            status = 'ok' if count <= budget else 'OVER BUDGET'
+            self.stdout.write(f"{name:<24} {count:3d} queries (budget {budget})  {status}")
+            if count > budget:
+                failed.append(name)
+        if failed:
+            raise CommandError(f"Query budget exceeded: {', '.join(failed)}")
+
+    def run_scenarios(self):
+        client = APIClient()
+        password = 'Str0ng-Passw0rd!'
+        results = {}
+
+        def count(name, func):
+            with count_queries() as queries:
+                func()
+            results[name] = len(queries)
+
+        def register():
+            response = client.post('/api/v1/user/register/', {
+                'username': 'Budget User',
+                'email': 'budget@example.com',
+                'password': password,
+                'password2': password,
+            }, format='json')
+            assert response.status_code == 201, response.data
+
+        def login():
+            response = client.post('/api/v1/user/token/', {
+                'email': 'budget@example.com',
+                'password': password,
+            }, format='json')
+            assert response.status_code == 200, response.data
+
+        count('register', register)
+        count('login', login)
+
+        profile = Profile.objects.get(user__email='budget@example.com')
+        profile.country = 'China'
+        count('profile_update', profile.save)
+        count('profile_noop_save', profile.save)
+
+        user = User.objects.get(email='budget@example.com')
+        user.full_name = 'Renamed User'
+        count('user_rename', user.save)
+        assert Profile.objects.get(user=user).full_name == 'Renamed User'
+
+        user.first_name = 'Renamed'
+        count('user_unrelated_update', user.save)
+        return results
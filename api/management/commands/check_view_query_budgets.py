@@ -0,0 +1,140 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api.blacklist import get_token_blacklist
+from api.management.commands._bench import throwaway_database
+from api.models import Category, Course, Enrollment, Lecture, Section, TranscodeJob
+from api.response_cache import reset_response_cache
+from api.serializer import MyTokenObtainPairSerializer
+from core.querybudget import QueryBudgetExceeded
+from userauths.models import User
+
+# 每种数据的行数，大于 N+1 的判定阈值，逐行查询的页面一定会被发现
+ROWS = 12
+
+
+class Command(BaseCommand):
+    """
+    开启 QueryBudgetMiddleware（ACTION=raise），在临时数据库中逐个请求 api 接口和后台列表 / 编辑页
+    每个请求都要满足视图上声明的 query_budget，并且没有重复执行 ROWS 次的同形状查询（N+1）
+    每个接口只请求一次，响应缓存总是未命中；登录限流关闭。任何请求失败时命令以非零状态退出，可以直接放进 CI
+    用法：python manage.py check_view_query_budgets
+    """
+    help = "Request every api view and admin page with query budgets and N+1 detection enforced"
+
+    def handle(self, *args, **options):
+        quiet = {
+            'QUERY_BUDGET': {'ENABLED': True, 'ACTION': 'raise'},
+            'AUTH_RATE_LIMIT': {'ENABLED': False},
+        }
+        with throwaway_database(), override_settings(**quiet):
+            reset_response_cache()
+            data = self.seed()
+            # 和 backend/wsgi.py 一样在处理请求之前加载令牌黑名单，加载的查询不计入第一个需要认证的请求
+            get_token_blacklist().warm_up()
+            failed = []
+            for name, request in self.scenarios(data):
+                try:
+                    response = request()
+                except QueryBudgetExceeded as e:
+                    self.stdout.write(f"{name:<28} OVER BUDGET\n{e}")
+                    failed.append(name)
+                    continue
+                if response.status_code >= 400:
+                    raise CommandError(f"{name}: unexpected status {response.status_code}: {response.content[:200]!r}")
+                self.stdout.write(f"{name:<28} {response['X-Query-Count']:>3} queries  ok")
+
+        if failed:
+            raise CommandError(f"Query budget exceeded: {', '.join(failed)}")
+
+    @staticmethod
+    def seed():
+        password = 'Str0ng-Passw0rd!'
+        admin = User.objects.create_superuser(email='admin@example.com', username='admin', password=password)
+        teacher = User.objects.create(email='teacher@example.com', username='teacher', full_name='Teacher')
+        student = User(email='student@example.com', username='student', full_name='Student')
+        student.set_password(password)
+        student.save()
+        for i in range(ROWS):
+            User.objects.create(email=f'user{i}@example.com', username=f'user{i}', full_name=f'User {i}')
+
+        category = Category.objects.create(title='Python', slug='python')
+        courses = []
+        for i in range(ROWS):
+            course = Course.objects.create(
+                category=category, teacher=teacher, title=f'Course {i}', slug=f'course-{i}',
+                status=Course.PUBLISHED, rating=i % 5,
+            )
+            for s in range(3):
+                section = Section.objects.create(course=course, title=f'Section {s}', position=s)
+                Lecture.objects.bulk_create(
+                    Lecture(section=section, title=f'Lecture {n}', duration=600, position=n) for n in range(4)
+                )
+            courses.append(course)
+        # 最后一门课程留给 checkout 场景
+        Enrollment.objects.bulk_create(Enrollment(user=student, course=course) for course in courses[:-1])
+
+        return {
+            'password': password,
+            'admin': admin,
+            'student': student,
+            'free_course': courses[-1],
+            'lecture': Lecture.objects.filter(section__course=courses[0]).first(),
+            'job': TranscodeJob.objects.create(source='course_videos/source/bench.mp4'),
+        }
+
+    @staticmethod
+    def scenarios(data):
+        def bearer(user):
+            token = MyTokenObtainPairSerializer.get_token(user).access_token
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            return client
+
+        anonymous = APIClient()
+        student = bearer(data['student'])
+        staff = bearer(data['admin'])
+        admin_site = APIClient()
+        admin_site.force_login(data['admin'])
+        lecture = data['lecture']
+        password = data['password']
+
+        def me_not_modified():
+            etag = student.get('/api/v1/user/me/?fields=id,full_name')['ETag']
+            response = student.get('/api/v1/user/me/?fields=id,full_name', HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == 304, response.status_code
+            return response
+
+        return [
+            ('login', lambda: anonymous.post(
+                '/api/v1/user/token/', {'email': 'student@example.com', 'password': password}, format='json',
+            )),
+            ('register', lambda: anonymous.post('/api/v1/user/register/', {
+                'username': 'New User', 'email': 'new@example.com', 'password': password, 'password2': password,
+            }, format='json')),
+            ('categories', lambda: anonymous.get('/api/v1/course/categories/')),
+            ('course list', lambda: anonymous.get('/api/v1/course/?category=python&page_size=20')),
+            ('course detail', lambda: anonymous.get('/api/v1/course/course-0/')),
+            ('course search', lambda: anonymous.get('/api/v1/course/search/?q=course')),
+            ('course autocomplete', lambda: anonymous.get('/api/v1/course/autocomplete/?q=cou')),
+            ('me', lambda: student.get('/api/v1/user/me/')),
+            ('me (not modified)', me_not_modified),
+            ('me update', lambda: student.patch('/api/v1/user/me/', {'country': 'China'}, format='json')),
+            ('my courses', lambda: student.get('/api/v1/student/courses/?page_size=20')),
+            ('progress heartbeat', lambda: student.post(
+                '/api/v1/student/progress/', {'lecture': lecture.pk, 'position': 30}, format='json',
+            )),
+            ('lecture progress', lambda: student.get(f'/api/v1/student/progress/{lecture.pk}/')),
+            ('checkout (free)', lambda: student.post(
+                '/api/v1/checkout/', {'course': data['free_course'].pk}, format='json',
+            )),
+            ('transcode job', lambda: staff.get(f"/api/v1/media/jobs/{data['job'].pk}/")),
+            ('cache stats', lambda: staff.get('/api/v1/cache/stats/')),
+            ('admin user list', lambda: admin_site.get('/admin/userauths/user/')),
+            ('admin user change', lambda: admin_site.get(f"/admin/userauths/user/{data['student'].pk}/change/")),
+            ('admin profile list', lambda: admin_site.get('/admin/userauths/profile/')),
+            ('admin profile change', lambda: admin_site.get(
+                f"/admin/userauths/profile/{data['student'].profile.pk}/change/",
+            )),
+        ]
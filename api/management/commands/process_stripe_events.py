@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.payments import process_pending
+
+
+class Command(BaseCommand):
+    """
+    批量处理 Stripe webhook 收件箱中的事件（更新订单、创建报名）
+    默认常驻运行、收件箱为空时轮询；--once 处理完当前积压的事件后退出（适合 cron）
+    PostgreSQL 上可以同时运行多个进程（SKIP LOCKED），SQLite 上运行一个即可
+    用法：python manage.py process_stripe_events [--once]
+    """
+    help = "Process queued Stripe webhook events in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="处理完积压的事件后退出")
+
+    def handle(self, *args, **options):
+        total = process_pending(
+            stop_when_empty=options['once'],
+            on_batch=lambda done: self.stdout.write(f"  processed {done} events", ending='\r'),
+        )
+        self.stdout.write(f"Processed {total} Stripe events")
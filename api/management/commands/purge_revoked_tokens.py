@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from api.blacklist import get_token_blacklist
+
+
+class Command(BaseCommand):
+    """
+    分批清理已过期的拉黑记录（可以放进 cron 定时执行）
+    每批删除 --chunk-size 条并可以暂停 --sleep 秒，避免长时间锁表
+    已删除的 jti 在各个服务进程的布隆过滤器中留下的位，由这些进程每隔 TOKEN_BLACKLIST['REBUILD_INTERVAL'] 秒在后台重建时去掉
+    用法：python manage.py purge_revoked_tokens --chunk-size 5000 --sleep 0.1 --legacy
+    """
+    help = "Delete expired revoked tokens in small chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="每批删除的记录数")
+        parser.add_argument('--sleep', type=float, default=0, help="每批之间暂停的秒数")
+        parser.add_argument('--legacy', action='store_true', help="同时清理 SimpleJWT token_blacklist 中过期的旧记录")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        now = timezone.now()
+        blacklist = get_token_blacklist()
+
+        total = 0
+        for deleted in blacklist.store.purge_expired(now=now, chunk_size=chunk_size):
+            total += deleted
+            time.sleep(options['sleep'])
+        self.stdout.write(f"Purged {total} expired revoked tokens")
+
+        if options['legacy']:
+            legacy_total = 0
+            while True:
+                ids = list(
+                    OutstandingToken.objects.filter(expires_at__lte=now)
+                    .values_list('pk', flat=True)[:chunk_size]
+                )
+                if not ids:
+                    break
+                # BlacklistedToken 通过外键级联删除
+                deleted, _ = OutstandingToken.objects.filter(pk__in=ids).delete()
+                legacy_total += deleted
+                time.sleep(options['sleep'])
+            self.stdout.write(f"Purged {legacy_total} expired legacy token rows")
@@ -0,0 +1,34 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.payments import process_pending, reconcile
+
+
+class Command(BaseCommand):
+    """
+    对账：从 Stripe 拉取最近 --hours 小时的事件写入收件箱（已收到的忽略），再批量处理
+    用于补齐 webhook 漏收的事件，建议每晚执行一次
+    离线运行整个流程时把 STRIPE['API_BASE'] 指向 api/stripe_fake.py 的假服务器（见 api/tests.py 的 StripeEventTests）
+    用法：python manage.py reconcile_stripe --hours 48
+    """
+    help = "Pull recent Stripe events into the webhook inbox and process them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=48, help="拉取最近多少小时的事件")
+        parser.add_argument('--chunk-size', type=int, default=500, help="每批写入收件箱的事件数")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options['hours'])
+        start = time.perf_counter()
+        fetched = reconcile(
+            since, chunk_size=options['chunk_size'],
+            on_chunk=lambda done: self.stdout.write(f"  fetched {done} events", ending='\r'),
+        )
+        self.stdout.write(f"Fetched {fetched} events in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        processed = process_pending()
+        self.stdout.write(f"Processed {processed} new events in {time.perf_counter() - start:.1f}s")
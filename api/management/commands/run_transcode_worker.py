@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import signal
+import subprocess
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.transcoding import enqueue, get_ffmpeg_binary, get_transcoding_settings, work
+
+
+def worker_main(burst, stop):
+    # Ctrl+C 由主进程处理：通知 worker 做完当前任务后退出，而不是中断 ffmpeg
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(burst=burst, stop=stop)
+
+
+class Command(BaseCommand):
+    """
+    启动视频转码 worker 进程池，从 api.TranscodeJob 表中领取任务执行
+    Ctrl+C / SIGTERM 后等待正在转码的任务完成再退出
+    用法：
+        python manage.py run_transcode_worker --workers 2
+        python manage.py run_transcode_worker --burst             # 处理完积压的任务后退出
+        python manage.py run_transcode_worker --sample --burst    # 生成几秒的测试视频并转码（CPU 即可）
+    """
+    help = "Run background worker processes that transcode uploaded videos to HLS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="worker 进程数，默认取 VIDEO_TRANSCODING['WORKERS']")
+        parser.add_argument('--burst', action='store_true', help="队列为空时退出")
+        parser.add_argument('--sample', action='store_true', help="先用 ffmpeg 生成一个测试视频并加入队列")
+        parser.add_argument('--sample-seconds', type=int, default=4, help="测试视频时长（秒）")
+
+    def handle(self, *args, **options):
+        if options['sample']:
+            job = self.enqueue_sample(options['sample_seconds'])
+            self.stdout.write(f"Enqueued sample transcode job {job.pk}")
+
+        workers = options['workers'] or get_transcoding_settings()['WORKERS']
+        stop = multiprocessing.Event()
+        # fork 前关闭数据库连接，子进程各自重新连接，不能共用父进程的连接
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=worker_main, args=(options['burst'], stop), name=f'transcode-{i}')
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {workers} transcode workers")
+
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for process in processes:
+                process.join()
+
+        if options['sample']:
+            job.refresh_from_db()
+            self.stdout.write(
+                f"Job {job.pk}: status={job.status} progress={job.progress:.0%} duration={job.duration} "
+                f"playlist={job.playlist or '-'} {job.error}"
+            )
+
+    @staticmethod
+    def enqueue_sample(seconds):
+        """用 ffmpeg 的 testsrc / sine 生成带音轨的 640x360 测试视频"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'sample.mp4')
+            subprocess.run([
+                get_ffmpeg_binary(), '-y', '-hide_banner', '-loglevel', 'error',
+                '-f', 'lavfi', '-i', f'testsrc=size=640x360:rate=24:duration={seconds}',
+                '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-shortest',
+                path,
+            ], check=True)
+            with open(path, 'rb') as f:
+                name = default_storage.save('course_videos/source/sample.mp4', File(f))
+        return enqueue(name)
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from api.management.commands._bench import throwaway_database
+
+ENGINES = {
+    'tuned': 'backend.sqlite_backend',
+    'stock': 'django.db.backends.sqlite3',
+}
+
+
+class Command(BaseCommand):
+    """
+    SQLite 多线程压力测试：多个线程同时调用注册接口和刷新 token 接口，统计成功数和错误数
+    测试数据库是临时目录中的 SQLite 文件（内存数据库无法体现文件锁竞争）
+    为了把压力集中在数据库上，压测期间使用 MD5 密码哈希
+    用法：python manage.py stress_sqlite --engine tuned --threads 8 --iterations 50
+    """
+    help = "Run register and token refresh in parallel threads against a SQLite file database"
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', choices=ENGINES, default='tuned', help="tuned: backend.sqlite_backend，stock: Django 自带后端")
+        parser.add_argument('--threads', type=int, default=8, help="并发线程数")
+        parser.add_argument('--iterations', type=int, default=50, help="每个线程的注册 + 刷新次数")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            database = connections.settings['default']
+            if not database['ENGINE'].endswith('sqlite3') and database['ENGINE'] not in ENGINES.values():
+                self.stderr.write("stress_sqlite only runs against SQLite")
+                return
+            database['ENGINE'] = ENGINES[options['engine']]
+            database['TEST'] = {**database.get('TEST', {}), 'NAME': os.path.join(tmp, 'stress.sqlite3')}
+            if 'default' in connections:
+                del connections['default']
+
+            fast_hashers = ['django.contrib.auth.hashers.MD5PasswordHasher']
+            # 所有请求来自同一个 IP，关闭登录 / 注册限流
+            no_limits = {'ENABLED': False}
+            with override_settings(PASSWORD_HASHERS=fast_hashers, AUTH_RATE_LIMIT=no_limits), throwaway_database():
+                results, elapsed = self.run(options['threads'], options['iterations'])
+
+        total = sum(results.values())
+        self.stdout.write(f"engine={options['engine']} threads={options['threads']} requests={total} elapsed={elapsed:.2f}s")
+        for outcome, count in sorted(results.items()):
+            self.stdout.write(f"  {outcome:<28} {count}")
+
+    def run(self, threads, iterations):
+        results = Counter()
+        lock = threading.Lock()
+        password = 'Str0ng-Passw0rd!'
+
+        def record(name, response):
+            with lock:
+                results[f"{name} {response.status_code}"] += 1
+
+        def worker(index):
+            client = Client()
+            refresh = None
+            try:
+                for i in range(iterations):
+                    email = f'stress-{index}-{i}@example.com'
+                    response = client.post('/api/v1/user/register/', {
+                        'username': f'Stress {index} {i}', 'email': email,
+                        'password': password, 'password2': password,
+                    }, content_type='application/json')
+                    record('register', response)
+
+                    if refresh is None:
+                        response = client.post('/api/v1/user/token/', {'email': email, 'password': password}, content_type='application/json')
+                        record('login', response)
+                        refresh = response.json().get('refresh') if response.status_code == 200 else None
+                    if refresh is not None:
+                        response = client.post('/api/v1/user/token/refresh/', {'refresh': refresh}, content_type='application/json')
+                        record('refresh', response)
+                        refresh = response.json().get('refresh') if response.status_code == 200 else None
+            except Exception as e:
+                with lock:
+                    results[f"exception {type(e).__name__}: {e}"[:60]] += 1
+            finally:
+                connections.close_all()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(worker, range(threads)))
+        return results, time.perf_counter() - start
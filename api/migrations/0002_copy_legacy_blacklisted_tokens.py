@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def copy_legacy_blacklisted_tokens(apps, schema_editor):
+    """把 SimpleJWT token_blacklist 中尚未过期的拉黑记录复制到 api.RevokedToken，保证升级后旧 token 仍然无效"""
+    from django.utils import timezone
+
+    BlacklistedToken = apps.get_model('token_blacklist', 'BlacklistedToken')
+    RevokedToken = apps.get_model('api', 'RevokedToken')
+
+    rows = (
+        BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        .values_list('token__jti', 'token__expires_at')
+        .iterator(chunk_size=10000)
+    )
+    batch = []
+    for jti, expires_at in rows:
+        batch.append(RevokedToken(jti=jti, expires_at=expires_at))
+        if len(batch) >= 10000:
+            RevokedToken.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        RevokedToken.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_legacy_blacklisted_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_transcodejob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('slug', models.SlugField(max_length=120, unique=True)),
+                ('active', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name_plural': 'categories',
+            },
+        ),
+        migrations.CreateModel(
+            name='Course',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('slug', models.SlugField(max_length=220, unique=True)),
+                ('description', models.TextField(blank=True, default='')),
+                ('image', models.FileField(blank=True, null=True, upload_to='course_images')),
+                ('price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('language', models.CharField(default='English', max_length=50)),
+                ('level', models.CharField(choices=[('beginner', 'Beginner'), ('intermediate', 'Intermediate'), ('advanced', 'Advanced')], default='beginner', max_length=20)),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('published', 'Published')], default='draft', max_length=20)),
+                ('featured', models.BooleanField(default=False)),
+                ('rating', models.FloatField(default=0)),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('enrollment_count', models.PositiveIntegerField(default=0)),
+                ('date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='courses', to='api.category')),
+                ('teacher', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='teaching_courses', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'category', '-rating', '-id'], name='api_course_cat_rating_idx'), models.Index(fields=['status', 'category', 'price', 'id'], name='api_course_cat_price_idx'), models.Index(fields=['status', '-rating', '-id'], name='api_course_rating_idx'), models.Index(fields=['status', 'price', 'id'], name='api_course_price_idx'), models.Index(fields=['status', '-date', '-id'], name='api_course_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Section',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sections', to='api.course')),
+            ],
+            options={
+                'ordering': ('position', 'id'),
+                'constraints': [models.UniqueConstraint(fields=('course', 'position'), name='api_section_course_position_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Lecture',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('video', models.FileField(blank=True, null=True, upload_to='course_videos/source')),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('preview', models.BooleanField(default=False)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('section', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lectures', to='api.section')),
+                ('transcode_job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.transcodejob')),
+            ],
+            options={
+                'ordering': ('position', 'id'),
+                'constraints': [models.UniqueConstraint(fields=('section', 'position'), name='api_lecture_section_position_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Enrollment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('enrolled_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrollments', to='api.course')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrollments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-id'], name='api_enrollment_user_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'course'), name='api_enrollment_user_course_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+"""
+创建课程全文搜索索引（见 api/search.py），按数据库类型分别处理：
+SQLite 创建 FTS5 虚拟表，PostgreSQL 创建 tsvector 表和 GIN 索引，其他数据库不做任何事
+"""
+
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_course_fts USING fts5("
+    "title, description, category, "
+    "tokenize = 'unicode61 remove_diacritics 2', "
+    "prefix = '2 3 4')"
+)
+
+POSTGRES_CREATE = (
+    "CREATE TABLE IF NOT EXISTS api_course_search ("
+    "course_id bigint PRIMARY KEY REFERENCES api_course (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS api_course_search_document_idx ON api_course_search USING GIN (document)",
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+    elif vendor == 'postgresql':
+        for statement in POSTGRES_CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS api_course_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS api_course_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_course_catalog'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
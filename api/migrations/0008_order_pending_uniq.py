@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fail_duplicate_pending_orders(apps, schema_editor):
+    """同一用户对同一课程有多个待支付订单时（重复点击购买留下的），只保留最新的一个，其余标记为失败"""
+    from django.db.models import Count, Max
+
+    Order = apps.get_model('api', 'Order')
+    duplicates = (
+        Order.objects.filter(status='pending').values('user_id', 'course_id')
+        .annotate(total=Count('id'), latest=Max('id')).filter(total__gt=1)
+    )
+    for row in duplicates:
+        Order.objects.filter(
+            user_id=row['user_id'], course_id=row['course_id'], status='pending', id__lt=row['latest'],
+        ).update(status='failed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_order_stripeevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_pending_orders, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('user', 'course'), name='api_order_pending_uniq'),
+        ),
+    ]
@@ -1,3 +1,364 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
+
+
+class RevokedToken(models.Model):
+    """
+    被拉黑的 refresh token（见 api/blacklist.py）
+    只保存 jti 和过期时间，过期后由 purge_revoked_tokens 命令分批删除
+
+    Fields:
+        jti: token 的唯一标识（唯一索引，用于拉黑检查）
+        expires_at: token 的过期时间（普通索引，用于清理过期记录）
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
+class TranscodeJob(models.Model):
+    """
+    课程视频转码任务（见 api/transcoding.py）
+    数据库即队列：worker 进程用带条件的 UPDATE 抢占任务，并通过租约（locked_until）判断持有者是否还活着，
+    worker 崩溃后租约过期，任务会被其他 worker 重新领取
+
+    Fields:
+        source: 上传的原始视频
+        status: 任务状态
+        progress: 转码进度（0 ~ 1）
+        attempts: 已经尝试的次数，达到 max_attempts 后不再重试
+        run_after: 最早可以执行的时间，失败重试时按指数退避推迟
+        locked_by / locked_until: 当前持有任务的 worker 和租约到期时间
+        duration: 视频时长（秒）
+        poster: 封面图
+        playlist: HLS 主播放列表（master.m3u8）在 MEDIA_ROOT 中的路径
+        error: 最近一次失败的错误信息
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+
+    source = models.FileField(upload_to='course_videos/source')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.FloatField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_until = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    poster = models.CharField(max_length=255, blank=True, default='')
+    playlist = models.CharField(max_length=255, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # worker 领取任务：WHERE status = 'queued' AND run_after <= now ORDER BY run_after
+            models.Index(fields=['status', 'run_after'], name='api_transcode_claim_idx'),
+            # 回收租约过期的任务：WHERE status = 'running' AND locked_until < now
+            models.Index(fields=['status', 'locked_until'], name='api_transcode_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.source.name} ({self.status})'
+
+
+class Category(models.Model):
+    """
+    课程分类
+
+    Fields:
+        title: 分类名称
+        slug: URL 中使用的标识（唯一）
+        active: 是否在目录中显示
+    """
+    title = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=120, unique=True)
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name_plural = 'categories'
+
+    def __str__(self):
+        return self.title
+
+
+class Course(models.Model):
+    """
+    课程
+
+    rating / review_count / enrollment_count 是冗余的统计值，写入评价和报名时更新，
+    目录按评分排序时不需要再聚合子表
+
+    Fields:
+        category: 所属分类
+        teacher: 授课老师（用户）
+        title / slug / description: 标题、URL 标识（唯一）、简介
+        image: 封面图
+        price: 价格
+        language / level: 授课语言、难度
+        status: 发布状态，只有 published 的课程出现在目录中
+        featured: 是否推荐
+        rating / review_count / enrollment_count: 平均评分、评价数、报名人数
+        date: 创建时间
+    """
+    DRAFT = 'draft'
+    PUBLISHED = 'published'
+    STATUS_CHOICES = ((DRAFT, 'Draft'), (PUBLISHED, 'Published'))
+
+    LEVEL_CHOICES = (
+        ('beginner', 'Beginner'),
+        ('intermediate', 'Intermediate'),
+        ('advanced', 'Advanced'),
+    )
+
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='courses')
+    teacher = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='teaching_courses',
+    )
+    title = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=220, unique=True)
+    description = models.TextField(blank=True, default='')
+    image = models.FileField(upload_to='course_images', null=True, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    language = models.CharField(max_length=50, default='English')
+    level = models.CharField(max_length=20, choices=LEVEL_CHOICES, default='beginner')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=DRAFT)
+    featured = models.BooleanField(default=False)
+    rating = models.FloatField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    enrollment_count = models.PositiveIntegerField(default=0)
+    date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # 目录的热点查询都以 status = 'published' 开头，再按排序字段 + id 做 keyset 分页（见 api/pagination.py）
+            # 某个分类下按评分排序：WHERE status = ? AND category_id = ? ORDER BY rating DESC, id DESC
+            models.Index(fields=['status', 'category', '-rating', '-id'], name='api_course_cat_rating_idx'),
+            # 某个分类下按价格排序 / 价格区间筛选
+            models.Index(fields=['status', 'category', 'price', 'id'], name='api_course_cat_price_idx'),
+            # 全部课程按评分排序
+            models.Index(fields=['status', '-rating', '-id'], name='api_course_rating_idx'),
+            # 全部课程按价格排序 / 价格区间筛选
+            models.Index(fields=['status', 'price', 'id'], name='api_course_price_idx'),
+            # 全部课程按上架时间排序（最新课程）
+            models.Index(fields=['status', '-date', '-id'], name='api_course_date_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class Section(models.Model):
+    """
+    课程章节
+
+    Fields:
+        course: 所属课程
+        title: 章节标题
+        position: 在课程中的顺序（同一课程内唯一）
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='sections')
+    title = models.CharField(max_length=200)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ('position', 'id')
+        constraints = [
+            # 同时作为「按课程取章节并排序」的索引
+            models.UniqueConstraint(fields=['course', 'position'], name='api_section_course_position_uniq'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class Lecture(models.Model):
+    """
+    课时（一个视频）
+
+    Fields:
+        section: 所属章节
+        title: 课时标题
+        video: 上传的原始视频
+        transcode_job: 对应的转码任务，完成后从任务中取 HLS 播放地址
+        duration: 视频时长（秒）
+        preview: 是否允许未报名的用户试看
+        position: 在章节中的顺序（同一章节内唯一）
+    """
+    section = models.ForeignKey(Section, on_delete=models.CASCADE, related_name='lectures')
+    title = models.CharField(max_length=200)
+    video = models.FileField(upload_to='course_videos/source', null=True, blank=True)
+    transcode_job = models.ForeignKey(TranscodeJob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    duration = models.FloatField(null=True, blank=True)
+    preview = models.BooleanField(default=False)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ('position', 'id')
+        constraints = [
+            models.UniqueConstraint(fields=['section', 'position'], name='api_lecture_section_position_uniq'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class Enrollment(models.Model):
+    """
+    报名记录（用户购买 / 加入的课程）
+
+    Fields:
+        user: 报名的用户
+        course: 课程
+        enrolled_at: 报名时间
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='enrollments')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='enrollments')
+    enrolled_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            # 同一用户不能重复报名同一课程；也是判断「是否已报名」的索引
+            models.UniqueConstraint(fields=['user', 'course'], name='api_enrollment_user_course_uniq'),
+        ]
+        indexes = [
+            # 我的课程：WHERE user_id = ? ORDER BY id DESC（id 与报名时间同序），keyset 分页
+            models.Index(fields=['user', '-id'], name='api_enrollment_user_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.course_id}'
+
+
+class LectureProgress(models.Model):
+    """
+    用户的课时观看进度（见 api/progress.py）
+    由播放心跳在内存中合并后批量 upsert，所有字段的合并方式都满足幂等、可交换：
+    同一心跳被重复提交、或被多个进程分别写入，结果都一样
+
+    Fields:
+        user / lecture: 用户和课时（联合唯一）
+        position: 最近一次心跳中的播放位置（秒），按客户端时间戳取最新
+        furthest_position: 看到过的最远位置（秒），取最大值
+        completed: 是否已看完，一旦为真不再变回假
+        client_ts: position 对应的客户端时间戳（毫秒），用于判断哪条心跳更新
+        updated_at: 最近一次写入数据库的时间
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='lecture_progress')
+    lecture = models.ForeignKey(Lecture, on_delete=models.CASCADE, related_name='progress')
+    position = models.FloatField(default=0)
+    furthest_position = models.FloatField(default=0)
+    completed = models.BooleanField(default=False)
+    client_ts = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            # upsert 的冲突目标，同时用于按用户查询进度
+            models.UniqueConstraint(fields=['user', 'lecture'], name='api_progress_user_lecture_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} @ {self.lecture_id}: {self.position:.0f}s'
+
+
+class Order(models.Model):
+    """
+    课程订单（见 api/payments.py）
+    支付成功由 Stripe webhook 确认，后台批量处理后创建 Enrollment
+
+    Fields:
+        user / course: 下单的用户和购买的课程
+        amount / currency: 金额和币种（下单时的价格）
+        status: 订单状态
+        stripe_session_id: Stripe Checkout Session id（唯一），webhook 按它找到订单
+        stripe_payment_intent: 支付成功后记录，退款事件按它找到订单
+        created_at / paid_at: 下单时间和支付时间
+    """
+    PENDING = 'pending'
+    PAID = 'paid'
+    FAILED = 'failed'
+    REFUNDED = 'refunded'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (PAID, 'Paid'),
+        (FAILED, 'Failed'),
+        (REFUNDED, 'Refunded'),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='orders')
+    course = models.ForeignKey(Course, on_delete=models.PROTECT, related_name='orders')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, default='usd')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    stripe_session_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    stripe_payment_intent = models.CharField(max_length=255, blank=True, default='', db_index=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # 同一用户对同一课程最多一个待支付订单：重复点击购买时复用已有的支付页面，不会创建两个订单
+            models.UniqueConstraint(
+                fields=['user', 'course'], condition=models.Q(status='pending'), name='api_order_pending_uniq',
+            ),
+        ]
+        indexes = [
+            # 我的订单 / 是否已有未支付订单：WHERE user_id = ? AND course_id = ? AND status = ?
+            models.Index(fields=['user', 'course', 'status'], name='api_order_user_course_idx'),
+        ]
+
+    def __str__(self):
+        return f'Order {self.pk} ({self.status})'
+
+
+class StripeEvent(models.Model):
+    """
+    Stripe webhook 收件箱
+    webhook 只负责验签并插入一行（event_id 唯一，重复推送的事件直接忽略），立即返回 200；
+    由 process_stripe_events 批量处理，nightly 对账任务 reconcile_stripe 补齐漏收的事件
+
+    Fields:
+        event_id: Stripe 事件 id（幂等键）
+        type: 事件类型
+        payload: 事件中的 data.object
+        created: 事件在 Stripe 的创建时间
+        received_at: 收到的时间
+        processed_at: 处理完成的时间，未处理为 NULL
+        attempts / error: 处理失败的次数和最近一次错误
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    created = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # 只索引未处理的事件，处理完的行不会让待处理队列的扫描变慢
+            models.Index(
+                fields=['id'], name='api_stripeevent_pending_idx',
+                condition=models.Q(processed_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.event_id} ({self.type})'
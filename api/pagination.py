@@ -0,0 +1,93 @@
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from core.keyset import decode_cursor, encode_cursor, keyset_condition
+
+"""
+keyset（游标）分页
+
+OFFSET 分页翻到第 n 页时数据库要先扫描并丢弃前面所有的行，页数越深越慢；
+keyset 分页把上一页最后一行的排序字段值编码进 cursor，下一页直接用
+WHERE (rating, id) < (上一页最后的 rating, id) 从索引中定位，每一页的耗时和查询数都与页码无关。
+
+DRF 自带的 CursorPagination 只用第一个排序字段定位，遇到大量相同值（例如同样 4.5 分的课程）时
+仍然要在相同值内部做 OFFSET，所以这里用完整的排序字段组合（最后一个字段必须唯一，一般是 id）。
+视图通过 get_keyset_ordering(request) 返回排序字段，例如 ('-rating', '-id')，需要有对应的联合索引。
+排序条件和游标编码在 core/keyset.py，后台列表页的 keyset 分页也使用它们。
+"""
+
+
+class KeysetPagination(BasePagination):
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = tuple(view.get_keyset_ordering(request))
+        self.model = queryset.model
+        self.page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self.after(cursor))
+
+        # 多取一行用来判断是否还有下一页，不需要 COUNT(*)
+        rows = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def after(self, values):
+        """排在 values 之后的条件，见 core/keyset.py"""
+        return keyset_condition(self.ordering, values)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            return decode_cursor(self.ordering, encoded, self.model)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row):
+        return encode_cursor(self.ordering, row)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_first_link(self):
+        return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'format': 'uri'},
+                'results': schema,
+            },
+        }
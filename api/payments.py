@@ -0,0 +1,389 @@
+import json
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from api.models import Course, Enrollment, Order, StripeEvent
+
+"""
+课程购买与报名（Stripe Checkout）
+
+下单：create_checkout() 创建待支付订单和 Stripe Checkout Session，前端跳转到返回的支付页面；免费课程直接报名。
+  Stripe 的网络请求在事务之外进行，用 idempotency_key 保证一个订单只对应一个 Session。
+
+webhook 收件箱：
+  Stripe 的 webhook 可能在短时间内集中推送（大促、批量退款），也会重复推送同一个事件。
+  webhook 接口只做两件事：验签、把事件插入 api.StripeEvent（event_id 唯一，重复事件被忽略），然后立即返回 200，
+  不在请求里修改订单，突发流量不会占住 Web worker。
+
+批量处理：process_stripe_events 命令每次取出最多 BATCH_SIZE 个未处理的事件，在一个事务里
+  - 按 session id / payment intent 一次性更新所有相关订单的状态
+  - 用一条 bulk_create 为新支付的订单创建 Enrollment（已存在的忽略）
+  - 按实际报名行数重新计算受影响课程的 enrollment_count
+  - 标记这批事件已处理
+  每一步都是幂等的：同一个事件处理两次，结果不变。
+
+对账：reconcile_stripe 命令（每晚执行）从 Stripe 分页拉取最近的事件，补齐 webhook 漏收的部分，再批量处理。
+  STRIPE['API_BASE'] 可以指向 api/stripe_fake.py 的本地假服务器，离线测试整个流程。
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SECRET_KEY': None,
+    'WEBHOOK_SECRET': None,
+    # 指向本地假服务器（见 api/stripe_fake.py）或其他兼容 Stripe 的地址，None 表示官方地址
+    'API_BASE': None,
+    'CURRENCY': 'usd',
+    'SUCCESS_URL': 'http://localhost:5173/payment-success?session_id={CHECKOUT_SESSION_ID}',
+    'CANCEL_URL': 'http://localhost:5173/payment-cancelled',
+    # webhook 签名允许的时间误差（秒）
+    'WEBHOOK_TOLERANCE': 300,
+    # 每个事务处理的事件数
+    'BATCH_SIZE': 500,
+    # 收件箱为空时的轮询间隔（秒）
+    'POLL_INTERVAL': 1.0,
+    # 单个事件最多处理失败的次数，超过后不再重试（留给人工排查）
+    'MAX_ATTEMPTS': 5,
+}
+
+# 会让订单变为已支付的事件
+PAID_EVENTS = ('checkout.session.completed', 'checkout.session.async_payment_succeeded')
+# 会让订单变为失败的事件
+FAILED_EVENTS = ('checkout.session.expired', 'checkout.session.async_payment_failed')
+REFUND_EVENTS = ('charge.refunded',)
+
+
+def get_stripe_settings():
+    """合并默认配置和 settings.STRIPE"""
+    return {**DEFAULTS, **getattr(settings, 'STRIPE', {})}
+
+
+def get_stripe():
+    """返回配置好 api_key / api_base 的 stripe 模块"""
+    import stripe
+
+    conf = get_stripe_settings()
+    stripe.api_key = conf['SECRET_KEY']
+    if conf['API_BASE']:
+        stripe.api_base = conf['API_BASE']
+    return stripe
+
+
+class AlreadyEnrolled(Exception):
+    """用户已经报名了该课程"""
+
+
+def create_checkout(user, course):
+    """
+    为用户购买课程创建订单
+    免费课程直接报名，返回 (订单, None)；付费课程返回 (订单, Stripe 支付页面地址)
+    已有待支付订单（重复点击购买）时返回它的支付页面。
+
+    调用 Stripe 的网络请求都不在事务中，不持有行锁，也不占用 SQLite 后端的进程内写锁（见 backend/sqlite_backend）：
+    1. 短事务：检查报名，取出或插入待支付订单
+    2. 事务外：订单已有 Session 时读取它的状态，没有时创建 Session；idempotency_key 按订单生成，
+       Stripe 请求失败后重试（或并发的重复点击）拿到的是同一个 Session，不会为一个订单创建多个支付页面
+    3. 一条 UPDATE 写入 session id
+    Stripe 请求失败时待支付订单保留（还没有 session id），下次购买时复用
+    """
+    conf = get_stripe_settings()
+    order = pending_order(user, course, conf)
+    if order.status == Order.PAID:
+        return order, None
+
+    stripe = get_stripe()
+    if order.stripe_session_id:
+        session = stripe.checkout.Session.retrieve(order.stripe_session_id)
+        if session.get('status') == 'open':
+            return order, session['url']
+        if session.get('status') == 'complete':
+            # 已经支付，webhook 事件还没有处理
+            raise AlreadyEnrolled()
+        # 支付页面已过期（checkout.session.expired 还没有处理），换一个新的待支付订单
+        Order.objects.filter(pk=order.pk, status=Order.PENDING).update(status=Order.FAILED)
+        order = pending_order(user, course, conf)
+        if order.status == Order.PAID:
+            return order, None
+
+    session = stripe.checkout.Session.create(
+        mode='payment',
+        client_reference_id=str(order.pk),
+        metadata={'order_id': str(order.pk)},
+        customer_email=user.email,
+        line_items=[{
+            'quantity': 1,
+            'price_data': {
+                'currency': order.currency,
+                # 以分为单位；四舍五入，避免 int() 截断浮点误差（19.99 * 100 不能少 1 分）
+                'unit_amount': int((order.amount * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP)),
+                'product_data': {'name': course.title},
+            },
+        }],
+        success_url=conf['SUCCESS_URL'],
+        cancel_url=conf['CANCEL_URL'],
+        idempotency_key=f'checkout-order-{order.pk}',
+    )
+    Order.objects.filter(pk=order.pk, stripe_session_id__isnull=True).update(stripe_session_id=session['id'])
+    order.stripe_session_id = session['id']
+    return order, session['url']
+
+
+def pending_order(user, course, conf):
+    """
+    第 1 步的短事务：已报名时抛出 AlreadyEnrolled；免费课程直接创建已支付订单并报名；
+    付费课程返回已有的待支付订单，没有时插入一个
+    """
+    with transaction.atomic():
+        if Enrollment.objects.filter(user=user, course=course).exists():
+            raise AlreadyEnrolled()
+
+        if not course.price:
+            order = Order.objects.create(
+                user=user, course=course, amount=0, currency=conf['CURRENCY'],
+                status=Order.PAID, paid_at=timezone.now(),
+            )
+            enroll_orders([order])
+            return order
+
+        pending = Order.objects.filter(user=user, course=course, status=Order.PENDING)
+        order = pending.first()
+        if order is not None:
+            return order
+        try:
+            with transaction.atomic():
+                return Order.objects.create(user=user, course=course, amount=course.price, currency=conf['CURRENCY'])
+        except IntegrityError:
+            # 另一个请求同时为这个用户插入了待支付订单（api_order_pending_uniq），复用它
+            return pending.get()
+
+
+class InvalidWebhook(Exception):
+    """签名错误或内容不是合法的事件"""
+
+
+def verify_webhook(payload, signature):
+    """验签并解析 webhook，返回事件 dict"""
+    stripe = get_stripe()
+    conf = get_stripe_settings()
+    try:
+        stripe.WebhookSignature.verify_header(
+            payload.decode('utf-8'), signature or '', conf['WEBHOOK_SECRET'], conf['WEBHOOK_TOLERANCE'],
+        )
+        event = json.loads(payload)
+    except (stripe.error.SignatureVerificationError, ValueError, UnicodeDecodeError) as e:
+        raise InvalidWebhook(str(e))
+    if not isinstance(event, dict) or 'id' not in event or 'type' not in event:
+        raise InvalidWebhook('not a Stripe event')
+    return event
+
+
+def to_inbox(event):
+    created = event.get('created')
+    return StripeEvent(
+        event_id=event['id'],
+        type=event['type'],
+        payload=(event.get('data') or {}).get('object') or {},
+        created=datetime.fromtimestamp(created, tz=dt_timezone.utc) if created else None,
+    )
+
+
+def ingest_events(events):
+    """把事件写入收件箱，已经存在的 event_id 忽略（幂等），返回提交的事件数"""
+    rows = [to_inbox(event) for event in events]
+    StripeEvent.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def claim_batch(batch_size, max_attempts, pks=None):
+    """
+    取出一批未处理的事件（需要在事务中调用），pks 不为空时只在这些事件中取
+    PostgreSQL 上用 SKIP LOCKED，多个处理进程可以同时运行、各自拿到不同的事件
+    """
+    queryset = StripeEvent.objects.filter(processed_at__isnull=True, attempts__lt=max_attempts).order_by('id')
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    connection = connections[router.db_for_write(StripeEvent)]
+    if connection.features.has_select_for_update_skip_locked:
+        queryset = queryset.select_for_update(skip_locked=True)
+    return list(queryset.only('id', 'event_id', 'type', 'payload', 'attempts')[:batch_size])
+
+
+def enroll_orders(orders):
+    """为已支付的订单批量创建报名记录，并重新计算相关课程的报名人数"""
+    if not orders:
+        return
+    Enrollment.objects.bulk_create(
+        [Enrollment(user_id=order.user_id, course_id=order.course_id) for order in orders],
+        ignore_conflicts=True,
+    )
+    refresh_enrollment_counts({order.course_id for order in orders})
+
+
+def refresh_enrollment_counts(course_ids):
+    """按报名表的实际行数更新 enrollment_count（而不是 +1），重复处理也不会多算"""
+    counts = (
+        Enrollment.objects.filter(course_id=OuterRef('pk'))
+        .order_by().values('course_id').annotate(total=Count('id')).values('total')
+    )
+    Course.objects.filter(pk__in=course_ids).update(enrollment_count=Coalesce(Subquery(counts), 0))
+
+
+def apply_events(events):
+    """
+    批量应用一批事件，返回 {'paid': n, 'failed': n, 'refunded': n}
+    同一批中先支付后退款的订单，会先变为已支付再变为已退款
+    """
+    paid_sessions, failed_sessions, refunded_intents = {}, set(), set()
+    for event in events:
+        obj = event.payload or {}
+        if event.type in PAID_EVENTS:
+            if obj.get('payment_status') in ('paid', 'no_payment_required'):
+                paid_sessions[obj.get('id')] = obj.get('payment_intent') or ''
+                failed_sessions.discard(obj.get('id'))
+        elif event.type in FAILED_EVENTS:
+            failed_sessions.add(obj.get('id'))
+        elif event.type in REFUND_EVENTS:
+            # 部分退款时 refunded 为 false，课程仍然有效
+            if obj.get('payment_intent') and obj.get('refunded'):
+                refunded_intents.add(obj['payment_intent'])
+    paid_sessions.pop(None, None)
+    failed_sessions.discard(None)
+
+    now = timezone.now()
+    result = defaultdict(int)
+    if paid_sessions:
+        orders = list(
+            Order.objects.filter(stripe_session_id__in=paid_sessions, status__in=(Order.PENDING, Order.FAILED))
+            .only('id', 'user_id', 'course_id', 'stripe_session_id')
+        )
+        for order in orders:
+            order.status = Order.PAID
+            order.paid_at = now
+            order.stripe_payment_intent = paid_sessions[order.stripe_session_id]
+        Order.objects.bulk_update(orders, ['status', 'paid_at', 'stripe_payment_intent'], batch_size=500)
+        enroll_orders(orders)
+        result['paid'] = len(orders)
+    if failed_sessions:
+        result['failed'] = Order.objects.filter(
+            stripe_session_id__in=failed_sessions, status=Order.PENDING,
+        ).update(status=Order.FAILED)
+    if refunded_intents:
+        orders = list(
+            Order.objects.filter(stripe_payment_intent__in=refunded_intents, status=Order.PAID)
+            .only('id', 'user_id', 'course_id')
+        )
+        if orders:
+            Order.objects.filter(pk__in=[order.pk for order in orders]).update(status=Order.REFUNDED)
+            for course_id, user_ids in group_by_course(orders).items():
+                Enrollment.objects.filter(course_id=course_id, user_id__in=user_ids).delete()
+            refresh_enrollment_counts({order.course_id for order in orders})
+        result['refunded'] = len(orders)
+    return dict(result)
+
+
+def group_by_course(orders):
+    grouped = defaultdict(list)
+    for order in orders:
+        grouped[order.course_id].append(order.user_id)
+    return grouped
+
+
+def process_batch(batch_size=None):
+    """
+    处理一批收件箱中的事件，返回取出的事件数（包括处理失败的；0 表示收件箱已空）
+    整批在一个事务中完成；失败时整批回滚，改为逐个处理这批事件：
+    出错的事件记录错误并增加 attempts 后跳过，不影响同一批中的其他事件
+    """
+    conf = get_stripe_settings()
+    batch_size = batch_size or conf['BATCH_SIZE']
+    alias = router.db_for_write(StripeEvent)
+    events = []
+    try:
+        with transaction.atomic(using=alias):
+            events = claim_batch(batch_size, conf['MAX_ATTEMPTS'])
+            if not events:
+                return 0
+            mark_processed(events)
+        return len(events)
+    except Exception as e:
+        if not events:
+            raise
+        logger.warning("Batch of Stripe events failed, retrying one by one: %s", e)
+    for event in events:
+        process_event(event.pk, conf['MAX_ATTEMPTS'], alias)
+    return len(events)
+
+
+def mark_processed(events):
+    apply_events(events)
+    StripeEvent.objects.filter(pk__in=[event.pk for event in events]).update(processed_at=timezone.now())
+
+
+def process_event(pk, max_attempts, alias):
+    """单独处理一个事件（已被其他进程处理的跳过）；失败时回滚，记录错误并增加 attempts，返回是否成功"""
+    try:
+        with transaction.atomic(using=alias):
+            events = claim_batch(1, max_attempts, pks=[pk])
+            if events:
+                mark_processed(events)
+        return True
+    except Exception as e:
+        logger.exception("Failed to process Stripe event %s", pk)
+        StripeEvent.objects.filter(pk=pk, processed_at__isnull=True).update(attempts=F('attempts') + 1, error=str(e))
+        return False
+
+
+def process_pending(stop_when_empty=True, on_batch=None):
+    """
+    不断处理收件箱中的事件；stop_when_empty=False 时作为常驻进程运行
+    单个事件的失败由 process_batch() 记录在事件上（attempts / error），超过 MAX_ATTEMPTS 后不再取出；
+    这里的异常是整批都无法处理（例如数据库不可用）：一次性运行时直接抛出，常驻进程记录日志后等待下一轮重试
+    """
+    conf = get_stripe_settings()
+    total = 0
+    while True:
+        try:
+            count = process_batch()
+        except Exception:
+            if stop_when_empty:
+                raise
+            logger.exception("Failed to process Stripe events, retrying in %ss", conf['POLL_INTERVAL'])
+            time.sleep(conf['POLL_INTERVAL'])
+            continue
+        total += count
+        if count and on_batch is not None:
+            on_batch(total)
+        if not count:
+            if stop_when_empty:
+                return total
+            time.sleep(conf['POLL_INTERVAL'])
+
+
+def reconcile(since, chunk_size=500, on_chunk=None):
+    """
+    从 Stripe 拉取 since（datetime）之后的所有事件并写入收件箱，返回拉取的事件数
+    auto_paging_iter 按页流式读取，内存中最多保留 chunk_size 个事件
+    """
+    stripe = get_stripe()
+    events = stripe.Event.list(created={'gte': int(since.timestamp())}, limit=100)
+    total = 0
+    chunk = []
+    for event in events.auto_paging_iter():
+        chunk.append(event.to_dict_recursive() if hasattr(event, 'to_dict_recursive') else dict(event))
+        if len(chunk) >= chunk_size:
+            total += ingest_events(chunk)
+            chunk = []
+            if on_chunk is not None:
+                on_chunk(total)
+    if chunk:
+        total += ingest_events(chunk)
+    return total
@@ -0,0 +1,357 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections, router
+from django.utils import timezone
+
+from api.models import Course, Lecture, LectureProgress
+
+"""
+课时观看进度（写回缓冲）
+
+播放器每隔几秒发送一次心跳（当前播放位置），如果每次心跳都写库，1 万人同时看视频就是每秒几千次写入。
+这里先在进程内按 (用户, 课时) 合并心跳，由后台线程每 FLUSH_INTERVAL 秒、或待写条目达到 FLUSH_THRESHOLD 时，
+用一条多行 INSERT ... ON CONFLICT DO UPDATE 批量写入。同一个人在一个周期内的几十次心跳只写一行。
+
+合并规则都是幂等、可交换的（position 按客户端时间戳取最新、furthest_position 取最大、completed 取或），
+所以：
+  - 重试或重复提交的心跳不会被重复计算
+  - 多个 worker 进程各自缓冲、各自写入同一行，数据库中按同样的规则合并，结果与顺序无关
+  - 写入失败时把这一批放回缓冲区下次重试，不会丢失也不会重复累加
+
+心跳接口只检查课时是否存在（走进程内缓存）；写库时每批用一条查询确认用户已报名该课时所属的课程、课程已发布，
+其余的心跳直接丢弃。客户端时间戳最多只能比服务器时间超前 MAX_CLOCK_SKEW 秒，
+否则一条带着很远未来时间戳的心跳会让之后的正常心跳再也无法更新 position。
+
+持久性：进程崩溃时最多丢失最近 FLUSH_INTERVAL 秒（加上一次写入耗时）的心跳；正常退出时会写完缓冲区。
+数据库长时间不可用、缓冲区超过 MAX_PENDING 时，新心跳直接拒绝（接口返回 503），而不是无限占用内存。
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # 两次批量写入之间的最长间隔（秒），也是进程崩溃时最多丢失的心跳时长
+    'FLUSH_INTERVAL': 5.0,
+    # 待写条目达到该数量时提前写入
+    'FLUSH_THRESHOLD': 2000,
+    # 缓冲区上限，超过后拒绝新心跳
+    'MAX_PENDING': 100_000,
+    # 每条 INSERT 语句包含的行数
+    'BATCH_SIZE': 500,
+    # 看到课时时长的多少比例算作看完
+    'COMPLETE_RATIO': 0.95,
+    # 进程内缓存的课时时长数量
+    'LECTURE_CACHE_SIZE': 50_000,
+    # 不存在的课时、时长未知（还没转码完）的课时的缓存时间（秒），之后重新查询
+    'UNKNOWN_DURATION_TTL': 30.0,
+    # 客户端时间戳最多比服务器时间超前的秒数，超出的部分按服务器时间加上这个值处理
+    'MAX_CLOCK_SKEW': 30.0,
+}
+
+
+def get_progress_settings():
+    """合并默认配置和 settings.LECTURE_PROGRESS"""
+    return {**DEFAULTS, **getattr(settings, 'LECTURE_PROGRESS', {})}
+
+
+class ProgressBufferFull(Exception):
+    """缓冲区已满（数据库长时间写入失败）"""
+
+
+class UnknownLecture(Exception):
+    """课时不存在"""
+
+
+class ProgressEntry:
+    """一个 (用户, 课时) 在缓冲区中合并后的进度"""
+    __slots__ = ('position', 'furthest_position', 'completed', 'client_ts')
+
+    def __init__(self, position, furthest_position, completed, client_ts):
+        self.position = position
+        self.furthest_position = furthest_position
+        self.completed = completed
+        self.client_ts = client_ts
+
+    def merge(self, other):
+        """与数据库中 ON CONFLICT 的合并规则一致"""
+        if other.client_ts >= self.client_ts:
+            self.position = other.position
+            self.client_ts = other.client_ts
+        self.furthest_position = max(self.furthest_position, other.furthest_position)
+        self.completed = self.completed or other.completed
+
+    def as_dict(self):
+        return {
+            'position': self.position,
+            'furthest_position': self.furthest_position,
+            'completed': self.completed,
+        }
+
+
+class LectureDurations:
+    """
+    课时时长的进程内 LRU 缓存，心跳不需要每次查询课时表
+    已知的时长一直缓存；不存在的课时（值为 False）和时长未知的课时（值为 0）只缓存 unknown_ttl 秒，
+    之后新建的课时、转码完成的视频可以被重新查到
+    """
+
+    def __init__(self, max_size, unknown_ttl=DEFAULTS['UNKNOWN_DURATION_TTL']):
+        self.max_size = max_size
+        self.unknown_ttl = unknown_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, lecture_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(lecture_id)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(lecture_id)
+                    return value
+                del self._entries[lecture_id]
+        rows = list(Lecture.objects.filter(pk=lecture_id).values_list('duration', flat=True)[:1])
+        # 时长未知（视频还没转码完）时记为 0，只记录位置，不判断是否看完
+        value = (rows[0] or 0) if rows else False
+        expires_at = None if value else now + self.unknown_ttl
+        with self._lock:
+            self._entries[lecture_id] = (value, expires_at)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ProgressBuffer:
+    """按 (用户, 课时) 合并心跳，由后台线程批量写入数据库"""
+
+    def __init__(self, flush_interval, flush_threshold, max_pending, batch_size):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.stats = {'heartbeats': 0, 'rows_written': 0, 'statements': 0, 'flush_errors': 0, 'rejected': 0}
+
+    def add(self, user_id, lecture_id, entry):
+        """合并一次心跳，返回合并后（尚未写库）的进度"""
+        self._ensure_flusher()
+        key = (user_id, lecture_id)
+        with self._lock:
+            current = self._pending.get(key)
+            if current is None:
+                if len(self._pending) >= self.max_pending:
+                    raise ProgressBufferFull()
+                self._pending[key] = current = entry
+            else:
+                current.merge(entry)
+            self.stats['heartbeats'] += 1
+            pending = len(self._pending)
+            result = current.as_dict()
+        if pending >= self.flush_threshold:
+            self._wakeup.set()
+        return result
+
+    def get(self, user_id, lecture_id):
+        with self._lock:
+            entry = self._pending.get((user_id, lecture_id))
+            return None if entry is None else ProgressEntry(
+                entry.position, entry.furthest_position, entry.completed, entry.client_ts,
+            )
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """把当前缓冲区写入数据库，返回写入的行数；失败时放回缓冲区并重新抛出异常"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                write_progress(batch, self.batch_size, self.stats)
+            except Exception:
+                self.stats['flush_errors'] += 1
+                with self._lock:
+                    # 放回期间新来的心跳已经在 _pending 中，用同样的规则合并，不会重复累加
+                    for key, entry in batch.items():
+                        current = self._pending.get(key)
+                        if current is None:
+                            self._pending[key] = entry
+                        else:
+                            entry.merge(current)
+                            self._pending[key] = entry
+                raise
+            return len(batch)
+
+    def _ensure_flusher(self):
+        # gunicorn 等 fork 出 worker 后，父进程中的线程不会被复制，在每个进程中第一次使用时启动
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='progress-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush lecture progress, will retry")
+            finally:
+                # 后台线程不经过请求周期，用完及时归还连接
+                connections.close_all()
+
+
+def allowed_keys(keys, using):
+    """
+    (用户, 课时) 中用户已报名课时所属课程、且课程已发布的部分，一条查询
+    从写库读取：刚报名（例如免费课程）就开始看视频时，只读副本可能还没有这条报名记录
+    """
+    rows = Lecture.objects.using(using).filter(
+        pk__in={lecture_id for _, lecture_id in keys},
+        section__course__status=Course.PUBLISHED,
+        section__course__enrollments__user_id__in={user_id for user_id, _ in keys},
+    ).values_list('section__course__enrollments__user_id', 'pk')
+    return set(rows).intersection(keys)
+
+
+def write_progress(batch, batch_size, stats=None):
+    """
+    批量 upsert：INSERT ... VALUES (...), (...) ON CONFLICT (user_id, lecture_id) DO UPDATE
+    合并规则与 ProgressEntry.merge 一致，SQLite 和 PostgreSQL 通用（只有取最大值的函数名不同）
+    每批先用 allowed_keys() 过滤掉没有报名或课程未发布的心跳
+    """
+    alias = router.db_for_write(LectureProgress)
+    connection = connections[alias]
+    greatest = 'GREATEST' if connection.vendor == 'postgresql' else 'MAX'
+    table = connection.ops.quote_name(LectureProgress._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    items = list(batch.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), batch_size):
+            chunk = items[start:start + batch_size]
+            allowed = allowed_keys([key for key, _ in chunk], alias)
+            if stats is not None:
+                stats['rejected'] += len(chunk) - len(allowed)
+            chunk = [(key, entry) for key, entry in chunk if key in allowed]
+            if not chunk:
+                continue
+            params = []
+            for (user_id, lecture_id), entry in chunk:
+                params.extend((
+                    user_id, lecture_id, entry.position, entry.furthest_position,
+                    entry.completed, entry.client_ts, now,
+                ))
+            values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(chunk))
+            cursor.execute(
+                f"INSERT INTO {table} "
+                f"(user_id, lecture_id, position, furthest_position, completed, client_ts, updated_at) "
+                f"VALUES {values} "
+                f"ON CONFLICT (user_id, lecture_id) DO UPDATE SET "
+                f"position = CASE WHEN excluded.client_ts >= {table}.client_ts "
+                f"THEN excluded.position ELSE {table}.position END, "
+                f"client_ts = {greatest}({table}.client_ts, excluded.client_ts), "
+                f"furthest_position = {greatest}({table}.furthest_position, excluded.furthest_position), "
+                f"completed = ({table}.completed OR excluded.completed), "
+                f"updated_at = excluded.updated_at",
+                params,
+            )
+            if stats is not None:
+                stats['statements'] += 1
+                stats['rows_written'] += len(chunk)
+
+
+_buffer = None
+_durations = None
+_buffer_lock = threading.Lock()
+
+
+def get_progress_buffer():
+    """返回进程内唯一的 ProgressBuffer 实例"""
+    global _buffer, _durations
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                conf = get_progress_settings()
+                _durations = LectureDurations(conf['LECTURE_CACHE_SIZE'], conf['UNKNOWN_DURATION_TTL'])
+                _buffer = ProgressBuffer(
+                    flush_interval=conf['FLUSH_INTERVAL'],
+                    flush_threshold=conf['FLUSH_THRESHOLD'],
+                    max_pending=conf['MAX_PENDING'],
+                    batch_size=conf['BATCH_SIZE'],
+                )
+    return _buffer
+
+
+def get_lecture_durations():
+    get_progress_buffer()
+    return _durations
+
+
+def record_heartbeat(user_id, lecture_id, position, client_ts=None, buffer=None):
+    """
+    记录一次播放心跳，返回合并后的进度
+    client_ts 为客户端时间戳（毫秒），不传时使用服务器时间，最多比服务器时间超前 MAX_CLOCK_SKEW 秒；
+    课时不存在时抛出 UnknownLecture。是否已报名在写库时批量检查（见 allowed_keys）
+    """
+    duration = get_lecture_durations().get(lecture_id)
+    if duration is False:
+        raise UnknownLecture(lecture_id)
+    if duration:
+        position = min(position, duration)
+    conf = get_progress_settings()
+    completed = bool(duration) and position >= duration * conf['COMPLETE_RATIO']
+    now = int(time.time() * 1000)
+    client_ts = now if client_ts is None else min(client_ts, now + int(conf['MAX_CLOCK_SKEW'] * 1000))
+    entry = ProgressEntry(position, position, completed, client_ts)
+    return (buffer or get_progress_buffer()).add(user_id, lecture_id, entry)
+
+
+def get_progress(user_id, lecture_id):
+    """数据库中的进度与本进程缓冲区中尚未写入的心跳合并后的结果"""
+    row = LectureProgress.objects.filter(user_id=user_id, lecture_id=lecture_id).only(
+        'position', 'furthest_position', 'completed', 'client_ts',
+    ).first()
+    entry = None
+    if row is not None:
+        entry = ProgressEntry(row.position, row.furthest_position, row.completed, row.client_ts)
+    pending = get_progress_buffer().get(user_id, lecture_id)
+    if pending is not None:
+        if entry is None:
+            entry = pending
+        else:
+            entry.merge(pending)
+    return entry.as_dict() if entry is not None else {'position': 0, 'furthest_position': 0, 'completed': False}
+
+
+@atexit.register
+def flush_on_exit():
+    """进程正常退出时写完缓冲区"""
+    if _buffer is not None and _buffer.pending_count():
+        try:
+            _buffer.flush()
+        except Exception:
+            logger.exception("Failed to flush lecture progress on exit")
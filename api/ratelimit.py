@@ -0,0 +1,477 @@
+import hashlib
+import ipaddress
+import logging
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+"""
+登录 / 注册接口的限流和暴力破解防护
+
+撞库攻击时每个错误密码都要算一次 PBKDF2（几十到几百毫秒的 CPU），这里在哈希之前拒绝请求：
+DRF 的 throttle 在视图处理之前执行，被拒绝的请求只有几次字典（或一次 Redis 往返）的开销。
+
+限流：滑动窗口计数（当前窗口计数 + 上一个窗口计数按剩余比例折算），按以下维度分别计数：
+    ip       客户端 IP
+    net      IP 所在的网段（IPv4 /24、IPv6 /48），近似同一个 ASN / 机房的一批地址
+    email    登录邮箱（不分来源），限制针对单个账号的分布式猜密码
+规则见 DEFAULTS['RULES']，每条为 (维度, 次数上限, 窗口秒数)，每个请求都计数。
+FAILURE_RULES 的格式相同，但只统计登录失败的次数，达到上限后才拒绝请求：
+按邮箱计数的规则放在这里，否则任何人不停地用某个邮箱请求登录（不管密码对错）就能把这个用户挡在外面。
+
+渐进式锁定：同一账号（邮箱 + 来源网段）或同一 IP 连续登录失败达到阈值后锁定一段时间，
+每次再被锁定时长翻倍（LOCKOUT_BASE * 2 ** (级别 - 1)，最多 LOCKOUT_MAX 秒），登录成功后清零。
+账号按“邮箱 + 网段”锁定，攻击者不能通过故意输错密码把真正的用户从其他网络锁在外面。
+锁定状态压缩成 5 个字节（级别 1 字节 + 解锁时间 4 字节），级别保留 LOCKOUT_MEMORY 秒。
+
+存储：
+    'local'  进程内字典（单进程部署、开发和测试）
+    'redis'  Redis 的原子 INCR，多个 worker 共享计数；Redis 不可用时自动退回进程内计数，不会拒绝所有登录
+key 中的邮箱和 IP 都只保存摘要。
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # 总开关
+    'ENABLED': True,
+    # 计数存储：'local' 或 'redis'
+    'STORE': 'local',
+    # Redis 地址，STORE 为 'redis' 时必填
+    'REDIS_URL': None,
+    # Redis 不可用后，多少秒内直接使用进程内计数，不再尝试连接
+    'REDIS_RETRY_INTERVAL': 5,
+    # key 的前缀
+    'KEY_PREFIX': 'rl',
+    # 进程内存储最多保存的 key 数量，超出后淘汰最久未使用的（防止伪造大量 IP 撑爆内存）
+    'LOCAL_MAX_KEYS': 200_000,
+    # 前面有几层反向代理（从 X-Forwarded-For 右边数第几个地址是客户端），0 表示直接使用 REMOTE_ADDR
+    'TRUSTED_PROXIES': 0,
+    # 限流规则：{场景: ((维度, 次数上限, 窗口秒数), ...)}
+    'RULES': {
+        'login': (('ip', 30, 60), ('net', 300, 60)),
+        'register': (('ip', 20, 3600), ('net', 100, 3600)),
+    },
+    # 只统计失败次数的限流规则，格式同 RULES
+    'FAILURE_RULES': {
+        'login': (('email', 10, 300),),
+    },
+    # 连续失败多少次后锁定：{维度: 阈值}
+    'LOCKOUT_THRESHOLDS': {'account': 5, 'ip': 50},
+    # 统计连续失败的时间范围（秒），超过这个时间没有再失败就重新计数
+    'LOCKOUT_WINDOW': 900,
+    # 第一次锁定的时长和最长锁定时长（秒）
+    'LOCKOUT_BASE': 30,
+    'LOCKOUT_MAX': 3600,
+    # 锁定级别保留多久（秒），期间再被锁定时长继续翻倍
+    'LOCKOUT_MEMORY': 24 * 3600,
+}
+
+
+def get_ratelimit_settings():
+    """合并默认配置和 settings.AUTH_RATE_LIMIT"""
+    return {**DEFAULTS, **getattr(settings, 'AUTH_RATE_LIMIT', {})}
+
+
+# 锁定状态：级别（0 ~ 255）+ 解锁时间（Unix 秒，够用到 2106 年）
+LOCK_STATE = struct.Struct('!BI')
+
+
+def pack_lock(level, locked_until):
+    return LOCK_STATE.pack(min(level, 255), int(locked_until))
+
+
+def unpack_lock(value):
+    """返回 (级别, 解锁时间)，没有记录时返回 (0, 0)"""
+    if not value:
+        return 0, 0
+    return LOCK_STATE.unpack(value)
+
+
+class LocalCounterStore:
+    """进程内计数存储，key 带过期时间，总数超过上限时按 LRU 淘汰"""
+    blocking = False
+
+    def __init__(self, max_keys=200_000):
+        self.max_keys = max_keys
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def _put(self, key, value, ttl, now):
+        self._data[key] = [value, now + ttl]
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_keys:
+            self._data.popitem(last=False)
+
+    def hit_many(self, windows):
+        """windows 为 [(当前窗口 key, 上一窗口 key, ttl)]，当前窗口计数加一，返回 [(当前计数, 上一窗口计数)]"""
+        now = time.monotonic()
+        result = []
+        with self._lock:
+            for current, previous, ttl in windows:
+                entry = self._get(current, now)
+                if entry is None:
+                    self._put(current, 1, ttl, now)
+                    count = 1
+                else:
+                    entry[0] += 1
+                    count = entry[0]
+                previous_entry = self._get(previous, now)
+                result.append((count, previous_entry[0] if previous_entry else 0))
+        return result
+
+    def incr(self, key, ttl):
+        """计数加一，key 第一次出现时设置过期时间"""
+        return self.hit_many([(key, key, ttl)])[0][0]
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            return [entry[0] if (entry := self._get(key, now)) else None for key in keys]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._put(key, value, ttl, time.monotonic())
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCounterStore:
+    """
+    Redis 计数存储
+    每次检查用一个 MULTI 事务完成：SET key 0 EX ttl NX（只在第一次设置过期时间）+ INCR + GET 上一窗口，
+    计数是原子的，多个 worker 之间不会丢失或重复
+    Redis 出错时记录日志，REDIS_RETRY_INTERVAL 秒内改用进程内存储
+    """
+    blocking = True
+
+    def __init__(self, client, fallback, retry_interval=5):
+        import redis  # 可选依赖，只有使用 Redis 存储时才需要安装
+
+        self.client = client
+        self.fallback = fallback
+        self.retry_interval = retry_interval
+        self.errors = (redis.RedisError,)
+        self._down_until = 0.0
+
+    def _call(self, method, *args):
+        if time.monotonic() >= self._down_until:
+            try:
+                return getattr(self, f'_redis_{method}')(*args)
+            except self.errors:
+                logger.warning("Rate limit store unavailable, using in-process counters", exc_info=True)
+                self._down_until = time.monotonic() + self.retry_interval
+        return getattr(self.fallback, method)(*args)
+
+    def hit_many(self, windows):
+        return self._call('hit_many', windows)
+
+    def incr(self, key, ttl):
+        return self._call('incr', key, ttl)
+
+    def get_many(self, keys):
+        return self._call('get_many', keys)
+
+    def set(self, key, value, ttl):
+        return self._call('set', key, value, ttl)
+
+    def delete(self, *keys):
+        return self._call('delete', *keys)
+
+    def _redis_hit_many(self, windows):
+        pipe = self.client.pipeline(transaction=True)
+        for current, previous, ttl in windows:
+            pipe.set(current, 0, ex=int(ttl), nx=True)
+            pipe.incr(current)
+            pipe.get(previous)
+        replies = pipe.execute()
+        return [
+            (int(replies[index + 1]), int(replies[index + 2] or 0))
+            for index in range(0, len(replies), 3)
+        ]
+
+    def _redis_incr(self, key, ttl):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(key, 0, ex=int(ttl), nx=True)
+        pipe.incr(key)
+        return int(pipe.execute()[1])
+
+    def _redis_get_many(self, keys):
+        return self.client.mget(keys)
+
+    def _redis_set(self, key, value, ttl):
+        self.client.set(key, value, ex=int(ttl))
+
+    def _redis_delete(self, *keys):
+        self.client.delete(*keys)
+
+
+class RateLimiter:
+    """滑动窗口限流 + 渐进式锁定"""
+
+    def __init__(self, store, rules, lockout_thresholds, lockout_window, lockout_base, lockout_max,
+                 lockout_memory, key_prefix='rl', failure_rules=None):
+        self.store = store
+        self.rules = rules
+        self.failure_rules = failure_rules or {}
+        self.lockout_thresholds = lockout_thresholds
+        self.lockout_window = lockout_window
+        self.lockout_base = lockout_base
+        self.lockout_max = lockout_max
+        self.lockout_memory = lockout_memory
+        self.key_prefix = key_prefix
+        self.stats = {'allowed': 0, 'rejected': 0, 'locked': 0, 'failures': 0, 'lockouts': 0}
+
+    def _digest(self, value):
+        return hashlib.blake2b(value.encode('utf-8'), digest_size=8).hexdigest()
+
+    def _lock_key(self, kind, value):
+        return f'{self.key_prefix}:lock:{kind}:{self._digest(value)}'
+
+    def _fail_key(self, kind, value):
+        return f'{self.key_prefix}:fail:{kind}:{self._digest(value)}'
+
+    def _lockable(self, identities):
+        return [(kind, identities[kind]) for kind in self.lockout_thresholds if identities.get(kind)]
+
+    def _windows(self, scope, rules, identities, now, counter=''):
+        """返回 [(当前窗口 key, 上一窗口 key, ttl)] 和对应的 [(次数上限, 窗口秒数, 当前窗口已过去的秒数)]"""
+        windows, limits = [], []
+        for kind, limit, window in rules.get(scope, ()):
+            value = identities.get(kind)
+            if not value:
+                continue
+            bucket, elapsed = divmod(now, window)
+            base = f'{self.key_prefix}:{scope}{counter}:{kind}:{window}:{self._digest(value)}'
+            # 当前窗口的计数要保留到下一个窗口结束，作为那时的“上一窗口”
+            windows.append((f'{base}:{int(bucket)}', f'{base}:{int(bucket) - 1}', window * 2))
+            limits.append((limit, window, elapsed))
+        return windows, limits
+
+    def check(self, scope, identities):
+        """
+        检查一次请求，返回需要等待的秒数，0 表示放行
+        identities 为 {维度: 值}，值为空的维度不参与计数
+        """
+        now = time.time()
+        lockable = self._lockable(identities)
+        if lockable:
+            states = self.store.get_many([self._lock_key(kind, value) for kind, value in lockable])
+            locked_until = max(unpack_lock(state)[1] for state in states)
+            if locked_until > now:
+                self.stats['locked'] += 1
+                return int(locked_until - now) + 1
+
+        # 失败次数只读不加：本次请求是否失败要等校验密码之后才知道（见 record_failure）
+        windows, limits = self._windows(scope, self.failure_rules, identities, now, ':fail')
+        if windows:
+            counts = self.store.get_many([key for window in windows for key in window[:2]])
+            for index, (limit, window, elapsed) in enumerate(limits):
+                current, previous = (int(count or 0) for count in counts[index * 2:index * 2 + 2])
+                if previous * (1 - elapsed / window) + current >= limit:
+                    self.stats['rejected'] += 1
+                    return int(window - elapsed) + 1
+
+        windows, limits = self._windows(scope, self.rules, identities, now)
+        if windows:
+            for (current, previous), (limit, window, elapsed) in zip(self.store.hit_many(windows), limits):
+                if previous * (1 - elapsed / window) + current > limit:
+                    self.stats['rejected'] += 1
+                    return int(window - elapsed) + 1
+        self.stats['allowed'] += 1
+        return 0
+
+    def record_failure(self, identities, scope='login'):
+        """
+        记录一次登录失败（FAILURE_RULES 的计数加一），返回新锁定的秒数（没有触发锁定时返回 0）
+        计数用原子 INCR，只有恰好达到阈值的那个请求写入锁定状态，并发失败不会重复加级
+        """
+        self.stats['failures'] += 1
+        windows, _ = self._windows(scope, self.failure_rules, identities, time.time(), ':fail')
+        if windows:
+            self.store.hit_many(windows)
+        locked_for = 0
+        for kind, value in self._lockable(identities):
+            fail_key = self._fail_key(kind, value)
+            if self.store.incr(fail_key, self.lockout_window) != self.lockout_thresholds[kind]:
+                continue
+            lock_key = self._lock_key(kind, value)
+            level = unpack_lock(self.store.get_many([lock_key])[0])[0] + 1
+            duration = min(self.lockout_base * 2 ** (level - 1), self.lockout_max)
+            self.store.set(lock_key, pack_lock(level, time.time() + duration), max(self.lockout_memory, duration))
+            self.store.delete(fail_key)
+            self.stats['lockouts'] += 1
+            locked_for = max(locked_for, duration)
+        return locked_for
+
+    def record_success(self, identities):
+        """登录成功后清除账号的失败计数和锁定级别（IP 维度不清除，同一 IP 上可能还有攻击者）"""
+        account = identities.get('account')
+        if account:
+            self.store.delete(self._fail_key('account', account), self._lock_key('account', account))
+
+
+def client_ip(request, trusted_proxies=None):
+    """客户端 IP：没有反向代理时取 REMOTE_ADDR，否则取 X-Forwarded-For 中由最外层可信代理写入的地址"""
+    if trusted_proxies is None:
+        trusted_proxies = get_ratelimit_settings()['TRUSTED_PROXIES']
+    if trusted_proxies:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        if len(forwarded) >= trusted_proxies:
+            return forwarded[-trusted_proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def network_of(ip):
+    """IP 所在的网段：IPv4 /24、IPv6 /48；无法解析时返回空字符串"""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return ''
+    prefix = 24 if address.version == 4 else 48
+    return str(ipaddress.ip_network(f'{address}/{prefix}', strict=False))
+
+
+def identities_for(request, email=None):
+    """从请求中取出限流用到的各个维度"""
+    ip = client_ip(request)
+    net = network_of(ip)
+    # 请求体里的 email 可能是任意 JSON 值
+    email = email.strip().lower() if isinstance(email, str) else ''
+    return {
+        'ip': ip,
+        'net': net,
+        'email': email,
+        'account': f'{email}|{net}' if email else '',
+    }
+
+
+def build_store(conf):
+    """根据配置创建计数存储"""
+    local = LocalCounterStore(conf['LOCAL_MAX_KEYS'])
+    if conf['STORE'] == 'local':
+        return local
+    if conf['STORE'] == 'redis':
+        import redis  # 可选依赖，只有使用 Redis 存储时才需要安装
+
+        client = redis.Redis.from_url(conf['REDIS_URL'], socket_timeout=0.1, socket_connect_timeout=0.1)
+        return RedisCounterStore(client, fallback=local, retry_interval=conf['REDIS_RETRY_INTERVAL'])
+    raise ValueError(f"Unknown AUTH_RATE_LIMIT store: {conf['STORE']}")
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """返回进程内唯一的 RateLimiter 实例"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                conf = get_ratelimit_settings()
+                _limiter = RateLimiter(
+                    store=build_store(conf),
+                    rules=conf['RULES'],
+                    failure_rules=conf['FAILURE_RULES'],
+                    lockout_thresholds=conf['LOCKOUT_THRESHOLDS'],
+                    lockout_window=conf['LOCKOUT_WINDOW'],
+                    lockout_base=conf['LOCKOUT_BASE'],
+                    lockout_max=conf['LOCKOUT_MAX'],
+                    lockout_memory=conf['LOCKOUT_MEMORY'],
+                    key_prefix=conf['KEY_PREFIX'],
+                )
+    return _limiter
+
+
+def reset_rate_limiter():
+    """丢弃当前实例，下次使用时按最新配置重建"""
+    global _limiter
+    with _limiter_lock:
+        _limiter = None
+
+
+class AuthRateThrottle(BaseThrottle):
+    """
+    DRF throttle：在视图处理（以及密码哈希）之前检查限流和锁定
+    子类通过 scope 指定使用 RULES 中的哪一组规则
+    """
+    scope = None
+
+    def allow_request(self, request, view):
+        if not get_ratelimit_settings()['ENABLED']:
+            return True
+        try:
+            email = request.data.get('email') if hasattr(request.data, 'get') else None
+        except Exception:
+            # 请求体无法解析：交给视图返回 400
+            email = None
+        self.retry_after = get_rate_limiter().check(self.scope, identities_for(request, email))
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
+
+
+class LoginRateThrottle(AuthRateThrottle):
+    scope = 'login'
+
+
+class RegisterRateThrottle(AuthRateThrottle):
+    scope = 'register'
+
+
+def record_login_failure(request, email):
+    """登录失败后调用（用户不存在或密码错误）"""
+    if get_ratelimit_settings()['ENABLED']:
+        get_rate_limiter().record_failure(identities_for(request, email))
+
+
+def record_login_success(request, email):
+    if get_ratelimit_settings()['ENABLED']:
+        get_rate_limiter().record_success(identities_for(request, email))
+
+
+async def _call(method, *args):
+    # 进程内存储只是几次字典操作，直接在事件循环中执行；Redis 存储放到线程中，避免阻塞事件循环
+    if get_rate_limiter().store.blocking:
+        return await sync_to_async(method)(*args)
+    return method(*args)
+
+
+async def acheck(scope, request, email=None):
+    """异步视图使用的 check()，返回需要等待的秒数，0 表示放行"""
+    if not get_ratelimit_settings()['ENABLED']:
+        return 0
+    return await _call(get_rate_limiter().check, scope, identities_for(request, email))
+
+
+async def arecord_login_failure(request, email):
+    if get_ratelimit_settings()['ENABLED']:
+        await _call(get_rate_limiter().record_failure, identities_for(request, email))
+
+
+async def arecord_login_success(request, email):
+    if get_ratelimit_settings()['ENABLED']:
+        await _call(get_rate_limiter().record_success, identities_for(request, email))
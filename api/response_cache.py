@@ -0,0 +1,565 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from rest_framework.response import Response
+
+from api.models import Category, Course, Lecture, Section
+from userauths.models import User
+
+"""
+公开只读接口的响应缓存
+
+缓存的是序列化后的 response.data（而不是渲染后的字节），命中时跳过查询和序列化，渲染仍由 DRF 完成，
+所以同一份缓存可以按 JSON / Browsable API 等不同格式返回。
+
+缓存 key = 视图名 + 路径 + 排序后的查询参数 + 认证范围：
+    'public'  所有人共用一份（内容与当前用户无关的接口，如课程目录）
+    'user'    每个登录用户各自一份，匿名用户共用一份
+
+两级存储：
+    第一级：进程内 OrderedDict，按最近使用淘汰
+    第二级：可选的 Django 共享缓存（settings.CACHES 中的别名），多个 worker 共用
+
+按标签失效：每个条目记录写入时各个标签的版本号，标签的版本号保存在共享缓存中；
+模型保存 / 删除时（事务提交后）把相关标签的版本号加一，读取时版本号对不上就当作未命中，
+不需要知道有哪些 key 用到了这个标签。其他进程最多在 TAG_CHECK_INTERVAL 秒后看到新版本号。
+生成响应期间任何进程发生过失效（共享缓存中的失效计数改变）时，这次生成的结果不写入缓存。
+
+防止缓存击穿：
+    - 同一进程内同一个 key 同时未命中时，只有一个请求查询数据库，其余的等待它的结果（请求合并）
+    - 多个进程之间用共享缓存的 add() 作为短时锁，拿不到锁的进程先等一会儿再读缓存
+    - 条目过期后的 STALE_TTL 秒内仍可使用（stale-while-revalidate）：一个请求负责重新生成，
+      其他请求直接返回旧内容，不会在过期的瞬间一起打到数据库
+
+只缓存 GET / HEAD 的 200 响应。QuerySet.update() 不会触发信号，批量修改后需要手动调用 invalidate_tags()。
+
+同一套版本号还可以用作条件请求的校验值（ResponseCache.validator()），
+判断“是否修改过”只需要读版本号，不需要查询数据库；只用进程内缓存时各个进程的版本号互不相同。
+"""
+
+# 默认配置，可以在 settings.py 中用 RESPONSE_CACHE 覆盖其中任意一项
+DEFAULTS = {
+    # 总开关
+    'ENABLED': True,
+    # 进程内最多缓存的响应数
+    'MAX_SIZE': 5000,
+    # 默认的新鲜期（秒），视图可以单独指定
+    'TTL': 60,
+    # 过期后还能作为旧内容返回的时间（秒），0 表示不使用 stale-while-revalidate
+    'STALE_TTL': 30,
+    # 共享缓存的别名，None 表示只用进程内缓存（单进程部署）
+    'SHARED_CACHE': None,
+    # 共享缓存中 key 的前缀
+    'KEY_PREFIX': 'api:resp',
+    # 进程内缓存的标签版本号多久向共享缓存确认一次（秒）
+    'TAG_CHECK_INTERVAL': 1.0,
+    # 其他进程正在生成同一个响应时，最多等待多久（秒），超时后自己生成
+    'LOCK_TIMEOUT': 5.0,
+}
+
+
+def get_response_cache_settings():
+    """合并默认配置和 settings.RESPONSE_CACHE"""
+    return {**DEFAULTS, **getattr(settings, 'RESPONSE_CACHE', {})}
+
+
+class CacheEntry:
+    """一条缓存的响应"""
+    __slots__ = ('data', 'status', 'headers', 'tags', 'fresh_until', 'stale_until')
+
+    def __init__(self, data, status, headers, tags, fresh_until, stale_until):
+        self.data = data
+        self.status = status
+        self.headers = headers
+        # {标签: 写入时的版本号}
+        self.tags = tags
+        # 使用墙上时间，共享缓存中的条目在不同进程之间可比较
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class ResponseCache:
+    """两级响应缓存 + 标签版本号 + 请求合并"""
+
+    def __init__(self, max_size, shared_cache=None, key_prefix='api:resp',
+                 tag_check_interval=1.0, lock_timeout=5.0):
+        self.max_size = max_size
+        self.shared_cache = shared_cache
+        self.key_prefix = key_prefix
+        self.tag_check_interval = tag_check_interval
+        self.lock_timeout = lock_timeout
+        self._entries = OrderedDict()
+        # {标签: (版本号, 上次向共享缓存确认的时间)}
+        self._tag_versions = {}
+        # 正在生成中的 key -> threading.Lock，用于同一进程内的请求合并
+        self._inflight = {}
+        # 本进程每次失效加一，其他进程的失效记在共享缓存中，见 generation()
+        self._generation = 0
+        # 版本号的纪元：(值, 上次向共享缓存确认的时间)，见 epoch()
+        self._epoch = None
+        self._process_epoch = os.urandom(8).hex()
+        self._lock = threading.Lock()
+        self.stats = {
+            'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'stale_hits': 0,
+            'coalesced': 0, 'invalidations': 0, 'stores': 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _tag_key(self, tag):
+        return f'{self.key_prefix}:tag:{tag}'
+
+    def _lock_key(self, key):
+        return f'{key}:lock'
+
+    # ---- 标签版本号 ----
+
+    def tag_versions(self, tags):
+        """返回 {标签: 当前版本号}，最近确认过的标签直接用进程内的值"""
+        now = time.monotonic()
+        versions, stale = {}, []
+        with self._lock:
+            for tag in tags:
+                cached = self._tag_versions.get(tag)
+                if cached is not None and (self.shared_cache is None or now - cached[1] < self.tag_check_interval):
+                    versions[tag] = cached[0]
+                else:
+                    stale.append(tag)
+        if stale:
+            if self.shared_cache is not None:
+                found = self.shared_cache.get_many([self._tag_key(tag) for tag in stale])
+                fetched = {tag: found.get(self._tag_key(tag), 0) for tag in stale}
+            else:
+                fetched = dict.fromkeys(stale, 0)
+            with self._lock:
+                for tag, version in fetched.items():
+                    self._tag_versions[tag] = (version, now)
+            versions.update(fetched)
+        return versions
+
+    def _incr_shared(self, key):
+        try:
+            return self.shared_cache.incr(key)
+        except ValueError:
+            # 还没有这个计数：写入 1；并发时 add 失败说明别人刚写入，再加一次
+            if self.shared_cache.add(key, 1, timeout=None):
+                return 1
+            return self.shared_cache.incr(key)
+
+    def generation(self):
+        """失效计数：(本进程的失效次数, 共享缓存中所有进程的失效次数)，生成响应前后不同说明期间发生过失效"""
+        shared = self.shared_cache.get(f'{self.key_prefix}:generation', 0) if self.shared_cache is not None else 0
+        with self._lock:
+            return self._generation, shared
+
+    def invalidate_tags(self, tags):
+        """把标签的版本号加一，所有带这些标签的缓存条目随之失效"""
+        tags = set(tags)
+        if tags and self.shared_cache is not None:
+            # 先于标签版本号增加：看到新版本号的进程一定也能看到新的失效计数（见 _produce）
+            self._incr_shared(f'{self.key_prefix}:generation')
+        for tag in tags:
+            version = None
+            if self.shared_cache is not None:
+                version = self._incr_shared(self._tag_key(tag))
+            with self._lock:
+                if version is None:
+                    version = self._tag_versions.get(tag, (0, 0))[0] + 1
+                self._tag_versions[tag] = (version, time.monotonic())
+                self._generation += 1
+                self.stats['invalidations'] += 1
+
+    def epoch(self):
+        """
+        标签版本号的纪元
+        只用进程内缓存时每个进程（每个实例）各不相同；使用共享缓存时在其中保存一个随机值，所有进程共用，
+        共享缓存被清空后版本号会从 0 重新计数，纪元也随之改变
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._epoch is not None and (self.shared_cache is None or now - self._epoch[1] < self.tag_check_interval):
+                return self._epoch[0]
+        value = self._process_epoch
+        if self.shared_cache is not None:
+            key = f'{self.key_prefix}:epoch'
+            value = self.shared_cache.get(key)
+            if value is None:
+                self.shared_cache.add(key, self._process_epoch, timeout=None)
+                value = self.shared_cache.get(key) or self._process_epoch
+        with self._lock:
+            self._epoch = (value, now)
+        return value
+
+    def validator(self, tags):
+        """
+        纪元 + 各个标签的版本号，任一标签失效后随之改变，可以作为 ETag 等条件请求的校验值
+        在读取数据之前取得：读取期间发生的修改会让下一次请求拿到新的校验值，而不会把旧数据标记为最新
+        """
+        versions = self.tag_versions(tags)
+        return ':'.join([self.epoch(), *(str(versions[tag]) for tag in tags)])
+
+    # ---- 读写 ----
+
+    def get(self, key, count=False):
+        """
+        返回 (条目, 状态)，状态为 'fresh' / 'stale'，取不到或已失效时返回 (None, None)
+        count=True 时把新鲜命中计入 local_hits / shared_hits
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        source = 'local_hits'
+        if entry is not None and not self._usable(entry):
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            entry = None
+        if entry is None and self.shared_cache is not None:
+            # 其他进程可能已经写入了失效之后重新生成的内容
+            entry = self.shared_cache.get(key)
+            if entry is not None and not self._usable(entry):
+                entry = None
+            if entry is not None:
+                source = 'shared_hits'
+                self._store_local(key, entry)
+        if entry is None:
+            return None, None
+        if entry.fresh_until > time.time():
+            if count:
+                self._count(source)
+            return entry, 'fresh'
+        return entry, 'stale'
+
+    def _usable(self, entry):
+        """没有超出 stale 窗口，且写入后所有标签都没有失效过"""
+        return entry.stale_until > time.time() and self.tag_versions(entry.tags) == entry.tags
+
+    def set(self, key, entry):
+        self._store_local(key, entry)
+        if self.shared_cache is not None:
+            self.shared_cache.set(key, entry, max(1, int(entry.stale_until - time.time()) + 1))
+        self._count('stores')
+
+    def _store_local(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tag_versions.clear()
+
+    # ---- 防击穿 ----
+
+    def fetch(self, key, produce, ttl, stale_ttl):
+        """
+        取缓存的响应，未命中时调用 produce() 生成
+        produce() 返回 (data, status, headers, tags)，status 为 None 表示结果不缓存
+        返回 (data, status, headers, 缓存状态)，缓存状态用于 X-Cache 响应头
+        """
+        entry, state = self.get(key, count=True)
+        if state == 'fresh':
+            return entry.data, entry.status, entry.headers, 'HIT'
+
+        local_lock = self._inflight_lock(key)
+        try:
+            if state == 'stale':
+                return self._revalidate(key, entry, local_lock, produce, ttl, stale_ttl)
+            return self._fill(key, local_lock, produce, ttl, stale_ttl)
+        finally:
+            self._drop_inflight_lock(key, local_lock)
+
+    def _revalidate(self, key, entry, local_lock, produce, ttl, stale_ttl):
+        """条目已过期但还在 stale 窗口内：只有拿到锁的请求重新生成，其余直接返回旧内容"""
+        if not local_lock.acquire(blocking=False):
+            self._count('stale_hits')
+            return entry.data, entry.status, entry.headers, 'STALE'
+        try:
+            if not self._acquire_shared_lock(key):
+                self._count('stale_hits')
+                return entry.data, entry.status, entry.headers, 'STALE'
+            try:
+                return self._produce(key, produce, ttl, stale_ttl)
+            finally:
+                self._release_shared_lock(key)
+        finally:
+            local_lock.release()
+
+    def _fill(self, key, local_lock, produce, ttl, stale_ttl):
+        """完全没有可用的内容：同一进程内排队，拿到锁后先看看别人是否已经生成好了"""
+        waited = not local_lock.acquire(blocking=False)
+        if waited:
+            local_lock.acquire()
+        try:
+            if waited:
+                entry, state = self.get(key)
+                if state is not None:
+                    self._count('coalesced')
+                    return entry.data, entry.status, entry.headers, 'HIT' if state == 'fresh' else 'STALE'
+            locked = self._acquire_shared_lock(key)
+            if not locked:
+                entry = self._wait_for_other_process(key)
+                if entry is not None:
+                    self._count('coalesced')
+                    return entry.data, entry.status, entry.headers, 'HIT'
+            try:
+                return self._produce(key, produce, ttl, stale_ttl)
+            finally:
+                if locked:
+                    self._release_shared_lock(key)
+        finally:
+            local_lock.release()
+
+    def _produce(self, key, produce, ttl, stale_ttl):
+        self._count('misses')
+        generation = self.generation()
+        data, status, headers, tags = produce()
+        if status is not None:
+            versions = self.tag_versions(tags)
+            # 生成期间任何进程发生过失效时不写缓存：标签要等数据生成后才知道，无法事先记下旧版本号，
+            # 此时读到的可能是失效之后的版本号和失效之前的数据
+            if generation == self.generation():
+                now = time.time()
+                self.set(key, CacheEntry(data, status, headers, versions, now + ttl, now + ttl + stale_ttl))
+        return data, status, headers, 'MISS'
+
+    def _inflight_lock(self, key):
+        with self._lock:
+            lock, waiters = self._inflight.get(key, (None, 0))
+            if lock is None:
+                lock = threading.Lock()
+            self._inflight[key] = (lock, waiters + 1)
+            return lock
+
+    def _drop_inflight_lock(self, key, lock):
+        with self._lock:
+            current, waiters = self._inflight.get(key, (None, 0))
+            if current is lock:
+                if waiters <= 1:
+                    del self._inflight[key]
+                else:
+                    self._inflight[key] = (lock, waiters - 1)
+
+    def _acquire_shared_lock(self, key):
+        if self.shared_cache is None:
+            return True
+        return self.shared_cache.add(self._lock_key(key), 1, timeout=max(1, int(self.lock_timeout)))
+
+    def _release_shared_lock(self, key):
+        if self.shared_cache is not None:
+            self.shared_cache.delete(self._lock_key(key))
+
+    def _wait_for_other_process(self, key):
+        """另一个进程持有锁：轮询共享缓存，直到它写入结果或者锁超时"""
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+            entry, state = self.get(key)
+            if state is not None:
+                return entry
+            if self.shared_cache.get(self._lock_key(key)) is None:
+                break
+        return None
+
+    def snapshot(self):
+        """命中率等指标"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['local_entries'] = len(self._entries)
+        hits = stats['local_hits'] + stats['shared_hits'] + stats['stale_hits'] + stats['coalesced']
+        total = hits + stats['misses']
+        stats['hit_rate'] = round(hits / total, 4) if total else None
+        return stats
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """返回进程内唯一的 ResponseCache 实例（第一次调用时按配置创建）"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                conf = get_response_cache_settings()
+                shared = caches[conf['SHARED_CACHE']] if conf['SHARED_CACHE'] else None
+                _response_cache = ResponseCache(
+                    max_size=conf['MAX_SIZE'],
+                    shared_cache=shared,
+                    key_prefix=conf['KEY_PREFIX'],
+                    tag_check_interval=conf['TAG_CHECK_INTERVAL'],
+                    lock_timeout=conf['LOCK_TIMEOUT'],
+                )
+    return _response_cache
+
+
+def reset_response_cache():
+    """丢弃当前缓存实例，下次使用时按最新配置重建（修改配置后调用）"""
+    global _response_cache
+    with _response_cache_lock:
+        _response_cache = None
+
+
+def invalidate_tags(*tags):
+    """对外暴露的失效入口，例如 QuerySet.update() 之后调用"""
+    get_response_cache().invalidate_tags(tags)
+
+
+def response_cache_key(request, view_name, scope='public'):
+    """视图名 + 域名 + 路径 + 排序后的查询参数 + 认证范围，摘要后作为 key（兼容 Memcached 的 key 长度限制）"""
+    if scope == 'user' and request.user.is_authenticated:
+        audience = f'user:{request.user.pk}'
+    elif scope == 'user':
+        audience = 'anon'
+    else:
+        audience = 'public'
+    query = sorted((name, value) for name in request.query_params for value in request.query_params.getlist(name))
+    # 分页的 next / first 是绝对地址，不同域名分别缓存
+    raw = repr((request.scheme, request.get_host(), request.path, query, audience))
+    digest = hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+    return f"{get_response_cache_settings()['KEY_PREFIX']}:{view_name}:{digest}"
+
+
+# 缓存的响应头（其余的如 Vary、Allow 由 DRF 每次重新生成）
+CACHED_HEADERS = ('Cache-Control', 'Retry-After')
+
+
+def cached_get(view, request, handler, ttl=None, stale_ttl=None, scope='public', tags=()):
+    """
+    用缓存包装一次 GET 处理
+    tags 可以是标签列表，也可以是 callable(request, data) -> 标签列表（例如按返回的课程 id 打标签）
+    """
+    conf = get_response_cache_settings()
+    if not conf['ENABLED'] or request.method not in ('GET', 'HEAD'):
+        return handler()
+    ttl = conf['TTL'] if ttl is None else ttl
+    stale_ttl = conf['STALE_TTL'] if stale_ttl is None else stale_ttl
+
+    produced = {}
+
+    def produce():
+        response = produced['response'] = handler()
+        if not isinstance(response, Response) or response.exception or response.status_code != 200:
+            # 错误响应和非 DRF 的响应原样返回，不缓存
+            return None, None, None, ()
+        entry_tags = tags(request, response.data) if callable(tags) else tags
+        headers = {name: response[name] for name in CACHED_HEADERS if response.has_header(name)}
+        return response.data, response.status_code, headers, tuple(entry_tags)
+
+    key = response_cache_key(request, type(view).__name__, scope)
+    data, status, headers, state = get_response_cache().fetch(key, produce, ttl, stale_ttl)
+    # 本次请求自己生成的响应直接返回，保留视图设置的全部响应头
+    response = produced.get('response') or Response(data, status=status, headers=headers)
+    if status is not None:
+        response['X-Cache'] = state
+    return response
+
+
+def cache_response(ttl=None, stale_ttl=None, scope='public', tags=()):
+    """
+    视图方法的装饰器：
+
+        class CategoryListView(APIView):
+            @cache_response(ttl=300, tags=('category',))
+            def get(self, request): ...
+
+    认证、权限检查和限流在 handler 之前执行，缓存命中时也不会被绕过。
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            return cached_get(
+                self, request, lambda: method(self, request, *args, **kwargs),
+                ttl=ttl, stale_ttl=stale_ttl, scope=scope, tags=tags,
+            )
+        return wrapper
+    return decorator
+
+
+class CachedResponseMixin:
+    """
+    给泛型视图（ListAPIView / RetrieveAPIView 等）加上响应缓存，放在继承列表的最前面
+    类属性：cache_ttl、cache_stale_ttl、cache_scope、cache_tags，或者重写 get_cache_tags(request, data)
+    """
+    cache_ttl = None
+    cache_stale_ttl = None
+    cache_scope = 'public'
+    cache_tags = ()
+
+    def get_cache_tags(self, request, data):
+        return self.cache_tags
+
+    def get(self, request, *args, **kwargs):
+        return cached_get(
+            self, request, lambda: super(CachedResponseMixin, self).get(request, *args, **kwargs),
+            ttl=self.cache_ttl, stale_ttl=self.cache_stale_ttl, scope=self.cache_scope,
+            tags=self.get_cache_tags,
+        )
+
+
+# ---- 模型变更 -> 标签失效 ----
+
+def invalidate_on(model, tags_for):
+    """
+    model 保存 / 删除后，在事务提交时让 tags_for(instance) 返回的标签失效
+    事务回滚时不会失效；提交前其他请求读到的仍是旧数据，此时写入的缓存也会被提交后的失效清掉
+    """
+    def handler(sender, instance, **kwargs):
+        if not get_response_cache_settings()['ENABLED']:
+            return
+        tags = tuple(tags_for(instance))
+        if tags:
+            transaction.on_commit(lambda: invalidate_tags(*tags), using=kwargs.get('using'))
+
+    post_save.connect(handler, sender=model, weak=False, dispatch_uid=f'response_cache:{model._meta.label}:save')
+    post_delete.connect(handler, sender=model, weak=False, dispatch_uid=f'response_cache:{model._meta.label}:delete')
+
+
+def course_tag(course_id):
+    return f'course:{course_id}'
+
+
+# 分类的标题会出现在课程列表和详情中
+invalidate_on(Category, lambda category: ('category', 'course'))
+invalidate_on(Course, lambda course: ('course', course_tag(course.pk)))
+# 章节 / 课时只影响所属课程的详情（大纲）
+invalidate_on(Section, lambda section: (course_tag(section.course_id),))
+invalidate_on(Lecture, lambda lecture: (
+    (course_tag(lecture.section.course_id),) if lecture.section_id else ()
+))
+
+
+def user_tags(user):
+    # 老师的姓名出现在课程列表和详情中；post_save 时 User.save() 还没有重新记录快照，脏字段仍然可用
+    # 其他修改（例如每次登录时的 save(update_fields=['last_login'])）不影响任何缓存的响应
+    dirty = user.get_dirty_fields()
+    if dirty is None or 'full_name' in dirty:
+        return ('course',)
+    return ()
+
+
+invalidate_on(User, user_tags)
@@ -0,0 +1,348 @@
+import re
+import threading
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+from api.models import Category, Course
+
+"""
+课程全文搜索
+
+icontains 在 SQLite / PostgreSQL 上都无法使用索引，每次搜索都要扫描整张课程表。这里维护一份倒排索引：
+
+- SQLite：FTS5 虚拟表 api_course_fts（rowid = 课程 id），按 BM25 排序；
+  建表时带 prefix='2 3 4'，额外为 2~4 个字符的前缀建立索引，输入联想（"pyt" -> python）直接查前缀索引
+- PostgreSQL：api_course_search 表（course_id, document tsvector）+ GIN 索引，
+  标题、分类、简介分别设置 A / B / C 权重，用 ts_rank_cd 排序（PostgreSQL 没有内置 BM25），前缀查询用 'pyt:*'
+
+两张表都由迁移 0005_course_search_index 按数据库类型创建。
+课程保存 / 删除、分类改名 / 删除时通过信号在事务提交后增量更新索引；bulk_create 等不触发信号的写入之后，
+用 python manage.py rebuild_search_index 分批重建。重建不清空索引：按 id 分批写入（已有的行覆盖），
+同一个事务里删除这一段 id 中已经不是已发布课程的行，重建过程中搜索始终可用。
+"""
+
+DEFAULTS = {
+    # 'auto' 按数据库类型选择；也可以指定 'sqlite' / 'postgres'
+    'BACKEND': 'auto',
+    # 搜索和联想最多返回的条数
+    'MAX_RESULTS': 50,
+    'AUTOCOMPLETE_LIMIT': 10,
+    # 是否通过信号增量更新索引
+    'AUTO_UPDATE': True,
+}
+
+# 只保留字母、数字、下划线组成的词（包括中文等 Unicode 字符），用户输入不会被当成 FTS / tsquery 语法
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def get_search_settings():
+    """合并默认配置和 settings.COURSE_SEARCH"""
+    return {**DEFAULTS, **getattr(settings, 'COURSE_SEARCH', {})}
+
+
+def parse_terms(query, limit=8):
+    return [term.lower() for term in TERM_RE.findall(query or '')][:limit]
+
+
+def document_rows(courses):
+    """把课程转换成索引需要的 (id, 标题, 简介, 分类名)；courses 需要 select_related('category')"""
+    for course in courses:
+        yield course.pk, course.title, course.description or '', course.category.title if course.category_id else ''
+
+
+def stale_delete(table, column, after, upto):
+    """(SQL, 参数)：删除索引表中 id 在 (after, upto] 之间、但已不是已发布课程的行"""
+    bounds, params = '{0} > %s', [after]
+    if upto is not None:
+        bounds += ' AND {0} <= %s'
+        params.append(upto)
+    sql = (
+        f'DELETE FROM {table} WHERE {bounds.format(column)} AND {column} NOT IN '
+        f'(SELECT id FROM {Course._meta.db_table} WHERE {bounds.format("id")} AND status = %s)'
+    )
+    return sql, [*params, *params, Course.PUBLISHED]
+
+
+class SQLiteSearchBackend:
+    """SQLite FTS5 倒排索引"""
+    table = 'api_course_fts'
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def index(self, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        with connections[self.alias].cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, title, description, category) VALUES (%s, %s, %s, %s)', rows,
+            )
+
+    def remove(self, ids):
+        with connections[self.alias].cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in ids])
+
+    def remove_stale(self, after, upto=None):
+        """删除 id 在 (after, upto] 之间、已经不是已发布课程的行；upto 为 None 表示没有上限"""
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(*stale_delete(self.table, 'rowid', after, upto))
+
+    def optimize(self):
+        """重建后合并 FTS5 的段，查询时需要合并的段越少越快"""
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+
+    @staticmethod
+    def match_expression(terms, column=None):
+        # 每个词都加引号按普通词处理，最后一个词按前缀匹配（边输入边搜索）
+        parts = [f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*']
+        if column:
+            parts = [f'{column} : {part}' for part in parts]
+        return ' '.join(parts)
+
+    def search(self, query, limit):
+        """返回 [(课程 id, 分数)]，分数越大越相关"""
+        terms = parse_terms(query)
+        if not terms:
+            return []
+        with connections[self.alias].cursor() as cursor:
+            # bm25() 的值越小越相关；参数是各列权重：标题 10、简介 1、分类 4
+            cursor.execute(
+                f'SELECT rowid, bm25({self.table}, 10.0, 1.0, 4.0) AS score FROM {self.table} '
+                f'WHERE {self.table} MATCH %s ORDER BY score LIMIT %s',
+                [self.match_expression(terms), limit],
+            )
+            return [(pk, -score) for pk, score in cursor.fetchall()]
+
+    def autocomplete(self, prefix, limit):
+        """只在标题中按前缀查找，返回 [(课程 id, 标题)]"""
+        terms = parse_terms(prefix)
+        if not terms:
+            return []
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, title FROM {self.table} WHERE {self.table} MATCH %s '
+                f'ORDER BY bm25({self.table}, 10.0, 1.0, 4.0) LIMIT %s',
+                [self.match_expression(terms, column='title'), limit],
+            )
+            return cursor.fetchall()
+
+
+class PostgresSearchBackend:
+    """PostgreSQL tsvector + GIN 索引"""
+    table = 'api_course_search'
+    config = 'simple'
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def index(self, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        with connections[self.alias].cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (course_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('{self.config}', %s), 'A') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'C') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'B')) "
+                f"ON CONFLICT (course_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+    def remove(self, ids):
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE course_id = ANY(%s)', [list(ids)])
+
+    def remove_stale(self, after, upto=None):
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(*stale_delete(self.table, 'course_id', after, upto))
+
+    def optimize(self):
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(f'ANALYZE {self.table}')
+
+    @staticmethod
+    def tsquery(terms):
+        return ' & '.join(terms[:-1] + [f'{terms[-1]}:*'])
+
+    def search(self, query, limit):
+        terms = parse_terms(query)
+        if not terms:
+            return []
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(
+                f"SELECT course_id, ts_rank_cd(document, q) AS score "
+                f"FROM {self.table}, to_tsquery('{self.config}', %s) q "
+                f"WHERE document @@ q ORDER BY score DESC, course_id LIMIT %s",
+                [self.tsquery(terms), limit],
+            )
+            return cursor.fetchall()
+
+    def autocomplete(self, prefix, limit):
+        terms = parse_terms(prefix)
+        if not terms:
+            return []
+        with connections[self.alias].cursor() as cursor:
+            # 只匹配权重为 A 的词（标题）
+            cursor.execute(
+                f"SELECT s.course_id, c.title FROM {self.table} s "
+                f"JOIN {Course._meta.db_table} c ON c.id = s.course_id, "
+                f"to_tsquery('{self.config}', %s) q "
+                f"WHERE s.document @@ q ORDER BY ts_rank_cd(s.document, q) DESC, s.course_id LIMIT %s",
+                [' & '.join([f'{term}:A' for term in terms[:-1]] + [f'{terms[-1]}:*A']), limit],
+            )
+            return cursor.fetchall()
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgres': PostgresSearchBackend,
+}
+
+
+def build_backend(name, alias):
+    """根据配置和数据库类型创建搜索后端"""
+    if name == 'auto':
+        vendor = connections[alias].vendor
+        name = 'postgres' if vendor == 'postgresql' else vendor
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown COURSE_SEARCH backend: {name}")
+    return BACKENDS[name](alias)
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_search_backend(write=False):
+    """
+    返回搜索后端；读写分离时搜索走副本，更新索引走主库（与 api.Course 的路由一致）
+    """
+    alias = router.db_for_write(Course) if write else router.db_for_read(Course)
+    alias = alias or 'default'
+    backend = _backends.get(alias)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(alias)
+            if backend is None:
+                backend = _backends[alias] = build_backend(get_search_settings()['BACKEND'], alias)
+    return backend
+
+
+def reset_search_backends():
+    """丢弃已创建的后端，下次使用时按最新配置重建"""
+    with _backends_lock:
+        _backends.clear()
+
+
+def search_courses(query, limit=None):
+    """全文搜索已发布的课程，返回按相关度排序的课程 id 列表"""
+    conf = get_search_settings()
+    limit = max(1, min(limit or conf['MAX_RESULTS'], conf['MAX_RESULTS']))
+    return [pk for pk, _ in get_search_backend().search(query, limit)]
+
+
+def autocomplete_courses(prefix, limit=None):
+    """标题前缀联想，返回 [(课程 id, 标题)]"""
+    conf = get_search_settings()
+    limit = max(1, min(limit or conf['AUTOCOMPLETE_LIMIT'], conf['AUTOCOMPLETE_LIMIT']))
+    return get_search_backend().autocomplete(prefix, limit)
+
+
+def reindex_courses(ids):
+    """重新索引指定课程：已发布的写入索引，其余（草稿、已删除）从索引中移除"""
+    ids = set(ids)
+    if not ids:
+        return
+    backend = get_search_backend(write=True)
+    courses = list(
+        Course.objects.filter(pk__in=ids, status=Course.PUBLISHED)
+        .select_related('category')
+        .only('id', 'title', 'description', 'category__title')
+    )
+    backend.index(document_rows(courses))
+    backend.remove(ids - {course.pk for course in courses})
+
+
+def iter_course_chunks(chunk_size):
+    """按 id 分批读取已发布的课程（keyset 方式，不用 OFFSET），每批一个列表"""
+    last_id = 0
+    queryset = (
+        Course.objects.filter(status=Course.PUBLISHED)
+        .select_related('category')
+        .only('id', 'title', 'description', 'category__title')
+        .order_by('id')
+    )
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].pk
+
+
+def rebuild_index(chunk_size=5000, on_chunk=None):
+    """
+    重建索引，返回索引的课程数；on_chunk(已完成数量) 用于输出进度
+    不先清空：每批在一个事务里写入课程并删除这一段 id 中的过期行，重建期间搜索结果始终完整
+    """
+    backend = get_search_backend(write=True)
+    total = last_id = 0
+    for chunk in iter_course_chunks(chunk_size):
+        with transaction.atomic(using=backend.alias):
+            backend.index(document_rows(chunk))
+            backend.remove_stale(last_id, chunk[-1].pk)
+        last_id = chunk[-1].pk
+        total += len(chunk)
+        if on_chunk is not None:
+            on_chunk(total)
+    with transaction.atomic(using=backend.alias):
+        # 最后一批之后的 id 都已经不是已发布课程
+        backend.remove_stale(last_id)
+    backend.optimize()
+    return total
+
+
+def schedule_reindex(ids):
+    """事务提交后再更新索引，回滚的修改不会进入索引"""
+    if not get_search_settings()['AUTO_UPDATE']:
+        return
+    ids = list(ids)
+    transaction.on_commit(lambda: reindex_courses(ids), using=router.db_for_write(Course))
+
+
+def course_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_reindex([instance.pk])
+
+
+def course_deleted(sender, instance, **kwargs):
+    if get_search_settings()['AUTO_UPDATE']:
+        pk = instance.pk
+        transaction.on_commit(lambda: get_search_backend(write=True).remove([pk]), using=router.db_for_write(Course))
+
+
+def category_deleting(sender, instance, **kwargs):
+    # 删除分类时课程的 category_id 由 SET_NULL 批量置空，不会触发课程的 post_save；
+    # 删除前记下其下的课程，事务提交后（分类已经置空）重新索引，去掉索引中的分类名
+    ids = list(Course.objects.filter(category_id=instance.pk, status=Course.PUBLISHED).values_list('pk', flat=True))
+    schedule_reindex(ids)
+
+
+def category_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # 只有已有分类的名称可能变化时才需要重新索引其下的课程
+    if created or raw or (update_fields is not None and 'title' not in update_fields):
+        return
+    ids = list(Course.objects.filter(category_id=instance.pk, status=Course.PUBLISHED).values_list('pk', flat=True))
+    schedule_reindex(ids)
+
+
+post_save.connect(course_saved, sender=Course)
+post_delete.connect(course_deleted, sender=Course)
+post_save.connect(category_saved, sender=Category)
+pre_delete.connect(category_deleting, sender=Category)
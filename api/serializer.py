@@ -1,7 +1,14 @@
+import secrets
+
 from django.contrib.auth.password_validation import validate_password
+from django.core.files.storage import default_storage
+from django.db import IntegrityError
 from rest_framework import serializers
 from userauths.models import User, Profile
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from api.avatars import get_thumbnail_sizes, thumbnail_urls
+from api.models import Category, Course, Enrollment, Lecture, Order, Section, TranscodeJob
+from api.tokens import ScalableRefreshToken
 
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -9,6 +16,9 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     自定义 Token 序列化器继承自TokenObtainPairSerializer
     用于在登录后生成自定义的 JWT 令牌，并附加额外字段（如用户名、邮箱、全名）
     """
+    # 使用 api.blacklist 黑名单的 refresh token，签发时不再写 OutstandingToken
+    token_class = ScalableRefreshToken
+
     @classmethod
     def get_token(cls, user):
         # 调用父类的方法生成标准 token
@@ -21,18 +31,34 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         return token
 
 
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    自定义 Token 刷新序列化器
+    轮换 refresh token 时，旧 token 写入 api.blacklist 黑名单，而不是 OutstandingToken + BlacklistedToken
+    在 settings.SIMPLE_JWT 的 TOKEN_REFRESH_SERIALIZER 中启用
+    """
+    token_class = ScalableRefreshToken
+
+
 class RegisterSerializer(serializers.ModelSerializer):
     """
     用户注册用的序列化器
     用于接收注册信息，并创建新用户。
     """
 
+    # 注册表单中的 username 其实是显示名称，保存到 full_name（可以重名）；
+    # 声明成普通字段，不使用 ModelSerializer 为 User.username 自动生成的 UniqueValidator，响应中返回的也是这个名称
+    username = serializers.CharField(source='full_name', max_length=100)
+
     # 密码字段，write_only 表示只用于输入不会被返回，validate_password 用于强度校验
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
 
     # 确认密码字段，write_only
     password2 = serializers.CharField(write_only=True, required=True)
 
+    # 自动生成的用户名与已有用户冲突时，最多尝试的次数（之后每次换一个随机后缀）
+    username_attempts = 5
+
     class Meta:
         """
         指定这个序列化器对应的模型是 User
@@ -40,41 +66,78 @@ class RegisterSerializer(serializers.ModelSerializer):
         """
         model = User
         fields = ('username', 'email', 'password', 'password2')
+        # 邮箱唯一性在 validate_email 中检查（不区分大小写），去掉 ModelSerializer 自动生成的区分大小写的 UniqueValidator
+        extra_kwargs = {'email': {'validators': []}}
+
+    def validate_email(self, value):
+        """邮箱不区分大小写唯一，与 LOWER(email) 上的唯一约束一致，查询使用该索引"""
+        if User.objects.by_email(value).exists():
+            raise serializers.ValidationError("user with this email already exists.")
+        return value
 
     def validate(self, attrs):
         """
         在调用 .is_valid() 时自动执行
-        用于校验密码和确认密码是否一致，同时检查密码强度
+        用于校验密码和确认密码是否一致
+        密码强度已经由 password 字段上的 validate_password 校验过，这里不再重复执行
         """
         if attrs['password'] != attrs['password2']:
             raise serializers.ValidationError("两次输入的密码不一致")
 
-        # 再次使用 Django 提供的密码强度验证
-        validate_password(attrs['password'])
-
         return attrs
 
     def create(self, validated_data):
         """
         创建并保存用户实例
         注意：这里并没有直接保存 username，而是从 email 自动生成用户名
-        """
-        user = User.objects.create(
-            full_name=validated_data["username"],   # 暂存为 full_name
-            email=validated_data["email"],
-        )
 
+        先在内存中把用户完整构造好（用户名、哈希后的密码），再一次性写入：
+        - 密码哈希（PBKDF2，耗时较长）在事务开启之前完成，不会长时间占用数据库事务
+        - user.save() 在一个事务里只执行一条 INSERT，并由 sync_user_profile 信号在同一事务中创建 Profile
+        - 用户名不预先查询是否被占用：INSERT 违反唯一约束时换一个带随机后缀的用户名重试（alice、alice-3f9a），
+          通常情况下不增加查询
+        """
+        email = validated_data["email"]
+        max_length = User._meta.get_field('username').max_length
         # 自动从 email 提取用户名
-        email_username = user.email.split('@')[0]
-        user.username = email_username
+        base = email.split('@')[0][:max_length]
+        user = User(
+            full_name=validated_data["full_name"],   # 注册表单中的 username
+            email=email,
+            username=base,
+        )
 
-        # 设置密码（会自动哈希）
-        user.set_password(validated_data['password'])
+        if 'password_hash' in validated_data:
+            # 异步注册视图已经在线程池中算好了哈希（serializer.save(password_hash=...)）
+            user.password = validated_data['password_hash']
+        else:
+            # 设置密码（会自动哈希），此时还没有访问数据库
+            user.set_password(validated_data['password'])
 
+        for _ in range(self.username_attempts - 1):
+            try:
+                user.save()
+                return user
+            except IntegrityError:
+                # 校验之后有并发注册了同一个邮箱：按校验失败返回，而不是 500
+                if User.objects.by_email(email).exists():
+                    raise serializers.ValidationError({'email': ["user with this email already exists."]})
+                user.username = f"{base[:max_length - 5]}-{secrets.token_hex(2)}"
         user.save()
         return user
 
 
+class BulkRegisterSerializer(serializers.Serializer):
+    """
+    批量注册用的序列化器
+    只负责接收上传的 CSV / JSONL 文件，逐行解析和创建用户由 userauths.bulk_import 完成
+    """
+    file = serializers.FileField()
+
+    # 文件格式，不传时根据文件扩展名判断
+    format = serializers.ChoiceField(choices=("csv", "jsonl"), required=False)
+
+
 class UserSerializer(serializers.ModelSerializer):
     """
     用户信息序列化器
@@ -85,11 +148,196 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'email', 'full_name', 'otp')
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class AvatarFieldsMixin:
+    """
+    头像：image 是默认尺寸缩略图的地址，thumbnails 是 {尺寸: 地址}；缩略图还没有生成时都是原图地址
+    序列化对象是 Profile，使用它的序列化器需要声明 image / thumbnails 两个 SerializerMethodField
+    """
+    # 编译序列化（见 api/fastserializer.py）时两个方法字段都需要 image 和 thumbnails_ready 列，
+    # 调用 get_<字段>_from_value(文件名, 缩略图是否已生成)
+    value_sources = {'image': ('image', 'thumbnails_ready'), 'thumbnails': ('image', 'thumbnails_ready')}
+
+    def get_thumbnails(self, obj):
+        return self.get_thumbnails_from_value(obj.image.name if obj.image else None, obj.thumbnails_ready)
+
+    def get_thumbnails_from_value(self, name, ready):
+        request = self.context.get('request')
+        urls = thumbnail_urls(name or None, ready)
+        if request is not None:
+            urls = {size: request.build_absolute_uri(url) for size, url in urls.items()}
+        return {str(size): url for size, url in urls.items()}
+
+    def get_image(self, obj):
+        return self.get_image_from_value(obj.image.name if obj.image else None, obj.thumbnails_ready)
+
+    def get_image_from_value(self, name, ready):
+        # 默认使用最大尺寸的缩略图
+        return self.get_thumbnails_from_value(name, ready).get(str(max(get_thumbnail_sizes())))
+
+
+class ProfileSerializer(AvatarFieldsMixin, serializers.ModelSerializer):
     """
     用户资料序列化器
     用于处理 Profile 模型（用户扩展信息）
+    头像：image 是默认尺寸缩略图的地址，thumbnails 是 {尺寸: 地址}；缩略图还没有生成时都是原图地址
     """
+    image = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
+
     class Meta:
         model = Profile
         fields = "__all__"  # 所有字段都序列化
+
+
+class CurrentUserSerializer(AvatarFieldsMixin, serializers.Serializer):
+    """
+    当前用户（/user/me/）：用户和资料合并成一个扁平对象，序列化对象是 select_related('user') 的 Profile
+    fields 只保留其中一部分字段；可修改的只有资料中的 full_name（显示名称）、country、about
+    """
+    id = serializers.IntegerField(source='user_id', read_only=True)
+    email = serializers.EmailField(source='user.email', read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True)
+    full_name = serializers.CharField(max_length=100)
+    country = serializers.CharField(max_length=100, allow_null=True, allow_blank=True)
+    about = serializers.CharField(allow_null=True, allow_blank=True)
+    image = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
+    date = serializers.DateTimeField(read_only=True)
+
+    # 字段 -> 需要从数据库读取的列（QuerySet.only() 的参数）
+    COLUMNS = {
+        'id': ('user_id',),
+        'email': ('user__email',),
+        'username': ('user__username',),
+        'full_name': ('full_name',),
+        'country': ('country',),
+        'about': ('about',),
+        'image': ('image', 'thumbnails_ready'),
+        'thumbnails': ('image', 'thumbnails_ready'),
+        'date': ('date',),
+    }
+    # 不传 fields 时返回的字段：about 可能很长，需要时用 ?fields= 显式请求
+    DEFAULT_FIELDS = ('id', 'email', 'username', 'full_name', 'country', 'image', 'date')
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def columns(cls, fields):
+        """序列化 fields 需要读取的列，已去重并保持顺序"""
+        return tuple(dict.fromkeys(column for name in fields for column in cls.COLUMNS[name]))
+
+
+class VideoUploadSerializer(serializers.Serializer):
+    """上传课程视频，保存后创建转码任务（见 api/transcoding.py）"""
+    video = serializers.FileField()
+
+
+class TranscodeJobSerializer(serializers.ModelSerializer):
+    """
+    转码任务状态
+    progress 为 0 ~ 1；成功后 playlist_url 是 HLS 主播放列表地址，poster_url 是封面地址
+    """
+    playlist_url = serializers.SerializerMethodField()
+    poster_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TranscodeJob
+        fields = (
+            'id', 'status', 'progress', 'attempts', 'max_attempts', 'duration',
+            'playlist_url', 'poster_url', 'error', 'created_at', 'updated_at',
+        )
+
+    def build_url(self, name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def get_playlist_url(self, obj):
+        return self.build_url(obj.playlist)
+
+    def get_poster_url(self, obj):
+        return self.build_url(obj.poster)
+
+
+class CategorySerializer(serializers.ModelSerializer):
+    """课程分类"""
+    class Meta:
+        model = Category
+        fields = ('id', 'title', 'slug')
+
+
+class CourseListSerializer(serializers.ModelSerializer):
+    """
+    课程目录中的一项
+    只包含列表需要的字段，视图用 only() 只查询这些列（见 api/views.py 中的 COURSE_LIST_FIELDS）
+    """
+    category = CategorySerializer(read_only=True)
+    teacher_name = serializers.CharField(source='teacher.full_name', default=None, read_only=True)
+
+    class Meta:
+        model = Course
+        fields = (
+            'id', 'title', 'slug', 'image', 'price', 'level', 'featured',
+            'rating', 'review_count', 'category', 'teacher_name',
+        )
+
+
+class LectureOutlineSerializer(serializers.ModelSerializer):
+    """课程大纲中的课时（不包含播放地址）"""
+    class Meta:
+        model = Lecture
+        fields = ('id', 'title', 'duration', 'preview', 'position')
+
+
+class SectionSerializer(serializers.ModelSerializer):
+    lectures = LectureOutlineSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Section
+        fields = ('id', 'title', 'position', 'lectures')
+
+
+class CourseDetailSerializer(CourseListSerializer):
+    """课程详情：目录字段 + 简介和完整大纲"""
+    sections = SectionSerializer(many=True, read_only=True)
+
+    class Meta(CourseListSerializer.Meta):
+        fields = CourseListSerializer.Meta.fields + (
+            'description', 'language', 'enrollment_count', 'date', 'sections',
+        )
+
+
+class EnrollmentSerializer(serializers.ModelSerializer):
+    """我的课程中的一项"""
+    course = CourseListSerializer(read_only=True)
+
+    class Meta:
+        model = Enrollment
+        fields = ('id', 'enrolled_at', 'course')
+
+
+class ProgressHeartbeatSerializer(serializers.Serializer):
+    """
+    播放心跳
+    position 为当前播放位置（秒）；client_ts 为客户端时间戳（毫秒，可选），用于在乱序到达时判断哪条更新
+    """
+    lecture = serializers.IntegerField(min_value=1)
+    position = serializers.FloatField(min_value=0)
+    client_ts = serializers.IntegerField(min_value=0, required=False)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    """购买课程：传入课程 id"""
+    course = serializers.PrimaryKeyRelatedField(queryset=Course.objects.filter(status=Course.PUBLISHED).only('id', 'title', 'price'))
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Order
+        fields = ('id', 'course', 'amount', 'currency', 'status', 'created_at', 'paid_at')
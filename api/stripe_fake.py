@@ -0,0 +1,161 @@
+import hashlib
+import hmac
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+"""
+本地的 Stripe 假服务器（只用于开发、对账测试和基准测试）
+
+实现 stripe 库用到的少量接口：
+    POST /v1/checkout/sessions   创建 Checkout Session（支持 Idempotency-Key）
+    GET  /v1/checkout/sessions/<id>  读取 Checkout Session
+    GET  /v1/events              按创建时间倒序分页列出事件（支持 created[gte]、limit、starting_after）
+把 settings.STRIPE['API_BASE'] 指向它即可离线运行下单、对账流程：
+
+    with FakeStripe().running() as fake:
+        fake.complete_session('cs_test_1')
+        ...
+
+sign_webhook() 按 Stripe 的规则生成 webhook 签名头，用于模拟 webhook 推送。
+"""
+
+
+def sign_webhook(payload, secret, timestamp=None):
+    """返回 Stripe-Signature 头：t=时间戳,v1=HMAC-SHA256(secret, "时间戳.内容")"""
+    timestamp = int(timestamp or time.time())
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8')
+    signature = hmac.new(secret.encode('utf-8'), f'{timestamp}.{payload}'.encode('utf-8'), hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+class FakeStripe:
+    """内存中的事件和 Checkout Session，以及对应的 HTTP 服务器"""
+
+    def __init__(self):
+        self.events = []
+        self.sessions = {}
+        # Idempotency-Key -> 创建的 Session
+        self.idempotent = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.base_url = None
+
+    def next_id(self, prefix):
+        return f'{prefix}_test_{next(self._ids):08d}'
+
+    def add_event(self, event_type, obj, created=None):
+        event = {
+            'id': self.next_id('evt'),
+            'object': 'event',
+            'type': event_type,
+            'created': int(created or time.time()),
+            'livemode': False,
+            'data': {'object': obj},
+        }
+        with self._lock:
+            self.events.append(event)
+        return event
+
+    def create_session(self, params, idempotency_key=None):
+        """与 Stripe 一样，相同 idempotency_key 的请求返回第一次创建的 Session"""
+        with self._lock:
+            if idempotency_key in self.idempotent:
+                return self.idempotent[idempotency_key]
+        session_id = self.next_id('cs')
+        session = {
+            'id': session_id,
+            'object': 'checkout.session',
+            'mode': params.get('mode', 'payment'),
+            'client_reference_id': params.get('client_reference_id'),
+            'metadata': {'order_id': params.get('metadata[order_id]')},
+            'status': 'open',
+            'payment_status': 'unpaid',
+            'payment_intent': None,
+            'url': f'{self.base_url or "http://fake-stripe"}/pay/{session_id}',
+        }
+        with self._lock:
+            self.sessions[session_id] = session
+            if idempotency_key:
+                self.idempotent[idempotency_key] = session
+        return session
+
+    def complete_session(self, session_id, created=None):
+        """模拟用户支付成功：生成 checkout.session.completed 事件"""
+        session = dict(self.sessions.get(session_id) or {'id': session_id, 'object': 'checkout.session'})
+        session.update(payment_status='paid', status='complete', payment_intent=self.next_id('pi'))
+        with self._lock:
+            self.sessions[session_id] = session
+        return self.add_event('checkout.session.completed', session, created)
+
+    def refund(self, payment_intent, created=None):
+        return self.add_event('charge.refunded', {
+            'id': self.next_id('ch'), 'object': 'charge', 'payment_intent': payment_intent, 'refunded': True,
+        }, created)
+
+    def list_events(self, query):
+        gte = int(query.get('created[gte]', ['0'])[0])
+        limit = min(int(query.get('limit', ['10'])[0]), 100)
+        starting_after = query.get('starting_after', [None])[0]
+        with self._lock:
+            # Stripe 按创建时间倒序返回
+            events = [event for event in reversed(self.events) if event['created'] >= gte]
+        if starting_after:
+            ids = [event['id'] for event in events]
+            events = events[ids.index(starting_after) + 1:] if starting_after in ids else []
+        page = events[:limit]
+        return {'object': 'list', 'url': '/v1/events', 'has_more': len(events) > limit, 'data': page}
+
+    @contextmanager
+    def running(self, host='127.0.0.1', port=0):
+        """在后台线程中启动 HTTP 服务器，退出时关闭"""
+        server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.base_url = f'http://{host}:{server.server_address[1]}'
+        thread = threading.Thread(target=server.serve_forever, name='fake-stripe', daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                session_id = url.path.removeprefix('/v1/checkout/sessions/')
+                if url.path == '/v1/events':
+                    self.send_json(200, fake.list_events(parse_qs(url.query)))
+                elif session_id != url.path and session_id in fake.sessions:
+                    self.send_json(200, fake.sessions[session_id])
+                else:
+                    self.send_json(404, {'error': {'type': 'invalid_request_error', 'message': 'Not found'}})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                params = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+                if url.path == '/v1/checkout/sessions':
+                    self.send_json(200, fake.create_session(params, self.headers.get('Idempotency-Key')))
+                else:
+                    self.send_json(404, {'error': {'type': 'invalid_request_error', 'message': 'Not found'}})
+
+            def send_json(self, status, data):
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -1,3 +1,817 @@
-from django.test import TestCase
+import base64
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+import stripe
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import get_hasher
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import serializer as api_serializer
+from api.authentication import AUTH_FIELDS, UserCache
+from api.avatars import generate_thumbnails, get_thumbnail_sizes, mark_thumbnails_ready, store_avatar, thumbnail_name
+from api.avatars import thumbnail_urls
+from api.blacklist import BloomFilter, DatabaseBlacklistStore, TokenBlacklist
+from api.blacklist import get_token_blacklist
+from api.fastserializer import dumps, get_plan, stream_json
+from api.hashing import HashingPool
+from api.models import Category, Course, Enrollment, Lecture, LectureProgress, Order, RevokedToken, Section
+from api.models import StripeEvent
+from api.payments import apply_events, create_checkout, get_stripe_settings, ingest_events, process_batch
+from api.payments import process_pending, reconcile
+from api.progress import LectureDurations, ProgressBuffer, get_lecture_durations, get_progress_buffer
+from api.progress import record_heartbeat
+from api.ratelimit import DEFAULTS as RATE_LIMIT_DEFAULTS, LocalCounterStore, RateLimiter
+from api.response_cache import ResponseCache, reset_response_cache
+from api.search import autocomplete_courses, rebuild_index, reset_search_backends, search_courses
+from api.stripe_fake import FakeStripe
+from api.serializer import MyTokenObtainPairSerializer
+from api.tokens import CachedAccessToken, get_claims_cache
+from api.transcoding import encode_rendition
+from core.querybudget import get_query_budget_settings, query_budget, view_budget
+from userauths.models import Profile, User
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='cache@example.com', username='cache', password='x')
+        self.cache = UserCache(max_size=10, ttl=60)
+
+    def test_only_auth_fields_are_cached(self):
+        self.cache.set(self.user)
+        expires_at, values = self.cache._entries[self.user.pk]
+        self.assertEqual(len(values), len(AUTH_FIELDS))
+        self.assertNotIn(self.user.password, values)
+
+    def test_cached_user_needs_no_query(self):
+        self.cache.set(self.user)
+        with self.assertNumQueries(0):
+            user = self.cache.get(self.user.pk)
+            self.assertEqual((user.pk, user.email, user.is_active), (self.user.pk, 'cache@example.com', True))
+        self.assertIn('password', user.get_deferred_fields())
+
+
+@override_settings(AUTH_RATE_LIMIT={'ENABLED': False})
+class RegisterViewTests(TestCase):
+    PASSWORD = 'Str0ng-Passw0rd!'
+
+    def register(self, url, username, email):
+        return self.client.post(url, {
+            'username': username, 'email': email, 'password': self.PASSWORD, 'password2': self.PASSWORD,
+        }, content_type='application/json')
+
+    def test_same_local_part_gets_a_unique_username(self):
+        for url in ('/api/v1/user/register/', '/api/v1/user/register/async/'):
+            with self.subTest(url=url):
+                User.objects.all().delete()
+                self.assertEqual(self.register(url, 'Alice A', 'alice@a.com').status_code, 201)
+                response = self.register(url, 'Alice B', 'alice@b.com')
+                self.assertEqual(response.status_code, 201, response.content)
+                usernames = set(User.objects.values_list('username', flat=True))
+                self.assertEqual(len(usernames), 2)
+                self.assertIn('alice', usernames)
+
+    def test_display_name_may_match_an_existing_username(self):
+        User.objects.create_user(email='bob@example.com', username='bob', password='x')
+        response = self.register('/api/v1/user/register/', 'bob', 'robert@example.com')
+        self.assertEqual(response.status_code, 201, response.content)
+        # 响应中返回提交的显示名称，而不是自动生成的用户名
+        self.assertEqual(response.json(), {'username': 'bob', 'email': 'robert@example.com'})
+        self.assertEqual(User.objects.get(email='robert@example.com').full_name, 'bob')
+
+
+@override_settings(AUTH_RATE_LIMIT={'ENABLED': False})
+class AsyncAuthViewTests(TransactionTestCase):
+    """
+    异步登录 / 注册接口（api/async_views.py）
+    旧哈希的升级在哈希线程池的线程中写库，用 TransactionTestCase 让其他线程的连接也能看到测试数据
+    """
+    PASSWORD = 'Str0ng-Passw0rd!'
+
+    def setUp(self):
+        # 每个测试使用自己的线程池，结束后等待后台任务完成
+        self.pool = HashingPool(workers=2, max_queue=2)
+        patcher = mock.patch('api.hashing._pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.pool._executor.shutdown)
+        # 用更少的迭代次数生成的旧哈希，登录时 check_password 会要求升级
+        self.old_hash = get_hasher().encode(self.PASSWORD, get_hasher().salt(), iterations=1000)
+        self.user = User.objects.create(email='async@example.com', username='async', password=self.old_hash)
+
+    async def login(self):
+        return await self.async_client.post(
+            '/api/v1/user/token/async/', {'email': 'async@example.com', 'password': self.PASSWORD},
+            content_type='application/json',
+        )
+
+    async def stored_hash(self):
+        return (await User.objects.aget(pk=self.user.pk)).password
+
+    async def test_register(self):
+        response = await self.async_client.post('/api/v1/user/register/async/', {
+            'username': 'New User', 'email': 'new@example.com', 'password': self.PASSWORD, 'password2': self.PASSWORD,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        user = await User.objects.aget(email='new@example.com')
+        self.assertTrue(await sync_to_async(user.check_password)(self.PASSWORD))
+
+    async def test_saturated_pool_returns_503(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        # 占满线程和排队名额
+        for _ in range(self.pool.workers + self.pool.max_queue):
+            self.pool.submit(release.wait)
+        register = await self.async_client.post('/api/v1/user/register/async/', {
+            'username': 'New User', 'email': 'new@example.com', 'password': self.PASSWORD, 'password2': self.PASSWORD,
+        }, content_type='application/json')
+        for response in (await self.login(), register):
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(await User.objects.filter(email='new@example.com').aexists())
+
+    async def test_rehash_sync(self):
+        with override_settings(PASSWORD_HASHING_POOL={'UPGRADE_ON_LOGIN': 'sync'}):
+            response = await self.login()
+        self.assertEqual(response.status_code, 200, response.content)
+        # 响应返回前已经保存了新哈希
+        self.assertFalse(get_hasher().must_update(await self.stored_hash()))
+
+    async def test_rehash_background(self):
+        with override_settings(PASSWORD_HASHING_POOL={'UPGRADE_ON_LOGIN': 'background'}):
+            response = await self.login()
+        self.assertEqual(response.status_code, 200, response.content)
+        await sync_to_async(self.pool._executor.shutdown)(wait=True)
+        self.assertFalse(get_hasher().must_update(await self.stored_hash()))
+
+    async def test_rehash_off(self):
+        with override_settings(PASSWORD_HASHING_POOL={'UPGRADE_ON_LOGIN': 'off'}):
+            response = await self.login()
+        self.assertEqual(response.status_code, 200, response.content)
+        await sync_to_async(self.pool._executor.shutdown)(wait=True)
+        self.assertEqual(await self.stored_hash(), self.old_hash)
+
+
+class BulkRegisterViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        admin = User.objects.create_superuser(email='admin@example.com', username='admin', password='x')
+        self.client.force_authenticate(admin)
+
+    @override_settings(BULK_IMPORT={'WORKERS': 0, 'MAX_REPORTED_ERRORS': 2})
+    def test_error_report_is_capped(self):
+        rows = ''.join(f'bad-{i},x\n' for i in range(5))
+        upload = SimpleUploadedFile('users.csv', ('\ufeffemail,password\n' + rows).encode('utf-8'))
+        response = self.client.post('/api/v1/user/bulk-register/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['failed'], len(response.data['errors'])), (5, 2))
+        self.assertTrue(response.data['errors_truncated'])
+
+
+class TokenBlacklistTests(TestCase):
+    def setUp(self):
+        expires_at = timezone.now() + timedelta(days=1)
+        RevokedToken.objects.bulk_create(RevokedToken(jti=f'jti-{i}', expires_at=expires_at) for i in range(25))
+        self.store = DatabaseBlacklistStore(chunk_size=10)
+
+    def test_changes_are_streamed_in_chunks(self):
+        chunks = [jtis for jtis, _ in self.store.changes_since(0)]
+        self.assertEqual([len(jtis) for jtis in chunks], [10, 10, 5])
+
+    def test_late_commit_below_the_cursor_is_synced(self):
+        # 主键较小的行在较大的行之后才提交（PostgreSQL 上的并发插入）
+        top = RevokedToken.objects.order_by('-pk').first().pk
+        expires_at = timezone.now() + timedelta(days=1)
+        RevokedToken.objects.create(pk=top + 2, jti='jti-fast', expires_at=expires_at)
+        cursor = None
+        for _, cursor in self.store.changes_since(0):
+            pass
+        self.assertEqual(cursor[0], top + 2)
+        RevokedToken.objects.create(pk=top + 1, jti='jti-late', expires_at=expires_at)
+        self.assertEqual([jtis for jtis, _ in self.store.changes_since(cursor)], [['jti-late']])
+
+    def test_gaps_are_given_up_after_the_timeout(self):
+        store = DatabaseBlacklistStore(gap_timeout=0)
+        top = RevokedToken.objects.order_by('-pk').first().pk
+        expires_at = timezone.now() + timedelta(days=1)
+        RevokedToken.objects.create(pk=top + 2, jti='jti-fast', expires_at=expires_at)
+        [(_, cursor)] = store.changes_since(top)
+        RevokedToken.objects.create(pk=top + 1, jti='jti-rolled-back', expires_at=expires_at)
+        self.assertEqual(list(store.changes_since(cursor)), [])
+
+    def test_reads_use_the_primary(self):
+        with mock.patch('api.blacklist.RevokedToken.objects.using', wraps=RevokedToken.objects.using) as using:
+            self.store.contains('jti-1')
+            list(self.store.changes_since(0))
+        self.assertEqual({call.args for call in using.call_args_list}, {('default',)})
+
+    def test_repeated_add_is_counted_once(self):
+        bloom = BloomFilter(100, 0.001)
+        self.assertTrue(bloom.add('a'))
+        self.assertFalse(bloom.add('a'))
+        self.assertEqual(bloom.count, 1)
+
+    def test_rebuild_sizes_filter_from_store(self):
+        blacklist = TokenBlacklist(self.store, capacity=4, error_rate=0.001, sync_interval=0)
+        blacklist.warm_up()
+        self.assertEqual((blacklist.filter.capacity, blacklist.filter.count), (50, 25))
+        self.assertTrue(blacklist.is_blacklisted('jti-3'))
+        self.assertFalse(blacklist.is_blacklisted('jti-unknown'))
+
+
+class CachedAccessTokenTests(TestCase):
+    """缓存命中时不再解码和校验签名，吊销后立即拒绝（耗时对比见 bench_access_token）"""
+
+    def setUp(self):
+        user = User.objects.create(email='token@example.com', full_name='token')
+        self.raw = str(MyTokenObtainPairSerializer.get_token(user).access_token).encode()
+        get_claims_cache().clear()
+
+    def test_cache_hits_skip_signature_verification(self):
+        with mock.patch.object(TokenBackend, 'decode', autospec=True, side_effect=TokenBackend.decode) as decode:
+            tokens = [CachedAccessToken(self.raw) for _ in range(5)]
+        decode.assert_called_once()
+        self.assertEqual(get_claims_cache().stats()['misses'], 1)
+        self.assertTrue(all(token.payload == AccessToken(self.raw).payload for token in tokens))
+
+    def test_revoked_token_is_rejected(self):
+        CachedAccessToken(self.raw).blacklist()
+        with self.assertRaises(TokenError):
+            CachedAccessToken(self.raw)
+
+
+class ProfileAvatarViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(email='avatar@example.com', username='avatar', password='x'))
+
+    def test_empty_file_is_rejected(self):
+        upload = SimpleUploadedFile('empty.png', b'', content_type='image/png')
+        response = self.client.post('/api/v1/user/profile/avatar/', {'image': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+
+    def test_unknown_type_is_rejected(self):
+        upload = SimpleUploadedFile('notes.png', b'plain text', content_type='image/png')
+        response = self.client.post('/api/v1/user/profile/avatar/', {'image': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+    @staticmethod
+    def png(width, height):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'red').save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def test_thumbnails_are_square_and_served_once_generated(self):
+        content = self.png(300, 200)
+        with tempfile.TemporaryDirectory() as directory:
+            storage = FileSystemStorage(location=directory, base_url='/media/')
+            upload = ContentFile(content)
+            upload.sha256, upload.extension = hashlib.sha256(content).hexdigest(), 'png'
+            name = store_avatar(upload, storage)
+
+            original = storage.url(name)
+            self.assertEqual(set(thumbnail_urls(name, False, storage).values()), {original})
+
+            created = generate_thumbnails(name, storage)
+            self.assertEqual(len(created), len(get_thumbnail_sizes()))
+            for size in get_thumbnail_sizes():
+                with storage.open(thumbnail_name(upload.sha256, size)) as thumbnail:
+                    self.assertEqual(Image.open(thumbnail).size, (size, size))
+            self.assertEqual(
+                thumbnail_urls(name, True, storage),
+                {size: storage.url(thumbnail_name(upload.sha256, size)) for size in get_thumbnail_sizes()},
+            )
+
+    def test_original_is_returned_until_thumbnails_are_ready(self):
+        user = User.objects.get(email='avatar@example.com')
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory):
+            upload = SimpleUploadedFile('me.png', self.png(120, 80), content_type='image/png')
+            with mock.patch('api.views.schedule_thumbnails') as schedule, \
+                    self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/v1/user/profile/avatar/', {'image': upload}, format='multipart')
+            self.assertEqual(response.status_code, 200, response.data)
+            name = Profile.objects.get(user=user).image.name
+            schedule.assert_called_once_with(name, user_id=user.pk)
+            self.assertTrue(response.data['image'].endswith(default_storage.url(name)))
+
+            generate_thumbnails(name)
+            mark_thumbnails_ready(user.pk, name)
+            response = self.client.get('/api/v1/user/me/')
+            digest = name.rsplit('/', 1)[1].split('.')[0]
+            size = max(get_thumbnail_sizes())
+            self.assertTrue(response.data['image'].endswith(default_storage.url(thumbnail_name(digest, size))))
+
+
+class EncodeRenditionTests(SimpleTestCase):
+    def test_large_stderr_does_not_block(self):
+        # 假的 ffmpeg：先向 stderr 写出远超管道缓冲区的内容，再输出进度并失败退出
+        script = (
+            'import sys\n'
+            'sys.stderr.write("x" * (1 << 20) + "boom")\n'
+            'print("out_time_ms=500000", flush=True)\n'
+            'sys.exit(1)\n'
+        )
+        progress = []
+        with tempfile.TemporaryDirectory() as directory:
+            fake = os.path.join(directory, 'ffmpeg')
+            with open(fake, 'w') as file:
+                file.write(f'#!{sys.executable}\n{script}')
+            os.chmod(fake, 0o755)
+            with mock.patch('api.transcoding.get_ffmpeg_binary', return_value=fake):
+                with self.assertRaisesRegex(RuntimeError, 'boom$'):
+                    encode_rendition('in.mp4', directory, ('360p', 360, '800k', '96k'), 640, 360, 1.0, progress.append)
+        self.assertEqual(progress, [0.5])
+
+
+class CourseListViewTests(TestCase):
+    def setUp(self):
+        Course.objects.bulk_create(
+            Course(title=f'Course {i}', slug=f'course-{i}', price=Decimal(i), status=Course.PUBLISHED) for i in range(3)
+        )
+
+    def test_pages_follow_the_cursor(self):
+        first = self.client.get('/api/v1/course/', {'ordering': 'price', 'page_size': 2}).json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual([course['slug'] for course in second['results']], ['course-2'])
+
+    def test_forged_cursor_is_not_found(self):
+        for values in (['abc', 1], [None, 1], [[1], 1], ['1.00', 'x']):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            response = self.client.get('/api/v1/course/', {'ordering': 'price', 'cursor': cursor})
+            self.assertEqual(response.status_code, 404, values)
+
+    def test_non_finite_price_is_rejected(self):
+        for value in ('nan', 'Infinity', '-inf', 'abc'):
+            response = self.client.get('/api/v1/course/', {'min_price': value})
+            self.assertEqual(response.status_code, 400, value)
+        response = self.client.get('/api/v1/course/', {'min_price': '1', 'max_price': '1.5'})
+        self.assertEqual([course['slug'] for course in response.json()['results']], ['course-1'])
+
+
+class CompiledSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create(email='teacher@example.com', username='teacher', full_name='Lǐ Wěi "老师"')
+        cls.student = User.objects.create_user(email='student@example.com', username='student', password='x')
+        category = Category.objects.create(title='Python & Django', slug='python')
+        courses = [
+            Course(category=category, teacher=teacher, title='入门 <Course>', slug='intro', image='course_images/a b.png',
+                   price=Decimal('19.90'), rating=4.75, review_count=12, featured=True, status=Course.PUBLISHED),
+            # 没有分类、老师和图片：嵌套对象和文件地址都是 null
+            Course(title='Course 2', slug='course-2', price=Decimal('0'), rating=0, status=Course.PUBLISHED),
+            Course(teacher=teacher, title='Course 3', slug='course-3', price=Decimal('1234.5'), level='advanced',
+                   status=Course.PUBLISHED),
+        ]
+        Course.objects.bulk_create(courses)
+        Enrollment.objects.bulk_create(Enrollment(user=cls.student, course=course) for course in courses)
+
+    def assertSameJSON(self, serializer_class, queryset, context):
+        plan = get_plan(serializer_class)
+        self.assertIsNotNone(plan)
+        expected = JSONRenderer().render(serializer_class(queryset, many=True, context=context).data)
+        self.assertEqual(dumps(plan.serialize(plan.rows(queryset), context)), expected)
+        chunks = stream_json(plan.rows(queryset).iterator(), plan.bind(context), chunk_size=2)
+        self.assertEqual(b''.join(chunks), expected)
+
+    def test_serializers_match_drf(self):
+        context = {'request': Request(APIRequestFactory().get('/api/v1/'))}
+        self.assertSameJSON(
+            api_serializer.CourseListSerializer, Course.objects.select_related('category', 'teacher').order_by('id'),
+            context,
+        )
+        self.assertSameJSON(
+            api_serializer.EnrollmentSerializer,
+            Enrollment.objects.select_related('course__category', 'course__teacher').order_by('-id'),
+            context,
+        )
+
+    def test_views_match_drf(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        for url in ('/api/v1/course/?ordering=price&page_size=2', '/api/v1/student/courses/'):
+            responses = []
+            for enabled in (True, False):
+                reset_response_cache()
+                with override_settings(FAST_SERIALIZER={'ENABLED': enabled}):
+                    responses.append(client.get(url))
+            self.assertEqual(responses[0].status_code, 200)
+            self.assertEqual(responses[0].content, responses[1].content, url)
+        reset_response_cache()
+
+
+class CourseSearchViewTests(TestCase):
+    def test_negative_limit_is_rejected(self):
+        for value in ('-5', 'abc'):
+            response = self.client.get('/api/v1/course/search/', {'q': 'django', 'limit': value})
+            self.assertEqual(response.status_code, 400, value)
+
+    def test_search_clamps_limit(self):
+        with mock.patch('api.search.get_search_backend') as backend:
+            backend.return_value.search.return_value = []
+            search_courses('django', limit=-5)
+        self.assertEqual(backend.return_value.search.call_args.args[1], 1)
+
+
+class SearchIndexTests(TestCase):
+    """直接使用迁移创建的 SQLite FTS5 索引表"""
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 index is only created on SQLite')
+        reset_search_backends()
+
+    def create_course(self, title, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Course.objects.create(title=title, slug=title.lower().replace(' ', '-'), status=Course.PUBLISHED, **kwargs)
+
+    def test_search_and_autocomplete(self):
+        course = self.create_course('Python for beginners', description='Variables and loops')
+        self.assertEqual(search_courses('loops'), [course.pk])
+        self.assertEqual(autocomplete_courses('pyt'), [(course.pk, 'Python for beginners')])
+
+    def test_category_delete_removes_its_title_from_the_index(self):
+        category = Category.objects.create(title='Databases', slug='databases')
+        course = self.create_course('Intro to SQL', category=category)
+        self.assertEqual(search_courses('databases'), [course.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            category.delete()
+        self.assertEqual(search_courses('databases'), [])
+        self.assertEqual(search_courses('sql'), [course.pk])
+
+    def test_rebuild_keeps_the_index_populated(self):
+        first, second, draft = (self.create_course(title) for title in ('First course', 'Second course', 'Draft course'))
+        # 不触发信号的批量修改：索引中留下过期的草稿课程
+        Course.objects.filter(pk=draft.pk).update(status=Course.DRAFT)
+        self.assertEqual(set(search_courses('course')), {first.pk, second.pk, draft.pk})
+
+        seen = []
+        rebuild_index(chunk_size=1, on_chunk=lambda done: seen.append(set(search_courses('course'))))
+        # 每一批写入之后，后面还没有重建的课程仍然可以搜到
+        self.assertTrue(all({first.pk, second.pk} <= ids for ids in seen))
+        self.assertEqual(set(search_courses('course')), {first.pk, second.pk})
+
+
+class LectureDurationsTests(TestCase):
+    def test_unknown_durations_expire(self):
+        durations = LectureDurations(max_size=10, unknown_ttl=30)
+        with mock.patch('api.progress.time.monotonic', return_value=1000.0):
+            self.assertIs(durations.get(12345), False)
+            with self.assertNumQueries(0):
+                self.assertIs(durations.get(12345), False)
+        with mock.patch('api.progress.time.monotonic', return_value=1031.0), self.assertNumQueries(1):
+            self.assertIs(durations.get(12345), False)
+
+
+class ProgressBufferTests(TestCase):
+    def setUp(self):
+        get_lecture_durations().clear()
+        self.user = User.objects.create_user(email='viewer@example.com', username='viewer', password='x')
+        self.course = Course.objects.create(title='Django', slug='django', status=Course.PUBLISHED)
+        section = Section.objects.create(course=self.course, title='Intro', position=0)
+        self.lecture = Lecture.objects.create(section=section, title='Welcome', position=0, duration=600)
+        # 不让后台线程在测试期间写库
+        self.buffer = ProgressBuffer(flush_interval=3600, flush_threshold=1000, max_pending=1000, batch_size=100)
+
+    def heartbeat(self, position, client_ts=None):
+        return record_heartbeat(self.user.pk, self.lecture.pk, position, client_ts, buffer=self.buffer)
+
+    def test_only_enrolled_users_of_published_courses_are_written(self):
+        self.heartbeat(30)
+        self.buffer.flush()
+        self.assertFalse(LectureProgress.objects.exists())
+        self.assertEqual(self.buffer.stats['rejected'], 1)
+
+        Enrollment.objects.create(user=self.user, course=self.course)
+        self.heartbeat(40)
+        self.buffer.flush()
+        self.assertEqual(LectureProgress.objects.get().position, 40)
+
+        Course.objects.filter(pk=self.course.pk).update(status=Course.DRAFT)
+        self.heartbeat(50)
+        self.buffer.flush()
+        self.assertEqual(LectureProgress.objects.get().position, 40)
+        self.assertEqual(self.buffer.stats['rejected'], 2)
+
+    def test_future_client_ts_is_clamped(self):
+        now = int(time.time() * 1000)
+        self.heartbeat(500, client_ts=now + 86_400_000)
+        # 一分钟后的正常心跳仍然能更新 position
+        with mock.patch('api.progress.time.time', return_value=now / 1000 + 60):
+            self.assertEqual(self.heartbeat(20, client_ts=now + 60_000)['position'], 20)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='x')
+        self.course = Course.objects.create(title='Django', slug='django', price=Decimal('19.99'), status=Course.PUBLISHED)
+
+    def test_double_click_reuses_the_pending_order(self):
+        with mock.patch('api.payments.get_stripe') as get_stripe:
+            sessions = get_stripe.return_value.checkout.Session
+            sessions.create.return_value = {'id': 'cs_1', 'url': 'https://pay/cs_1'}
+            sessions.retrieve.return_value = {'id': 'cs_1', 'status': 'open', 'url': 'https://pay/cs_1'}
+            first = create_checkout(self.user, self.course)
+            second = create_checkout(self.user, self.course)
+        self.assertEqual(first, second)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(sessions.create.call_args.kwargs['line_items'][0]['price_data']['unit_amount'], 1999)
+
+    def test_stripe_is_called_outside_the_transaction(self):
+        outer = len(connection.atomic_blocks)
+        depths = []
+
+        def create(**kwargs):
+            depths.append(len(connection.atomic_blocks))
+            return {'id': 'cs_1', 'url': 'https://pay/cs_1'}
+
+        with mock.patch('api.payments.get_stripe') as get_stripe:
+            get_stripe.return_value.checkout.Session.create.side_effect = create
+            create_checkout(self.user, self.course)
+        self.assertEqual(depths, [outer])
+        self.assertEqual(Order.objects.get().stripe_session_id, 'cs_1')
+
+    def test_stripe_failure_is_retried_with_the_same_idempotency_key(self):
+        with mock.patch('api.payments.get_stripe') as get_stripe:
+            sessions = get_stripe.return_value.checkout.Session
+            sessions.create.side_effect = RuntimeError('stripe is down')
+            with self.assertRaises(RuntimeError):
+                create_checkout(self.user, self.course)
+            order = Order.objects.get()
+            self.assertEqual((order.status, order.stripe_session_id), (Order.PENDING, None))
+
+            sessions.create.side_effect = None
+            sessions.create.return_value = {'id': 'cs_1', 'url': 'https://pay/cs_1'}
+            self.assertEqual(create_checkout(self.user, self.course), (order, 'https://pay/cs_1'))
+        keys = {call.kwargs['idempotency_key'] for call in sessions.create.call_args_list}
+        self.assertEqual(keys, {f'checkout-order-{order.pk}'})
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class StripeEventTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='x')
+        self.course = Course.objects.create(title='Django', slug='django', price=Decimal('19.99'), status=Course.PUBLISHED)
+        self.order = Order.objects.create(
+            user=self.user, course=self.course, amount=self.course.price, stripe_session_id='cs_1',
+        )
+
+    def event(self, event_id, event_type, obj):
+        return {'id': event_id, 'type': event_type, 'created': 1700000000, 'data': {'object': obj}}
+
+    def test_partial_refund_keeps_the_enrollment(self):
+        ingest_events([
+            self.event('evt_1', 'checkout.session.completed', {'id': 'cs_1', 'payment_status': 'paid', 'payment_intent': 'pi_1'}),
+            self.event('evt_2', 'charge.refunded', {'id': 'ch_1', 'payment_intent': 'pi_1', 'refunded': False}),
+        ])
+        process_batch()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.PAID)
+        self.assertTrue(Enrollment.objects.filter(user=self.user, course=self.course).exists())
+
+        ingest_events([self.event('evt_3', 'charge.refunded', {'id': 'ch_1', 'payment_intent': 'pi_1', 'refunded': True})])
+        process_batch()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.REFUNDED)
+        self.assertFalse(Enrollment.objects.exists())
+
+    def test_reconcile_against_the_fake_server(self):
+        # reconcile_stripe 的完整流程：从（假的）Stripe 拉取漏收的事件，写入收件箱并处理
+        self.addCleanup(setattr, stripe, 'api_base', stripe.api_base)
+        with FakeStripe().running() as fake:
+            fake.complete_session('cs_1')
+            fake.add_event('checkout.session.completed', {'id': 'cs_other', 'payment_status': 'paid'})
+            conf = {**get_stripe_settings(), 'SECRET_KEY': 'sk_test_fake', 'API_BASE': fake.base_url}
+            with override_settings(STRIPE=conf):
+                fetched = reconcile(timezone.now() - timedelta(hours=1), chunk_size=1)
+        self.assertEqual((fetched, process_pending()), (2, 2))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.PAID)
+        self.assertTrue(Enrollment.objects.filter(user=self.user, course=self.course).exists())
+
+    def test_processing_errors_are_not_swallowed(self):
+        with mock.patch('api.payments.process_batch', side_effect=DatabaseError('database is down')):
+            with self.assertRaises(DatabaseError):
+                process_pending()
+
+        # 常驻进程：记录日志后等待下一轮重试，而不是当作收件箱已空
+        batches = [DatabaseError('database is down'), 1, 0]
+        with mock.patch('api.payments.process_batch', side_effect=batches) as batch, \
+                mock.patch('api.payments.time.sleep', side_effect=[None, StopIteration]):
+            with self.assertLogs('api.payments', 'ERROR'), self.assertRaises(StopIteration):
+                process_pending(stop_when_empty=False)
+        self.assertEqual(batch.call_count, 3)
+
+    def test_failing_event_does_not_block_the_batch(self):
+        ingest_events([
+            self.event('evt_bad', 'checkout.session.completed', {'id': 'cs_bad', 'payment_status': 'paid'}),
+            self.event('evt_1', 'checkout.session.completed', {'id': 'cs_1', 'payment_status': 'paid', 'payment_intent': 'pi_1'}),
+        ])
+        def fail_on_bad(events):
+            if any(event.event_id == 'evt_bad' for event in events):
+                raise ValueError('bad event')
+            return apply_events(events)
+
+        with mock.patch('api.payments.apply_events', side_effect=fail_on_bad), self.assertLogs('api.payments'):
+            self.assertEqual(process_batch(), 2)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.PAID)
+        bad = StripeEvent.objects.get(event_id='evt_bad')
+        self.assertEqual((bad.attempts, bad.processed_at, bad.error), (1, None, 'bad event'))
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def test_invalidation_by_another_process_during_produce_skips_the_store(self):
+        this, other = (ResponseCache(max_size=10, shared_cache=caches['default'], key_prefix='test') for _ in range(2))
+
+        def produce():
+            # 读完旧数据之后，另一个进程提交了修改并让标签失效
+            other.invalidate_tags(['course'])
+            return ['old'], 200, {}, ('course',)
+
+        self.assertEqual(this.fetch('test:key', produce, 60, 0)[0], ['old'])
+        self.assertEqual(this.get('test:key'), (None, None))
+        self.assertEqual(this.fetch('test:key', lambda: (['new'], 200, {}, ('course',)), 60, 0)[0], ['new'])
+        self.assertEqual(other.get('test:key')[0].data, ['new'])
+
+
+class RateLimiterTests(SimpleTestCase):
+    def limiter(self):
+        return RateLimiter(
+            LocalCounterStore(), RATE_LIMIT_DEFAULTS['RULES'], {'account': 5, 'ip': 50}, 900, 30, 3600, 86400,
+            failure_rules=RATE_LIMIT_DEFAULTS['FAILURE_RULES'],
+        )
+
+    def identities(self, number):
+        # 每次来自不同的网段，不触发 ip / net / account 维度的限制
+        net = f'10.{number}.0'
+        return {'ip': f'{net}.1', 'net': f'{net}.0/24', 'email': 'victim@example.com', 'account': f'victim@example.com|{net}'}
+
+    def test_requests_without_failures_do_not_block_the_email(self):
+        limiter = self.limiter()
+        for number in range(50):
+            self.assertEqual(limiter.check('login', self.identities(number)), 0)
+
+    def test_failures_per_email_are_limited(self):
+        limiter = self.limiter()
+        for number in range(10):
+            self.assertEqual(limiter.check('login', self.identities(number)), 0)
+            limiter.record_failure(self.identities(number))
+        self.assertGreater(limiter.check('login', self.identities(10)), 0)
+
+
+@override_settings(AUTH_RATE_LIMIT={'ENABLED': False})
+class ViewQueryBudgetTests(TestCase):
+    """每个接口都要满足视图上声明的 query_budget，并且没有 N+1（与 check_view_query_budgets 相同的检查）"""
+    # 每种数据的行数，大于 N+1 的判定阈值
+    ROWS = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create(email='teacher@example.com', username='teacher', full_name='Teacher')
+        cls.student = User.objects.create_user(email='student@example.com', username='student', password='x')
+        cls.staff = User.objects.create_superuser(email='admin@example.com', username='admin', password='x')
+        category = Category.objects.create(title='Python', slug='python')
+        courses = []
+        for i in range(cls.ROWS):
+            course = Course.objects.create(
+                category=category, teacher=teacher, title=f'Course {i}', slug=f'course-{i}', status=Course.PUBLISHED,
+            )
+            for position in range(3):
+                section = Section.objects.create(course=course, title=f'Section {position}', position=position)
+                Lecture.objects.bulk_create(
+                    Lecture(section=section, title=f'Lecture {n}', duration=600, position=n) for n in range(4)
+                )
+            courses.append(course)
+        Enrollment.objects.bulk_create(Enrollment(user=cls.student, course=course) for course in courses)
+        cls.lecture = Lecture.objects.filter(section__course=courses[0]).first()
+
+    def setUp(self):
+        # 每个请求都是缓存未命中；黑名单和 backend/wsgi.py 中一样提前加载
+        reset_response_cache()
+        self.addCleanup(reset_response_cache)
+        get_token_blacklist().warm_up()
+
+    def client_for(self, user=None):
+        client = APIClient()
+        if user is not None:
+            token = MyTokenObtainPairSerializer.get_token(user).access_token
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def request(self, client, method, url, **kwargs):
+        budget, threshold = view_budget(resolve(url.split('?')[0]).func, get_query_budget_settings())
+        with query_budget(budget, threshold, label=f'{method.upper()} {url}'):
+            response = getattr(client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400, response.content[:200])
+        return response
+
+    def test_catalog(self):
+        client = self.client_for()
+        for url in (
+            '/api/v1/course/categories/',
+            '/api/v1/course/?category=python&page_size=20',
+            '/api/v1/course/course-0/',
+            '/api/v1/course/search/?q=course',
+            '/api/v1/course/autocomplete/?q=cou',
+        ):
+            with self.subTest(url=url):
+                self.request(client, 'get', url)
+
+    def test_current_user(self):
+        client = self.client_for(self.student)
+        etag = self.request(client, 'get', '/api/v1/user/me/')['ETag']
+        self.assertEqual(self.request(client, 'get', '/api/v1/user/me/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.request(client, 'patch', '/api/v1/user/me/', data={'country': 'China'}, format='json')
+
+    def test_student(self):
+        client = self.client_for(self.student)
+        self.request(client, 'get', '/api/v1/student/courses/?page_size=20')
+        self.request(client, 'get', f'/api/v1/student/progress/{self.lecture.pk}/')
+        self.request(client, 'post', '/api/v1/student/progress/', data={'lecture': self.lecture.pk, 'position': 30}, format='json')
+        # 在测试数据库销毁之前写入缓冲的心跳
+        get_progress_buffer().flush()
+
+    def test_staff(self):
+        self.request(self.client_for(self.staff), 'get', '/api/v1/cache/stats/')
+
+
+class CurrentUserETagTests(TestCase):
+    def setUp(self):
+        # TestCase 回滚后用户 id 可能复用，清掉上一个测试留下的版本号
+        caches['default'].clear()
+        self.user = User.objects.create_user(email='me@example.com', username='me', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/api/v1/user/me/', **headers)
+
+    def test_not_modified_until_profile_changes(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(etag).status_code, 304)
+        # 其他进程修改了资料：响应缓存的标签版本号在本进程中没有变化，数据库中的版本号变了
+        with override_settings(RESPONSE_CACHE={'ENABLED': False}), self.captureOnCommitCallbacks(execute=True):
+            self.user.full_name = 'Renamed'
+            self.user.save()
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['full_name'], 'Renamed')
+        self.assertEqual(self.get(response['ETag']).status_code, 304)
+
+    def test_not_modified_needs_no_queries(self):
+        etag = self.get()['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(etag).status_code, 304)
+
+    def test_cache_miss_falls_back_to_the_database(self):
+        etag = self.get()['ETag']
+        caches['default'].clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get(etag).status_code, 304)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(etag).status_code, 304)
+
+    def test_profile_save_publishes_the_new_version(self):
+        etag = self.get()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = Profile.objects.get(user=self.user)
+            profile.about = 'Updated elsewhere'
+            profile.save()
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_patch_returns_the_new_etag(self):
+        etag = self.get()['ETag']
+        response = self.client.patch('/api/v1/user/me/', {'about': 'Hi'}, format='json')
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.get(response['ETag']).status_code, 304)
@@ -0,0 +1,164 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, BlacklistMixin, RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow, datetime_from_epoch, datetime_to_epoch
+
+from api.blacklist import get_token_blacklist
+
+
+class ClaimsCache:
+    """
+    已验证 access token 声明的 LRU 缓存
+    key 是原始 token 的 SHA-256 摘要（不在内存中保存 token 原文），value 是 (过期时间戳, 声明)
+    条目在 token 自身的 exp 之后自动失效；超出容量时淘汰最久未使用的条目
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def digest(raw_token):
+        if isinstance(raw_token, str):
+            raw_token = raw_token.encode()
+        return hashlib.sha256(raw_token).digest()
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, payload = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return payload
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, expires_at, payload):
+        with self._lock:
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_claims_cache = None
+_claims_cache_lock = threading.Lock()
+
+
+def get_claims_cache():
+    """返回进程内唯一的 ClaimsCache 实例，容量由 settings.ACCESS_TOKEN_CACHE['MAX_SIZE'] 决定"""
+    global _claims_cache
+    if _claims_cache is None:
+        with _claims_cache_lock:
+            if _claims_cache is None:
+                conf = getattr(settings, 'ACCESS_TOKEN_CACHE', {})
+                _claims_cache = ClaimsCache(max_size=conf.get('MAX_SIZE', 10000))
+    return _claims_cache
+
+
+class CachedAccessToken(AccessToken):
+    """
+    带验证结果缓存的 AccessToken，可直接替换 SIMPLE_JWT['AUTH_TOKEN_CLASSES'] 中的 AccessToken
+    同一个 token 第一次出现时正常解码并校验 HMAC 签名，之后直到 exp 之前都直接复用缓存的声明；
+    每次使用都会检查 jti 是否已被拉黑（布隆过滤器，通常不访问存储）
+    """
+
+    def __init__(self, token=None, verify=True):
+        if token is None or not verify:
+            super().__init__(token, verify)
+            return
+
+        cache = get_claims_cache()
+        key = cache.digest(token)
+        now = aware_utcnow()
+        payload = cache.get(key, datetime_to_epoch(now))
+        if payload is None:
+            super().__init__(token, verify)
+            # 只缓存到 exp 为止，之后再次使用会重新完整校验并因过期被拒绝
+            cache.set(key, self.payload['exp'], dict(self.payload))
+        else:
+            self.token = token
+            self.current_time = now
+            self.payload = dict(payload)
+        self.check_blacklist()
+
+    def check_blacklist(self):
+        """access token 的 jti 被拉黑（例如用户主动注销）时抛出 TokenError"""
+        jti = self.payload.get(api_settings.JTI_CLAIM)
+        if jti is not None and get_token_blacklist().is_blacklisted(jti):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        """吊销当前 access token，并从缓存中移除"""
+        get_token_blacklist().add(
+            self.payload[api_settings.JTI_CLAIM],
+            datetime_from_epoch(self.payload["exp"]),
+        )
+        if self.token is not None:
+            get_claims_cache().discard(get_claims_cache().digest(self.token))
+
+
+class ScalableRefreshToken(RefreshToken):
+    """
+    使用 api.blacklist 黑名单的 refresh token
+    - 签发时不写 OutstandingToken
+    - 拉黑时只写入一条 RevokedToken（或 Redis key）
+    - 校验时先查布隆过滤器，绝大多数未拉黑的 token 不需要访问存储
+    """
+    access_token_class = CachedAccessToken
+
+    @classmethod
+    def for_user(cls, user):
+        # 跳过 BlacklistMixin.for_user，不再为每个签发的 token 插入 OutstandingToken
+        return super(BlacklistMixin, cls).for_user(user)
+
+    def verify(self, *args, **kwargs):
+        self.check_blacklist()
+        # 跳过 BlacklistMixin.verify，避免再查询 BlacklistedToken 表
+        super(BlacklistMixin, self).verify(*args, **kwargs)
+
+    def check_blacklist(self):
+        """token 已被拉黑时抛出 TokenError"""
+        if get_token_blacklist().is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        """把当前 token 加入黑名单，保留到它本身过期为止"""
+        get_token_blacklist().add(
+            self.payload[api_settings.JTI_CLAIM],
+            datetime_from_epoch(self.payload["exp"]),
+        )
@@ -0,0 +1,332 @@
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api.models import TranscodeJob
+
+"""
+课程视频转码（HLS 多码率）
+
+上传的视频保存后只在 api.TranscodeJob 表中插入一条任务，请求立即返回；
+转码由 run_transcode_worker 命令启动的独立 worker 进程完成，不占用 Web worker：
+  1. 用 moviepy 读取时长和分辨率，截取一帧作为封面
+  2. 按 RENDITIONS 逐个码率调用 ffmpeg（moviepy 自带的 imageio-ffmpeg 二进制）切成 HLS 分片
+  3. 写入 master.m3u8，播放器根据带宽自动切换码率
+输出目录：MEDIA_ROOT/course_videos/hls/<任务 id>/{master.m3u8, poster.jpg, 360p/index.m3u8, ...}
+
+队列直接使用数据库：
+  - 领取任务用带条件的 UPDATE（WHERE id = ? AND 仍然可领取），SQLite 和 PostgreSQL 都不会被两个 worker 同时领到
+  - worker 执行期间定期续租（locked_until），进程崩溃后租约过期，任务自动回到可领取状态
+  - 失败后按指数退避重试，超过 max_attempts 标记为 failed
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # run_transcode_worker 默认启动的 worker 进程数
+    'WORKERS': 2,
+    # 每个任务最多尝试的次数
+    'MAX_ATTEMPTS': 3,
+    # 第 n 次失败后等待 RETRY_BACKOFF * 2 ** (n - 1) 秒再重试
+    'RETRY_BACKOFF': 30,
+    # 租约时长（秒），worker 在转码过程中会不断续租
+    'LEASE_SECONDS': 120,
+    # 队列为空时的轮询间隔（秒）
+    'POLL_INTERVAL': 2.0,
+    # HLS 分片时长（秒）
+    'SEGMENT_SECONDS': 6,
+    # 码率阶梯：(名称, 高度, 视频码率, 音频码率)，高于原视频的档位会被跳过（至少保留最低一档）
+    'RENDITIONS': (
+        ('360p', 360, '800k', '96k'),
+        ('720p', 720, '2800k', '128k'),
+        ('1080p', 1080, '5000k', '192k'),
+    ),
+    # x264 编码速度，CPU 转码时 veryfast 在速度和体积之间比较均衡
+    'PRESET': 'veryfast',
+    # 输出目录（MEDIA_ROOT 下的相对路径）
+    'OUTPUT_DIR': 'course_videos/hls',
+}
+
+
+def get_transcoding_settings():
+    """合并默认配置和 settings.VIDEO_TRANSCODING"""
+    return {**DEFAULTS, **getattr(settings, 'VIDEO_TRANSCODING', {})}
+
+
+def get_ffmpeg_binary():
+    """使用 moviepy 配置的 ffmpeg（默认是 imageio-ffmpeg 自带的静态二进制），不依赖系统安装"""
+    from moviepy.config import get_setting
+
+    return get_setting('FFMPEG_BINARY')
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def enqueue(source_name):
+    """为已保存的视频创建转码任务"""
+    conf = get_transcoding_settings()
+    return TranscodeJob.objects.create(source=source_name, max_attempts=conf['MAX_ATTEMPTS'])
+
+
+def claimable(now):
+    """可以领取的任务：排队中且已到执行时间，或者执行中但租约已过期（worker 崩溃）"""
+    return (
+        Q(status=TranscodeJob.QUEUED, run_after__lte=now)
+        | Q(status=TranscodeJob.RUNNING, locked_until__lt=now)
+    )
+
+
+def claim_job(worker, batch=5):
+    """
+    领取一个任务，没有可领取的任务时返回 None
+    先读出几个候选 id，再逐个用带条件的 UPDATE 抢占，UPDATE 影响 1 行才算领取成功
+    """
+    conf = get_transcoding_settings()
+    now = timezone.now()
+    # 最后一次尝试时 worker 崩溃的任务不会再被领取，直接标记为失败
+    TranscodeJob.objects.filter(
+        status=TranscodeJob.RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts'),
+    ).update(status=TranscodeJob.FAILED, error='worker lease expired', locked_until=None, updated_at=now)
+
+    candidates = list(
+        TranscodeJob.objects.filter(claimable(now), attempts__lt=F('max_attempts'))
+        .order_by('run_after', 'id')
+        .values_list('id', flat=True)[:batch]
+    )
+    for job_id in candidates:
+        claimed = TranscodeJob.objects.filter(claimable(now), pk=job_id, attempts__lt=F('max_attempts')).update(
+            status=TranscodeJob.RUNNING,
+            locked_by=worker,
+            locked_until=now + timedelta(seconds=conf['LEASE_SECONDS']),
+            attempts=F('attempts') + 1,
+            progress=0,
+            updated_at=now,
+        )
+        if claimed:
+            return TranscodeJob.objects.get(pk=job_id)
+    return None
+
+
+class ProgressReporter:
+    """
+    把转码进度写回任务，同时续租
+    每秒最多写一次数据库；任务已被其他 worker 接管（租约过期后被重新领取）时抛出 LeaseLost
+    """
+
+    def __init__(self, job, interval=1.0):
+        self.job = job
+        self.interval = interval
+        self.last_write = 0
+        self.lease = get_transcoding_settings()['LEASE_SECONDS']
+
+    def __call__(self, progress, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_write < self.interval:
+            return
+        self.last_write = now
+        updated = TranscodeJob.objects.filter(pk=self.job.pk, locked_by=self.job.locked_by).update(
+            progress=round(min(max(progress, 0), 1), 4),
+            locked_until=timezone.now() + timedelta(seconds=self.lease),
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            raise LeaseLost(self.job.pk)
+
+
+class LeaseLost(Exception):
+    """任务已不再属于当前 worker"""
+
+
+def probe(path):
+    """返回 (时长秒数, 宽, 高)"""
+    from moviepy.editor import VideoFileClip
+
+    with VideoFileClip(path, audio=False) as clip:
+        width, height = clip.size
+        return clip.duration, width, height
+
+
+def save_poster(path, target, duration):
+    """截取第 1 秒（短视频取中间）的画面作为封面"""
+    from moviepy.editor import VideoFileClip
+
+    with VideoFileClip(path, audio=False) as clip:
+        clip.save_frame(target, t=min(1.0, duration / 2))
+
+
+def select_renditions(height, renditions):
+    """去掉比原视频更高的档位，至少保留最低一档"""
+    selected = [r for r in renditions if r[1] <= height]
+    return selected or [min(renditions, key=lambda r: r[1])]
+
+
+def even(value):
+    """libx264 要求宽高为偶数"""
+    return max(2, int(round(value / 2)) * 2)
+
+
+def encode_rendition(source, output_dir, rendition, width, height, duration, on_progress):
+    """
+    用 ffmpeg 输出一档码率的 HLS 分片
+    通过 -progress pipe:1 读取已编码的时长，换算成 0 ~ 1 的进度回调 on_progress
+    """
+    conf = get_transcoding_settings()
+    name, target_height, video_bitrate, audio_bitrate = rendition
+    target_width = even(width * target_height / height)
+    os.makedirs(output_dir, exist_ok=True)
+    command = [
+        get_ffmpeg_binary(), '-y', '-hide_banner', '-loglevel', 'error', '-nostats',
+        '-i', source,
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-vf', f'scale={target_width}:{even(target_height)}',
+        '-c:v', 'libx264', '-preset', conf['PRESET'], '-profile:v', 'main',
+        '-b:v', video_bitrate, '-maxrate', video_bitrate, '-bufsize', video_bitrate,
+        # 每个分片起点强制关键帧、关闭场景切换关键帧，保证各档位的分片边界对齐，播放器切换码率时不会卡顿
+        '-force_key_frames', f"expr:gte(t,n_forced*{conf['SEGMENT_SECONDS']})", '-sc_threshold', '0',
+        '-c:a', 'aac', '-b:a', audio_bitrate, '-ac', '2',
+        '-f', 'hls', '-hls_time', str(conf['SEGMENT_SECONDS']), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(output_dir, 'segment_%05d.ts'),
+        '-progress', 'pipe:1',
+        os.path.join(output_dir, 'index.m3u8'),
+    ]
+    # stderr 写到临时文件而不是管道：只读 stdout 时，ffmpeg 写满 stderr 管道的缓冲区会阻塞，两边互相等待
+    with tempfile.TemporaryFile(mode='w+') as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, text=True)
+        try:
+            for line in process.stdout:
+                key, _, value = line.strip().partition('=')
+                # 虽然叫 out_time_ms，单位实际是微秒
+                if key == 'out_time_ms' and value.isdigit() and duration:
+                    on_progress(int(value) / 1_000_000 / duration)
+            if process.wait() != 0:
+                stderr.seek(0)
+                raise RuntimeError(f'ffmpeg failed for {name}: {stderr.read().strip()[-2000:]}')
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+    return name, target_width, even(target_height), video_bitrate, audio_bitrate
+
+
+def bitrate_to_bps(value):
+    value = str(value).lower()
+    if value.endswith('k'):
+        return int(float(value[:-1]) * 1000)
+    if value.endswith('m'):
+        return int(float(value[:-1]) * 1_000_000)
+    return int(value)
+
+
+def write_master_playlist(output_dir, variants):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for name, width, height, video_bitrate, audio_bitrate in variants:
+        bandwidth = bitrate_to_bps(video_bitrate) + bitrate_to_bps(audio_bitrate)
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={width}x{height}')
+        lines.append(f'{name}/index.m3u8')
+    with open(os.path.join(output_dir, 'master.m3u8'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def transcode(job, on_progress=lambda progress, force=False: None):
+    """
+    执行一个转码任务，返回需要写回任务的字段
+    输出先写到临时目录，全部成功后再替换正式目录，重试时不会留下不完整的分片
+    原始视频需要在本地文件系统上（FileSystemStorage），ffmpeg 直接读取文件
+    """
+    conf = get_transcoding_settings()
+    source = job.source.path
+    relative_dir = f"{conf['OUTPUT_DIR'].rstrip('/')}/{job.pk}"
+    output_dir = os.path.join(settings.MEDIA_ROOT, relative_dir)
+    working_dir = f'{output_dir}.tmp'
+    shutil.rmtree(working_dir, ignore_errors=True)
+    os.makedirs(working_dir)
+
+    try:
+        duration, width, height = probe(source)
+        save_poster(source, os.path.join(working_dir, 'poster.jpg'), duration)
+
+        renditions = select_renditions(height, conf['RENDITIONS'])
+        variants = []
+        for index, rendition in enumerate(renditions):
+            def report(fraction, index=index):
+                on_progress((index + min(fraction, 1)) / len(renditions))
+
+            variants.append(encode_rendition(
+                source, os.path.join(working_dir, rendition[0]), rendition, width, height, duration, report,
+            ))
+        write_master_playlist(working_dir, variants)
+
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.replace(working_dir, output_dir)
+    except BaseException:
+        shutil.rmtree(working_dir, ignore_errors=True)
+        raise
+
+    return {
+        'duration': duration,
+        'poster': f'{relative_dir}/poster.jpg',
+        'playlist': f'{relative_dir}/master.m3u8',
+    }
+
+
+def run_job(job):
+    """执行已领取的任务并记录结果：成功、等待重试或最终失败"""
+    conf = get_transcoding_settings()
+    reporter = ProgressReporter(job)
+    owned = TranscodeJob.objects.filter(pk=job.pk, locked_by=job.locked_by)
+    try:
+        result = transcode(job, reporter)
+    except LeaseLost:
+        logger.warning("Transcode job %s was taken over by another worker", job.pk)
+        return
+    except Exception as e:
+        logger.exception("Transcode job %s failed (attempt %s/%s)", job.pk, job.attempts, job.max_attempts)
+        if job.attempts >= job.max_attempts:
+            owned.update(status=TranscodeJob.FAILED, error=str(e), locked_until=None, updated_at=timezone.now())
+        else:
+            delay = conf['RETRY_BACKOFF'] * 2 ** (job.attempts - 1)
+            owned.update(
+                status=TranscodeJob.QUEUED,
+                error=str(e),
+                run_after=timezone.now() + timedelta(seconds=delay),
+                locked_until=None,
+                updated_at=timezone.now(),
+            )
+        return
+    owned.update(
+        status=TranscodeJob.SUCCEEDED, progress=1, error='', locked_until=None, updated_at=timezone.now(), **result,
+    )
+
+
+def work(burst=False, stop=None):
+    """
+    worker 主循环：不断领取并执行任务
+    burst=True 时队列为空就退出（用于测试和一次性处理积压）；stop 为 multiprocessing.Event，置位后退出
+    """
+    conf = get_transcoding_settings()
+    name = worker_name()
+    processed = 0
+    while stop is None or not stop.is_set():
+        close_old_connections()
+        job = claim_job(name)
+        if job is None:
+            if burst:
+                break
+            time.sleep(conf['POLL_INTERVAL'])
+            continue
+        logger.info("Worker %s picked transcode job %s", name, job.pk)
+        run_job(job)
+        processed += 1
+    return processed
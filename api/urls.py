@@ -1,5 +1,6 @@
 from yaml import Token
 from api import views as api_views
+from api import async_views as api_async_views
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
 
@@ -14,6 +15,73 @@ urlpatterns = [
 
     # 注册接口：使用自定义视图（RegisterView），创建新用户
     # 请求方式：POST，参数包含用户名、邮箱、密码等信息
-    path("user/register/", api_views.RegisterView.as_view())
+    path("user/register/", api_views.RegisterView.as_view()),
+
+    # 批量注册接口：仅管理员可用，上传 CSV / JSONL 文件批量创建用户
+    # 请求方式：POST，multipart/form-data，字段 file（必填）和 format（csv / jsonl，可选）
+    path("user/bulk-register/", api_views.BulkRegisterView.as_view()),
+
+    # 导出用户 / 资料：仅管理员可用，例如 user/export/users.csv、user/export/profiles.ndjson?gzip=1
+    # 请求方式：GET，流式返回，不受行数限制
+    path("user/export/<slug:dataset>.<slug:fmt>", api_views.UserExportView.as_view()),
+
+    # 当前用户：GET 返回用户和资料（?fields= 选择字段，支持 If-None-Match / 304），PATCH 修改显示名称、国家、简介
+    path("user/me/", api_views.CurrentUserView.as_view()),
+
+    # 头像上传接口：登录用户上传自己的头像，返回带缩略图地址的资料
+    # 请求方式：POST，multipart/form-data，字段 image
+    path("user/profile/avatar/", api_views.ProfileAvatarView.as_view()),
+
+    # 课程视频上传接口：仅管理员可用，保存视频并创建后台转码任务，返回 202 和任务信息
+    # 请求方式：POST，multipart/form-data，字段 video
+    path("media/videos/", api_views.VideoUploadView.as_view()),
+
+    # 转码任务进度：status、progress（0 ~ 1），完成后返回 HLS 播放地址和封面地址
+    # 请求方式：GET
+    path("media/jobs/<int:pk>/", api_views.TranscodeJobView.as_view()),
+
+    # 课程分类列表
+    path("course/categories/", api_views.CategoryListView.as_view()),
+
+    # 课程目录：按分类 / 价格筛选，按评分 / 价格 / 上架时间排序，keyset 分页（翻页使用返回的 next 地址）
+    # 请求方式：GET，例如 /api/v1/course/?category=python&ordering=rating
+    path("course/", api_views.CourseListView.as_view()),
+
+    # 课程全文搜索：按相关度排序，例如 /api/v1/course/search/?q=django rest
+    path("course/search/", api_views.CourseSearchView.as_view()),
+
+    # 搜索框输入联想：按标题前缀匹配，例如 /api/v1/course/autocomplete/?q=pyt
+    path("course/autocomplete/", api_views.CourseAutocompleteView.as_view()),
+
+    # 课程详情（含章节和课时大纲）
+    path("course/<slug:slug>/", api_views.CourseDetailView.as_view()),
+
+    # 我的课程：当前用户报名的课程
+    path("student/courses/", api_views.MyCourseListView.as_view()),
+
+    # 播放心跳：播放器每隔几秒上报一次播放位置，服务器合并后批量写库
+    # 请求方式：POST，参数 {"lecture": 1, "position": 123.4, "client_ts": 1700000000000}
+    path("student/progress/", api_views.ProgressHeartbeatView.as_view()),
+
+    # 查询某个课时的观看进度
+    path("student/progress/<int:lecture_id>/", api_views.LectureProgressView.as_view()),
+
+    # 购买课程：创建订单并返回 Stripe 支付页面地址（免费课程直接报名）
+    # 请求方式：POST，参数 {"course": 1}
+    path("checkout/", api_views.CheckoutView.as_view()),
+
+    # Stripe webhook：验签后写入收件箱，由 process_stripe_events 后台批量处理
+    path("payments/stripe/webhook/", api_views.StripeWebhookView.as_view()),
+
+    # 响应缓存的命中率等指标（仅管理员）
+    path("cache/stats/", api_views.ResponseCacheStatsView.as_view()),
+
+    # 异步登录 / 注册接口：参数和返回值与上面的同步接口相同，
+    # 在 ASGI 下运行时密码哈希交给有界线程池，不会阻塞 worker；线程池满时返回 503
+    path("user/token/async/", api_async_views.token_obtain_view),
+    path("user/register/async/", api_async_views.register_view),
+
+    # 密码哈希线程池的排队深度等指标
+    path("user/hashing/stats/", api_async_views.hashing_pool_stats_view),
 ]
 
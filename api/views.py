@@ -1,10 +1,38 @@
+import hashlib
+import io
+from decimal import Decimal, InvalidOperation
+
 from django.shortcuts import render
 from api import serializer as api_serializer  # 导入序列化器模块并重命名为 api_serializer
 from rest_framework_simplejwt.views import TokenObtainPairView  # 引入 JWT 登录视图
 from rest_framework import generics  # 引入泛型视图（如 CreateAPIView）
-from rest_framework.permissions import AllowAny  # 引入权限类，允许所有用户访问
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated  # 引入权限类，允许所有用户访问 / 仅管理员访问 / 仅登录用户访问
+from rest_framework.parsers import MultiPartParser  # 解析 multipart/form-data 文件上传
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from userauths.models import User  # 导入用户模型
+from api.avatars import AvatarUploadHandler, schedule_thumbnails, store_avatar  # 头像流式上传、内容寻址存储和缩略图
+from api.models import Category, Course, Enrollment, Lecture, Section, TranscodeJob  # 课程目录和视频转码任务
+from api.pagination import KeysetPagination  # keyset（游标）分页
+from api.fastserializer import CompiledListMixin  # 列表接口用编译后的序列化器直接转换 values_list() 的行
+from api.search import autocomplete_courses, search_courses  # 课程全文搜索
+from api.payments import AlreadyEnrolled, InvalidWebhook, create_checkout, ingest_events, verify_webhook  # 课程购买和 Stripe webhook 收件箱
+from api.ratelimit import LoginRateThrottle, RegisterRateThrottle, record_login_failure, record_login_success  # 登录 / 注册限流
+from api.progress import ProgressBufferFull, UnknownLecture, get_progress, record_heartbeat  # 观看进度（写回缓冲）
+from api.response_cache import CachedResponseMixin, cache_response, course_tag, get_response_cache  # 公开接口的响应缓存
+from api.transcoding import enqueue  # 创建转码任务，由独立的 worker 进程执行
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils.http import parse_etags
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.negotiation import BaseContentNegotiation
+from userauths.bulk_import import (  # 批量导入用户
+    ENCODING, BulkUserImporter, get_import_settings, get_shared_executor, guess_format, iter_rows,
+)
+from userauths.export import DATASETS, FORMATS, export_response  # 流式导出用户 / 资料
+from userauths.models import Profile, User  # 导入用户和资料模型
+from userauths.profile_version import get_cached_version, remember_version  # /user/me/ 的 ETag 使用的资料版本号缓存
 
 # Create your views here.  # 这是 Django 自动生成的注释，表示你可以在这里写视图逻辑
 
@@ -22,6 +50,23 @@ class MyTokenObtainPairView(TokenObtainPairView):
     # serializer_class 不是 Python 关键字，但在 DRF 中是“约定俗成”的属性名，
     # 视图调用时会自动使用这里指定的序列化器来处理请求数据（如登录验证）。
 
+    # 限流和锁定在校验密码之前检查，被拒绝的请求不会计算密码哈希（见 api/ratelimit.py）
+    throttle_classes = (LoginRateThrottle,)
+
+    # 查询预算（见 core/querybudget.py）：按邮箱查询用户，密码哈希升级时再更新一次
+    query_budget = 2
+
+    def post(self, request, *args, **kwargs):
+        email = request.data.get(User.USERNAME_FIELD) if hasattr(request.data, 'get') else None
+        try:
+            response = super().post(request, *args, **kwargs)
+        except AuthenticationFailed:
+            # 用户不存在、密码错误或账号已停用
+            record_login_failure(request, email)
+            raise
+        record_login_success(request, email)
+        return response
+
 
 class RegisterView(generics.CreateAPIView):
     """
@@ -34,6 +79,498 @@ class RegisterView(generics.CreateAPIView):
 
     # 设置权限为允许任意用户访问（即使未登录也能注册）
     permission_classes = (AllowAny,)
+    # 邮箱唯一性校验 1 条 + 插入用户和资料 2 条（BEGIN 由数据库后端直接执行，不计入）
+    query_budget = 3
 
     # 指定用于处理请求的序列化器
     serializer_class = api_serializer.RegisterSerializer
+
+    # 按 IP / 网段限制注册频率，在校验和哈希密码之前拒绝
+    throttle_classes = (RegisterRateThrottle,)
+
+
+class BulkRegisterView(APIView):
+    """
+    批量注册视图（仅管理员）
+    上传 CSV / JSONL 文件（multipart 字段名 file），按批次校验、在共用的进程池中哈希密码并批量写入
+    返回创建数量以及逐行的错误报告；错误报告最多 BULK_IMPORT['MAX_REPORTED_ERRORS'] 行，
+    超出时 errors_truncated 为 true，出错的总行数见 failed
+    """
+    permission_classes = (IsAdminUser,)
+    # 查询数随文件大小增长，且每个批次执行相同的语句：不限条数，也不检查 N+1
+    query_budget = None
+    query_repeat_limit = 0
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request):
+        serializer = api_serializer.BulkRegisterSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        upload = serializer.validated_data['file']
+        fmt = serializer.validated_data.get('format') or guess_format(upload.name)
+
+        conf = get_import_settings()
+        max_errors = conf['MAX_REPORTED_ERRORS']
+        errors = []
+
+        def on_error(line, email, messages):
+            if len(errors) < max_errors:
+                errors.append({'line': line, 'email': email, 'errors': messages})
+
+        importer = BulkUserImporter(workers=conf['WORKERS'], on_error=on_error, executor=get_shared_executor())
+        # 大文件由 Django 保存在临时文件中，这里逐行读取，不会一次性载入内存
+        stream = io.TextIOWrapper(upload.file, encoding=ENCODING, newline='')
+        summary = importer.run(iter_rows(stream, fmt))
+
+        return Response({**summary.as_dict(), 'errors': errors, 'errors_truncated': summary.failed > len(errors)})
+
+
+class ExportContentNegotiation(BaseContentNegotiation):
+    """导出的内容类型由 URL 决定，不按 Accept 请求头协商（否则 Accept: text/csv 会得到 406）；错误信息仍以 JSON 返回"""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class UserExportView(APIView):
+    """
+    导出用户 / 资料（仅管理员）
+    请求方式：GET /user/export/users.csv、/user/export/profiles.ndjson，参数 gzip=1 时返回 .gz 文件
+    按主键顺序逐块查询、编码并流式返回，内存占用与表的大小无关
+    """
+    permission_classes = (IsAdminUser,)
+    content_negotiation_class = ExportContentNegotiation
+    # 认证 + 导出查询（在视图返回后、发送响应时才逐块执行）
+    query_budget = 2
+
+    def get(self, request, dataset, fmt):
+        if dataset not in DATASETS or fmt not in FORMATS:
+            return Response({'detail': f"可选：{', '.join(DATASETS)} / {', '.join(FORMATS)}"}, status=404)
+        return export_response(dataset, fmt, compress=request.query_params.get('gzip') in ('1', 'true'))
+
+
+class ProfileAvatarView(APIView):
+    """
+    上传当前用户头像
+    请求方式：POST，multipart/form-data，字段 image
+    上传内容按块写入临时文件并计算哈希，超过大小限制或不是图片时立即停止接收；
+    保存后在后台生成缩略图；生成完成之前返回的资料中 image / thumbnails 为原图地址，之后为缩略图地址
+    """
+    permission_classes = (IsAuthenticated,)
+    # 认证 + 查询资料 + 更新 image / thumbnails_ready
+    query_budget = 3
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request):
+        # 必须在第一次访问 request.data / request.FILES 之前替换上传处理器
+        handler = AvatarUploadHandler(request._request)
+        request._request.upload_handlers = [handler]
+        upload = request.FILES.get('image')
+
+        if handler.error:
+            return Response({'image': [handler.error]}, status=handler.status_code)
+        if upload is None:
+            return Response({'image': ['请上传头像文件']}, status=400)
+
+        name = store_avatar(upload)
+        profile = Profile.objects.get(user_id=request.user.pk)
+        if profile.image != name:
+            profile.image = name
+            profile.thumbnails_ready = False
+        # Profile.save 只会更新 image / thumbnails_ready 这两列
+        profile.save()
+        # 提交后再生成缩略图，生成完成时才能找到已经换上新头像的资料
+        transaction.on_commit(lambda: schedule_thumbnails(name, user_id=request.user.pk))
+
+        return Response(api_serializer.ProfileSerializer(profile, context={'request': request}).data)
+
+
+class CurrentUserView(APIView):
+    """
+    当前用户（用户和资料合并成一个对象）
+    请求方式：
+        GET    参数 fields（可选，逗号分隔，例如 ?fields=id,full_name,image），默认不返回 about
+        PATCH  修改 full_name（显示名称）/ country / about，只写入真正改变的列
+    响应带由资料版本号（Profile.version，每次写入资料时加一）计算的 ETag；版本号同时缓存在共享缓存中
+    （userauths/profile_version.py），请求带 If-None-Match 时先和缓存中的版本号比较，资料没有修改时直接返回 304，
+    不查询数据库也不序列化；缓存未命中或 ETag 不同时再用一条 JOIN 查询取出需要的列和版本号
+    """
+    permission_classes = (IsAuthenticated,)
+    # 认证（用户缓存未命中时）+ 一条 JOIN 查询（版本号缓存命中并返回 304 时没有）；PATCH 再加一条 UPDATE
+    query_budget = 3
+
+    def get(self, request):
+        fields = self.get_fields(request)
+        version = get_cached_version(request.user.pk)
+        if version is not None:
+            etag = self.get_etag(request.user, version, fields)
+            if self.not_modified(request, etag):
+                return self.not_modified_response(etag)
+
+        profile = self.get_profile(request, fields)
+        if version is None:
+            remember_version(request.user.pk, profile.version)
+        etag = self.get_etag(request.user, profile.version, fields)
+        if self.not_modified(request, etag):
+            return self.not_modified_response(etag)
+        return self.respond(request, profile, fields, etag)
+
+    def patch(self, request):
+        fields = self.get_fields(request)
+        serializer = api_serializer.CurrentUserSerializer(data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        changes = serializer.validated_data
+
+        # Profile.save() 总会读取 full_name，一起取出，避免再加载一次延迟字段
+        profile = self.get_profile(request, (*fields, *changes, 'full_name'))
+        changed = [name for name, value in changes.items() if getattr(profile, name) != value]
+        for name in changed:
+            setattr(profile, name, changes[name])
+        if changed:
+            profile.save(update_fields=changed)
+        return self.respond(request, profile, fields, self.get_etag(request.user, profile.version, fields))
+
+    def get_fields(self, request):
+        raw = request.query_params.get('fields')
+        if not raw:
+            return api_serializer.CurrentUserSerializer.DEFAULT_FIELDS
+        fields = tuple(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+        columns = api_serializer.CurrentUserSerializer.COLUMNS
+        if not fields or any(name not in columns for name in fields):
+            raise ValidationError({'fields': [f"可选值：{', '.join(columns)}"]})
+        return fields
+
+    def get_profile(self, request, fields):
+        columns = (*api_serializer.CurrentUserSerializer.columns(fields), 'version')
+        queryset = Profile.objects.filter(user_id=request.user.pk)
+        if any(column.startswith('user__') for column in columns):
+            queryset = queryset.select_related('user')
+        return generics.get_object_or_404(queryset.only(*columns))
+
+    @staticmethod
+    def get_etag(user, version, fields):
+        # 邮箱、用户名在用户表中，不受资料版本号管理，使用认证时取出的用户（与版本号一样不需要查询）
+        user_values = [
+            str(getattr(user, column.removeprefix('user__')))
+            for column in api_serializer.CurrentUserSerializer.columns(fields) if column.startswith('user__')
+        ]
+        raw = f"{user.pk}:{version}:{','.join(fields)}:{':'.join(user_values)}"
+        return '"%s"' % hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def not_modified(request, etag):
+        # If-None-Match 使用弱比较，忽略 W/ 前缀
+        candidates = parse_etags(request.headers.get('If-None-Match', ''))
+        return '*' in candidates or etag in (candidate.removeprefix('W/') for candidate in candidates)
+
+    @staticmethod
+    def not_modified_response(etag):
+        return Response(status=304, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+    def respond(self, request, profile, fields, etag):
+        data = api_serializer.CurrentUserSerializer(profile, fields=fields, context={'request': request}).data
+        return Response(data, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+
+class VideoUploadView(APIView):
+    """
+    上传课程视频（仅管理员）
+    请求方式：POST，multipart/form-data，字段 video
+    视频保存后只创建转码任务，立即返回 202 和任务信息，转码由 run_transcode_worker 在后台完成
+    """
+    permission_classes = (IsAdminUser,)
+    # 认证 + 创建转码任务
+    query_budget = 2
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request):
+        serializer = api_serializer.VideoUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        upload = serializer.validated_data['video']
+        name = default_storage.save(f'course_videos/source/{upload.name}', upload)
+        job = enqueue(name)
+
+        data = api_serializer.TranscodeJobSerializer(job, context={'request': request}).data
+        return Response(data, status=202)
+
+
+class TranscodeJobView(generics.RetrieveAPIView):
+    """
+    查询转码任务的状态和进度（仅管理员）
+    请求方式：GET，前端可以轮询 progress，status 为 succeeded 后使用 playlist_url 播放
+    """
+    queryset = TranscodeJob.objects.all()
+    permission_classes = (IsAdminUser,)
+    query_budget = 2
+    serializer_class = api_serializer.TranscodeJobSerializer
+
+
+# 课程列表只查询序列化需要的列（CourseListSerializer），关联的分类和老师通过 JOIN 一次取出
+COURSE_LIST_FIELDS = (
+    'id', 'title', 'slug', 'image', 'price', 'level', 'featured', 'rating', 'review_count', 'date',
+    'category__id', 'category__title', 'category__slug',
+    'teacher__id', 'teacher__full_name',
+)
+
+# 目录的排序方式 -> keyset 排序字段，每一种都有对应的联合索引（见 api.models.Course.Meta.indexes）
+COURSE_ORDERINGS = {
+    'rating': ('-rating', '-id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    'newest': ('-date', '-id'),
+}
+
+
+def parse_price(value):
+    """解析价格筛选参数；不是数字或者是 NaN / Infinity 时返回 400"""
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        price = None
+    if price is None or not price.is_finite():
+        raise ValidationError({'price': ['价格必须是数字']})
+    return price
+
+
+class CategoryListView(CachedResponseMixin, generics.ListAPIView):
+    """
+    课程分类列表（数量很少，不分页）
+    请求方式：GET，响应缓存 5 分钟，分类变更后立即失效
+    """
+    permission_classes = (AllowAny,)
+    query_budget = 1
+    cache_ttl = 300
+    cache_tags = ('category',)
+    serializer_class = api_serializer.CategorySerializer
+    pagination_class = None
+    queryset = Category.objects.filter(active=True).only('id', 'title', 'slug').order_by('title')
+
+
+class CourseListView(CachedResponseMixin, CompiledListMixin, generics.ListAPIView):
+    """
+    课程目录
+    请求方式：GET，参数（都可选）：
+        category   分类 slug
+        min_price / max_price   价格区间
+        ordering   rating（默认）/ price / -price / newest
+        cursor / page_size      keyset 分页，翻页使用返回的 next 地址
+    每一组参数（每一页）分别缓存，任何课程或分类变更后失效
+    缓存未命中时用编译后的 CourseListSerializer 直接转换查询出的行，不构造模型实例（见 api/fastserializer.py）
+    """
+    permission_classes = (AllowAny,)
+    # 分类 slug -> id + 一页课程
+    query_budget = 2
+    cache_tags = ('course',)
+    serializer_class = api_serializer.CourseListSerializer
+    pagination_class = KeysetPagination
+
+    def get_keyset_ordering(self, request):
+        ordering = request.query_params.get('ordering') or 'rating'
+        if ordering not in COURSE_ORDERINGS:
+            raise ValidationError({'ordering': [f"可选值：{', '.join(COURSE_ORDERINGS)}"]})
+        return COURSE_ORDERINGS[ordering]
+
+    def get_queryset(self):
+        params = self.request.query_params
+        queryset = Course.objects.filter(status=Course.PUBLISHED)
+
+        category = params.get('category')
+        if category:
+            # 先取出分类 id，课程表上直接用 category_id 走联合索引，而不是 JOIN 分类表再过滤
+            category_id = Category.objects.filter(slug=category).values_list('id', flat=True).first()
+            if category_id is None:
+                return Course.objects.none()
+            queryset = queryset.filter(category_id=category_id)
+
+        if params.get('min_price'):
+            queryset = queryset.filter(price__gte=parse_price(params['min_price']))
+        if params.get('max_price'):
+            queryset = queryset.filter(price__lte=parse_price(params['max_price']))
+
+        return queryset.select_related('category', 'teacher').only(*COURSE_LIST_FIELDS)
+
+
+class CourseDetailView(CachedResponseMixin, generics.RetrieveAPIView):
+    """
+    课程详情（含章节和课时大纲）
+    请求方式：GET，按 slug 查询；课程、章节、课时共 3 条查询，与章节 / 课时数量无关
+    响应按课程打标签，该课程的章节 / 课时变更后失效
+    """
+    permission_classes = (AllowAny,)
+    query_budget = 3
+    serializer_class = api_serializer.CourseDetailSerializer
+    lookup_field = 'slug'
+
+    def get_cache_tags(self, request, data):
+        return ('course', course_tag(data['id']))
+
+    def get_queryset(self):
+        lectures = Lecture.objects.only('id', 'section_id', 'title', 'duration', 'preview', 'position')
+        sections = Section.objects.only('id', 'course_id', 'title', 'position').prefetch_related(
+            Prefetch('lectures', queryset=lectures),
+        )
+        return (
+            Course.objects.filter(status=Course.PUBLISHED)
+            .select_related('category', 'teacher')
+            .only(*COURSE_LIST_FIELDS, 'description', 'language', 'enrollment_count')
+            .prefetch_related(Prefetch('sections', queryset=sections))
+        )
+
+
+class MyCourseListView(CompiledListMixin, generics.ListAPIView):
+    """
+    我的课程：当前用户报名的课程，按报名先后倒序
+    请求方式：GET，keyset 分页
+    """
+    permission_classes = (IsAuthenticated,)
+    # 认证 + 一页报名记录（课程、分类、老师通过 JOIN 取出）
+    query_budget = 2
+    serializer_class = api_serializer.EnrollmentSerializer
+    pagination_class = KeysetPagination
+
+    def get_keyset_ordering(self, request):
+        return ('-id',)
+
+    def get_queryset(self):
+        return (
+            Enrollment.objects.filter(user_id=self.request.user.pk)
+            .select_related('course', 'course__category', 'course__teacher')
+            .only('id', 'enrolled_at', *(f'course__{field}' for field in COURSE_LIST_FIELDS))
+        )
+
+
+class CourseSearchView(CachedResponseMixin, generics.ListAPIView):
+    """
+    课程全文搜索，按相关度排序
+    请求方式：GET，参数 q（搜索词，最后一个词按前缀匹配）、limit（可选，最多 COURSE_SEARCH['MAX_RESULTS'] 条）
+    倒排索引返回课程 id 后再用一条查询取出课程，共 2 条查询
+    """
+    permission_classes = (AllowAny,)
+    query_budget = 2
+    cache_tags = ('course',)
+    serializer_class = api_serializer.CourseListSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        try:
+            limit = int(self.request.query_params.get('limit', 0))
+        except ValueError:
+            limit = -1
+        if limit < 0:
+            raise ValidationError({'limit': ['limit 必须是非负整数']})
+        ids = search_courses(self.request.query_params.get('q', ''), limit=limit or None)
+        if not ids:
+            return []
+        courses = (
+            Course.objects.filter(pk__in=ids, status=Course.PUBLISHED)
+            .select_related('category', 'teacher')
+            .only(*COURSE_LIST_FIELDS)
+        )
+        # 按索引返回的相关度顺序排列
+        by_id = {course.pk: course for course in courses}
+        return [by_id[pk] for pk in ids if pk in by_id]
+
+
+class CourseAutocompleteView(APIView):
+    """
+    搜索框输入联想：按标题前缀匹配
+    请求方式：GET，参数 q，返回 [{id, title}]，只查询索引，不访问课程表
+    """
+    permission_classes = (AllowAny,)
+    query_budget = 1
+
+    @cache_response(tags=('course',))
+    def get(self, request):
+        suggestions = autocomplete_courses(request.query_params.get('q', ''))
+        return Response([{'id': pk, 'title': title} for pk, title in suggestions])
+
+
+class ResponseCacheStatsView(APIView):
+    """
+    响应缓存的命中率等指标（仅管理员可见）
+    请求方式：GET
+    """
+    permission_classes = (IsAdminUser,)
+    query_budget = 1
+
+    def get(self, request):
+        return Response(get_response_cache().snapshot())
+
+
+class ProgressHeartbeatView(APIView):
+    """
+    播放心跳：记录当前用户在某个课时的播放位置
+    请求方式：POST，参数 lecture、position、client_ts（可选）
+    心跳先在进程内合并，后台批量写库，返回 202 和合并后的进度；缓冲区已满（数据库不可用）时返回 503
+    """
+    permission_classes = (IsAuthenticated,)
+    # 认证 + 课时时长（之后走进程内缓存）
+    query_budget = 2
+
+    def post(self, request):
+        serializer = api_serializer.ProgressHeartbeatSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            progress = record_heartbeat(request.user.pk, data['lecture'], data['position'], data.get('client_ts'))
+        except UnknownLecture:
+            return Response({'lecture': ['课时不存在']}, status=400)
+        except ProgressBufferFull:
+            return Response({'detail': '服务繁忙，请稍后重试'}, status=503, headers={'Retry-After': '5'})
+        return Response(progress, status=202)
+
+
+class LectureProgressView(APIView):
+    """
+    查询当前用户在某个课时的进度（包含本进程中尚未写库的心跳）
+    请求方式：GET
+    """
+    permission_classes = (IsAuthenticated,)
+    query_budget = 2
+
+    def get(self, request, lecture_id):
+        return Response(get_progress(request.user.pk, lecture_id))
+
+
+class CheckoutView(APIView):
+    """
+    购买课程
+    请求方式：POST，参数 course（课程 id）
+    付费课程返回订单和 Stripe 支付页面地址 checkout_url；免费课程直接报名，checkout_url 为 null
+    """
+    permission_classes = (IsAuthenticated,)
+    # 认证、课程、是否已报名；免费课程在一个事务里创建订单、报名并更新报名人数
+    query_budget = 8
+
+    def post(self, request):
+        serializer = api_serializer.CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            order, checkout_url = create_checkout(request.user, serializer.validated_data['course'])
+        except AlreadyEnrolled:
+            return Response({'course': ['已经报名了该课程']}, status=400)
+        data = api_serializer.OrderSerializer(order).data
+        return Response({**data, 'checkout_url': checkout_url}, status=201)
+
+
+class StripeWebhookView(APIView):
+    """
+    Stripe webhook
+    只验签并把事件写入收件箱（重复推送的事件被忽略），立即返回 200；
+    订单和报名由 process_stripe_events 在后台批量处理
+    """
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+    query_budget = 1
+
+    def post(self, request):
+        try:
+            event = verify_webhook(request.body, request.META.get('HTTP_STRIPE_SIGNATURE'))
+        except InvalidWebhook as e:
+            return Response({'detail': str(e)}, status=400)
+        ingest_events([event])
+        return Response({'received': True})
@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+异步登录 / 注册接口（api/async_views.py）需要以 ASGI 方式运行才能发挥作用，例如：
+    gunicorn backend.asgi:application -k uvicorn.workers.UvicornWorker
 """
 
 import os
@@ -14,3 +17,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# 在处理第一个请求之前加载 refresh token 黑名单
+from api.blacklist import warm_up_token_blacklist  # noqa: E402
+
+warm_up_token_blacklist()
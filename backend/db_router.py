@@ -0,0 +1,113 @@
+import contextvars
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+"""
+主库 / 只读副本路由
+
+settings.DATABASES 中除 'default'（主库）外，名字以 'replica' 开头的连接都被视为只读副本：
+- 写操作始终走主库
+- 请求中的读操作随机分配到副本（例如资料查询、后台列表页）
+- 读己之写：请求中一旦发生写操作，本请求剩余的读操作都走主库，
+  并通过 Cookie 让该客户端在 DATABASE_REPLICA_STICKY_SECONDS 秒内继续读主库，避免副本延迟导致读不到刚写入的数据
+- 主库处于事务中时，读操作也走主库，保证事务内读取的一致性
+- 请求之外（管理命令、后台任务等）的读操作默认走主库
+"""
+
+# 当前请求的路由状态：{'pinned': 是否固定读主库, 'wrote': 本请求是否写过}
+_request_state = contextvars.ContextVar('db_router_request_state', default=None)
+
+STICKY_COOKIE_NAME = 'db_primary_until'
+
+
+def get_replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+class PrimaryReplicaRouter:
+    """数据库路由，需要与 ReplicaStickinessMiddleware 配合使用"""
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None or state['pinned'] or connections['default'].in_atomic_block:
+            return 'default'
+        replicas = get_replica_aliases()
+        if not replicas:
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['pinned'] = True
+            state['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 主库和副本是同一份数据，允许跨连接建立关联
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 只在主库上执行迁移，副本通过数据库自身的复制同步结构
+        return db == 'default'
+
+
+class ReplicaStickinessMiddleware:
+    """
+    为每个请求初始化路由状态，并维护“读主库”的 Cookie
+    需要放在 MIDDLEWARE 中所有可能访问数据库的中间件之前
+    同时支持同步和异步请求：ASGI 下不会让 Django 为这个中间件在线程和事件循环之间来回切换；
+    异步视图通过 sync_to_async 执行的 ORM 调用会复制当前的 context，写操作记录在同一个状态字典中
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self._start(request)
+        try:
+            response = self.get_response(request)
+            self._finish(response)
+        finally:
+            _request_state.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        token = self._start(request)
+        try:
+            response = await self.get_response(request)
+            self._finish(response)
+        finally:
+            _request_state.reset(token)
+        return response
+
+    @staticmethod
+    def _start(request):
+        sticky_until = request.COOKIES.get(STICKY_COOKIE_NAME)
+        try:
+            pinned = float(sticky_until) > time.time()
+        except (TypeError, ValueError):
+            pinned = False
+        return _request_state.set({'pinned': pinned, 'wrote': False})
+
+    @staticmethod
+    def _finish(response):
+        if _request_state.get()['wrote']:
+            seconds = getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 5)
+            response.set_cookie(
+                STICKY_COOKIE_NAME,
+                str(time.time() + seconds),
+                max_age=seconds,
+                httponly=True,
+                samesite='Lax',
+            )
@@ -0,0 +1,148 @@
+import re
+import threading
+
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+"""
+针对并发调优的 SQLite 数据库后端（ENGINE = 'backend.sqlite_backend'）
+
+在 Django 自带 sqlite3 后端的基础上：
+- 每个新连接设置 WAL 日志模式、synchronous=NORMAL、mmap 和 busy_timeout，读写互不阻塞
+- 事务的 BEGIN 推迟到事务中的第一条语句，按语句类型决定：
+  第一条是写语句时使用 BEGIN IMMEDIATE，在事务开始时就拿到写锁，避免中途升级为写事务时直接报 "database is locked"；
+  第一条是读语句时使用 BEGIN DEFERRED，只读的 atomic() 块不拿写锁，也不进入写队列
+- 进程内写队列：同一个数据库文件同一时间只允许一个线程进入写事务，其余线程在进程内排队，
+  而不是全部挤到 SQLite 的文件锁上轮询。写队列在事务的第一条写语句之前才加入；
+  先读后写的事务在第一次写入时升级，如果读取之后其他连接已经提交过写入，SQLite 仍会报 "database is locked"，
+  这类事务最好先执行写语句
+
+以上参数都可以在 DATABASES[...]['OPTIONS'] 中调整，例如：
+    'OPTIONS': {'busy_timeout': 5000, 'mmap_size': 268435456, 'write_queue': True}
+"""
+
+DEFAULT_OPTIONS = {
+    # 等待锁的最长时间（毫秒），同时用作进程内写队列的等待上限
+    'busy_timeout': 20000,
+    # 内存映射读取的大小（字节）
+    'mmap_size': 256 * 1024 * 1024,
+    # 日志模式和同步级别
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    # 是否启用进程内写队列
+    'write_queue': True,
+}
+
+# 每个数据库文件一把写锁，同一进程内的所有连接共用
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+
+# 会写数据库的语句（SAVEPOINT、PRAGMA 等都按读语句处理）
+WRITE_RE = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b', re.I)
+
+
+def get_write_lock(name):
+    with _write_locks_guard:
+        return _write_locks.setdefault(str(name), threading.Lock())
+
+
+class CursorWrapper(base.SQLiteCursorWrapper):
+    """执行语句之前先让 DatabaseWrapper 按语句类型开始事务、加入写队列"""
+
+    def execute(self, query, params=None):
+        self.db.before_statement(query)
+        return super().execute(query, params)
+
+    def executemany(self, query, param_list):
+        self.db.before_statement(query)
+        return super().executemany(query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # 事务已经开始（atomic() 已进入）但还没有执行 BEGIN
+    _begin_pending = False
+    # 当前事务持有的进程内写锁
+    _write_lock = None
+
+    def get_connection_params(self):
+        options = self.settings_dict["OPTIONS"]
+        self.tuning = {key: options.get(key, default) for key, default in DEFAULT_OPTIONS.items()}
+        # 自定义参数不能传给 sqlite3.connect()，先从 OPTIONS 中去掉
+        self.settings_dict["OPTIONS"] = {
+            key: value for key, value in options.items() if key not in DEFAULT_OPTIONS
+        }
+        try:
+            kwargs = super().get_connection_params()
+        finally:
+            self.settings_dict["OPTIONS"] = options
+        kwargs.setdefault("timeout", self.tuning['busy_timeout'] / 1000)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if not self.is_in_memory_db():
+            conn.execute(f"PRAGMA journal_mode = {self.tuning['journal_mode']}")
+        conn.execute(f"PRAGMA synchronous = {self.tuning['synchronous']}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.tuning['mmap_size'])}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.tuning['busy_timeout'])}")
+        return conn
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=CursorWrapper)
+        cursor.db = self
+        return cursor
+
+    def _start_transaction_under_autocommit(self):
+        # 由第一条语句决定 BEGIN 的类型，见 before_statement()
+        self._begin_pending = True
+
+    def before_statement(self, sql):
+        if self._begin_pending:
+            self._begin_pending = False
+            if WRITE_RE.match(sql):
+                self._acquire_write_lock()
+                try:
+                    # 显式配置了 transaction_mode（如 EXCLUSIVE）时照样使用
+                    self.connection.execute(f"BEGIN {self.transaction_mode or 'IMMEDIATE'}")
+                except Exception:
+                    self._release_write_lock()
+                    raise
+            else:
+                self.connection.execute("BEGIN DEFERRED")
+        elif self._write_lock is None and self.connection.in_transaction and WRITE_RE.match(sql):
+            # 只读开始的事务第一次写入
+            self._acquire_write_lock()
+
+    def _acquire_write_lock(self):
+        if not self.tuning['write_queue'] or self.is_in_memory_db():
+            return
+        lock = get_write_lock(self.settings_dict["NAME"])
+        if not lock.acquire(timeout=self.tuning['busy_timeout'] / 1000):
+            raise OperationalError("database is locked (timed out waiting in the write queue)")
+        self._write_lock = lock
+
+    def _release_write_lock(self):
+        self._begin_pending = False
+        lock = self._write_lock
+        if lock is not None:
+            self._write_lock = None
+            lock.release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_write_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_write_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_write_lock()
@@ -15,21 +15,34 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path,include
-from django.conf import settings
+import re
+
+from django.urls import path,include,re_path
+
+from core import media as core_media
+from core import views as core_views
 
-from django.conf.urls.static import static
 urlpatterns = [
     # 管理后台的 URL 路径，例如访问 http://127.0.0.1:8000/admin/ 会进入后台管理界面
     path('admin/', admin.site.urls),
 
     # 接口版本 v1 的 URL 路径，包含 api 应用下的所有 URL（api/urls.py 里定义的）
     path('api/v1/', include('api.urls')),
-]
 
+    # 数据库健康检查，供负载均衡或容器探针调用
+    path('health/db/', core_views.database_health),
+
+    # Prometheus 指标：按路由统计的耗时、SQL 次数和耗时、序列化耗时、缓存命中、密码哈希耗时
+    path('metrics', core_views.metrics),
+]
 
-# 将媒体文件 URL（用户上传的内容）映射到对应的文件路径，开发环境中使用
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
-# 将静态文件 URL（如 CSS/JS）映射到对应的文件路径，开发环境中使用
-urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+# 媒体文件（MEDIA_URL）和静态文件（STATIC_URL）的 URL 映射，由 core.media.serve 返回（支持 ETag、Range、长期缓存）
+# 正常情况下 core.media.MediaServingMiddleware 已经在中间件链最前面处理了这些请求，
+# 这里是没有启用该中间件时的后备路由；只有 MEDIA_SERVING['ENABLED']（默认跟随 DEBUG）时才挂载
+for prefix, root in core_media.get_mounts():
+    urlpatterns.append(re_path(
+        rf'^{re.escape(prefix.lstrip("/"))}(?P<path>.*)$',
+        core_media.serve,
+        {'document_root': root, 'url_prefix': prefix},
+    ))
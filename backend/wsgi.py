@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# 在处理第一个请求之前加载 refresh token 黑名单
+from api.blacklist import warm_up_token_blacklist  # noqa: E402
+
+warm_up_token_blacklist()
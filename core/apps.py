@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from core.metrics import get_metrics_settings, install_query_timing, install_serializer_timing
+
+        # 统计每个请求的 SQL 和 DRF 序列化耗时（见 core/metrics.py）
+        if get_metrics_settings()['ENABLED']:
+            install_query_timing()
+            install_serializer_timing()
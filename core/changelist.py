@@ -0,0 +1,217 @@
+from django.conf import settings
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.utils import lookup_spawns_duplicates
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import OperationalError, connections
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils.functional import cached_property
+
+from core.keyset import decode_cursor, encode_cursor, keyset_condition
+
+"""
+大表的后台列表页
+
+Django 后台的列表页每次打开都要 COUNT(*) 整张表（分页和“共 N 条”），翻到第 n 页用 OFFSET，
+搜索用 icontains，这三项在几百万行的表上都要扫描全表。FastChangeListMixin 把它们换成：
+
+- 计数：没有筛选条件时用数据库统计信息中的估算行数（PostgreSQL 的 pg_class.reltuples、
+  SQLite ANALYZE 之后的 sqlite_stat1），超过 COUNT_THRESHOLD 才使用；有筛选条件或没有统计信息时
+  最多只数到 COUNT_THRESHOLD 行。页面上估算值显示为“≈ 2000000”，数到上限显示为“10000+”。
+  不再计算“共 N 条”（show_full_result_count = False）。
+- 分页：当前排序的每个字段都是本模型上不可为空的字段、并且包含唯一字段（默认的 -pk 排序就满足）时，
+  用 keyset 分页（?cursor=，见 core/keyset.py），每一页都从索引直接定位；按其他字段排序时退回 OFFSET 分页。
+- 搜索：search_fields 全部以 ^ 开头时（Django 约定的前缀搜索），整个搜索词作为一个前缀，
+  转换成 LOWER(字段) 上的范围条件 >= 'abc' AND < 'abd'，使用模型上对应的 Lower() 函数索引；
+  每个 ^ 字段都要有这样的索引。有不带 ^ 的字段时仍然使用 Django 默认的搜索。
+- list_select_related 照常由 ModelAdmin 声明。
+"""
+
+DEFAULTS = {
+    # 超过这个行数就不再精确计数
+    'COUNT_THRESHOLD': 10_000,
+}
+
+# 游标的查询参数
+CURSOR_VAR = 'cursor'
+
+
+def get_changelist_settings():
+    """合并默认配置和 settings.ADMIN_CHANGELIST"""
+    return {**DEFAULTS, **getattr(settings, 'ADMIN_CHANGELIST', {})}
+
+
+def table_estimate(model, using):
+    """表的估算行数，来自数据库的统计信息；没有统计信息或数据库不支持时返回 None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # 从未 ANALYZE 过的表 reltuples 是 -1（PostgreSQL 14 之前是 0）
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)', [connection.ops.quote_name(table)])
+            row = cursor.fetchone()
+            return int(row[0]) if row and row[0] > 0 else None
+        if connection.vendor == 'sqlite':
+            # 每个索引一行，stat 的第一个数是索引（即表）的行数；没有执行过 ANALYZE 时 sqlite_stat1 不存在
+            try:
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+            except OperationalError:
+                return None
+            counts = [int(stat.split()[0]) for stat, in cursor.fetchall() if stat]
+            return max(counts) if counts else None
+    return None
+
+
+def fast_count(queryset, threshold):
+    """
+    返回 (行数, 类型)，类型是 exact（精确值）、estimate（统计信息的估算值）或 lower_bound（至少这么多行）
+    """
+    if not queryset.query.has_filters():
+        estimate = table_estimate(queryset.model, queryset.db)
+        if estimate is not None and estimate > threshold:
+            return estimate, 'estimate'
+    # SELECT COUNT(*) FROM (SELECT ... LIMIT threshold + 1)，最多读取 threshold + 1 行
+    count = queryset.order_by()[:threshold + 1].count()
+    if count > threshold:
+        return threshold, 'lower_bound'
+    return count, 'exact'
+
+
+class FastCountPaginator(Paginator):
+    """count 用 fast_count()，OFFSET 分页（退回时）按估算的行数计算页数"""
+
+    @cached_property
+    def counted(self):
+        return fast_count(self.object_list, get_changelist_settings()['COUNT_THRESHOLD'])
+
+    @property
+    def count(self):
+        return self.counted[0]
+
+    @property
+    def count_kind(self):
+        return self.counted[1]
+
+
+def prefix_condition(fields, term):
+    """
+    fields 中任意一个字段（小写后）以 term 开头；返回 (别名, 条件)，别名需要先 alias() 到查询集上
+    范围条件让数据库使用 Lower() 函数索引，startswith 保证在任何排序规则下结果都准确
+    """
+    term = term.lower()
+    last = ord(term[-1])
+    upper = term[:-1] + chr(last + 1) if last < 0x10FFFF else None
+    aliases = {f"_prefix_{field.replace('__', '_')}": Lower(field) for field in fields}
+    condition = Q()
+    for alias in aliases:
+        lookups = {f'{alias}__gte': term, f'{alias}__startswith': term}
+        if upper is not None:
+            lookups[f'{alias}__lt'] = upper
+        condition |= Q(**lookups)
+    return aliases, condition
+
+
+class KeysetChangeList(ChangeList):
+    """支持 keyset 分页和估算计数的 ChangeList"""
+
+    def get_filters_params(self, params=None):
+        # cursor 不是筛选条件，否则会被当成字段查询
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # 排序、筛选、搜索的链接都回到第一页，只有“下一页”的链接带 cursor
+        return super().get_query_string({CURSOR_VAR: None, **(new_params or {})}, remove)
+
+    def get_keyset_ordering(self):
+        """
+        当前排序可以用 keyset 分页时，返回截止到第一个唯一字段的排序元组，例如 ('-pk',)、('email',)；
+        排序中有表达式、关联字段、可为空的字段，或者列表可编辑（表单集需要 QuerySet）时返回 None
+        """
+        if self.list_editable:
+            return None
+        ordering = []
+        for part in self.queryset.query.order_by:
+            if not isinstance(part, str):
+                return None
+            name = part.lstrip('-')
+            if name == 'pk':
+                return (*ordering, part)
+            try:
+                field = self.lookup_opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if not field.concrete or field.is_relation or field.null:
+                return None
+            ordering.append(part)
+            if field.unique:
+                return tuple(ordering)
+        return None
+
+    def get_results(self, request):
+        self.keyset_ordering = self.get_keyset_ordering()
+        self.cursor = request.GET.get(CURSOR_VAR) if self.keyset_ordering else None
+        self.next_page_query = None
+        self.first_page_query = self.get_query_string()
+        if self.keyset_ordering is None or self.show_all:
+            super().get_results(request)
+            self.result_count_kind = getattr(self.paginator, 'count_kind', 'exact')
+            return
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        queryset = self.queryset
+        if self.cursor:
+            try:
+                values = decode_cursor(self.keyset_ordering, self.cursor, self.model)
+            except ValueError:
+                raise IncorrectLookupParameters
+            queryset = queryset.filter(keyset_condition(self.keyset_ordering, values))
+        # 多取一行用来判断是否还有下一页
+        rows = list(queryset[:self.list_per_page + 1])
+        has_next = len(rows) > self.list_per_page
+        self.result_list = rows[:self.list_per_page]
+        if has_next:
+            self.next_page_query = self.get_query_string(
+                {CURSOR_VAR: encode_cursor(self.keyset_ordering, self.result_list[-1])},
+            )
+
+        if self.model_admin.show_full_result_count:
+            threshold = get_changelist_settings()['COUNT_THRESHOLD']
+            full_result_count = fast_count(self.root_queryset, threshold)[0]
+        else:
+            full_result_count = None
+        self.result_count = paginator.count
+        self.result_count_kind = getattr(paginator, 'count_kind', 'exact')
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.show_admin_actions = not self.show_full_result_count or bool(full_result_count)
+        self.full_result_count = full_result_count
+        self.can_show_all = self.result_count <= self.list_max_show_all
+        self.multi_page = has_next or bool(self.cursor)
+        self.paginator = paginator
+
+
+class FastChangeListMixin:
+    """
+    大表的 ModelAdmin 混入类，写在 admin.ModelAdmin 之前：
+        class UserAdmin(FastChangeListMixin, admin.ModelAdmin):
+            search_fields = ('^email', '^username')
+    """
+    paginator = FastCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        search_fields = self.get_search_fields(request)
+        term = search_term.strip()
+        if not term or not search_fields or not all(field.startswith('^') for field in search_fields):
+            return super().get_search_results(request, queryset, search_term)
+        fields = [field[1:] for field in search_fields]
+        aliases, condition = prefix_condition(fields, term)
+        may_have_duplicates = any(lookup_spawns_duplicates(self.opts, field) for field in fields)
+        return queryset.alias(**aliases).filter(condition), may_have_duplicates
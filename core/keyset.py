@@ -0,0 +1,75 @@
+import base64
+import binascii
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+"""
+keyset（游标）分页的公共部分：排序条件和游标编码
+
+DRF 接口的 KeysetPagination（api/pagination.py）和后台列表页的 KeysetChangeList（core/changelist.py）共用。
+ordering 是排序字段的元组，例如 ('-rating', '-id')，最后一个字段必须唯一；
+游标是上一页最后一行这些字段的值，JSON 数组再做 URL 安全的 base64 编码。
+"""
+
+
+def keyset_condition(ordering, values):
+    """
+    生成「排在 values 之后」的条件，支持各字段不同的排序方向：
+    (a > v1) OR (a = v1 AND b > v2) OR (a = v1 AND b = v2 AND c > v3) ...
+    前面再加一个冗余的 a >= v1，数据库才能直接从索引中的这个位置开始扫描，而不是从头扫描再逐行过滤
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    first = ordering[0]
+    bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+    return bound & condition
+
+
+def encode_value(value):
+    # DjangoJSONEncoder 会把时间截断到毫秒，游标必须保留完整精度
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(ordering, row):
+    """row 是上一页的最后一行（模型实例或具名元组），按 ordering 取出各字段的值"""
+    values = [encode_value(getattr(row, field.lstrip('-'))) for field in ordering]
+    data = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_value(model, name, value):
+    """用排序字段的 to_python() 转换游标中的值，类型不对（例如伪造的游标）时抛出 ValueError"""
+    field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+    if value is None or isinstance(value, (list, dict)):
+        raise ValueError('Invalid cursor')
+    try:
+        return field.to_python(value)
+    except (ValidationError, TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def decode_cursor(ordering, encoded, model):
+    """
+    解码游标，格式不对、字段个数与 ordering 不一致或者值不能转换成 model 上对应字段的类型时抛出 ValueError
+    调用方把 ValueError 转换成 404（接口）或 IncorrectLookupParameters（后台），而不是在查询时出错返回 500
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+    except (ValueError, binascii.Error, UnicodeEncodeError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise ValueError('Invalid cursor')
+    return [decode_value(model, field.lstrip('-'), value) for field, value in zip(ordering, values)]
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import clear_url_caches, re_path
+from django.views import static
+
+# 对照组的 URL 配置：与原来 urls.py 中的 static(settings.MEDIA_URL, ...) 等价，在 handle() 中填充
+urlpatterns = []
+
+MIDDLEWARE_PATH = 'core.media.MediaServingMiddleware'
+
+# 内容哈希风格的头像文件名，会命中 immutable 缓存规则
+AVATAR_NAME = 'user_folder/ab/ab' + '0' * 62 + '.png'
+VIDEO_NAME = 'course_videos/lecture-01.mp4'
+
+
+class Command(BaseCommand):
+    """
+    对比 core.media 和原来的 static()（django.views.static.serve）返回媒体文件的耗时
+    使用测试客户端经过完整的中间件链，分别测试小头像和大视频文件：
+      - 完整 GET
+      - 带 If-None-Match 的条件 GET（static() 不支持 ETag，仍然返回整个文件）
+      - 视频拖动进度条时的 Range 请求（static() 不支持 Range，仍然返回整个文件）
+    用法：python manage.py bench_media --rounds 200 --video-mb 64
+    """
+    help = "Benchmark core.media against django.views.static.serve for avatars and large video files"
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=200, help="每种场景的请求数（视频场景为其十分之一）")
+        parser.add_argument('--avatar-kb', type=int, default=24, help="头像文件大小（KB）")
+        parser.add_argument('--video-mb', type=int, default=64, help="视频文件大小（MB）")
+
+    def handle(self, *args, **options):
+        rounds = options['rounds']
+        with tempfile.TemporaryDirectory() as media_root:
+            self.write_file(media_root, AVATAR_NAME, options['avatar_kb'] * 1024)
+            self.write_file(media_root, VIDEO_NAME, options['video_mb'] * 1024 * 1024)
+            video_size = options['video_mb'] * 1024 * 1024
+            middle = video_size // 2
+
+            scenarios = [
+                ('avatar GET', AVATAR_NAME, {}, rounds),
+                ('avatar conditional GET', AVATAR_NAME, {'etag': True}, rounds),
+                ('video GET', VIDEO_NAME, {}, max(1, rounds // 10)),
+                ('video Range 1MB', VIDEO_NAME, {'HTTP_RANGE': f'bytes={middle}-{middle + 1024 * 1024 - 1}'}, max(1, rounds // 10)),
+            ]
+
+            urlpatterns[:] = [re_path(r'^media/(?P<path>.*)$', static.serve, {'document_root': media_root})]
+            without_middleware = [m for m in settings.MIDDLEWARE if m != MIDDLEWARE_PATH]
+            variants = [
+                ('static()', {'ROOT_URLCONF': __name__, 'MIDDLEWARE': without_middleware}),
+                ('core.media', {'MIDDLEWARE': [MIDDLEWARE_PATH, *without_middleware]}),
+            ]
+
+            for label, overrides in variants:
+                with override_settings(MEDIA_URL='/media/', MEDIA_ROOT=media_root, DEBUG=True, **overrides):
+                    clear_url_caches()
+                    client = Client()
+                    for name, file_name, headers, count in scenarios:
+                        ms, status, sent = self.measure(client, f'/media/{file_name}', headers, count)
+                        self.stdout.write(
+                            f"{label:<12} {name:<24} status={status}  {ms:9.3f} ms/request  {sent / 1024:10.1f} KB/request"
+                        )
+            clear_url_caches()
+
+    @staticmethod
+    def write_file(root, name, size):
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            chunk = os.urandom(1024 * 1024)
+            while size > 0:
+                f.write(chunk[:size])
+                size -= len(chunk)
+
+    @staticmethod
+    def measure(client, url, headers, rounds):
+        """返回 (每次平均耗时毫秒, 状态码, 每次返回的字节数)"""
+        headers = dict(headers)
+        if headers.pop('etag', False):
+            response = client.get(url)
+            etag = response.headers.get('ETag')
+            response.close()
+            if etag:
+                headers['HTTP_IF_NONE_MATCH'] = etag
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            response = client.get(url, **headers)
+            if response.streaming:
+                sent = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                sent = len(response.content)
+            response.close()
+        elapsed = time.perf_counter() - start
+        return elapsed * 1000 / rounds, response.status_code, sent
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.metrics import get_metrics_settings, make_profile_header
+
+
+class Command(BaseCommand):
+    """
+    生成开启单个请求采样分析的请求头（用 SECRET_KEY 签名，PROFILE_MAX_AGE 秒内有效）
+    用法：curl -H "$(python manage.py make_profile_header)" https://example.com/api/v1/course/
+    分析结果写入 METRICS['PROFILE_DIR']，文件名见响应头 X-Profile-File
+    """
+    help = "Print a signed X-Profile header that enables the sampling profiler for a request"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{get_metrics_settings()['PROFILE_HEADER']}: {make_profile_header()}")
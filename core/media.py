@@ -0,0 +1,281 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+"""
+媒体文件 / 静态文件服务
+
+替代 django.conf.urls.static.static()（只在 DEBUG 下生效、没有缓存相关的响应头）：
+- 完整文件用 FileResponse 返回，WSGI 服务器提供 wsgi.file_wrapper 时（如 gunicorn）走 sendfile 零拷贝
+- ETag / Last-Modified，支持 If-None-Match、If-Modified-Since，命中时返回 304
+- 单个 Range 请求返回 206（视频拖动进度条需要），If-Range 不匹配时返回完整文件
+- 文件名中带内容哈希的文件（头像、缩略图、collectstatic 生成的带哈希文件）返回一年的 immutable 缓存
+- 前面有 nginx / Apache 时可以只返回 X-Accel-Redirect / X-Sendfile 头，由代理读取文件
+- MediaServingMiddleware 放在 MIDDLEWARE 最前面，媒体请求不再经过会话、认证、CSRF 等中间件
+  （包括 SecurityMiddleware，所以 X-Content-Type-Options: nosniff 由 serve() 自己加上）
+
+只有 ENABLED 为 True 时才挂载这些目录（默认跟随 DEBUG）：生产环境通常由 nginx / CDN 提供这些文件，
+需要由 Django 返回时显式打开 MEDIA_SERVING['ENABLED']。
+"""
+
+DEFAULTS = {
+    # 是否由 Django 返回 MEDIA_URL / STATIC_URL 下的文件，None 表示跟随 DEBUG
+    'ENABLED': None,
+    # 'python'           由 Django 读取文件返回
+    # 'x-accel-redirect' 返回 X-Accel-Redirect 头，由 nginx 读取文件（需要配置 internal location）
+    # 'x-sendfile'       返回 X-Sendfile 头，由 Apache mod_xsendfile / lighttpd 读取文件
+    'MODE': 'python',
+    # X-Accel-Redirect 模式下的内部路径前缀：{前缀}{URL 前缀去掉斜杠}/{文件路径}，例如 /protected/media/a.png
+    'ACCEL_PREFIX': '/protected/',
+    # 普通文件的浏览器缓存时间（秒），0 表示每次都用 ETag 向服务器确认
+    'MAX_AGE': 0,
+    # 带哈希的文件名的缓存时间（秒）
+    'IMMUTABLE_MAX_AGE': 365 * 24 * 3600,
+    # 文件名（不含目录）匹配该正则时视为内容不会变化的带哈希文件
+    'IMMUTABLE_PATTERN': r'(?:^|\.)[0-9a-f]{12,64}(?:[._]|$)',
+    # 返回文件时每次读取的块大小
+    'BLOCK_SIZE': 256 * 1024,
+}
+
+
+def get_media_settings():
+    """合并默认配置和 settings.MEDIA_SERVING"""
+    return {**DEFAULTS, **getattr(settings, 'MEDIA_SERVING', {})}
+
+
+def url_prefix(url):
+    """把 MEDIA_URL / STATIC_URL 统一成以 / 开头和结尾的路径前缀（'static/' -> '/static/'）"""
+    return '/' + url.strip('/') + '/'
+
+
+def serving_enabled():
+    enabled = get_media_settings()['ENABLED']
+    return settings.DEBUG if enabled is None else bool(enabled)
+
+
+def get_mounts():
+    """返回 [(URL 前缀, 文件目录)]，未启用时返回空列表，未配置的目录会被跳过"""
+    if not serving_enabled():
+        return []
+    mounts = []
+    for url, root in ((settings.MEDIA_URL, settings.MEDIA_ROOT), (settings.STATIC_URL, settings.STATIC_ROOT)):
+        if url and root and '://' not in url:
+            mounts.append((url_prefix(url), str(root)))
+    return mounts
+
+
+def make_etag(st):
+    """根据文件大小和修改时间生成 ETag，不需要读取文件内容"""
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def is_immutable(path, pattern):
+    return re.search(pattern, os.path.basename(path)) is not None
+
+
+def parse_range(header, size):
+    """
+    解析 Range 头，返回 (起始位置, 结束位置)（都包含在内）
+    没有 Range 头、格式不支持或包含多个区间时返回 None（按完整文件处理，RFC 允许忽略 Range）
+    区间无法满足时返回 'unsatisfiable'
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start, _, end = header[6:].strip().partition('-')
+    try:
+        if start:
+            start = int(start)
+            end = int(end) if end else size - 1
+        elif end:
+            # bytes=-500 表示最后 500 个字节
+            start = max(0, size - int(end))
+            end = size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start > end or start < 0:
+        return None
+    if start >= size:
+        return 'unsatisfiable'
+    return start, min(end, size - 1)
+
+
+def range_still_valid(request, etag, last_modified):
+    """If-Range：ETag 或修改时间与当前文件一致时才按 Range 返回，否则返回完整文件"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+class RangeFile:
+    """
+    只读取文件中 [start, end] 一段的文件对象
+    保留 fileno()，gunicorn 等服务器仍然可以配合 Content-Length 用 sendfile 发送这一段
+    """
+
+    def __init__(self, file, start, end):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = end - start + 1
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def serve(request, path, document_root, url_prefix=None):
+    """
+    返回 document_root 下 path 对应的文件
+    用法与 django.views.static.serve 相同，可以直接用在 urlpatterns 中
+    """
+    conf = get_media_settings()
+    try:
+        fullpath = safe_join(document_root, path)
+    except (SuspiciousFileOperation, ValueError):
+        raise Http404("File not found")
+    try:
+        st = os.stat(fullpath)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404("File not found")
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404("File not found")
+
+    etag = make_etag(st)
+    last_modified = int(st.st_mtime)
+    if is_immutable(path, conf['IMMUTABLE_PATTERN']):
+        cache_control = f"public, max-age={conf['IMMUTABLE_MAX_AGE']}, immutable"
+    elif conf['MAX_AGE']:
+        cache_control = f"public, max-age={conf['MAX_AGE']}"
+    else:
+        cache_control = 'no-cache'
+
+    # 条件请求：ETag / 修改时间都没变时直接返回 304，不打开文件
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        if isinstance(not_modified, HttpResponseNotModified):
+            not_modified['Cache-Control'] = cache_control
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    if conf['MODE'] == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        prefix = conf['ACCEL_PREFIX'].rstrip('/') + (url_prefix or '/')
+        response['X-Accel-Redirect'] = quote(prefix + path)
+    elif conf['MODE'] == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = fullpath
+    else:
+        response = file_response(request, fullpath, st, etag, last_modified, content_type, conf['BLOCK_SIZE'])
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    # 不允许浏览器根据内容猜测类型（例如把用户上传的文件当成 HTML 执行）
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+def file_response(request, fullpath, st, etag, last_modified, content_type, block_size):
+    """由 Django 返回文件内容：完整文件返回 200，单个 Range 返回 206"""
+    size = st.st_size
+    byte_range = None
+    if request.method == 'GET' and range_still_valid(request, etag, last_modified):
+        byte_range = parse_range(request.headers.get('Range'), size)
+
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(fullpath, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(RangeFile(file, start, end), status=206, content_type=content_type)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response.block_size = block_size
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+class MediaServingMiddleware:
+    """
+    在中间件链最前面直接处理 MEDIA_URL / STATIC_URL 下的 GET、HEAD 请求
+    其余请求原样交给后续中间件；需要放在 MIDDLEWARE 的第一位。没有启用文件服务时不安装
+    同时支持同步和异步请求，ASGI 下读取文件的部分在线程中执行
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.mounts = get_mounts()
+        if not self.mounts:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def match(self, request):
+        """返回 (文件目录, 相对路径, URL 前缀)，不是文件请求时返回 None"""
+        if request.method in ('GET', 'HEAD'):
+            for prefix, root in self.mounts:
+                if request.path_info.startswith(prefix):
+                    return root, request.path_info[len(prefix):], prefix
+        return None
+
+    @staticmethod
+    def serve_or_none(request, root, path, prefix):
+        try:
+            return serve(request, path, root, url_prefix=prefix)
+        except Http404:
+            # 文件不存在时交给 URL 路由，保持与原来一致的 404 页面
+            return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        matched = self.match(request)
+        if matched is not None:
+            response = self.serve_or_none(request, *matched)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        matched = self.match(request)
+        if matched is not None:
+            response = await sync_to_async(self.serve_or_none, thread_sensitive=False)(request, *matched)
+            if response is not None:
+                return response
+        return await self.get_response(request)
@@ -0,0 +1,515 @@
+import atexit
+import bisect
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core import signing
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+"""
+请求级性能指标
+
+MetricsMiddleware 为每个请求记录：
+    - 按路由（URL 模式，而不是实际路径）、方法、状态码统计的耗时直方图
+    - 数据库查询次数和耗时（每个数据库连接上常驻的 execute_wrapper，按 ContextVar 找到当前请求；
+      异步视图通过 sync_to_async 在其他线程中执行的查询同样会被统计）
+    - 序列化耗时（DRF serializer.data，见 install_serializer_timing）
+    - 响应缓存的命中情况（api.response_cache 写入的 X-Cache 响应头）
+密码哈希耗时由 TimedPBKDF2PasswordHasher 记录（在 PASSWORD_HASHERS 中启用），
+异步登录的哈希在线程池中执行，不属于某个请求，所以只按算法统计。
+
+多进程：gunicorn 的每个 worker 各自在内存中累加，每隔 FLUSH_INTERVAL 秒把自己的累计值整体写入
+MULTIPROCESS_DIR 下以 pid + 进程启动时的随机值命名的文件（写临时文件再 rename，不会读到一半；
+pid 被新进程复用时不会覆盖已退出进程的累计值）。/metrics 读取目录中所有文件求和，
+各进程只写自己的文件，不会互相覆盖。已退出的 worker 的文件保留（计数器是累计值，求和仍然正确），
+部署时清空目录即可。不配置目录时只导出当前进程的数据。
+
+按请求开启的采样分析器：请求带上签名的 X-Profile 头（python manage.py make_profile_header 生成，
+有效期 PROFILE_MAX_AGE 秒）时，后台线程每隔 PROFILE_INTERVAL 秒采样一次处理该请求的线程的调用栈，
+结束后以 folded stacks 格式（flamegraph.pl / speedscope 可直接打开）写入 PROFILE_DIR，
+文件名通过 X-Profile-File 响应头返回。
+"""
+
+DEFAULTS = {
+    # 总开关
+    'ENABLED': True,
+    # 多进程汇总目录，None 表示只导出当前进程的数据
+    'MULTIPROCESS_DIR': None,
+    # 每个进程把累计值写入汇总目录的最小间隔（秒）
+    'FLUSH_INTERVAL': 1.0,
+    # 耗时直方图的桶（秒）
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    # /metrics 的访问令牌（Authorization: Bearer <令牌>），None 表示只允许 DEBUG 模式或管理员访问
+    'AUTH_TOKEN': None,
+    # 采样分析器的请求头、签名有效期（秒）、采样间隔（秒）和输出目录（None 表示系统临时目录下的 profiles）
+    'PROFILE_HEADER': 'X-Profile',
+    'PROFILE_MAX_AGE': 300,
+    'PROFILE_INTERVAL': 0.002,
+    'PROFILE_DIR': None,
+}
+
+
+def get_metrics_settings():
+    """合并默认配置和 settings.METRICS"""
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+# 指标名 -> (类型, 标签名, 说明)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', ('route', 'method', 'status'), 'Request latency by route'),
+    'db_queries_total': ('counter', ('route',), 'SQL statements executed by route'),
+    'db_query_duration_seconds_total': ('counter', ('route',), 'Time spent in SQL statements by route'),
+    'serializer_duration_seconds_total': ('counter', ('route',), 'Time spent in DRF serializer.data by route'),
+    'response_cache_requests_total': ('counter', ('route', 'result'), 'Response cache lookups by result'),
+    'password_hash_duration_seconds': ('histogram', ('algorithm',), 'Password hashing latency'),
+}
+
+
+class Registry:
+    """
+    进程内的指标累加器
+    计数器：{(指标名, 标签值): 值}；直方图：{(指标名, 标签值): [各个桶的计数..., 总和, 次数]}
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def _observe(self, key, value):
+        # 调用方持有锁；桶的计数不累积，导出时再求前缀和
+        series = self.histograms.get(key)
+        if series is None:
+            series = self.histograms[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            self._observe((name, labels), value)
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self.counters[(name, labels)] += value
+
+    def record_request(self, route, method, status, duration, stats, cache_result):
+        """一个请求的全部指标在一次加锁中写入"""
+        with self._lock:
+            self._observe(('http_request_duration_seconds', (route, method, status)), duration)
+            if stats.queries:
+                self.counters[('db_queries_total', (route,))] += stats.queries
+                self.counters[('db_query_duration_seconds_total', (route,))] += stats.db_time
+            if stats.serializer_time:
+                self.counters[('serializer_duration_seconds_total', (route,))] += stats.serializer_time
+            if cache_result:
+                self.counters[('response_cache_requests_total', (route, cache_result))] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'buckets': list(self.buckets),
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(series)] for (name, labels), series in self.histograms.items()],
+            }
+
+
+def merge_snapshots(snapshots):
+    """把多个进程的快照相加（桶必须相同，不同的快照被跳过）"""
+    merged = {'buckets': None, 'counters': defaultdict(float), 'histograms': {}}
+    for snapshot in snapshots:
+        if merged['buckets'] is None:
+            merged['buckets'] = snapshot['buckets']
+        elif snapshot['buckets'] != merged['buckets']:
+            continue
+        for name, labels, value in snapshot['counters']:
+            merged['counters'][(name, tuple(labels))] += value
+        for name, labels, series in snapshot['histograms']:
+            key = (name, tuple(labels))
+            current = merged['histograms'].get(key)
+            merged['histograms'][key] = series if current is None else [a + b for a, b in zip(current, series)]
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render_prometheus(merged):
+    """按 Prometheus 文本格式（0.0.4）导出"""
+    lines = []
+    buckets = merged['buckets'] or []
+    by_name = defaultdict(list)
+    for (name, labels), value in merged['counters'].items():
+        by_name[name].append((labels, value))
+    for (name, labels), series in merged['histograms'].items():
+        by_name[name].append((labels, series))
+
+    for name, (kind, label_names, help_text) in METRICS.items():
+        if name not in by_name:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name[name]):
+            if kind == 'counter':
+                lines.append(f'{name}{_labels(label_names, labels)} {float(value)!r}')
+                continue
+            cumulative = 0
+            for bound, count in zip([*buckets, '+Inf'], value[:-2]):
+                cumulative += count
+                le = bound if bound == '+Inf' else f'{bound:g}'
+                lines.append(f'{name}_bucket{_labels(label_names, labels, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(label_names, labels)} {float(value[-2])!r}')
+            lines.append(f'{name}_count{_labels(label_names, labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+class MultiprocessStore:
+    """每个进程把自己的快照写入 {目录}/metrics-{pid}-{随机值}.json，读取时汇总目录中的所有文件"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._pid = None
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self):
+        """当前进程的文件；fork 出的子进程 pid 不同，会重新生成随机值"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._path = os.path.join(self.directory, f'metrics-{self._pid}-{os.urandom(4).hex()}.json')
+        return self._path
+
+    def write(self, snapshot):
+        path = self.path()
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.metrics-', suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    def read_all(self):
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # 文件在读取前被清理：跳过
+                continue
+        return snapshots
+
+
+class Metrics:
+    """进程内唯一的指标对象：Registry + 可选的多进程汇总"""
+
+    def __init__(self, buckets, directory=None, flush_interval=1.0):
+        self.registry = Registry(buckets)
+        self.store = MultiprocessStore(directory) if directory else None
+        self.flush_interval = flush_interval
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+
+    def maybe_flush(self, now):
+        if self.store is None or now - self._last_flush < self.flush_interval:
+            return
+        # 只让一个线程写文件，其他线程不等待
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_flush = now
+            self.store.write(self.registry.snapshot())
+        finally:
+            self._flush_lock.release()
+
+    def flush(self):
+        if self.store is not None:
+            with self._flush_lock:
+                self._last_flush = time.monotonic()
+                self.store.write(self.registry.snapshot())
+
+    def export(self):
+        if self.store is None:
+            return render_prometheus(merge_snapshots([self.registry.snapshot()]))
+        self.flush()
+        return render_prometheus(merge_snapshots(self.store.read_all()))
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """返回进程内唯一的 Metrics 实例"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                conf = get_metrics_settings()
+                _metrics = Metrics(conf['BUCKETS'], conf['MULTIPROCESS_DIR'], conf['FLUSH_INTERVAL'])
+    return _metrics
+
+
+def reset_metrics():
+    """丢弃当前实例，下次使用时按最新配置重建"""
+    global _metrics
+    with _metrics_lock:
+        _metrics = None
+
+
+@atexit.register
+def flush_on_exit():
+    if _metrics is not None:
+        try:
+            _metrics.flush()
+        except OSError:
+            pass
+
+
+class RequestStats:
+    """一个请求内累计的数据库和序列化耗时；同时作为 execute_wrapper 使用"""
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+_current = ContextVar('core_metrics_request', default=None)
+
+
+def current_request_stats():
+    """当前请求的 RequestStats，不在请求中时返回 None"""
+    return _current.get()
+
+
+def count_query(execute, sql, params, many, context):
+    """常驻在每个数据库连接上的 execute_wrapper，把查询计入当前请求；不在请求中时直接执行"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def _add_query_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
+
+
+def install_query_timing():
+    """
+    在每个数据库连接（包括之后新建的）上安装 count_query（CoreConfig.ready() 中调用一次）
+    连接是线程本地的，请求开始时临时安装的 execute_wrapper 看不到 sync_to_async 线程中的查询；
+    ContextVar 会随 sync_to_async 复制过去，常驻的 wrapper 可以找到当前请求
+    """
+    connection_created.connect(_add_query_counter, dispatch_uid='core.metrics.count_query')
+    for connection in connections.all(initialized_only=True):
+        _add_query_counter(None, connection)
+
+
+def install_serializer_timing():
+    """
+    把 DRF BaseSerializer.data 换成计时版本（CoreConfig.ready() 中调用一次）
+    只统计最外层的 .data，嵌套序列化器的耗时已经包含在内；不在请求中时直接调用原实现
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    original = BaseSerializer.data.fget
+    if getattr(original, 'timed', False):
+        return
+
+    def data(self):
+        stats = _current.get()
+        if stats is None or stats.serializing:
+            return original(self)
+        stats.serializing = True
+        start = time.perf_counter()
+        try:
+            return original(self)
+        finally:
+            stats.serializing = False
+            stats.serializer_time += time.perf_counter() - start
+
+    data.timed = True
+    BaseSerializer.data = property(data)
+
+
+def record_serializer_time(seconds):
+    """不经过 BaseSerializer.data 的序列化（例如 api/fastserializer.py 的编译序列化器）把耗时计入当前请求"""
+    stats = _current.get()
+    if stats is not None:
+        stats.serializer_time += seconds
+
+
+class TimedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    记录耗时的 PBKDF2 哈希器，算法名和哈希格式与 Django 默认的完全相同，可以直接替换
+    校验密码（verify）也会调用 encode，所以登录和注册都会被统计
+    """
+
+    def encode(self, password, salt, iterations=None):
+        start = time.perf_counter()
+        try:
+            return super().encode(password, salt, iterations)
+        finally:
+            if get_metrics_settings()['ENABLED']:
+                get_metrics().registry.observe(
+                    'password_hash_duration_seconds', (self.algorithm,), time.perf_counter() - start,
+                )
+
+
+class SamplingProfiler:
+    """后台线程定期读取目标线程的调用栈（sys._current_frames），按 folded stacks 汇总"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+
+PROFILE_SALT = 'core.metrics.profile'
+
+
+def make_profile_header():
+    """生成一个带时间戳签名的 X-Profile 头的值（使用 SECRET_KEY 签名）"""
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign('profile')
+
+
+def profile_requested(request, conf):
+    value = request.headers.get(conf['PROFILE_HEADER'])
+    if not value:
+        return False
+    try:
+        return signing.TimestampSigner(salt=PROFILE_SALT).unsign(value, max_age=conf['PROFILE_MAX_AGE']) == 'profile'
+    except signing.BadSignature:
+        return False
+
+
+def write_profile(profiler, route):
+    directory = get_metrics_settings()['PROFILE_DIR'] or os.path.join(tempfile.gettempdir(), 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{route.strip('/').replace('/', '_') or 'root'}.folded"
+    name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+    with open(os.path.join(directory, name), 'w') as f:
+        f.write(profiler.folded())
+    return name
+
+
+class MetricsMiddleware:
+    """
+    记录每个请求的耗时、数据库查询、序列化耗时和缓存命中情况
+    放在 MIDDLEWARE 中 MediaServingMiddleware 之后，其余中间件之前，统计的耗时包含它们
+    同时支持同步和异步请求，ASGI 下不会让 Django 为这个中间件在线程和事件循环之间来回切换；
+    采样分析器只对同步请求生效（异步请求的代码分散在事件循环和线程池中）
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.conf = get_metrics_settings()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.conf['ENABLED']:
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        profiler = None
+        if profile_requested(request, self.conf):
+            profiler = SamplingProfiler(threading.get_ident(), self.conf['PROFILE_INTERVAL']).start()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            duration = time.perf_counter() - start
+            _current.reset(token)
+            if profiler is not None:
+                profiler.stop()
+
+        route = self._record(request, response, stats, duration)
+        if profiler is not None:
+            response['X-Profile-File'] = write_profile(profiler, route)
+            response['X-Profile-Samples'] = str(sum(profiler.samples.values()))
+        return response
+
+    async def __acall__(self, request):
+        if not self.conf['ENABLED']:
+            return await self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            duration = time.perf_counter() - start
+            _current.reset(token)
+        self._record(request, response, stats, duration)
+        return response
+
+    @staticmethod
+    def _record(request, response, stats, duration):
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else '<unmatched>'
+        metrics = get_metrics()
+        metrics.registry.record_request(
+            route, request.method, str(response.status_code), duration, stats, response.get('X-Cache'),
+        )
+        metrics.maybe_flush(time.monotonic())
+        return route
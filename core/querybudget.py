@@ -0,0 +1,239 @@
+import functools
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+"""
+查询预算和 N+1 检测
+
+QueryRecorder 通过 connection.execute_wrapper 记录一段代码执行的 SQL：总条数，以及按“形状”
+（去掉参数和字面量、IN 列表折叠后的 SQL）统计的次数。同一形状在一次请求中重复 REPEAT_THRESHOLD 次以上，
+基本就是在循环里逐行查询（N+1）；每个形状第二次出现时记录一次项目代码的调用栈，报告中直接指出是哪一行触发的。
+
+两种用法：
+    测试 / 基准命令：query_budget 既是上下文管理器也是装饰器，超出时抛出 QueryBudgetExceeded（AssertionError 的子类）
+        with query_budget(3):
+            client.get('/api/v1/course/')
+
+        @query_budget(5, repeat_threshold=3)
+        def test_register(self): ...
+
+    staging：QueryBudgetMiddleware 检查每个请求，按 ACTION 记录警告或抛出异常，并返回 X-Query-Count 响应头
+        视图用属性声明自己的预算：
+            query_budget = 3          最多执行的 SQL 条数（包括认证、会话等中间件的查询），None 表示不限
+            query_repeat_limit = 0    覆盖 REPEAT_THRESHOLD，0 表示不检查 N+1（按批次循环写库的视图）
+        DRF / 类视图写在类上，admin 写在 ModelAdmin 上（对它的所有页面生效），函数视图写在函数上。
+        异步视图中的 ORM 调用在 sync_to_async 的线程里执行，不经过这里安装的 execute_wrapper，不会被统计。
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # 是否安装中间件（query_budget 上下文管理器不受影响）；生产环境保持关闭
+    'ENABLED': False,
+    # 超出预算时：log 记录一条警告；raise 抛出 QueryBudgetExceeded（请求返回 500，staging 中更容易发现）
+    'ACTION': 'log',
+    # 视图没有声明 query_budget 时的预算，None 表示只检查 N+1
+    'DEFAULT_BUDGET': 30,
+    # 同一形状的查询在一个请求中执行多少次视为 N+1
+    'REPEAT_THRESHOLD': 5,
+    # 报告中每个调用栈最多保留的帧数（只保留项目代码的帧）
+    'STACK_DEPTH': 8,
+}
+
+
+def get_query_budget_settings():
+    """合并默认配置和 settings.QUERY_BUDGET"""
+    return {**DEFAULTS, **getattr(settings, 'QUERY_BUDGET', {})}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """超出查询预算或发现 N+1；继承 AssertionError，在测试中显示为断言失败"""
+
+
+# 字符串 / 数字字面量，以及任意长度的 IN (%s, %s, ...) 列表
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:%s|\?)(?:, ?(?:%s|\?))*\)', re.IGNORECASE)
+
+# 事务控制语句：每个请求都可能出现多次，不参与 N+1 检查
+_TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+
+@functools.lru_cache(maxsize=2048)
+def query_shape(sql):
+    """
+    SQL 的形状：字面量替换为 ?，IN 列表折叠为 IN (...)
+    ORM 生成的 SQL 参数本来就是占位符，这里主要处理 IN 列表长度不同和手写 SQL 中的字面量
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+_THIS_FILE = os.path.normcase(os.path.abspath(__file__))
+
+
+def capture_stack(depth):
+    """
+    当前调用栈中属于项目代码（BASE_DIR 下、不在 site-packages 中）的最内层 depth 帧，从外到内排列
+    直接遍历帧对象，不读取源码文件，开销只在第一次发现重复形状时发生
+    """
+    base_dir = os.path.normcase(str(getattr(settings, 'BASE_DIR', '')))
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None and len(frames) < depth:
+        filename = os.path.normcase(frame.f_code.co_filename)
+        if (
+            filename.startswith(base_dir)
+            and filename != _THIS_FILE
+            and 'site-packages' not in filename
+        ):
+            frames.append(f'{os.path.relpath(filename, base_dir)}:{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+class QueryRecorder:
+    """
+    一段代码中执行的查询；作为 execute_wrapper 使用
+    count：总条数；shapes：形状 -> 次数；stacks：重复出现过的形状 -> 第二次执行时的调用栈
+    """
+
+    def __init__(self, stack_depth=DEFAULTS['STACK_DEPTH']):
+        self.stack_depth = stack_depth
+        self.count = 0
+        self.shapes = Counter()
+        self.stacks = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        shape = query_shape(sql)
+        self.shapes[shape] += 1
+        if self.shapes[shape] == 2 and not shape.lstrip().upper().startswith(_TRANSACTION_STATEMENTS):
+            self.stacks[shape] = capture_stack(self.stack_depth)
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold):
+        """执行次数达到 threshold 的形状：[(形状, 次数, 调用栈)]，按次数倒序"""
+        if not threshold:
+            return []
+        return sorted(
+            ((shape, self.shapes[shape], stack) for shape, stack in self.stacks.items() if self.shapes[shape] >= threshold),
+            key=lambda item: -item[1],
+        )
+
+    def problems(self, max_queries, repeat_threshold):
+        """超出预算和疑似 N+1 的描述，没有问题时返回空列表"""
+        problems = []
+        if max_queries is not None and self.count > max_queries:
+            problems.append(f'{self.count} queries, budget is {max_queries}')
+        for shape, times, stack in self.repeated(repeat_threshold):
+            lines = [f'possible N+1: executed {times} times: {shape}']
+            lines.extend(f'    {frame}' for frame in stack)
+            problems.append('\n'.join(lines))
+        return problems
+
+
+def report(label, problems, action):
+    """按 action 记录警告或抛出 QueryBudgetExceeded"""
+    message = f'{label}: ' + '\n'.join(problems)
+    if action == 'raise':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class query_budget:
+    """
+    查询预算：上下文管理器或装饰器
+    max_queries：最多执行的 SQL 条数，None 表示不限；repeat_threshold：同一形状执行多少次视为 N+1，0 表示不检查
+    using：只统计这些数据库别名，默认全部；action：raise（默认）或 log
+    代码块内抛出异常时不再检查，原异常照常传播
+    """
+
+    def __init__(self, max_queries=None, repeat_threshold=None, using=None, action='raise', label=None):
+        conf = get_query_budget_settings()
+        self.max_queries = max_queries
+        self.repeat_threshold = conf['REPEAT_THRESHOLD'] if repeat_threshold is None else repeat_threshold
+        self.using = (using,) if isinstance(using, str) else using
+        self.action = action
+        self.label = label
+        self.stack_depth = conf['STACK_DEPTH']
+        self._exit_stack = None
+
+    def __enter__(self):
+        recorder = QueryRecorder(self.stack_depth)
+        self._exit_stack = ExitStack()
+        for alias in self.using or settings.DATABASES:
+            self._exit_stack.enter_context(connections[alias].execute_wrapper(recorder))
+        self.recorder = recorder
+        return recorder
+
+    def __exit__(self, exc_type, exc, tb):
+        self._exit_stack.close()
+        if exc_type is None:
+            problems = self.recorder.problems(self.max_queries, self.repeat_threshold)
+            if problems:
+                report(self.label or 'query budget', problems, self.action)
+        return False
+
+    def __call__(self, func):
+        label = self.label or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # 每次调用使用新的实例，递归或多线程调用时互不影响
+            with query_budget(self.max_queries, self.repeat_threshold, self.using, self.action, label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def view_budget(func, conf):
+    """
+    视图声明的 (query_budget, query_repeat_limit)，没有声明时使用配置中的默认值
+    类视图读 as_view() 设置的 view_class，admin 页面读 ModelAdmin.get_urls() 设置的 model_admin，其余读函数本身
+    """
+    owner = getattr(func, 'view_class', None) or getattr(func, 'model_admin', None) or func
+    budget = getattr(owner, 'query_budget', conf['DEFAULT_BUDGET'])
+    threshold = getattr(owner, 'query_repeat_limit', None)
+    return budget, conf['REPEAT_THRESHOLD'] if threshold is None else threshold
+
+
+class QueryBudgetMiddleware:
+    """
+    staging 环境下检查每个请求的查询数和 N+1（QUERY_BUDGET['ENABLED'] 为 False 时不安装）
+    放在 MIDDLEWARE 中 MetricsMiddleware 之后，会话、认证等中间件的查询也计入预算
+    """
+
+    def __init__(self, get_response):
+        self.conf = get_query_budget_settings()
+        if not self.conf['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.aliases = list(settings.DATABASES)
+
+    def __call__(self, request):
+        recorder = QueryRecorder(self.conf['STACK_DEPTH'])
+        with ExitStack() as stack:
+            for alias in self.aliases:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        response['X-Query-Count'] = str(recorder.count)
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+        budget, threshold = view_budget(match.func, self.conf)
+        problems = recorder.problems(budget, threshold)
+        if problems:
+            report(f'{request.method} {match.route or request.path}', problems, self.conf['ACTION'])
+        return response
@@ -1,3 +1,147 @@
-from django.test import TestCase
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from backend.db_router import STICKY_COOKIE_NAME, ReplicaStickinessMiddleware, _request_state
+from backend.sqlite_backend.base import DatabaseWrapper, get_write_lock
+from core.media import MediaServingMiddleware, get_mounts
+from core.metrics import MetricsMiddleware, MultiprocessStore, get_metrics, reset_metrics
+
+
+class DatabaseHealthTests(TestCase):
+    def test_reports_status_only(self):
+        response = self.client.get('/health/db/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'ok': True, 'databases': {'default': 'ok'}})
+
+    def test_failure_hides_error_details(self):
+        with mock.patch('django.db.backends.base.base.BaseDatabaseWrapper.cursor', side_effect=Exception('secret-host')):
+            with self.assertLogs('core.views', 'ERROR'):
+                response = self.client.get('/health/db/')
+        self.assertEqual(response.status_code, 503)
+        self.assertNotIn(b'secret-host', response.content)
+        self.assertEqual(response.json()['databases'], {'default': 'failed'})
+
+
+class ReplicaStickinessMiddlewareTests(SimpleTestCase):
+    def test_async_write_sets_sticky_cookie(self):
+        async def view(request):
+            _request_state.get()['wrote'] = True
+            return HttpResponse()
+
+        middleware = ReplicaStickinessMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertIn(STICKY_COOKIE_NAME, response.cookies)
+        self.assertIsNone(_request_state.get())
+
+    def test_sync_read_sets_no_cookie(self):
+        middleware = ReplicaStickinessMiddleware(lambda request: HttpResponse())
+        self.assertFalse(iscoroutinefunction(middleware))
+        response = middleware(RequestFactory().get('/'))
+        self.assertNotIn(STICKY_COOKIE_NAME, response.cookies)
+
+
+class SQLiteWriteQueueTests(SimpleTestCase):
+    """只读事务不进入进程内写队列，写队列在第一条写语句之前才加入"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = {**connection.settings_dict, 'NAME': os.path.join(directory.name, 'queue.sqlite3'), 'OPTIONS': {}}
+        self.db = DatabaseWrapper(settings_dict, alias='write_queue_test')
+        self.addCleanup(self.db.close)
+        with self.db.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+        self.lock = get_write_lock(settings_dict['NAME'])
+
+    def test_read_only_transaction_skips_the_lock(self):
+        self.db.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        with self.db.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM item')
+        self.assertFalse(self.lock.locked())
+        self.db.commit()
+        self.db.set_autocommit(True)
+
+    def test_first_write_takes_the_lock(self):
+        self.db.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        with self.db.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM item')
+            cursor.execute('INSERT INTO item DEFAULT VALUES')
+        self.assertTrue(self.lock.locked())
+        self.db.commit()
+        self.assertFalse(self.lock.locked())
+        self.db.set_autocommit(True)
+
+
+class MediaServingTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        with open(os.path.join(self.root, 'avatar.png'), 'wb') as file:
+            file.write(b'\x89PNG\r\n\x1a\n')
+
+    @override_settings(DEBUG=False, MEDIA_SERVING={})
+    def test_not_mounted_without_debug(self):
+        self.assertEqual(get_mounts(), [])
+        with self.assertRaises(MiddlewareNotUsed):
+            MediaServingMiddleware(lambda request: HttpResponse())
+
+    def test_serves_with_nosniff(self):
+        with override_settings(DEBUG=False, MEDIA_SERVING={'ENABLED': True}, MEDIA_ROOT=self.root):
+            middleware = MediaServingMiddleware(lambda request: HttpResponse(status=404))
+            response = middleware(RequestFactory().get('/media/avatar.png'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        response.close()
+
+    def test_async_falls_through_for_missing_files(self):
+        async def view(request):
+            return HttpResponse(status=404)
+
+        with override_settings(MEDIA_SERVING={'ENABLED': True}, MEDIA_ROOT=self.root):
+            middleware = MediaServingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/media/missing.png'))
+        self.assertEqual(response.status_code, 404)
+
+
+class MetricsMiddlewareTests(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        reset_metrics()
+        self.addCleanup(reset_metrics)
+
+    def test_async_request_counts_queries_in_worker_threads(self):
+        def query():
+            try:
+                with connections['default'].cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            finally:
+                connections.close_all()
+
+        async def view(request):
+            await sync_to_async(query, thread_sensitive=False)()
+            return HttpResponse()
+
+        middleware = MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        async_to_sync(middleware)(RequestFactory().get('/'))
+        counters = get_metrics().registry.counters
+        self.assertEqual(counters[('db_queries_total', ('<unmatched>',))], 1)
+
+    def test_snapshot_files_are_unique_per_process_start(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # 同一个 pid 先后启动的两个进程
+        for value in (1, 2):
+            MultiprocessStore(directory.name).write({'buckets': [], 'counters': [['c', [], value]], 'histograms': []})
+        self.assertEqual(len(MultiprocessStore(directory.name).read_all()), 2)
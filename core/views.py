@@ -1,3 +1,50 @@
+import hmac
+import logging
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
 
+from core.metrics import get_metrics, get_metrics_settings
+
+logger = logging.getLogger(__name__)
+
 # Create your views here.
+
+
+def database_health(request):
+    """
+    数据库健康检查（供负载均衡 / 容器探针使用）
+    对 settings.DATABASES 中的每个连接执行 SELECT 1，每个连接只返回 ok / failed
+    接口不需要登录，错误详情（可能包含主机名、用户名）只写入日志；任意一个连接不可用时返回 503
+    """
+    results = {}
+    healthy = True
+    for alias in connections:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            results[alias] = 'ok'
+        except Exception:
+            logger.exception("Database health check failed for %r", alias)
+            healthy = False
+            results[alias] = 'failed'
+    return JsonResponse({'ok': healthy, 'databases': results}, status=200 if healthy else 503)
+
+
+def metrics(request):
+    """
+    Prometheus 指标（文本格式），配置了多进程目录时是所有 worker 的汇总
+    配置了 METRICS['AUTH_TOKEN'] 时需要 Authorization: Bearer <令牌>，否则只允许 DEBUG 模式或管理员访问
+    """
+    token = get_metrics_settings()['AUTH_TOKEN']
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        allowed = hmac.compare_digest(supplied.encode(), token.encode())
+    else:
+        allowed = settings.DEBUG or request.user.is_staff
+    if not allowed:
+        return JsonResponse({'detail': 'Forbidden'}, status=403)
+    return HttpResponse(get_metrics().export(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,15 +1,72 @@
 from django.contrib import admin
+from core.changelist import FastChangeListMixin
+from userauths.export import export_response
 from userauths.models import User,Profile
 # Register your models here.
 
+# 后台页面的查询预算（见 core/querybudget.py），对该模型的列表页、编辑页都生效：
+# 列表页是会话 + 当前用户 + 统计信息中的估算行数 + 计数（最多数到 COUNT_THRESHOLD 行）+ 当前页共 5 条，与每页显示多少行无关；
+# 编辑页还要取出对象、已选的多对多关系和各个选择框的选项
+ADMIN_QUERY_BUDGET = 10
+
+
+def export_actions(dataset):
+    """
+    导出选中行的后台动作（CSV / NDJSON / 压缩的 CSV），边查询边下载，不受行数限制
+    勾选“选中所有”时导出当前筛选条件下的全部行
+    """
+    def export_csv(modeladmin, request, queryset):
+        return export_response(dataset, "csv", queryset)
+
+    def export_ndjson(modeladmin, request, queryset):
+        return export_response(dataset, "ndjson", queryset)
+
+    def export_csv_gzip(modeladmin, request, queryset):
+        return export_response(dataset, "csv", queryset, compress=True)
+
+    return [
+        admin.action(description="导出为 CSV")(export_csv),
+        admin.action(description="导出为 NDJSON")(export_ndjson),
+        admin.action(description="导出为 CSV（gzip 压缩）")(export_csv_gzip),
+    ]
+
+
+# 用户后台：估算计数、keyset 分页和前缀搜索见 core/changelist.py
+class UserAdmin(FastChangeListMixin, admin.ModelAdmin):
+    list_display = ['email', 'username', 'full_name', 'is_staff', 'date_joined']
+    # 前缀搜索，使用 User 上的 Lower() 函数索引
+    search_fields = ['^email', '^username', '^full_name']
+
+    query_budget = ADMIN_QUERY_BUDGET
+    actions = export_actions("users")
+
+    def formfield_for_manytomany(self, db_field, request=None, **kwargs):
+        # 权限选项显示为“应用 | 模型 | 名称”，用 JOIN 一次取出 content_type，而不是每个权限再查询一次
+        # （与 django.contrib.auth.admin.GroupAdmin 的做法相同）
+        if db_field.name == 'user_permissions':
+            qs = kwargs.get('queryset', db_field.remote_field.model.objects)
+            kwargs['queryset'] = qs.select_related('content_type')
+        return super().formfield_for_manytomany(db_field, request=request, **kwargs)
+
+
 # 定义一个自定义的后台管理类，用于美化或增强 Profile 模型在后台的显示方式
-class ProfileAdmin(admin.ModelAdmin):
+class ProfileAdmin(FastChangeListMixin, admin.ModelAdmin):
     # 指定在后台“列表页”显示的字段
     list_display = ['user', 'full_name', 'date']  # 显示用户名、全名、创建时间等字段
 
+    # user 列显示关联的用户，列表页用 JOIN 一次取出，而不是每行再查询一次 User
+    list_select_related = ('user',)
+
+    # 按姓名前缀搜索，使用 Profile 上的 Lower() 函数索引；按邮箱查找请用用户列表
+    # （跨表的 OR 条件无法同时使用两张表的索引）
+    search_fields = ['^full_name']
+
+    query_budget = ADMIN_QUERY_BUDGET
+    actions = export_actions("profiles")
+
 
-# 将自定义用户模型 User 注册到后台，使用默认展示方式
-admin.site.register(User)
+# 将自定义用户模型 User 注册到后台
+admin.site.register(User, UserAdmin)
 
 # 将 Profile 模型注册到后台，并使用自定义的 ProfileAdmin 管理类来控制显示样式
 admin.site.register(Profile, ProfileAdmin)
@@ -0,0 +1,263 @@
+import csv
+import itertools
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from userauths.models import Profile, User
+
+"""
+批量导入用户
+
+输入是 CSV 或 JSONL 流（每行一个用户，字段：email、password，可选 username、full_name），
+按批次处理，整个文件不会一次性读入内存：
+
+1. 校验：邮箱格式、密码强度、批内重复，以及与数据库已有用户的冲突（每批一次查询）
+2. 哈希：把一批密码分发到进程池并行计算 PBKDF2
+3. 写入：User 和 Profile 分别用 bulk_create 插入（不会触发逐行的 post_save 信号）
+
+每一行出错都会通过 on_error 回调报告，调用方可以边处理边输出错误报告。
+输入按 utf-8-sig 解码（ENCODING），Excel 导出的 CSV 开头的 BOM 不会混进第一列的列名。
+
+管理命令每次运行创建自己的进程池；接口共用 get_shared_executor() 返回的进程池，
+大小由 BULK_IMPORT["WORKERS"] 限定，并发的导入请求在同一个池中排队，不会各自启动 CPU 核数个进程。
+"""
+
+FORMATS = ("csv", "jsonl")
+
+# 读取上传文件时使用的编码，兼容带 BOM 的 UTF-8
+ENCODING = "utf-8-sig"
+
+DEFAULTS = {
+    # 接口共用的哈希进程数，0 或 1 表示在请求线程内计算
+    "WORKERS": 2,
+    # 接口返回的错误报告最多包含的行数，其余出错的行只计入 failed
+    "MAX_REPORTED_ERRORS": 1000,
+}
+
+
+def get_import_settings():
+    """合并默认配置和 settings.BULK_IMPORT"""
+    return {**DEFAULTS, **getattr(settings, "BULK_IMPORT", {})}
+
+
+def guess_format(filename, default="csv"):
+    """根据文件扩展名判断格式，.jsonl / .ndjson 视为 JSONL，其余按默认值处理"""
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if extension == ".csv":
+        return "csv"
+    return default
+
+
+def iter_rows(stream, fmt):
+    """
+    逐行读取文本流，产出 (行号, dict)
+    JSONL 中无法解析的行会产出 (行号, None)，由导入器记为错误
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # 行号以文件中的物理行为准（表头是第 1 行）
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def _init_worker():
+    # 子进程以 spawn 方式启动时需要重新初始化 Django（fork 时这一步几乎没有开销）
+    django.setup()
+
+
+_shared_executor = None
+_shared_executor_lock = threading.Lock()
+
+
+def get_shared_executor():
+    """返回进程内共用的哈希进程池（第一次调用时创建）；WORKERS 不大于 1 时返回 None"""
+    global _shared_executor
+    workers = get_import_settings()["WORKERS"]
+    if workers <= 1:
+        return None
+    if _shared_executor is None:
+        with _shared_executor_lock:
+            if _shared_executor is None:
+                _shared_executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    return _shared_executor
+
+
+class ImportSummary:
+    """导入结果统计"""
+
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+
+    def as_dict(self):
+        return {"created": self.created, "failed": self.failed}
+
+
+class BulkUserImporter:
+    """
+    批量导入器
+    batch_size: 每批处理的行数，也是 bulk_create 的分块大小
+    workers:    哈希进程数，0 或 1 表示在当前进程内计算
+    on_error:   回调 on_error(行号, email, 错误信息列表)
+    executor:   已有的进程池（例如 get_shared_executor()），传入时不再创建也不会关闭，workers 应与池的大小一致
+    """
+
+    def __init__(self, batch_size=1000, workers=None, on_error=None, executor=None):
+        self.batch_size = batch_size
+        self.workers = os.cpu_count() if workers is None else workers
+        self.executor = executor
+        self.on_error = on_error or (lambda line, email, errors: None)
+
+    def run(self, rows):
+        summary = ImportSummary()
+        executor = self.executor
+        if executor is None and self.workers and self.workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        try:
+            rows = iter(rows)
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    break
+                self._process_batch(batch, summary, executor)
+        finally:
+            if executor is not None and executor is not self.executor:
+                executor.shutdown()
+        return summary
+
+    def _fail(self, summary, line, email, errors):
+        summary.failed += 1
+        self.on_error(line, email, errors)
+
+    def _process_batch(self, batch, summary, executor):
+        candidates = self._validate_batch(batch, summary)
+        if not candidates:
+            return
+
+        passwords = [password for _, _, password in candidates]
+        if executor is not None:
+            chunksize = max(1, len(passwords) // (self.workers * 4))
+            hashes = list(executor.map(make_password, passwords, chunksize=chunksize))
+        else:
+            hashes = [make_password(password) for password in passwords]
+
+        users = []
+        for (line, user, _), encoded in zip(candidates, hashes):
+            user.password = encoded
+            users.append((line, user))
+        self._insert(users, summary)
+
+    def _validate_batch(self, batch, summary):
+        """
+        校验一批数据，返回 [(行号, 未保存的 User, 明文密码)]
+        唯一性检查对整批数据每个唯一字段只发一次查询
+        """
+        parsed = []
+        for line, row in batch:
+            if row is None:
+                self._fail(summary, line, "", ["无法解析该行"])
+                continue
+            email = (row.get("email") or "").strip()
+            password = row.get("password") or ""
+            email_username = email.split("@")[0]
+            user = User(
+                email=email,
+                username=(row.get("username") or "").strip() or email_username,
+                full_name=(row.get("full_name") or "").strip() or email_username,
+            )
+            errors = []
+            try:
+                validate_email(email)
+            except ValidationError as e:
+                errors.extend(e.messages)
+            if not password:
+                errors.append("密码不能为空")
+            else:
+                try:
+                    validate_password(password, user=user)
+                except ValidationError as e:
+                    errors.extend(e.messages)
+            if errors:
+                self._fail(summary, line, email, errors)
+            else:
+                parsed.append((line, user, password))
+
+        # 唯一字段 -> 比较用的值：邮箱不区分大小写唯一（LOWER(email) 上的唯一约束），按小写比较；姓名允许重复
+        unique_keys = {
+            "email": lambda user: user.email.lower(),
+            "username": lambda user: user.username,
+        }
+        taken = {name: set() for name in unique_keys}
+        if parsed:
+            emails = [unique_keys["email"](user) for _, user, _ in parsed]
+            taken["email"].update(
+                User.objects.annotate(email_lower=Lower("email"))
+                .filter(email_lower__in=emails)
+                .values_list("email_lower", flat=True)
+            )
+            usernames = [user.username for _, user, _ in parsed]
+            taken["username"].update(User.objects.filter(username__in=usernames).values_list("username", flat=True))
+
+        candidates = []
+        for line, user, password in parsed:
+            errors = []
+            for name, key in unique_keys.items():
+                if key(user) in taken[name]:
+                    errors.append(f"{name} 已存在: {getattr(user, name)}")
+            if errors:
+                self._fail(summary, line, user.email, errors)
+                continue
+            # 同一批次内后出现的重复行同样视为冲突
+            for name, key in unique_keys.items():
+                taken[name].add(key(user))
+            candidates.append((line, user, password))
+        return candidates
+
+    def _insert(self, users, summary):
+        """整批插入；如果与并发写入发生唯一性冲突，退回到逐行插入以定位出错的行"""
+        try:
+            with transaction.atomic():
+                self._bulk_create([user for _, user in users])
+            summary.created += len(users)
+        except IntegrityError:
+            for line, user in users:
+                user.pk = None
+                user._state.adding = True
+                try:
+                    with transaction.atomic():
+                        self._bulk_create([user])
+                    summary.created += 1
+                except IntegrityError as e:
+                    self._fail(summary, line, user.email, [str(e)])
+
+    def _bulk_create(self, users):
+        created = User.objects.bulk_create(users, batch_size=self.batch_size)
+        Profile.objects.bulk_create(
+            [Profile(user=user, full_name=user.full_name) for user in created],
+            batch_size=self.batch_size,
+        )
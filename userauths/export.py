@@ -0,0 +1,159 @@
+import csv
+import itertools
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from userauths.models import Profile, User
+
+"""
+流式导出用户 / 资料
+
+按主键顺序用 QuerySet.values_list().iterator(chunk_size=...) 逐块读取
+（PostgreSQL 上是服务器端游标，SQLite 上是逐步读取的游标），每块编码成 CSV 或 NDJSON 后交给 StreamingHttpResponse，
+边查询边发送，进程内同时只保留一块数据，内存占用与表的大小无关。
+可选 gzip：用 zlib 流式压缩，输出标准的 .gz 文件。
+
+不导出密码哈希和 OTP。CSV 表头 / NDJSON 的键就是 DATASETS 中的列名，email、username、full_name
+与 bulk_import 的输入字段同名，但因为没有密码，导出的文件不能直接重新导入。
+"""
+
+FORMATS = ("csv", "ndjson")
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+
+# 数据集 -> (模型, [(列名, 查询路径)])
+DATASETS = {
+    "users": (User, [
+        ("id", "id"),
+        ("email", "email"),
+        ("username", "username"),
+        ("full_name", "full_name"),
+        ("first_name", "first_name"),
+        ("last_name", "last_name"),
+        ("is_active", "is_active"),
+        ("is_staff", "is_staff"),
+        ("date_joined", "date_joined"),
+        ("last_login", "last_login"),
+    ]),
+    "profiles": (Profile, [
+        ("id", "id"),
+        ("user_id", "user_id"),
+        ("email", "user__email"),
+        ("full_name", "full_name"),
+        ("country", "country"),
+        ("about", "about"),
+        ("image", "image"),
+        ("date", "date"),
+    ]),
+}
+
+# 每次从数据库读取、编码的行数
+CHUNK_SIZE = 2000
+
+
+def iter_rows(dataset, queryset=None, chunk_size=CHUNK_SIZE):
+    """
+    按主键顺序逐块读取数据集，产出元组（顺序与 DATASETS 中的列相同）
+    queryset 用来限定范围（例如后台动作选中的行），默认导出整张表
+    """
+    model, columns = DATASETS[dataset]
+    if queryset is None:
+        queryset = model.objects.all()
+    lookups = [lookup for _, lookup in columns]
+    return queryset.order_by("pk").values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+# 以这些字符开头的单元格会被 Excel / LibreOffice 当成公式执行（CSV 注入）
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def csv_cell(value):
+    """
+    单元格的值：时间为 ISO 8601；可能被当成公式的字符串前面加单引号，表格软件把它显示为普通文本
+    （full_name、about 等都是用户自己填写的）
+    """
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class _Line:
+    """csv.writer 的输出目标：writerow() 直接返回写入的那一行"""
+
+    def write(self, value):
+        return value
+
+
+def encode_csv(names, rows, chunk_size=CHUNK_SIZE):
+    """表头 + 每块行编码成一个字节块；None 输出为空，其他值见 csv_cell()"""
+    writer = csv.writer(_Line())
+    yield writer.writerow(names).encode("utf-8")
+    for chunk in _chunks(rows, chunk_size):
+        yield "".join(writer.writerow([csv_cell(value) for value in row]) for row in chunk).encode("utf-8")
+
+
+def encode_ndjson(names, rows, chunk_size=CHUNK_SIZE):
+    """每行一个 JSON 对象，每块行编码成一个字节块"""
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    for chunk in _chunks(rows, chunk_size):
+        yield "".join(encoder.encode(dict(zip(names, row))) + "\n" for row in chunk).encode("utf-8")
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson}
+
+
+def gzip_stream(chunks, level=6):
+    """把字节块流式压缩成 gzip 格式，压缩器只缓存一个窗口的数据"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_stream(dataset, fmt, queryset=None, compress=False, chunk_size=CHUNK_SIZE):
+    """数据集编码后的字节块迭代器"""
+    if dataset not in DATASETS:
+        raise ValueError(f"Unsupported dataset: {dataset}")
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    names = [name for name, _ in DATASETS[dataset][1]]
+    chunks = ENCODERS[fmt](names, iter_rows(dataset, queryset, chunk_size), chunk_size)
+    return gzip_stream(chunks) if compress else chunks
+
+
+def export_response(dataset, fmt, queryset=None, compress=False):
+    """
+    下载导出文件的 StreamingHttpResponse，文件名如 users-20250101-120000.csv.gz
+    压缩时内容类型是 application/gzip（不用 Content-Encoding，浏览器保存的就是 .gz 文件）
+    """
+    filename = f"{dataset}-{timezone.now():%Y%m%d-%H%M%S}.{fmt}"
+    if compress:
+        filename += ".gz"
+    response = StreamingHttpResponse(
+        export_stream(dataset, fmt, queryset, compress),
+        content_type="application/gzip" if compress else CONTENT_TYPES[fmt],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["Cache-Control"] = "no-store"
+    # 让 nginx 等反向代理边收边转发，而不是缓冲整个响应
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,61 @@
+import io
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from userauths.bulk_import import ENCODING, FORMATS, BulkUserImporter, guess_format, iter_rows
+
+
+class Command(BaseCommand):
+    """
+    从 CSV / JSONL 文件批量导入用户
+    用法：
+        python manage.py import_users cohort.csv
+        python manage.py import_users cohort.jsonl --batch-size 2000 --workers 8 --report errors.jsonl
+        cat cohort.csv | python manage.py import_users - --format csv
+    错误报告为 JSONL，每行一个出错的输入行：{"line": 行号, "email": ..., "errors": [...]}
+    """
+    help = "Bulk import users from a CSV or JSONL stream"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="输入文件路径，'-' 表示从标准输入读取")
+        parser.add_argument('--format', choices=FORMATS, help="输入格式，默认根据扩展名判断")
+        parser.add_argument('--batch-size', type=int, default=1000, help="每批处理的行数")
+        parser.add_argument('--workers', type=int, default=None, help="密码哈希进程数，默认等于 CPU 核数")
+        parser.add_argument('--report', help="错误报告输出文件，默认输出到标准错误")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        report = open(options['report'], 'w', encoding='utf-8') if options['report'] else self.stderr
+
+        def on_error(line, email, errors):
+            report.write(json.dumps({'line': line, 'email': email, 'errors': errors}, ensure_ascii=False) + '\n')
+
+        importer = BulkUserImporter(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            on_error=on_error,
+        )
+        if path == '-':
+            source = io.TextIOWrapper(sys.stdin.buffer, encoding=ENCODING, newline='')
+        else:
+            source = open(path, encoding=ENCODING, newline='')
+        try:
+            summary = importer.run(iter_rows(source, fmt))
+        finally:
+            if path == '-':
+                # 不关闭底层的标准输入
+                source.detach()
+            else:
+                source.close()
+            if options['report']:
+                report.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {summary.created} users, {summary.failed} rows failed"
+        ))
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:33
+
+import django.db.models.functions.text
+import userauths.models
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+"""
+userauths 的索引和约束：
+- 后台前缀搜索用的 LOWER(username)、LOWER(full_name) 函数索引（见 core/changelist.py）
+- full_name 不再唯一（同名用户注册不再失败），后台按姓名排序改用 (full_name, id DESC) 索引
+- 邮箱改为不区分大小写唯一：LOWER(email) 上的唯一索引，登录、注册和后台的邮箱前缀搜索都使用它
+- Profile 增加后台排序 / 筛选用的 (date DESC, id DESC)、(country, id DESC) 索引
+"""
+
+
+def check_case_insensitive_emails(apps, schema_editor):
+    """已有只有大小写不同的重复邮箱时，唯一约束无法创建：先列出这些邮箱，需要人工合并账号后再迁移"""
+    User = apps.get_model('userauths', 'User')
+    duplicates = list(
+        User.objects.using(schema_editor.connection.alias)
+        .annotate(email_lower=Lower('email'))
+        .values('email_lower')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .values_list('email_lower', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Emails that differ only in case must be merged before migrating: " + ", ".join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('userauths', '0003_alter_user_otp'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_case_insensitive_emails, migrations.RunPython.noop),
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', userauths.models.UserManager()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='full_name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(django.db.models.functions.text.Lower('full_name'), name='userauths_prof_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['-date', '-id'], name='userauths_prof_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['country', '-id'], name='userauths_prof_country_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Lower('username'), name='userauths_username_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Lower('full_name'), name='userauths_fullname_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['full_name', '-id'], name='userauths_user_fullname_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='userauths_user_email_ci_uniq'),
+        ),
+    ]
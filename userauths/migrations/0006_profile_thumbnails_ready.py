@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+def mark_uploaded_avatars_ready(apps, schema_editor):
+    """已有的上传头像按原来的假设（缩略图已经在上传时生成）标记为已生成，保持现有接口返回的地址不变"""
+    Profile = apps.get_model('userauths', 'Profile')
+    Profile.objects.filter(image__startswith='user_folder/').update(thumbnails_ready=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userauths', '0005_profile_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='thumbnails_ready',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_uploaded_avatars_ready, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,12 @@
 from typing import Iterable
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Lower
 from django.db.models.signals import post_save
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as DjangoUserManager
+
+from userauths.profile_version import publish_version
 
 """
 post_save 是 Django 提供的一个信号机制，用于在模型保存之后执行某些逻辑，常用于自动创建关联对象（如 Profile)、发送通知、记录日志等场景。无论是新建还是更新，只要是通过 Django ORM 的保存机制完成的保存操作，都会触发。
@@ -18,7 +22,78 @@ models.Model vs AbstractUser 的区别
 
 """
 
-class User(AbstractUser):
+
+class DirtyFieldsMixin:
+    """
+    脏字段追踪
+    在模型从数据库加载（或保存成功）时，记录 tracked_fields 中各字段的值；
+    之后通过 get_dirty_fields() 得到真正被修改过的字段及其原值，用来决定是否需要写库、写哪些列。
+    tracked_fields = "__all__" 表示追踪除主键以外的所有列（包括以后新增的字段）。
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def get_tracked_fields(cls):
+        if cls.tracked_fields == "__all__":
+            return tuple(field.name for field in cls._meta.concrete_fields if not field.primary_key)
+        return cls.tracked_fields
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def _tracked_value(self, field):
+        # 统一转换成写库时的值，避免 FieldFile 和字符串之间比较出错
+        return field.get_prep_value(field.value_from_object(self))
+
+    def _snapshot_tracked_fields(self):
+        loaded = self.get_deferred_fields()
+        self._loaded_values = {
+            name: self._tracked_value(self._meta.get_field(name))
+            for name in self.get_tracked_fields()
+            if self._meta.get_field(name).attname not in loaded
+        }
+
+    def get_dirty_fields(self):
+        """
+        返回 {字段名: 原值}，只包含值发生变化的追踪字段
+        如果实例没有快照（例如手动构造的对象），返回 None，表示无法判断
+        """
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            return None
+        deferred = self.get_deferred_fields()
+        dirty = {}
+        for name in self.get_tracked_fields():
+            field = self._meta.get_field(name)
+            if field.attname in deferred:
+                continue
+            if name not in loaded_values:
+                # 加载时被延迟、之后又被赋值的字段，按已修改处理
+                dirty[name] = None
+            elif self._tracked_value(field) != loaded_values[name]:
+                dirty[name] = loaded_values[name]
+        return dirty
+
+
+class UserQuerySet(models.QuerySet):
+    def by_email(self, email):
+        """
+        按邮箱查找用户，不区分大小写：LOWER(email) = LOWER(%s)
+        使用 LOWER(email) 上的唯一索引，而不是 email__iexact（UPPER(email) = UPPER(%s) / LIKE，用不上索引，要扫描全表）
+        """
+        return self.alias(email_lower=Lower("email")).filter(email_lower=Lower(Value(email)))
+
+
+class UserManager(DjangoUserManager.from_queryset(UserQuerySet)):
+    def get_by_natural_key(self, username):
+        """登录（ModelBackend）和 createsuperuser 按邮箱查找用户，不区分大小写"""
+        return self.by_email(username).get()
+
+
+class User(DirtyFieldsMixin, AbstractUser):
     
     """
     自定义用户模型，继承自 Django 的 AbstractUser
@@ -32,7 +107,7 @@ class User(AbstractUser):
     Fields:
         username: 用户名(唯一)最大长度100
         email: 电子邮件地址（唯一）
-        full_name: 完整姓名（唯一）
+        full_name: 完整姓名（可以重名）
         otp: 一次性密码（唯一）
     """
     username = models.CharField(
@@ -43,8 +118,7 @@ class User(AbstractUser):
     email = models.EmailField(unique=True)  # 电子邮件地址必须唯一
     
     full_name = models.CharField(
-        unique=True,  # 完整姓名必须唯一
-        max_length=100  # 最大长度100字符
+        max_length=100  # 最大长度100字符；姓名允许重复，注册时不再因为同名而失败
     )
 
     otp = models.CharField(
@@ -68,6 +142,25 @@ class User(AbstractUser):
     USERNAME_FIELD = "email"  # 用户以后登录的时候，用的是 邮箱
     REQUIRED_FIELDS = ["username"]  # ：在你创建用户的时候（比如通过命令 python manage.py createsuperuser），除了 email 和 password，还必须输入 username。
 
+    # 需要同步到 Profile 的字段，只有它们变化时才会写 Profile
+    tracked_fields = ("full_name",)
+
+    objects = UserManager()
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # 后台列表页的前缀搜索（见 core/changelist.py）：LOWER(username) >= 'abc' AND LOWER(username) < 'abd'
+            # 邮箱的前缀搜索使用下面 userauths_user_email_ci_uniq 的索引
+            models.Index(Lower("username"), name="userauths_username_lower_idx"),
+            models.Index(Lower("full_name"), name="userauths_fullname_lower_idx"),
+            # 后台按姓名排序：ORDER BY full_name, id DESC（full_name 不再唯一，排序需要带上 id）
+            models.Index(fields=["full_name", "-id"], name="userauths_user_fullname_idx"),
+        ]
+        constraints = [
+            # 邮箱不区分大小写唯一；登录、注册的邮箱查询（UserQuerySet.by_email）都走这个索引
+            models.UniqueConstraint(Lower("email"), name="userauths_user_email_ci_uniq"),
+        ]
+
     def __str__(self):
         """返回用户的电子邮件地址作为字符串表示"""
         return self.email
@@ -79,6 +172,7 @@ class User(AbstractUser):
         1. 从电子邮件地址中提取用户名（@之前的部分）
         2. 如果完整姓名为空，则使用用户名
         3. 如果用户名为空，则使用电子邮件的用户名部分
+        4. 用户和 Profile 在同一个事务中写入（Profile 由 post_save 信号 sync_user_profile 负责）
         """
         email_username, full_name = self.email.split("@")
         if self.full_name == "" or self.full_name is None:
@@ -86,10 +180,13 @@ class User(AbstractUser):
         if self.username == "" or self.username is None:
             self.username = email_username
         # 调用 Django 的 AbstractUser 类中的 save() 方法，找到 User 类的父类”（也就是 AbstractUser）并将原始传入的参数原样传递过去。
-        super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+        # 保存成功后重新记录快照，后续再次 save() 时只对比新的改动
+        self._snapshot_tracked_fields()
 
 
-class Profile(models.Model):
+class Profile(DirtyFieldsMixin, models.Model):
     """
     用户个人资料模型
     
@@ -100,6 +197,8 @@ class Profile(models.Model):
         country: 用户所在国家
         about: 用户个人简介
         date: 资料创建时间
+        thumbnails_ready: 头像缩略图是否已经生成（见 api/avatars.py）
+        version: 版本号，每次写入资料时加一；/user/me/ 的 ETag 由它计算，同时缓存在共享缓存中（userauths/profile_version.py）
     """
     user = models.OneToOneField(
         # 📌 举例：如果你的 app 名是 userauths，用户模型叫 User，那么 AUTH_USER_MODEL = 'userauths.User' 会在 settings.py 中配置。
@@ -134,6 +233,23 @@ class Profile(models.Model):
     
     date = models.DateTimeField(auto_now_add=True)  # 创建时间，自动添加
 
+    version = models.PositiveIntegerField(default=0)  # 版本号，每次更新资料时加一
+
+    thumbnails_ready = models.BooleanField(default=False)  # 头像缩略图是否已经生成，生成之前接口返回原图地址
+
+    # 追踪所有列，更新已有资料时只写入发生变化的列（包括 user、date），不会漏掉任何修改
+    tracked_fields = "__all__"
+
+    class Meta:
+        indexes = [
+            # 后台资料列表页按姓名前缀搜索
+            models.Index(Lower("full_name"), name="userauths_prof_name_lower_idx"),
+            # 后台按创建时间排序：ORDER BY date DESC, id DESC（keyset 分页，见 core/changelist.py）
+            models.Index(fields=["-date", "-id"], name="userauths_prof_date_idx"),
+            # 后台按国家筛选，默认按 id 倒序：WHERE country = ? ORDER BY id DESC
+            models.Index(fields=["country", "-id"], name="userauths_prof_country_idx"),
+        ]
+
     def __str__(self) -> str:
         """
         返回个人资料的字符串表示
@@ -149,30 +265,65 @@ class Profile(models.Model):
         """
         重写保存方法
         如果完整姓名为空，则使用关联用户的完整姓名
+        更新已有资料且未指定 update_fields 时，只写入变化过的列；没有任何变化则不访问数据库
+        真正写入已有资料时 version 加一，和其他列在同一条 UPDATE 中写入
         """
         if self.full_name == "" or self.full_name == None:
             self.full_name = self.user.full_name
+        bumped = version_expression = False
+        if not self._state.adding:
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                dirty = self.get_dirty_fields()
+                if dirty is not None:
+                    # update_fields 为空列表时 Django 直接返回，不会发出 UPDATE
+                    update_fields = list(dirty)
+            if update_fields is None or update_fields:
+                bumped = True
+                version_expression = self._bump_version()
+                if update_fields is not None and "version" not in update_fields:
+                    update_fields = [*update_fields, "version"]
+            kwargs["update_fields"] = update_fields
         super().save(*args, **kwargs)
+        if version_expression:
+            # 数据库中加一后的值没有读回来，按延迟字段处理，用到时再加载
+            del self.version
+        if bumped:
+            # 提交后更新共享缓存中的版本号（userauths/profile_version.py）
+            publish_version(self.user_id, None if version_expression else self.version)
+        self._snapshot_tracked_fields()
+
+    def _bump_version(self):
+        """版本号加一；没有加载版本号时在数据库中加一（不为了读取它多发一条查询），返回 True"""
+        if "version" in self.get_deferred_fields():
+            self.version = F("version") + 1
+            return True
+        self.version += 1
+        return False
 
 # sender：发送信号的模型类（比如 User）！！！
-def create_user_porfile(sender,instance,created,**kwargs):
-    # “如果这是一个新创建的用户，那就给他创建一个关联的 Profile。”
+def sync_user_profile(sender, instance, created, **kwargs):
     """
-    创建一个新的 Profile 实例；
-    将它的 user 字段设置为传入的 User 对象（即 instance）；
-    保存到数据库中。
+    User 保存后同步 Profile（唯一的写入路径，取代原来的 create_user_porfile + save_user_profile）
+
+    新用户：在 User.save() 的同一个事务里创建 Profile（一条 INSERT）
+    老用户：只有镜像字段 full_name 真正改变、且 Profile 仍在沿用旧的 full_name 时，才发一条 UPDATE；
+           其他情况不查询也不写入 Profile
     """
     if created:
-        Profile.objects.create(user =instance)
+        Profile.objects.create(user=instance, full_name=instance.full_name)
+        return
 
-def save_user_profile(sender,instance,**kwargs):
-    """
-    你可以把它理解为：
-    当你修改并保存用(User)的信息时，
-    这个函数会“顺便”也保存用户的个人资料(Profile)。
-    """
-    instance.profile.save()
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None and "full_name" not in update_fields:
+        return
+    dirty = instance.get_dirty_fields()
+    if dirty and "full_name" in dirty:
+        updated = Profile.objects.filter(user=instance, full_name=dirty["full_name"]).update(
+            full_name=instance.full_name, version=F("version") + 1,
+        )
+        if updated:
+            publish_version(instance.pk)
 
 # post_save 是 Django 提供的一个 内置信号（built-in signal），它会在模型调用 .save() 方法之后自动触发。第一个参数相当于监听函数
-post_save.connect(create_user_porfile,sender=User)
-post_save.connect(save_user_profile,sender=User)
\ No newline at end of file
+post_save.connect(sync_user_profile, sender=User)
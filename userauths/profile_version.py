@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+"""
+资料版本号缓存：user_id -> Profile.version
+
+/user/me/ 的 ETag 由资料版本号计算（见 api/views.py 的 CurrentUserView）。版本号同时放在共享缓存中，
+带 If-None-Match 的请求先和缓存中的版本号比较，命中时直接返回 304，不查询数据库；缓存未命中时才查询资料，
+并用 cache.add() 写回读到的版本号。
+
+Profile 每次写入后（事务提交后）用 cache.set() 写入新的版本号：
+- 先读到旧版本号的请求用 add() 写回时，如果写入方已经 set() 过，add() 不会覆盖新值
+- 写入方 set() 在读取方 add() 之后时，覆盖掉旧值
+版本号在数据库中用 F("version") + 1 加一（没有读回来）时，提交后再读一次版本号。
+
+CACHE 必须是所有 worker 进程共用的缓存（例如 Redis）；进程内的 LocMemCache 只适用于单进程部署，
+否则其他进程修改资料后，本进程在 TIMEOUT 之内可能返回过期的 304。
+"""
+
+DEFAULTS = {
+    # 缓存别名（settings.CACHES 中的 key）
+    'CACHE': 'default',
+    # 缓存有效期（秒），过期后下一次请求从数据库读取
+    'TIMEOUT': 600,
+    'KEY_PREFIX': 'profile-version',
+}
+
+
+def get_profile_version_settings():
+    """合并默认配置和 settings.PROFILE_VERSION_CACHE"""
+    return {**DEFAULTS, **getattr(settings, 'PROFILE_VERSION_CACHE', {})}
+
+
+def _cache_and_key(user_id):
+    conf = get_profile_version_settings()
+    return caches[conf['CACHE']], f"{conf['KEY_PREFIX']}:{user_id}", conf['TIMEOUT']
+
+
+def get_cached_version(user_id):
+    """缓存中的版本号，未命中时返回 None"""
+    cache, key, _ = _cache_and_key(user_id)
+    return cache.get(key)
+
+
+def remember_version(user_id, version):
+    """缓存未命中、从数据库读到版本号后写回；已有值（可能是更新的版本号）时不覆盖"""
+    cache, key, timeout = _cache_and_key(user_id)
+    cache.add(key, version, timeout)
+
+
+def publish_version(user_id, version=None):
+    """
+    资料写入后在事务提交时更新缓存；version 为 None 表示数据库中的值没有读回来，提交后再查询一次
+    """
+    def publish():
+        value = version
+        if value is None:
+            from userauths.models import Profile
+
+            value = Profile.objects.filter(user_id=user_id).values_list('version', flat=True).first()
+        cache, key, timeout = _cache_and_key(user_id)
+        if value is None:
+            cache.delete(key)
+        else:
+            cache.set(key, value, timeout)
+
+    transaction.on_commit(publish)
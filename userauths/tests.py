@@ -1,3 +1,331 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import json
+import re
+from io import BytesIO, TextIOWrapper
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from core.querybudget import get_query_budget_settings, query_budget, view_budget
+from userauths.bulk_import import ENCODING, BulkUserImporter, iter_rows
+from userauths.export import export_stream
+from userauths.models import Profile, User
+
+# SQLite 查询计划中的全表扫描（SEARCH ... USING INDEX 才是索引查找）
+SQLITE_SCAN_RE = re.compile(r"^SCAN (?!CONSTANT ROW)")
+
+# 需要检查查询计划的语句：读和按条件写，INSERT 不需要
+CHECKED_RE = re.compile(r"^\s*(SELECT|UPDATE|DELETE)\b", re.I)
+
+
+class StatementRecorder:
+    """通过 connection.execute_wrapper 记录执行过的 userauths 语句和参数"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and CHECKED_RE.match(sql) and "userauths_" in sql:
+            self.statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def sqlite_problems(cursor, sql, params):
+    cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+    details = [row[3] for row in cursor.fetchall()]
+    return details, [detail for detail in details if SQLITE_SCAN_RE.match(detail)]
+
+
+def postgres_problems(cursor, sql, params):
+    # 关掉顺序扫描：只要存在可用的索引，计划里就不应该再出现 Seq Scan
+    cursor.execute("SET enable_seqscan = off")
+    try:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    finally:
+        cursor.execute("RESET enable_seqscan")
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    details, problems = [], []
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get("Plans", ()))
+        node_type = node["Node Type"]
+        target = node.get("Index Name") or node.get("Relation Name", "")
+        condition = node.get("Index Cond", "")
+        details.append(f"{node_type} {target} {condition}".strip())
+        if node_type == "Seq Scan":
+            problems.append(f"Seq Scan on {target}")
+        elif node_type in ("Index Scan", "Index Only Scan", "Bitmap Index Scan") and not condition:
+            # 没有 Index Cond 说明是按顺序读完整个索引
+            problems.append(f"{node_type} on {target} without an index condition")
+    return details, problems
+
+
+EXPLAINERS = {"sqlite": sqlite_problems, "postgresql": postgres_problems}
+
+
+class ProfileSaveQueryTests(TestCase):
+    """Profile / User 保存的查询数回归测试（对应 check_query_budgets 的场景）"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='saver@example.com', username='saver', password='x')
+        self.profile = Profile.objects.get(user=self.user)
+
+    def test_create_user_inserts_profile(self):
+        # SAVEPOINT + 插入用户 + 插入资料 + RELEASE
+        with self.assertNumQueries(4):
+            User.objects.create_user(email='other@example.com', username='other', password='x')
+        self.assertTrue(Profile.objects.filter(user__email='other@example.com').exists())
+
+    def test_noop_save_runs_no_query(self):
+        with self.assertNumQueries(0):
+            self.profile.save()
+
+    def test_update_writes_changed_column_only(self):
+        self.profile.country = 'China'
+        with self.assertNumQueries(1) as queries:
+            self.profile.save()
+        sql = queries.captured_queries[0]['sql']
+        self.assertIn('"country"', sql)
+        self.assertNotIn('"about"', sql)
+        self.assertEqual(Profile.objects.get(pk=self.profile.pk).country, 'China')
+
+    def test_every_column_is_tracked(self):
+        other = User.objects.create_user(email='new-owner@example.com', username='new-owner', password='x')
+        Profile.objects.filter(user=other).delete()
+        date = timezone.now() - datetime.timedelta(days=30)
+        self.profile.user = other
+        self.profile.date = date
+        with self.assertNumQueries(1):
+            self.profile.save()
+        saved = Profile.objects.get(pk=self.profile.pk)
+        self.assertEqual((saved.user_id, saved.date), (other.pk, date))
+
+    def test_version_is_bumped_in_the_same_update(self):
+        self.profile.about = 'Hello'
+        with self.assertNumQueries(1):
+            self.profile.save()
+        self.profile.save()
+        self.assertEqual(Profile.objects.get(pk=self.profile.pk).version, 1)
+
+    def test_deferred_version_is_bumped_in_the_database(self):
+        profile = Profile.objects.only('id', 'user_id', 'full_name', 'country').get(pk=self.profile.pk)
+        profile.country = 'Japan'
+        with self.assertNumQueries(1):
+            profile.save(update_fields=['country'])
+        self.assertEqual(profile.version, 1)
+
+    def test_user_rename_updates_profile(self):
+        self.user.full_name = 'Renamed User'
+        # SAVEPOINT + 更新用户 + 同步资料 + RELEASE
+        with self.assertNumQueries(4):
+            self.user.save()
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual((profile.full_name, profile.version), ('Renamed User', 1))
+
+    def test_unrelated_user_update_skips_profile(self):
+        self.user.first_name = 'Saver'
+        # SAVEPOINT + 更新用户 + RELEASE
+        with self.assertNumQueries(3):
+            self.user.save()
+
+
+@override_settings(AUTH_RATE_LIMIT={"ENABLED": False})
+class AuthEndpointQueryTests(TestCase):
+    """注册、登录和资料修改接口的查询数回归测试（与 check_query_budgets 的场景对应，TestCase 中事务是 SAVEPOINT）"""
+    PASSWORD = "Str0ng-Passw0rd!"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="member@example.com", username="member", password=self.PASSWORD)
+
+    def test_register(self):
+        # 邮箱唯一性校验 + SAVEPOINT + 插入用户 + 插入资料 + RELEASE
+        with self.assertNumQueries(5):
+            response = self.client.post("/api/v1/user/register/", {
+                "username": "New User", "email": "new.user@example.com",
+                "password": self.PASSWORD, "password2": self.PASSWORD,
+            }, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_register_duplicate_email(self):
+        # 只有邮箱唯一性校验
+        with self.assertNumQueries(1):
+            response = self.client.post("/api/v1/user/register/", {
+                "username": "Member", "email": "MEMBER@example.com",
+                "password": self.PASSWORD, "password2": self.PASSWORD,
+            }, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_login(self):
+        # 按邮箱查询用户（一条查询取出认证和令牌需要的列）
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                "/api/v1/user/token/", {"email": "member@example.com", "password": self.PASSWORD}, format="json",
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_profile_update(self):
+        self.client.force_authenticate(self.user)
+        # 查询资料 + 更新改动的列
+        with self.assertNumQueries(2):
+            response = self.client.patch("/api/v1/user/me/", {"country": "China"}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(Profile.objects.get(user=self.user).country, "China")
+
+
+class BulkImportTests(TestCase):
+    def test_csv_with_bom(self):
+        data = "\ufeffemail,password\nbom@example.com,Str0ng-Passw0rd!\n".encode("utf-8")
+        stream = TextIOWrapper(BytesIO(data), encoding=ENCODING, newline="")
+        summary = BulkUserImporter(workers=0).run(iter_rows(stream, "csv"))
+        self.assertEqual(summary.as_dict(), {"created": 1, "failed": 0})
+        self.assertTrue(User.objects.filter(email="bom@example.com").exists())
+
+
+class ExportTests(TestCase):
+    def test_csv_formulas_are_escaped(self):
+        for i, name in enumerate(("=HYPERLINK(\"http://evil\")", "+1", "-2+3", "@SUM(A1)", "\tx", "Plain - name")):
+            User.objects.create(email=f"user{i}@example.com", username=f"user{i}", full_name=name)
+        data = b"".join(export_stream("users", "csv")).decode("utf-8")
+        names = [row[3] for row in csv.reader(data.splitlines())][1:]
+        self.assertEqual(names, ["'=HYPERLINK(\"http://evil\")", "'+1", "'-2+3", "'@SUM(A1)", "'\tx", "Plain - name"])
+
+    def test_ndjson_is_not_escaped(self):
+        User.objects.create(email="user@example.com", username="user", full_name="=1+1")
+        data = b"".join(export_stream("users", "ndjson")).decode("utf-8")
+        self.assertEqual(json.loads(data)["full_name"], "=1+1")
+
+
+class UserAdminCursorTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser(email="admin@example.com", username="admin", password="x")
+        self.client.force_login(admin)
+
+    def test_forged_cursor_redirects_with_error(self):
+        cursor = base64.urlsafe_b64encode(json.dumps(["not-a-number"]).encode()).decode()
+        response = self.client.get("/admin/userauths/user/", {"cursor": cursor})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("e=1", response["Location"])
+
+
+class AdminQueryBudgetTests(TestCase):
+    """后台列表页和编辑页都要满足 ModelAdmin 上声明的 query_budget，并且没有 N+1"""
+    # 大于 N+1 的判定阈值
+    ROWS = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(email="admin@example.com", username="admin", password="x")
+        for i in range(cls.ROWS):
+            User.objects.create_user(email=f"user{i}@example.com", username=f"user{i}", full_name=f"User {i}", password="x")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def get(self, url, params=None):
+        budget, threshold = view_budget(resolve(url).func, get_query_budget_settings())
+        with query_budget(budget, threshold, label=f"GET {url}"):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_changelists(self):
+        for url, params in (
+            ("/admin/userauths/user/", None),
+            ("/admin/userauths/user/", {"q": "user1"}),
+            ("/admin/userauths/user/", {"o": "1"}),
+            ("/admin/userauths/profile/", None),
+            ("/admin/userauths/profile/", {"q": "user"}),
+        ):
+            with self.subTest(url=url, params=params):
+                self.get(url, params)
+
+    def test_change_pages(self):
+        self.get(f"/admin/userauths/user/{self.admin.pk}/change/")
+        self.get(f"/admin/userauths/profile/{self.admin.profile.pk}/change/")
+
+
+@override_settings(AUTH_RATE_LIMIT={"ENABLED": False})
+class AuthQueryPlanTests(TestCase):
+    """
+    登录和注册查询的执行计划
+    插入 ROWS 个用户并 ANALYZE 后，对登录、注册、重复邮箱注册和 by_email() 访问 userauths 表的每条
+    SELECT / UPDATE / DELETE 执行 EXPLAIN：SQLite 的计划中不能有 SCAN（全表扫描），
+    PostgreSQL 关闭 enable_seqscan 后不能有 Seq Scan 或没有条件的索引扫描
+    """
+    # 表中的行数：足够多，数据库不会因为表太小而直接选择全表扫描
+    ROWS = 5000
+    PASSWORD = "Str0ng-Passw0rd!"
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            User(email=f"user{i}@example.com", username=f"user{i}", full_name=f"User {i % 100}") for i in range(cls.ROWS)
+        )
+        Profile.objects.bulk_create(
+            Profile(user=user, full_name=user.full_name, country=("China", "Japan", "France")[user.pk % 3])
+            for user in users
+        )
+        student = User(email="Student@Example.com", username="student", full_name="Student")
+        student.set_password(cls.PASSWORD)
+        student.save()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        if connection.vendor not in EXPLAINERS:
+            self.skipTest(f"EXPLAIN is not checked on {connection.vendor}")
+        self.client = APIClient()
+
+    def assertIndexLookups(self, scenario):
+        recorder = StatementRecorder()
+        with connection.execute_wrapper(recorder):
+            scenario()
+        self.assertTrue(recorder.statements, "no userauths query was recorded")
+        for sql, params in recorder.statements:
+            with connection.cursor() as cursor:
+                details, problems = EXPLAINERS[connection.vendor](cursor, sql, params)
+            self.assertEqual(problems, [], f"{sql}\n{' | '.join(details)}")
+
+    def register(self, username, email):
+        return self.client.post("/api/v1/user/register/", {
+            "username": username, "email": email, "password": self.PASSWORD, "password2": self.PASSWORD,
+        }, format="json")
+
+    def test_login(self):
+        def login():
+            # 邮箱大小写与注册时不同，仍然可以登录
+            response = self.client.post(
+                "/api/v1/user/token/", {"email": "student@example.com", "password": self.PASSWORD}, format="json",
+            )
+            self.assertEqual(response.status_code, 200, response.data)
+
+        self.assertIndexLookups(login)
+
+    def test_register(self):
+        def register():
+            # 与已有用户同名：full_name 不再唯一
+            response = self.register("User 7", "New.User@example.com")
+            self.assertEqual(response.status_code, 201, response.data)
+
+        def register_duplicate():
+            response = self.register("Someone", "new.user@EXAMPLE.com")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("email", response.data)
+
+        self.assertIndexLookups(register)
+        self.assertIndexLookups(register_duplicate)
+
+    def test_by_email_lookup(self):
+        # 异步登录接口 token_obtain_view 使用的查询（异步视图的查询不经过 execute_wrapper）
+        self.assertIndexLookups(lambda: self.assertIsNotNone(User.objects.by_email("USER42@example.com").first()))